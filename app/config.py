@@ -34,6 +34,115 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: str = "redis://redis:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://redis:6379/0"
 
+    # Sistema RAG: presupuesto (tamaño en disco) de los índices FAISS abiertos por proceso
+    RAG_INDEX_CACHE_MAX_MB: int = 512
+    # Compactación del índice por bot: al superar esta proporción de vectores borrados,
+    # y en todo caso cada RAG_COMPACTION_INTERVAL_SECONDS (celery beat)
+    RAG_COMPACTION_TOMBSTONE_RATIO: float = 0.2
+    RAG_COMPACTION_INTERVAL_SECONDS: int = 3600
+    # Estrategia automática de índice por cantidad de vectores: flat -> hnsw -> ivf_sq8 -> ivf_pq
+    RAG_FLAT_MAX_VECTORS: int = 20000
+    RAG_HNSW_MAX_VECTORS: int = 100000
+    RAG_IVF_SQ8_MAX_VECTORS: int = 1000000
+    # Parámetros de búsqueda ANN (0 = usar los calculados al construir el índice)
+    RAG_HNSW_EF_SEARCH: int = 0
+    RAG_IVF_NPROBE: int = 0
+    # Caché de embeddings de consultas (en proceso, con nivel opcional en Redis)
+    RAG_QUERY_EMBEDDING_CACHE_SIZE: int = 10000
+    RAG_QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 86400
+    RAG_QUERY_EMBEDDING_CACHE_REDIS: bool = True
+    # Búsqueda híbrida (vectorial + BM25): candidatos por lista y constante k de RRF
+    RAG_HYBRID_CANDIDATES: int = 20
+    RAG_HYBRID_RRF_K: int = 60
+    # Presupuesto de tokens por defecto para el contexto RAG de cada pregunta (0 = sin límite)
+    RAG_CONTEXT_TOKEN_BUDGET: int = 1200
+
+    # Caché de respuestas exactas del chat (Redis)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 50000
+    # Caché semántica (preguntas parafraseadas). Umbral de similitud coseno por defecto:
+    # 0 = desactivada salvo en los bots con semantic_cache_threshold (recomendado ~0.92-0.95)
+    SEMANTIC_CACHE_THRESHOLD: float = 0.0
+    SEMANTIC_CACHE_MAX_ENTRIES_PER_BOT: int = 1000
+    SEMANTIC_CACHE_TTL_SECONDS: int = 86400
+    SEMANTIC_CACHE_AUDIT_SAMPLE: int = 200
+    # Deduplicación de preguntas idénticas en curso (single-flight); con Redis, entre workers
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_REDIS: bool = False
+    SINGLE_FLIGHT_WAIT_SECONDS: int = 60
+    # Circuit breaker por proveedor (compartido en Redis) y cadena de fallback
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_BREAKER_WINDOW_SECONDS: int = 60
+    CIRCUIT_BREAKER_MIN_CALLS: int = 10
+    CIRCUIT_BREAKER_ERROR_RATE: float = 0.5
+    CIRCUIT_BREAKER_SLOW_CALL_MS: int = 15000
+    CIRCUIT_BREAKER_OPEN_SECONDS: int = 30
+    # Sin primer trozo en este tiempo, se pasa al siguiente modelo de la cadena (0 = sin límite)
+    FALLBACK_FIRST_CHUNK_TIMEOUT_SECONDS: float = 30.0
+    # Hedging (por bot con hedge_percentile): espera del percentil de TTFT antes de lanzar el segundo modelo
+    HEDGING_TTFT_WINDOW: int = 500
+    HEDGING_MIN_SAMPLES: int = 20
+    HEDGING_DEFAULT_DELAY_MS: int = 3000
+    HEDGING_MIN_DELAY_MS: int = 300
+    # Router adaptativo (bots con routing_objective distinto de "keywords")
+    ROUTER_STATS_WINDOW: int = 200
+    ROUTER_MIN_SAMPLES: int = 10
+    ROUTER_MAX_ERROR_RATE: float = 0.2
+    ROUTER_DEFAULT_LATENCY_SLO_MS: int = 5000
+    # Fracción de peticiones que van a un modelo elegible al azar para mantener sus estadísticas al día
+    ROUTER_EXPLORATION_RATE: float = 0.05
+    # Clasificador por embeddings (bots con task_classifier=embedding): similitud mínima con el
+    # centroide más cercano; por debajo se usan las palabras clave (0 = siempre el más cercano)
+    INTENT_MIN_SIMILARITY: float = 0.0
+
+    # Escritura diferida de token_usage / analytics_events del chat (lotes cada USAGE_WRITER_FLUSH_MS)
+    USAGE_WRITE_BEHIND: bool = True
+    USAGE_WRITER_MAX_QUEUE: int = 10000
+    USAGE_WRITER_BATCH_SIZE: int = 500
+    USAGE_WRITER_FLUSH_MS: int = 200
+    # Registros que no se pudieron escribir al apagar; se reescriben al arrancar (vacío = se pierden)
+    USAGE_WRITER_SPILL_PATH: str = "usage_writer_spill.jsonl"
+    # Precios de model_pricing en memoria: se recargan al recibir el aviso de cambio por Redis
+    # (crud de precios) y, por si se pierde alguno, cuando la tabla supera esta antigüedad
+    PRICING_MAX_AGE_SECONDS: int = 600
+    # Agregados por hora/día de token_usage para las analíticas (los diarios no se borran)
+    USAGE_ROLLUP_HOURLY_RETENTION_DAYS: int = 90
+    USAGE_ROLLUP_PRUNE_INTERVAL_SECONDS: int = 86400
+    # Particiones mensuales de token_usage y analytics_events (migrate_partition_usage_tables.sql):
+    # se crean por adelantado y se borran las anteriores a la retención (0 = se conservan todas;
+    # los agregados diarios mantienen los totales de lo borrado)
+    USAGE_PARTITION_MONTHS_AHEAD: int = 3
+    USAGE_PARTITION_RETENTION_MONTHS: int = 0
+    USAGE_PARTITION_MAINTENANCE_SECONDS: int = 86400
+    # Saldo de BytTokens en Redis: reserva del costo estimado antes de llamar al modelo y
+    # reconciliación periódica con user_plans (tarea de Celery beat)
+    BYTOKEN_LEDGER_ENABLED: bool = True
+    BYTOKEN_LEDGER_RESERVATION_TTL_SECONDS: int = 300
+    # Tokens de respuesta que se suponen al reservar (el consumo real se liquida al terminar)
+    BYTOKEN_LEDGER_ESTIMATED_COMPLETION_TOKENS: int = 500
+    BYTOKEN_LEDGER_RECONCILE_SECONDS: int = 10
+    BYTOKEN_LEDGER_RECONCILE_BATCH: int = 500
+
+    # Backends de embeddings (por bot: google o local)
+    DEFAULT_EMBEDDING_BACKEND: str = "google"
+    GOOGLE_EMBEDDING_MODEL: str = "models/embedding-001"
+    LOCAL_EMBEDDING_MODEL: str = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+    LOCAL_EMBEDDING_BATCH_SIZE: int = 32
+    LOCAL_EMBEDDING_THREADS: int = 2
+    # Archivo ONNX dentro del repo del modelo, p. ej. "onnx/model_qint8_avx512_vnni.onnx" (vacío = PyTorch)
+    LOCAL_EMBEDDING_ONNX_FILE: str = ""
+
+    # Clientes HTTP compartidos (keep-alive) hacia los proveedores externos
+    HTTP_POOL_MAX_CONNECTIONS: int = 100
+    HTTP_POOL_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_READ_TIMEOUT_SECONDS: float = 120.0
+    HTTP_POOL_TIMEOUT_SECONDS: float = 10.0
+    # HTTP/2 requiere el paquete 'h2' (httpx[http2])
+    HTTP2_ENABLED: bool = False
+
     # Construye la URL completa de la base de datos
     @property
     def DATABASE_URL_COMPUTED(self) -> str:
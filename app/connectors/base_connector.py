@@ -1,5 +1,22 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Generator, Dict, Any, Tuple
+from typing import AsyncIterator, Generator, Dict, Any, Optional, Tuple
+
+# Textos con los que los conectores (y el orquestador) responden cuando falla el proveedor
+ERROR_RESPONSE_MARKERS = (
+    "Lo siento, he tenido un problema al conectar",
+    "Error en DeepSeek:",
+    "Error al procesar la solicitud:",
+)
+
+
+def is_error_response(text: str) -> bool:
+    """True si la respuesta es (o termina en) un mensaje de error de un conector."""
+    return any(marker in text for marker in ERROR_RESPONSE_MARKERS)
+
+
+class ConnectorError(Exception):
+    """Fallo del proveedor en la API async: el orquestador decide si prueba otro modelo."""
 
 class BaseConnector(ABC):
     @abstractmethod
@@ -26,6 +43,53 @@ class BaseConnector(ABC):
         """
         pass
 
+    async def aget_response_stream(self, prompt_package: dict, model_id: str, temperature: float = 0.7,
+                                   usage: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Versión asíncrona de get_response_stream. Por defecto consume el generador
+        síncrono en un hilo trozo a trozo; los conectores con cliente async la sobrescriben
+        para no ocupar un hilo durante toda la generación.
+
+        Si se pasa `usage`, el conector lo completa con el consumo real que informe el
+        proveedor al final del stream (prompt_tokens, completion_tokens, total_tokens,
+        model_used). Si queda vacío (proveedor sin uso en streaming o stream cortado),
+        quien llama debe estimarlo.
+
+        Los errores del proveedor se lanzan como ConnectorError (no como texto).
+        """
+        stream = self.get_response_stream(prompt_package, model_id, temperature)
+        finished = object()
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, stream, finished)
+                if chunk is finished:
+                    return
+                if is_error_response(chunk):
+                    raise ConnectorError(chunk)
+                yield chunk
+        finally:
+            try:
+                stream.close()
+            except ValueError:
+                # Cancelado mientras el hilo seguía dentro de next(): se libera cuando el hilo termine
+                pass
+
+    async def aget_response_with_metrics(self, prompt_package: dict, model_id: str, temperature: float = 0.7) -> Tuple[str, Dict[str, Any]]:
+        """Versión asíncrona de get_response_with_metrics (por defecto, en un hilo)."""
+        return await asyncio.to_thread(self.get_response_with_metrics, prompt_package, model_id, temperature)
+
+    @staticmethod
+    def fill_usage(usage: Optional[Dict[str, Any]], prompt_tokens: int, completion_tokens: int, model_id: str):
+        """Anota en `usage` el consumo informado por el proveedor al final de un stream."""
+        if usage is None:
+            return
+        usage.update({
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0),
+            "model_used": model_id,
+        })
+
     def estimate_tokens(self, text: str) -> int:
         """
         Estimación básica de tokens basada en palabras.
@@ -1,105 +1,144 @@
 # app/connectors/deepseek_connector.py
 import os
 import time
-import httpx
 import json
-from typing import Tuple, Dict, Any, Generator
-from .base_connector import BaseConnector
+from typing import Tuple, Dict, Any, Generator, AsyncIterator, Optional
+from .base_connector import BaseConnector, ConnectorError
+from .http_client import get_http_client, get_async_http_client
 
 class DeepSeekConnector(BaseConnector):
     def __init__(self):
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("DEEPSEEK_API_KEY no encontrada.")
-        self.base_url = "https://api.deepseek.com/v1"
+        self.base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+        # Cliente de larga vida: reutiliza las conexiones TCP+TLS entre mensajes
+        self.client = get_http_client("deepseek", base_url=self.base_url)
         print("Conector de DeepSeek inicializado.")
 
-    def get_response_stream(self, prompt_package: dict, model_id: str, temperature: float = 0.7) -> Generator[str, None, None]:
-        headers = { "Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}" }
-        data = {
+    def _headers(self) -> Dict[str, str]:
+        return { "Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}" }
+
+    def _payload(self, prompt_package: dict, model_id: str, temperature: float, stream: bool) -> Dict[str, Any]:
+        return {
             "model": model_id,
             "messages": [
                 {"role": "system", "content": prompt_package.get("system_prompt")},
                 {"role": "user", "content": prompt_package.get("user_question")}
             ],
-            "stream": True,
+            "stream": stream,
             "temperature": temperature,
             "max_tokens": 4096
         }
+
+    @staticmethod
+    def _parse_stream_line(line: str) -> Optional[dict]:
+        """Evento JSON de una línea SSE ('data: {...}'); {"done": True} para '[DONE]' y None si no es válida."""
+        if not line.startswith("data: "):
+            return None
+        line_content = line[6:]
+        if line_content.strip() == "[DONE]":
+            return {"done": True}
         try:
-            with httpx.stream("POST", f"{self.base_url}/chat/completions", headers=headers, json=data, timeout=120) as r:
+            return json.loads(line_content)
+        except json.JSONDecodeError:
+            return None
+
+    def _handle_stream_event(self, event: dict, model_id: str, usage: Optional[dict]) -> Optional[str]:
+        """Texto del evento; el último evento trae el bloque 'usage' (con stream_options.include_usage)."""
+        if event.get("usage"):
+            self.fill_usage(usage, event["usage"].get("prompt_tokens"), event["usage"].get("completion_tokens"), model_id)
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+    @staticmethod
+    def _metrics_from_response(response_data: dict, model_id: str, response_time_ms: int) -> Tuple[str, Dict[str, Any]]:
+        response_text = response_data["choices"][0]["message"]["content"]
+        usage = response_data.get("usage", {})
+        metrics = {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "model_used": model_id,
+            "response_time_ms": response_time_ms
+        }
+        return response_text, metrics
+
+    def _error_metrics(self, prompt_package: dict, model_id: str, error: Exception) -> Tuple[str, Dict[str, Any]]:
+        """En caso de error, se estiman los tokens"""
+        print(f"Error en el conector de DeepSeek: {error}")
+        system_prompt = prompt_package.get("system_prompt", "")
+        user_question = prompt_package.get("user_question", "")
+        estimated_prompt = self.estimate_tokens(system_prompt + user_question)
+        error_message = f"Error en DeepSeek: {str(error)}"
+        estimated_completion = self.estimate_tokens(error_message)
+
+        metrics = {
+            "prompt_tokens": estimated_prompt,
+            "completion_tokens": estimated_completion,
+            "total_tokens": estimated_prompt + estimated_completion,
+            "model_used": model_id,
+            "response_time_ms": 0,
+            "error": str(error)
+        }
+        return error_message, metrics
+
+    def get_response_stream(self, prompt_package: dict, model_id: str, temperature: float = 0.7) -> Generator[str, None, None]:
+        data = self._payload(prompt_package, model_id, temperature, stream=True)
+        try:
+            with self.client.stream("POST", "/chat/completions", headers=self._headers(), json=data) as r:
                 r.raise_for_status()
                 for line in r.iter_lines():
-                    if line.startswith("data: "):
-                        line_content = line[6:]
-                        if line_content.strip() == "[DONE]": break
-                        try:
-                            json_data = json.loads(line_content)
-                            content = json_data.get("choices", [{}])[0].get("delta", {}).get("content")
-                            if content:
-                                yield content
-                        except json.JSONDecodeError:
-                            continue
+                    event = self._parse_stream_line(line)
+                    if not event: continue
+                    if event.get("done"): break
+                    content = self._handle_stream_event(event, model_id, None)
+                    if content:
+                        yield content
         except Exception as e:
             yield f"Error en DeepSeek: {str(e)}"
 
+    async def aget_response_stream(self, prompt_package: dict, model_id: str, temperature: float = 0.7,
+                                   usage: Optional[dict] = None) -> AsyncIterator[str]:
+        client = get_async_http_client("deepseek", base_url=self.base_url)
+        data = self._payload(prompt_package, model_id, temperature, stream=True)
+        if usage is not None:
+            data["stream_options"] = {"include_usage": True}
+        try:
+            async with client.stream("POST", "/chat/completions", headers=self._headers(), json=data) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    event = self._parse_stream_line(line)
+                    if not event: continue
+                    if event.get("done"): break
+                    content = self._handle_stream_event(event, model_id, usage)
+                    if content:
+                        yield content
+        except Exception as e:
+            raise ConnectorError(f"DeepSeek: {e}") from e
+
     def get_response_with_metrics(self, prompt_package: dict, model_id: str, temperature: float = 0.7) -> Tuple[str, Dict[str, Any]]:
         """
         Obtiene una respuesta completa con métricas de tokens de DeepSeek.
         """
-        headers = { "Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}" }
-        data = {
-            "model": model_id,
-            "messages": [
-                {"role": "system", "content": prompt_package.get("system_prompt")},
-                {"role": "user", "content": prompt_package.get("user_question")}
-            ],
-            "stream": False,  # No streaming para obtener métricas
-            "temperature": temperature,
-            "max_tokens": 4096
-        }
-        
+        data = self._payload(prompt_package, model_id, temperature, stream=False)  # No streaming para obtener métricas
+        start_time = time.time()
+        try:
+            response = self.client.post("/chat/completions", headers=self._headers(), json=data)
+            response.raise_for_status()
+            response_time_ms = int((time.time() - start_time) * 1000)
+            return self._metrics_from_response(response.json(), model_id, response_time_ms)
+        except Exception as e:
+            return self._error_metrics(prompt_package, model_id, e)
+
+    async def aget_response_with_metrics(self, prompt_package: dict, model_id: str, temperature: float = 0.7) -> Tuple[str, Dict[str, Any]]:
+        client = get_async_http_client("deepseek", base_url=self.base_url)
+        data = self._payload(prompt_package, model_id, temperature, stream=False)
         start_time = time.time()
-        
         try:
-            response = httpx.post(f"{self.base_url}/chat/completions", headers=headers, json=data, timeout=120)
+            response = await client.post("/chat/completions", headers=self._headers(), json=data)
             response.raise_for_status()
-            
-            end_time = time.time()
-            response_time_ms = int((end_time - start_time) * 1000)
-            
-            response_data = response.json()
-            
-            # Extraer información de la respuesta
-            response_text = response_data["choices"][0]["message"]["content"]
-            usage = response_data.get("usage", {})
-            
-            metrics = {
-                "prompt_tokens": usage.get("prompt_tokens", 0),
-                "completion_tokens": usage.get("completion_tokens", 0),
-                "total_tokens": usage.get("total_tokens", 0),
-                "model_used": model_id,
-                "response_time_ms": response_time_ms
-            }
-            
-            return response_text, metrics
-            
+            response_time_ms = int((time.time() - start_time) * 1000)
+            return self._metrics_from_response(response.json(), model_id, response_time_ms)
         except Exception as e:
-            print(f"Error en el conector de DeepSeek: {e}")
-            # En caso de error, estimar tokens
-            system_prompt = prompt_package.get("system_prompt", "")
-            user_question = prompt_package.get("user_question", "")
-            estimated_prompt = self.estimate_tokens(system_prompt + user_question)
-            error_message = f"Error en DeepSeek: {str(e)}"
-            estimated_completion = self.estimate_tokens(error_message)
-            
-            metrics = {
-                "prompt_tokens": estimated_prompt,
-                "completion_tokens": estimated_completion,
-                "total_tokens": estimated_prompt + estimated_completion,
-                "model_used": model_id,
-                "response_time_ms": 0,
-                "error": str(e)
-            }
-            
-            return error_message, metrics
\ No newline at end of file
+            return self._error_metrics(prompt_package, model_id, e)
@@ -1,9 +1,9 @@
 import time
 import google.generativeai as genai
-from typing import Tuple, Dict, Any, Generator
+from typing import Tuple, Dict, Any, Generator, AsyncIterator, Optional
 # Importamos nuestro objeto de configuración centralizado
 from ..config import settings
-from .base_connector import BaseConnector
+from .base_connector import BaseConnector, ConnectorError
 
 class GoogleConnector(BaseConnector):
     def __init__(self):
@@ -15,6 +15,38 @@ class GoogleConnector(BaseConnector):
         genai.configure(api_key=api_key)
         print("Conector de Google inicializado correctamente.")
 
+    @staticmethod
+    def _metrics_from_response(response, model_id: str, response_time_ms: int) -> Tuple[str, Dict[str, Any]]:
+        # Google Gemini incluye información de tokens en la respuesta
+        usage_metadata = response.usage_metadata
+        metrics = {
+            "prompt_tokens": usage_metadata.prompt_token_count,
+            "completion_tokens": usage_metadata.candidates_token_count,
+            "total_tokens": usage_metadata.total_token_count,
+            "model_used": model_id,
+            "response_time_ms": response_time_ms
+        }
+        return response.text, metrics
+
+    def _error_metrics(self, prompt_package: dict, model_id: str, error: Exception) -> Tuple[str, Dict[str, Any]]:
+        """En caso de error, se estiman los tokens"""
+        print(f"Error en el conector de Google: {error}")
+        system_prompt = prompt_package.get("system_prompt", "Eres un asistente útil.")
+        user_question = prompt_package.get("user_question", "")
+        estimated_prompt = self.estimate_tokens(system_prompt + user_question)
+        error_message = "Lo siento, he tenido un problema al conectar con el servicio de Google."
+        estimated_completion = self.estimate_tokens(error_message)
+
+        metrics = {
+            "prompt_tokens": estimated_prompt,
+            "completion_tokens": estimated_completion,
+            "total_tokens": estimated_prompt + estimated_completion,
+            "model_used": model_id,
+            "response_time_ms": 0,
+            "error": str(error)
+        }
+        return error_message, metrics
+
     def get_response_stream(self, prompt_package: dict, model_id: str = 'gemini-1.5-pro-latest', temperature: float = 0.7) -> Generator[str, None, None]:
         """
         Obtiene una respuesta en streaming del modelo de Google.
@@ -55,41 +87,51 @@ class GoogleConnector(BaseConnector):
             
             generation_config = genai.types.GenerationConfig(temperature=temperature)
             response = model.generate_content(user_question, generation_config=generation_config)
-            
-            end_time = time.time()
-            response_time_ms = int((end_time - start_time) * 1000)
-            
-            # Extraer información de la respuesta
-            response_text = response.text
-            
-            # Google Gemini incluye información de tokens en la respuesta
-            usage_metadata = response.usage_metadata
-            
-            metrics = {
-                "prompt_tokens": usage_metadata.prompt_token_count,
-                "completion_tokens": usage_metadata.candidates_token_count,
-                "total_tokens": usage_metadata.total_token_count,
-                "model_used": model_id,
-                "response_time_ms": response_time_ms
-            }
-            
-            return response_text, metrics
-            
+            response_time_ms = int((time.time() - start_time) * 1000)
+            return self._metrics_from_response(response, model_id, response_time_ms)
+
         except Exception as e:
-            print(f"Error en el conector de Google: {e}")
-            # En caso de error, estimar tokens
-            estimated_prompt = self.estimate_tokens(system_prompt + user_question)
-            error_message = "Lo siento, he tenido un problema al conectar con el servicio de Google."
-            estimated_completion = self.estimate_tokens(error_message)
-            
-            metrics = {
-                "prompt_tokens": estimated_prompt,
-                "completion_tokens": estimated_completion,
-                "total_tokens": estimated_prompt + estimated_completion,
-                "model_used": model_id,
-                "response_time_ms": 0,
-                "error": str(e)
-            }
-            
-            return error_message, metrics
+            return self._error_metrics(prompt_package, model_id, e)
+
+    async def aget_response_stream(self, prompt_package: dict, model_id: str = 'gemini-1.5-pro-latest', temperature: float = 0.7,
+                                   usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """
+        Versión asíncrona de get_response_stream (cliente async del SDK de Google).
+        Cada chunk trae usage_metadata acumulado; el del último es el consumo final.
+        """
+        try:
+            model = genai.GenerativeModel(
+                model_name=model_id,
+                system_instruction=prompt_package.get("system_prompt", "Eres un asistente útil.")
+            )
+            generation_config = genai.types.GenerationConfig(temperature=temperature)
+            response_stream = await model.generate_content_async(
+                prompt_package.get("user_question", ""), stream=True, generation_config=generation_config
+            )
+            async for chunk in response_stream:
+                usage_metadata = getattr(chunk, "usage_metadata", None)
+                if usage_metadata and usage_metadata.total_token_count:
+                    self.fill_usage(usage, usage_metadata.prompt_token_count,
+                                    usage_metadata.candidates_token_count, model_id)
+                yield chunk.text
+        except Exception as e:
+            raise ConnectorError(f"Google: {e}") from e
 
+    async def aget_response_with_metrics(self, prompt_package: dict, model_id: str = 'gemini-1.5-pro-latest', temperature: float = 0.7) -> Tuple[str, Dict[str, Any]]:
+        """
+        Versión asíncrona de get_response_with_metrics.
+        """
+        start_time = time.time()
+        try:
+            model = genai.GenerativeModel(
+                model_name=model_id,
+                system_instruction=prompt_package.get("system_prompt", "Eres un asistente útil.")
+            )
+            generation_config = genai.types.GenerationConfig(temperature=temperature)
+            response = await model.generate_content_async(
+                prompt_package.get("user_question", ""), generation_config=generation_config
+            )
+            response_time_ms = int((time.time() - start_time) * 1000)
+            return self._metrics_from_response(response, model_id, response_time_ms)
+        except Exception as e:
+            return self._error_metrics(prompt_package, model_id, e)
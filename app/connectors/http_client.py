@@ -0,0 +1,219 @@
+# app/connectors/http_client.py
+
+import time
+import logging
+import threading
+from typing import Any, Dict, Tuple
+
+import httpx
+
+from ..config import settings
+
+# Eventos de httpcore (extensión "trace") que marcan el inicio del envío de la petición
+_SEND_EVENTS = ("http11.send_request_headers.started", "http2.send_request_headers.started")
+
+
+class PoolStats:
+    """Contadores de uso de un pool de conexiones HTTP."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.pool_wait_ms_total = 0.0
+        self.pool_wait_ms_max = 0.0
+        self.connect_ms_total = 0.0
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finished(self, start: float, events: Dict[str, float]):
+        """
+        Registra los tiempos de una petición a partir de los eventos de httpcore:
+        espera del pool = desde el inicio hasta que hay conexión (nueva o reutilizada);
+        conexión = TCP + TLS cuando hubo que abrir una conexión nueva.
+        """
+        first_step = min(
+            (events[name] for name in ("connection.connect_tcp.started",) + _SEND_EVENTS if name in events),
+            default=None,
+        )
+        with self._lock:
+            self.in_flight -= 1
+            if first_step is not None:
+                wait_ms = (first_step - start) * 1000
+                self.pool_wait_ms_total += wait_ms
+                self.pool_wait_ms_max = max(self.pool_wait_ms_max, wait_ms)
+            if "connection.connect_tcp.started" in events:
+                self.new_connections += 1
+                connected = events.get("connection.start_tls.complete") or events.get("connection.connect_tcp.complete")
+                if connected:
+                    self.connect_ms_total += (connected - events["connection.connect_tcp.started"]) * 1000
+            if "connection.start_tls.complete" in events:
+                self.tls_handshakes += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "connection_reuse_rate": round(1 - self.new_connections / self.requests, 4) if self.requests else 0.0,
+                "avg_pool_wait_ms": round(self.pool_wait_ms_total / self.requests, 3) if self.requests else 0.0,
+                "max_pool_wait_ms": round(self.pool_wait_ms_max, 3),
+                "avg_connect_ms": round(self.connect_ms_total / self.new_connections, 3) if self.new_connections else 0.0,
+            }
+
+
+def _traced(request: httpx.Request, is_async: bool = False) -> Dict[str, float]:
+    """Engancha un trace de httpcore a la petición y devuelve el dict donde se anotan los eventos."""
+    events: Dict[str, float] = {}
+    previous = request.extensions.get("trace")
+
+    def trace(event_name: str, info: dict):
+        events.setdefault(event_name, time.perf_counter())
+        if previous is not None:
+            previous(event_name, info)
+
+    async def atrace(event_name: str, info: dict):
+        # En la interfaz async, httpcore exige que el callback sea una corrutina
+        events.setdefault(event_name, time.perf_counter())
+        if previous is not None:
+            await previous(event_name, info)
+
+    request.extensions["trace"] = atrace if is_async else trace
+    return events
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTPTransport que registra la espera del pool y las conexiones nuevas en PoolStats."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        events = _traced(request)
+        start = time.perf_counter()
+        self.stats.started()
+        try:
+            return super().handle_request(request)
+        finally:
+            self.stats.finished(start, events)
+
+
+class AsyncInstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Versión asíncrona de InstrumentedTransport (para los conectores async)."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        events = _traced(request, is_async=True)
+        start = time.perf_counter()
+        self.stats.started()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.stats.finished(start, events)
+
+
+def _connection_counts(transport: httpx.BaseTransport) -> Dict[str, int]:
+    """Conexiones abiertas del pool de httpcore (activas = con una petición en curso)."""
+    pool = getattr(transport, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return {}
+    connections = [conn for conn in connections if not conn.is_closed()]
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {"open_connections": len(connections), "active_connections": len(connections) - idle,
+            "idle_connections": idle}
+
+
+def _http2_enabled() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("HTTP2_ENABLED está activo pero falta el paquete 'h2' (pip install httpx[http2]); se usa HTTP/1.1.")
+        return False
+
+
+def pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def pool_timeout() -> httpx.Timeout:
+    """Timeouts separados: conectar debe ser rápido; leer puede tardar lo que tarde el modelo."""
+    return httpx.Timeout(
+        connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        read=settings.HTTP_READ_TIMEOUT_SECONDS,
+        write=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        pool=settings.HTTP_POOL_TIMEOUT_SECONDS,
+    )
+
+
+_clients: Dict[str, Tuple[httpx.Client, PoolStats]] = {}
+_async_clients: Dict[str, Tuple[httpx.AsyncClient, PoolStats]] = {}
+_lock = threading.Lock()
+
+
+def get_http_client(name: str, base_url: str = "") -> httpx.Client:
+    """
+    Cliente HTTP de larga vida para un servicio externo (uno por nombre y proceso),
+    con keep-alive, límites de pool y HTTP/2 opcional. Reutilizarlo evita abrir una
+    conexión TCP+TLS nueva en cada mensaje.
+    """
+    entry = _clients.get(name)
+    if entry is not None:
+        return entry[0]
+    with _lock:
+        if name not in _clients:
+            stats = PoolStats()
+            http2 = _http2_enabled()
+            transport = InstrumentedTransport(stats, limits=pool_limits(), http2=http2)
+            client = httpx.Client(base_url=base_url, transport=transport, timeout=pool_timeout())
+            _clients[name] = (client, stats)
+            logging.info(f"Cliente HTTP '{name}' creado (http2={http2}).")
+        return _clients[name][0]
+
+
+def get_async_http_client(name: str, base_url: str = "") -> httpx.AsyncClient:
+    """
+    Igual que get_http_client pero asíncrono. Las conexiones quedan ligadas al event
+    loop donde se usan por primera vez (el del servidor ASGI).
+    """
+    entry = _async_clients.get(name)
+    if entry is not None:
+        return entry[0]
+    with _lock:
+        if name not in _async_clients:
+            stats = PoolStats()
+            http2 = _http2_enabled()
+            transport = AsyncInstrumentedTransport(stats, limits=pool_limits(), http2=http2)
+            client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=pool_timeout())
+            _async_clients[name] = (client, stats)
+            logging.info(f"Cliente HTTP async '{name}' creado (http2={http2}).")
+        return _async_clients[name][0]
+
+
+def http_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Métricas de todos los pools HTTP del proceso, por nombre de servicio."""
+    with _lock:
+        entries = dict(_clients)
+        entries.update({f"{name}-async": entry for name, entry in _async_clients.items()})
+    return {
+        name: {**stats.snapshot(), **_connection_counts(client._transport)}
+        for name, (client, stats) in entries.items()
+    }
@@ -1,30 +1,79 @@
 import time
-from openai import OpenAI
-from typing import Tuple, Dict, Any, Generator
+from openai import OpenAI, AsyncOpenAI
+from typing import Tuple, Dict, Any, Generator, AsyncIterator, Optional
 # Importamos nuestro objeto de configuración centralizado
 from ..config import settings
-from .base_connector import BaseConnector
+from .base_connector import BaseConnector, ConnectorError
+from .http_client import get_http_client, get_async_http_client, pool_timeout
 
 class OpenAIConnector(BaseConnector):
     def __init__(self):
         # Leemos la clave de API desde el objeto 'settings'
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=get_http_client("openai"),
+            timeout=pool_timeout(),
+        )
+        # El cliente async se crea al primer uso, dentro del event loop del servidor
+        self._async_client = None
         print("Conector de OpenAI inicializado correctamente.")
 
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=get_async_http_client("openai"),
+                timeout=pool_timeout(),
+            )
+        return self._async_client
+
+    @staticmethod
+    def _messages(prompt_package: dict) -> list:
+        return [
+            {"role": "system", "content": prompt_package.get("system_prompt", "Eres un asistente útil.")},
+            {"role": "user", "content": prompt_package.get("user_question", "")}
+        ]
+
+    @staticmethod
+    def _metrics_from_response(response, model_id: str, response_time_ms: int) -> Tuple[str, Dict[str, Any]]:
+        usage = response.usage
+        metrics = {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+            "model_used": model_id,
+            "response_time_ms": response_time_ms
+        }
+        return response.choices[0].message.content, metrics
+
+    def _error_metrics(self, prompt_package: dict, model_id: str, error: Exception) -> Tuple[str, Dict[str, Any]]:
+        """En caso de error, se estiman los tokens"""
+        print(f"Error en el conector de OpenAI: {error}")
+        system_prompt = prompt_package.get("system_prompt", "Eres un asistente útil.")
+        user_question = prompt_package.get("user_question", "")
+        estimated_prompt = self.estimate_tokens(system_prompt + user_question)
+        error_message = "Lo siento, he tenido un problema al conectar con el servicio de OpenAI."
+        estimated_completion = self.estimate_tokens(error_message)
+
+        metrics = {
+            "prompt_tokens": estimated_prompt,
+            "completion_tokens": estimated_completion,
+            "total_tokens": estimated_prompt + estimated_completion,
+            "model_used": model_id,
+            "response_time_ms": 0,
+            "error": str(error)
+        }
+        return error_message, metrics
+
     def get_response_stream(self, prompt_package: dict, model_id: str = 'gpt-4o', temperature: float = 0.7) -> Generator[str, None, None]:
         """
         Obtiene una respuesta en streaming del modelo de OpenAI.
         """
-        system_prompt = prompt_package.get("system_prompt", "Eres un asistente útil.")
-        user_question = prompt_package.get("user_question", "")
-
         try:
             stream = self.client.chat.completions.create(
                 model=model_id,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_question}
-                ],
+                messages=self._messages(prompt_package),
                 stream=True,
                 temperature=temperature,
             )
@@ -40,52 +89,54 @@ class OpenAIConnector(BaseConnector):
         """
         Obtiene una respuesta completa con métricas de tokens de OpenAI.
         """
-        system_prompt = prompt_package.get("system_prompt", "Eres un asistente útil.")
-        user_question = prompt_package.get("user_question", "")
-        
         start_time = time.time()
-        
         try:
             response = self.client.chat.completions.create(
                 model=model_id,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_question}
-                ],
+                messages=self._messages(prompt_package),
                 temperature=temperature,
             )
-            
-            end_time = time.time()
-            response_time_ms = int((end_time - start_time) * 1000)
-            
-            # Extraer información de la respuesta
-            response_text = response.choices[0].message.content
-            usage = response.usage
-            
-            metrics = {
-                "prompt_tokens": usage.prompt_tokens,
-                "completion_tokens": usage.completion_tokens,
-                "total_tokens": usage.total_tokens,
-                "model_used": model_id,
-                "response_time_ms": response_time_ms
-            }
-            
-            return response_text, metrics
-            
+            response_time_ms = int((time.time() - start_time) * 1000)
+            return self._metrics_from_response(response, model_id, response_time_ms)
         except Exception as e:
-            print(f"Error en el conector de OpenAI: {e}")
-            # En caso de error, estimar tokens
-            estimated_prompt = self.estimate_tokens(system_prompt + user_question)
-            error_message = "Lo siento, he tenido un problema al conectar con el servicio de OpenAI."
-            estimated_completion = self.estimate_tokens(error_message)
-            
-            metrics = {
-                "prompt_tokens": estimated_prompt,
-                "completion_tokens": estimated_completion,
-                "total_tokens": estimated_prompt + estimated_completion,
-                "model_used": model_id,
-                "response_time_ms": 0,
-                "error": str(e)
-            }
-            
-            return error_message, metrics
+            return self._error_metrics(prompt_package, model_id, e)
+
+    async def aget_response_stream(self, prompt_package: dict, model_id: str = 'gpt-4o', temperature: float = 0.7,
+                                   usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """
+        Versión asíncrona de get_response_stream (no ocupa un hilo durante la generación).
+        Con `usage`, pide stream_options.include_usage: el último chunk trae el consumo.
+        """
+        try:
+            extra = {"stream_options": {"include_usage": True}} if usage is not None else {}
+            stream = await self.async_client.chat.completions.create(
+                model=model_id,
+                messages=self._messages(prompt_package),
+                stream=True,
+                temperature=temperature,
+                **extra,
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    self.fill_usage(usage, chunk.usage.prompt_tokens, chunk.usage.completion_tokens, model_id)
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    yield content
+        except Exception as e:
+            raise ConnectorError(f"OpenAI: {e}") from e
+
+    async def aget_response_with_metrics(self, prompt_package: dict, model_id: str = 'gpt-4o', temperature: float = 0.7) -> Tuple[str, Dict[str, Any]]:
+        """
+        Versión asíncrona de get_response_with_metrics.
+        """
+        start_time = time.time()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=model_id,
+                messages=self._messages(prompt_package),
+                temperature=temperature,
+            )
+            response_time_ms = int((time.time() - start_time) * 1000)
+            return self._metrics_from_response(response, model_id, response_time_ms)
+        except Exception as e:
+            return self._error_metrics(prompt_package, model_id, e)
@@ -0,0 +1,77 @@
+# app/connectors/registry.py
+
+import logging
+import threading
+from typing import Callable, Dict, List
+
+from .base_connector import BaseConnector
+
+
+def _google_connector() -> BaseConnector:
+    from .google_connector import GoogleConnector
+    return GoogleConnector()
+
+
+def _openai_connector() -> BaseConnector:
+    from .openai_connector import OpenAIConnector
+    return OpenAIConnector()
+
+
+def _deepseek_connector() -> BaseConnector:
+    from .deepseek_connector import DeepSeekConnector
+    return DeepSeekConnector()
+
+
+DEFAULT_CONNECTOR_FACTORIES: Dict[str, Callable[[], BaseConnector]] = {
+    "google": _google_connector,
+    "openai": _openai_connector,
+    "deepseek": _deepseek_connector,
+}
+
+
+class ConnectorRegistry:
+    """
+    Conectores de LLM compartidos por todo el proceso.
+
+    Cada conector se construye la primera vez que se pide su proveedor (no en cada
+    petición) y se reutiliza después, con sus clientes HTTP y configuración.
+    Si un proveedor no se puede inicializar (p. ej. falta su API key), solo fallan
+    las peticiones que lo usan, y se vuelve a intentar en la siguiente.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], BaseConnector]]):
+        self._factories = dict(factories)
+        self._connectors: Dict[str, BaseConnector] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> BaseConnector:
+        """Devuelve el conector del proveedor. Lanza KeyError si no existe o ValueError si no se pudo crear."""
+        connector = self._connectors.get(provider)
+        if connector is not None:
+            return connector
+
+        factory = self._factories.get(provider)
+        if factory is None:
+            raise KeyError(f"Proveedor de LLM desconocido: '{provider}'")
+
+        with self._lock:
+            connector = self._connectors.get(provider)
+            if connector is None:
+                try:
+                    connector = factory()
+                except Exception as e:
+                    logging.error(f"No se pudo inicializar el conector '{provider}': {e}")
+                    raise ValueError(f"Conector para '{provider}' no disponible: {e}") from e
+                self._connectors[provider] = connector
+                logging.info(f"Conector '{provider}' inicializado (compartido por el proceso).")
+            return connector
+
+    def providers(self) -> List[str]:
+        return list(self._factories)
+
+    def initialized(self) -> List[str]:
+        return list(self._connectors)
+
+
+# Instancia única para todo el proceso (se crea al arrancar la app)
+connector_registry = ConnectorRegistry(DEFAULT_CONNECTOR_FACTORIES)
@@ -1,15 +1,109 @@
-# Un gestor de caché muy simple basado en un diccionario de Python.
-class CacheManager:
-    def __init__(self):
-        self.cache = {}
-        print("CacheManager inicializado (memoria a corto plazo lista).")
-
-    def get(self, query: str):
-        """Busca una respuesta en el caché para una pregunta dada."""
-        # .get(query, None) intenta buscar la 'query'. Si no la encuentra, devuelve None.
-        return self.cache.get(query, None)
-
-    def set(self, query: str, response: dict):
-        """Guarda una nueva respuesta en el caché."""
-        print(f"Guardando en caché la respuesta para: '{query}'")
-        self.cache[query] = response
\ No newline at end of file
+# app/core/cache_manager.py
+
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import redis
+
+from app.config import settings
+from app.core.text_utils import normalize_query
+
+
+class ResponseCache:
+    """
+    Caché de respuestas exactas del chat, compartida por todos los workers vía Redis.
+
+    La clave combina (bot, versión de configuración del bot, pregunta normalizada,
+    ids de los chunks recuperados). Editar el bot, sus modelos o sus documentos
+    incrementa `bots.config_version`, así que las entradas anteriores dejan de
+    coincidir y expiran solas por TTL.
+
+    El tamaño se acota con un sorted set de claves por antigüedad: al superar
+    `max_entries` se borran las más viejas. Si Redis no responde la caché se
+    desactiva para esa petición (nunca rompe el chat).
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int, max_entries: int,
+                 namespace: str = "bytchat:response_cache"):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self._index_key = f"{namespace}:index"
+        self._redis = redis.Redis.from_url(redis_url)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, bot_id: int, config_version: int, query: str, chunk_ids: Iterable[int]) -> str:
+        payload = json.dumps([bot_id, config_version, normalize_query(query), sorted(chunk_ids)])
+        return f"{self.namespace}:{bot_id}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Devuelve la entrada cacheada ({response, provider, model_id, ...}) o None."""
+        try:
+            raw = self._redis.get(key)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"ResponseCache: Redis no disponible ({e}).")
+            return None
+
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, response: str, provider: str, model_id: str, **extra):
+        """Guarda una respuesta. Las respuestas de error nunca deben llegar aquí."""
+        entry = {"response": response, "provider": provider, "model_id": model_id,
+                 "created_at": time.time(), **extra}
+        try:
+            pipe = self._redis.pipeline()
+            pipe.set(key, json.dumps(entry, ensure_ascii=False), ex=self.ttl_seconds)
+            pipe.zadd(self._index_key, {key: entry["created_at"]})
+            # Las claves ya expiradas también salen del índice
+            pipe.zremrangebyscore(self._index_key, 0, entry["created_at"] - self.ttl_seconds)
+            pipe.zcard(self._index_key)
+            size = pipe.execute()[-1]
+
+            if size > self.max_entries:
+                oldest = [member for member, _ in self._redis.zpopmin(self._index_key, size - self.max_entries)]
+                if oldest:
+                    self._redis.delete(*oldest)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"ResponseCache: no se pudo guardar la respuesta ({e}).")
+
+    @staticmethod
+    def stream(response: str, piece_size: int = 64) -> Iterator[str]:
+        """Entrega una respuesta cacheada en trozos, igual que un stream del modelo."""
+        for start in range(0, len(response), piece_size):
+            yield response[start:start + piece_size]
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de este proceso y tamaño total en Redis."""
+        try:
+            entries = self._redis.zcard(self._index_key)
+        except redis.exceptions.RedisError:
+            entries = None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Instancia única para todo el proceso
+response_cache = ResponseCache(
+    redis_url=settings.REDIS_URL,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+)
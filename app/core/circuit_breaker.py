@@ -0,0 +1,191 @@
+# app/core/circuit_breaker.py
+
+import time
+import uuid
+import logging
+from typing import Dict, Iterable, Optional, Union
+
+import redis
+import redis.asyncio as aioredis
+
+from app.config import settings
+
+# KEYS: half_open, probe, ventana actual, ventana anterior | ARGV: token de la prueba, '1' = cerrar
+# 0 si no está semiabierto; -1 si la llamada no es la prueba en curso; 1 si lo es (y se cierra si ARGV[2] = '1')
+PROBE_RESULT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[1] == '' or redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return -1
+end
+if ARGV[2] == '1' then
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+end
+return 1
+"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por proveedor de LLM, compartido entre workers vía Redis.
+
+    - Cerrado: se cuentan llamadas, errores y llamadas lentas (primer trozo por encima
+      de `slow_call_ms`) en ventanas de `window_seconds` (la actual y la anterior).
+      Con al menos `min_calls` llamadas y una tasa de fallos >= `error_rate`, se abre.
+    - Abierto: durante `open_seconds` el proveedor se omite. Cada worker recuerda el
+      vencimiento en memoria, así que omitirlo no cuesta ni una ida a Redis.
+    - Semiabierto: al vencer, un solo worker (SET NX) deja pasar una petición de prueba;
+      si va bien se cierra el circuito y si falla se vuelve a abrir. Solo la prueba lo
+      cierra: `allow` le da un token que hay que pasar a `record_success`, y una
+      llamada lanzada antes de abrirse que termina bien mientras tanto no cuenta.
+
+    Si Redis no responde, se deja pasar la petición (el breaker nunca bloquea el chat).
+    """
+
+    def __init__(self, redis_url: str, window_seconds: int = 60, min_calls: int = 10,
+                 error_rate: float = 0.5, slow_call_ms: int = 15000, open_seconds: int = 30,
+                 namespace: str = "bytchat:circuit"):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.namespace = namespace
+        self._redis = aioredis.Redis.from_url(redis_url, decode_responses=True)
+        self._probe_result = self._redis.register_script(PROBE_RESULT_SCRIPT)
+        # proveedor -> instante (monotonic) hasta el que se sabe que está abierto
+        self._open_until: Dict[str, float] = {}
+        self.skipped = 0
+        self.opened = 0
+
+    def _key(self, provider: str, suffix: str) -> str:
+        return f"{self.namespace}:{provider}:{suffix}"
+
+    def _window_keys(self, provider: str):
+        bucket = int(time.time() // self.window_seconds)
+        return self._key(provider, f"w:{bucket}"), self._key(provider, f"w:{bucket - 1}")
+
+    async def allow(self, provider: str) -> Union[bool, str]:
+        """
+        Si se puede llamar al proveedor ahora: False si no; si sí, True (circuito cerrado)
+        o el token de la petición de prueba (semiabierto), que se pasa a `record_success`.
+        """
+        if self._open_until.get(provider, 0) > time.monotonic():
+            self.skipped += 1
+            return False
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.pttl(self._key(provider, "open"))
+                pipe.exists(self._key(provider, "half_open"))
+                open_ms, half_open = await pipe.execute()
+            if open_ms > 0:
+                self._open_until[provider] = time.monotonic() + open_ms / 1000
+                self.skipped += 1
+                return False
+            if half_open:
+                # Solo una petición de prueba a la vez entre todos los workers
+                probe = uuid.uuid4().hex
+                if await self._redis.set(self._key(provider, "probe"), probe, nx=True, ex=self.open_seconds):
+                    logging.info(f"CircuitBreaker: petición de prueba a '{provider}' (semiabierto)")
+                    return probe
+                self.skipped += 1
+                return False
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"CircuitBreaker: Redis no disponible ({e}); se permite la llamada.")
+        return True
+
+    async def record_success(self, provider: str, latency_ms: float, permit: Union[bool, str] = True):
+        """
+        Registra una llamada correcta; `latency_ms` es el tiempo hasta el primer trozo y
+        `permit`, lo que devolvió `allow` para esa llamada.
+        """
+        slow = latency_ms > self.slow_call_ms
+        probe = permit if isinstance(permit, str) else ""
+        try:
+            result = await self._probe_result(
+                keys=[self._key(provider, "half_open"), self._key(provider, "probe"), *self._window_keys(provider)],
+                args=[probe, "0" if slow else "1"],
+            )
+            if result == 0:
+                await self._count(provider, failed=slow)
+            elif result == 1:
+                if slow:
+                    await self._open(provider)
+                else:
+                    self._open_until.pop(provider, None)
+                    logging.info(f"CircuitBreaker: circuito de '{provider}' cerrado de nuevo")
+            # -1: semiabierto y no es la prueba (se lanzó antes de abrirse): no decide nada
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"CircuitBreaker: no se pudo registrar la llamada ({e}).")
+
+    async def record_failure(self, provider: str):
+        try:
+            if await self._redis.exists(self._key(provider, "half_open")):
+                await self._open(provider)
+                return
+            await self._count(provider, failed=True)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"CircuitBreaker: no se pudo registrar el fallo ({e}).")
+
+    async def _count(self, provider: str, failed: bool):
+        current, previous = self._window_keys(provider)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hincrby(current, "calls", 1)
+            pipe.hincrby(current, "failures", 1 if failed else 0)
+            pipe.expire(current, self.window_seconds * 2)
+            pipe.hgetall(previous)
+            calls, failures, _, before = await pipe.execute()
+        if not failed:
+            return
+        calls += int(before.get("calls", 0))
+        failures += int(before.get("failures", 0))
+        if calls >= self.min_calls and failures / calls >= self.error_rate:
+            logging.warning(f"CircuitBreaker: '{provider}' con {failures}/{calls} fallos")
+            await self._open(provider)
+
+    async def _open(self, provider: str):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._key(provider, "open"), "1", px=int(self.open_seconds * 1000))
+            pipe.set(self._key(provider, "half_open"), "1", ex=86400)
+            pipe.delete(self._key(provider, "probe"))
+            await pipe.execute()
+        self._open_until[provider] = time.monotonic() + self.open_seconds
+        self.opened += 1
+        logging.warning(f"CircuitBreaker: circuito de '{provider}' ABIERTO por {self.open_seconds}s")
+
+    async def state(self, provider: str) -> Dict[str, object]:
+        current, previous = self._window_keys(provider)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.pttl(self._key(provider, "open"))
+            pipe.exists(self._key(provider, "half_open"))
+            pipe.hgetall(current)
+            pipe.hgetall(previous)
+            open_ms, half_open, now, before = await pipe.execute()
+        calls = int(now.get("calls", 0)) + int(before.get("calls", 0))
+        failures = int(now.get("failures", 0)) + int(before.get("failures", 0))
+        return {
+            "state": "open" if open_ms > 0 else ("half_open" if half_open else "closed"),
+            "open_remaining_seconds": round(open_ms / 1000, 1) if open_ms > 0 else 0,
+            "recent_calls": calls,
+            "recent_failures": failures,
+            "error_rate": round(failures / calls, 4) if calls else 0.0,
+        }
+
+    async def stats(self, providers: Iterable[str]) -> Dict[str, object]:
+        try:
+            states = {provider: await self.state(provider) for provider in providers}
+        except redis.exceptions.RedisError as e:
+            states = {"error": str(e)}
+        return {"providers": states, "skipped_calls": self.skipped, "opened": self.opened}
+
+
+# Instancia única para todo el proceso (None = breaker desactivado)
+circuit_breaker: Optional[CircuitBreaker] = CircuitBreaker(
+    redis_url=settings.REDIS_URL,
+    window_seconds=settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+    min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+    error_rate=settings.CIRCUIT_BREAKER_ERROR_RATE,
+    slow_call_ms=settings.CIRCUIT_BREAKER_SLOW_CALL_MS,
+    open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+) if settings.CIRCUIT_BREAKER_ENABLED else None
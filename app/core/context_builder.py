@@ -0,0 +1,137 @@
+# app/core/context_builder.py
+
+import re
+from typing import Any, Dict, List, Optional
+
+from app.core.text_utils import estimate_tokens, fold_accents, normalize_query
+
+# Fin de oración seguido de espacio, o salto de línea
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+# Coincidencia mínima (en caracteres) para considerar que dos chunks se solapan
+MIN_OVERLAP_CHARS = 40
+
+
+def _sentence_key(sentence: str) -> str:
+    return fold_accents(normalize_query(sentence))
+
+
+def _strip_overlap(previous: str, current: str, max_overlap: int = 400) -> str:
+    """
+    Quita del inicio de `current` el texto que repite el final de `previous`
+    (el splitter genera chunks consecutivos con chunk_overlap caracteres en común).
+    """
+    limit = min(len(previous), len(current), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(current[:size]):
+            return current[size:].lstrip()
+    return current
+
+
+def _strip_trailing_overlap(current: str, following: str, max_overlap: int = 400) -> str:
+    """Quita del final de `current` el texto que repite el inicio de `following`."""
+    limit = min(len(following), len(current), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if following.startswith(current[-size:]):
+            return current[:-size].rstrip()
+    return current
+
+
+def _new_sentences(text: str, seen_sentences: set) -> List[tuple]:
+    """(clave, oración) de las oraciones de `text` que no están en `seen_sentences` ni repetidas."""
+    sentences, keys = [], set()
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        key = _sentence_key(sentence)
+        if not key or key in seen_sentences or key in keys:
+            continue
+        keys.add(key)
+        sentences.append((key, sentence.strip()))
+    return sentences
+
+
+def _truncate_to_budget(text: str, budget_tokens: int) -> str:
+    """Recorta un texto por oraciones (o por palabras si hace falta) hasta `budget_tokens`."""
+    kept = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        # Se mide el texto resultante: la estimación redondea, sumar la de cada oración se queda corto
+        if estimate_tokens(" ".join(kept + [sentence])) > budget_tokens:
+            break
+        kept.append(sentence)
+    if kept:
+        return " ".join(kept)
+    words = text.split()
+    return " ".join(words[:max(1, int(budget_tokens / 0.75))])
+
+
+def build_context(chunks: List[Dict[str, Any]], budget_tokens: Optional[int]) -> Dict[str, Any]:
+    """
+    Arma el contexto del prompt a partir de los chunks recuperados (ordenados por
+    relevancia, como los devuelve RAGRetriever.search_chunks):
+
+      1. Si hay presupuesto, recorre los chunks por densidad (relevancia / tokens);
+         el primero siempre entra, recortado si no cabe.
+      2. Cada chunk se deduplica solo contra los ya elegidos: se quita el
+         solapamiento con sus vecinos del mismo documento y las oraciones que ya
+         están en el contexto. Entra si lo que queda cabe en el presupuesto.
+      3. Devuelve el contexto en el orden de relevancia original.
+
+    Deduplicar contra los elegidos (y no contra todos los recuperados) evita perder
+    una oración porque se quitó de un chunk y el chunk que la tenía no entró.
+
+    `tokens_saved` compara contra unir los chunks tal cual (el comportamiento anterior).
+    """
+    original_tokens = sum(estimate_tokens(chunk["text"]) for chunk in chunks)
+
+    # 1. Orden de selección
+    candidates = [
+        {
+            "position": position,
+            "id": chunk["id"],
+            "text": chunk["text"],
+            "tokens": max(1, estimate_tokens(chunk["text"])),
+            "relevance": chunk.get("relevance") or 1.0 / (position + 1),
+        }
+        for position, chunk in enumerate(chunks)
+    ]
+    if budget_tokens:
+        candidates[1:] = sorted(candidates[1:], key=lambda c: c["relevance"] / c["tokens"], reverse=True)
+
+    # 2. Deduplicación contra los elegidos y empaquetado. Los chunks vecinos de un
+    #    documento tienen ids consecutivos; el solapamiento se mide sobre el texto original.
+    selected_texts = {}
+    seen_sentences = set()
+    selected = []
+    for candidate in candidates:
+        text = candidate["text"]
+        previous_text = selected_texts.get(candidate["id"] - 1)
+        if previous_text is not None:
+            text = _strip_overlap(previous_text, text)
+        following_text = selected_texts.get(candidate["id"] + 1)
+        if following_text is not None:
+            text = _strip_trailing_overlap(text, following_text)
+
+        sentences = _new_sentences(text, seen_sentences)
+        if not sentences:
+            continue
+        text = " ".join(sentence for _, sentence in sentences)
+
+        if budget_tokens and estimate_tokens("\n".join([*(c["text"] for c in selected), text])) > budget_tokens:
+            if selected:
+                continue
+            text = _truncate_to_budget(text, budget_tokens)
+            sentences = _new_sentences(text, seen_sentences)
+
+        seen_sentences.update(key for key, _ in sentences)
+        selected_texts[candidate["id"]] = candidate["text"]
+        selected.append(dict(candidate, text=text))
+    selected.sort(key=lambda c: c["position"])
+
+    # 3. Contexto final
+    context = "\n".join(candidate["text"] for candidate in selected)
+    context_tokens = estimate_tokens(context)
+    return {
+        "context": context,
+        "chunks_used": len(selected),
+        "context_tokens": context_tokens,
+        "original_tokens": original_tokens,
+        "tokens_saved": max(0, original_tokens - context_tokens),
+    }
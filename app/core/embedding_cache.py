@@ -0,0 +1,136 @@
+# app/core/embedding_cache.py
+
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+import redis
+
+from app.config import settings
+from app.core.text_utils import normalize_query
+
+
+class QueryEmbeddingCache:
+    """
+    Caché de embeddings de consultas: pregunta normalizada -> vector.
+
+    Tiene dos niveles:
+      - En proceso: LRU acotada a `max_entries` con TTL, sin ninguna llamada de red.
+      - Redis (opcional): compartida por todos los workers web; un acierto aquí
+        se copia al nivel local.
+    Si Redis no responde, la caché sigue funcionando solo en memoria.
+    La clave incluye el modelo de embeddings, así nunca se mezclan vectores de
+    modelos distintos.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, redis_url: Optional[str] = None,
+                 namespace: str = "bytchat:query_embedding"):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        # clave -> (instante de expiración, vector)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = redis.Redis.from_url(redis_url) if redis_url else None
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _key(self, model: str, query: str) -> str:
+        digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{model}:{digest}"
+
+    def get_or_embed(self, query: str, embed: Callable[[str], Sequence[float]], model: str = "default") -> np.ndarray:
+        """
+        Devuelve el embedding de `query`, llamando a `embed(query)` solo si no está
+        en ninguno de los dos niveles.
+        """
+        key = self._key(model, query)
+
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector
+
+        vector = self._get_redis(key)
+        if vector is not None:
+            with self._lock:
+                self.redis_hits += 1
+            self._set_local(key, vector)
+            return vector
+
+        with self._lock:
+            self.misses += 1
+        vector = np.asarray(embed(query), dtype="float32")
+        self._set_local(key, vector)
+        self._set_redis(key, vector)
+        return vector
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.local_hits += 1
+            return entry[1]
+
+    def _set_local(self, key: str, vector: np.ndarray):
+        # El vector se comparte entre peticiones: se marca como inmutable
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_redis(self, key: str) -> Optional[np.ndarray]:
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(key)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"QueryEmbeddingCache: Redis no disponible ({e}); se usa solo la caché local.")
+            return None
+        return np.frombuffer(raw, dtype="float32").copy() if raw else None
+
+    def _set_redis(self, key: str, vector: np.ndarray):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(key, vector.astype("float32").tobytes(), ex=self.ttl_seconds)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"QueryEmbeddingCache: no se pudo guardar en Redis ({e}).")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de la caché para monitoreo."""
+        with self._lock:
+            lookups = self.local_hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "redis_enabled": self._redis is not None,
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Instancia única para todo el proceso
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=settings.RAG_QUERY_EMBEDDING_CACHE_SIZE,
+    ttl_seconds=settings.RAG_QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+    redis_url=settings.REDIS_URL if settings.RAG_QUERY_EMBEDDING_CACHE_REDIS else None,
+)
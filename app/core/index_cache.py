@@ -0,0 +1,159 @@
+# app/core/index_cache.py
+
+import os
+import logging
+import threading
+from stat import S_ISREG
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+from app.config import settings
+
+
+def _index_files(index_path: str):
+    """
+    Archivos del índice con su stat. Se ignoran los `*.tmp` a medio escribir y los
+    archivos que desaparecen entre listar y leer (el worker los reemplaza con os.replace).
+    """
+    for name in os.listdir(index_path):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            info = os.stat(os.path.join(index_path, name))
+        except FileNotFoundError:
+            continue
+        if S_ISREG(info.st_mode):
+            yield info
+
+
+def index_mtime(index_path: str) -> float:
+    """
+    Devuelve el mtime más reciente del índice. Los índices se guardan como un
+    directorio con varios archivos, así que se revisan todos.
+    """
+    if os.path.isdir(index_path):
+        mtimes = [info.st_mtime for info in _index_files(index_path)]
+        return max(mtimes) if mtimes else os.path.getmtime(index_path)
+    return os.path.getmtime(index_path)
+
+
+def index_size_bytes(index_path: str) -> int:
+    """Tamaño en disco del índice, usado como estimación de su huella en memoria."""
+    if os.path.isdir(index_path):
+        return sum(info.st_size for info in _index_files(index_path))
+    return os.path.getsize(index_path)
+
+
+class IndexCache:
+    """
+    Caché LRU de índices vectoriales residentes en memoria, compartida por todo el proceso.
+
+    Cada entrada se identifica por su clave (p. ej. el id del bot) junto con la ruta
+    y el mtime del índice en disco: si el worker publica una generación nueva del
+    índice (otra ruta) o lo reescribe en el sitio (otro mtime), la siguiente búsqueda
+    lo vuelve a cargar. El total de bytes residentes se limita a
+    `max_bytes`; al superarlo se expulsan las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # clave -> ((ruta, mtime), índice cargado, tamaño en bytes)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        # Un lock por clave evita que varias peticiones concurrentes carguen el mismo índice
+        self._load_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, index_path: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Devuelve el índice cacheado para `key` si sigue vigente; si no, lo carga con
+        `loader(index_path)` y lo guarda en la caché.
+        """
+        version = (index_path, index_mtime(index_path))
+        cached = self._lookup(key, version)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Otra petición pudo haberlo cargado mientras esperábamos
+            cached = self._lookup(key, version, count=False)
+            if cached is not None:
+                return cached
+
+            with self._lock:
+                self.misses += 1
+            try:
+                value = loader(index_path)
+                self._store(key, version, value, index_size_bytes(index_path))
+                return value
+            finally:
+                # Quien esperaba ya tiene su referencia al lock y encontrará el índice en la
+                # caché; así el diccionario no crece con cada bot que se consultó alguna vez
+                with self._lock:
+                    if self._load_locks.get(key) is load_lock:
+                        del self._load_locks[key]
+
+    def _lookup(self, key: Hashable, version: tuple, count: bool = True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def _store(self, key: Hashable, version: tuple, value: Any, size: int):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._current_bytes -= previous[2]
+
+            if size > self.max_bytes:
+                logging.warning(f"IndexCache: el índice '{key}' ({size} bytes) excede el presupuesto, no se cachea.")
+                return
+
+            self._entries[key] = (version, value, size)
+            self._current_bytes += size
+
+            while self._current_bytes > self.max_bytes and self._entries:
+                evicted_key, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_size
+                self.evictions += 1
+                logging.info(f"IndexCache: índice '{evicted_key}' expulsado ({evicted_size} bytes).")
+
+    def invalidate(self, key: Hashable):
+        """Elimina una entrada de la caché (p. ej. al borrar un bot)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._current_bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de la caché para monitoreo."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Instancia única para todo el proceso: la comparten todas las peticiones de chat
+index_cache = IndexCache(max_bytes=settings.RAG_INDEX_CACHE_MAX_MB * 1024 * 1024)
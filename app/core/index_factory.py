@@ -0,0 +1,116 @@
+# app/core/index_factory.py
+
+import math
+import logging
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+# Estrategias de índice disponibles por bot:
+#   flat     -> búsqueda exacta (IndexFlatL2). Ideal para pocos chunks.
+#   hnsw     -> grafo HNSW sobre vectores completos. Muy buen recall, más memoria.
+#   ivf_sq8  -> IVF con cuantización escalar de 8 bits (4x menos memoria).
+#   ivf_pq   -> IVF con cuantización de producto (la más compacta, menor recall).
+#   auto     -> se elige según la cantidad de vectores al (re)construir el índice.
+INDEX_STRATEGIES = ("auto", "flat", "hnsw", "ivf_sq8", "ivf_pq")
+
+# Umbrales por defecto para la estrategia automática (cantidad de vectores)
+DEFAULT_FLAT_MAX_VECTORS = 20_000
+DEFAULT_HNSW_MAX_VECTORS = 100_000
+DEFAULT_IVF_SQ8_MAX_VECTORS = 1_000_000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# FAISS recomienda ~39 puntos de entrenamiento por centroide
+IVF_MIN_POINTS_PER_LIST = 39
+
+
+def choose_index_strategy(n_vectors: int, requested: str = "auto",
+                          flat_max: int = DEFAULT_FLAT_MAX_VECTORS,
+                          hnsw_max: int = DEFAULT_HNSW_MAX_VECTORS,
+                          ivf_sq8_max: int = DEFAULT_IVF_SQ8_MAX_VECTORS) -> str:
+    """Resuelve la estrategia concreta para un índice de `n_vectors` vectores."""
+    if requested not in INDEX_STRATEGIES:
+        logging.warning(f"Estrategia de índice desconocida '{requested}', se usa 'auto'.")
+        requested = "auto"
+
+    if requested == "auto":
+        if n_vectors <= flat_max:
+            return "flat"
+        if n_vectors <= hnsw_max:
+            return "hnsw"
+        if n_vectors <= ivf_sq8_max:
+            return "ivf_sq8"
+        return "ivf_pq"
+
+    # Los índices IVF necesitan suficientes puntos para entrenar los centroides
+    if requested.startswith("ivf") and n_vectors < IVF_MIN_POINTS_PER_LIST * 16:
+        return "flat"
+    return requested
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    """Número de listas IVF: ~4·sqrt(n), acotado por los puntos disponibles para entrenar."""
+    nlist = int(4 * math.sqrt(n_vectors))
+    nlist = min(nlist, n_vectors // IVF_MIN_POINTS_PER_LIST)
+    return max(16, min(nlist, 65536))
+
+
+def pq_subquantizers(dim: int) -> int:
+    """Subcuantizadores PQ: se busca ~8 dimensiones por subvector, dividiendo exactamente a `dim`."""
+    for m in (dim // 8, 64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if m > 0 and dim % m == 0:
+            return m
+    return 1
+
+
+def default_search_params(strategy: str, n_vectors: int) -> Dict[str, int]:
+    """Parámetros de búsqueda iniciales según la estrategia (ajustables en el manifest o en .env)."""
+    if strategy == "hnsw":
+        return {"efSearch": 64}
+    if strategy.startswith("ivf"):
+        return {"nprobe": max(8, ivf_nlist(n_vectors) // 16)}
+    return {}
+
+
+def build_faiss_index(vectors: np.ndarray, ids: np.ndarray, strategy: str) -> faiss.Index:
+    """
+    Construye un índice FAISS con ids explícitos para la estrategia dada
+    (entrenando los cuantizadores si hace falta).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    n_vectors, dim = vectors.shape
+
+    if strategy == "flat":
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+    elif strategy == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap(hnsw)
+    elif strategy == "ivf_sq8":
+        # Los índices IVF guardan ids propios: no necesitan IndexIDMap
+        index = faiss.index_factory(dim, f"IVF{ivf_nlist(n_vectors)},SQ8")
+    elif strategy == "ivf_pq":
+        index = faiss.index_factory(dim, f"IVF{ivf_nlist(n_vectors)},PQ{pq_subquantizers(dim)}x8")
+    else:
+        raise ValueError(f"Estrategia de índice no soportada: {strategy}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    if n_vectors:
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def make_search_params(strategy: str, search_params: Dict[str, int], k: int) -> Optional[faiss.SearchParameters]:
+    """
+    Parámetros por consulta (no se modifica el índice compartido entre hilos).
+    efSearch nunca puede ser menor que la cantidad de resultados pedidos.
+    """
+    if strategy == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=max(k, int(search_params.get("efSearch", 64))))
+    if strategy.startswith("ivf"):
+        return faiss.SearchParametersIVF(nprobe=int(search_params.get("nprobe", 8)))
+    return None
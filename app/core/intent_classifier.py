@@ -0,0 +1,94 @@
+# app/core/intent_classifier.py
+
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+
+class IntentCentroids:
+    """Centroide normalizado de los ejemplos de cada tipo de tarea; clasifica por similitud coseno."""
+
+    def __init__(self, examples: Iterable[Tuple[str, np.ndarray]]):
+        grouped = defaultdict(list)
+        for task_type, vector in examples:
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                grouped[task_type].append(vector / norm)
+        self.task_types: List[str] = sorted(grouped)
+        self.counts = {task_type: len(grouped[task_type]) for task_type in self.task_types}
+        matrix = np.array([np.mean(grouped[task_type], axis=0) for task_type in self.task_types], dtype="float32")
+        if len(matrix):
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._matrix = matrix
+
+    def nearest(self, vector: np.ndarray) -> Optional[Tuple[str, float]]:
+        """(tipo de tarea, similitud) del centroide más cercano, o None sin ejemplos."""
+        norm = np.linalg.norm(vector)
+        if not self.task_types or norm == 0:
+            return None
+        similarities = self._matrix @ (np.asarray(vector, dtype="float32") / norm)
+        best = int(np.argmax(similarities))
+        return self.task_types[best], float(similarities[best])
+
+
+def load_intent_examples(db: Session, bot_id: int, embedding_model: str) -> List[Tuple[str, np.ndarray]]:
+    """Ejemplos del bot calculados con `embedding_model` (los de otro modelo no son comparables)."""
+    rows = db.query(models.BotIntentExample).filter(
+        models.BotIntentExample.bot_id == bot_id,
+        models.BotIntentExample.embedding_model == embedding_model,
+    ).all()
+    return [(row.task_type, np.frombuffer(row.embedding, dtype="float32")) for row in rows]
+
+
+class IntentClassifier:
+    """
+    Clasificador del tipo de tarea de una consulta por centroide más cercano.
+
+    Los centroides se calculan una vez por (bot, versión de configuración, modelo de
+    embeddings) a partir de bot_intent_examples y se guardan en una LRU del proceso;
+    añadir o borrar ejemplos incrementa la versión del bot. El vector de la consulta
+    es el mismo que usa la recuperación, así que clasificar no hace llamadas de red.
+    """
+
+    def __init__(self, max_entries: int = 1024, min_similarity: float = 0.0):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self._centroids: "OrderedDict[Hashable, IntentCentroids]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def centroids(self, db: Session, bot_id: int, config_version: int, embedding_model: str) -> IntentCentroids:
+        key = (bot_id, config_version, embedding_model)
+        with self._lock:
+            centroids = self._centroids.get(key)
+            if centroids is not None:
+                self._centroids.move_to_end(key)
+                return centroids
+        centroids = IntentCentroids(load_intent_examples(db, bot_id, embedding_model))
+        with self._lock:
+            self._centroids[key] = centroids
+            while len(self._centroids) > self.max_entries:
+                self._centroids.popitem(last=False)
+        return centroids
+
+    def classify(self, db: Session, bot_id: int, config_version: int, embedding_model: str,
+                 vector: np.ndarray) -> Optional[str]:
+        """Tipo de tarea de la consulta, o None si el bot no tiene ejemplos o la similitud no llega al mínimo."""
+        result = self.centroids(db, bot_id, config_version, embedding_model).nearest(vector)
+        if result is None:
+            return None
+        task_type, similarity = result
+        if similarity < self.min_similarity:
+            logging.info(f"IntentClassifier: '{task_type}' con similitud {similarity:.3f} por debajo del mínimo")
+            return None
+        return task_type
+
+
+# Instancia única para todo el proceso
+intent_classifier = IntentClassifier(min_similarity=settings.INTENT_MIN_SIMILARITY)
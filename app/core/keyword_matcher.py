@@ -0,0 +1,106 @@
+# app/core/keyword_matcher.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+from app.core.text_utils import fold_accents
+
+# Reglas por defecto (bots sin routing_keywords). "*" al final = prefijo ("analiz*" -> analiza, analizar, análisis...)
+DEFAULT_KEYWORD_RULES: Dict[str, List[str]] = {
+    "complex": [
+        "analiz*", "análisis", "resum*", "traduc*", "explic*", "código", "tabla*",
+        "lista*", "optimiz*", "compar*", "crea*"
+    ],
+}
+
+
+def _fold(text: str) -> str:
+    return fold_accents(text.lower())
+
+
+_END = ""  # marca de fin de palabra en el trie: "word" (palabra completa) o "prefix"
+
+
+def _trie_pattern(node: dict) -> str:
+    """
+    Regex equivalente a un trie de palabras: los prefijos comunes se comparten, así que
+    en cada posición de la consulta se avanza carácter a carácter en lugar de probar
+    cada palabra por separado (mismo efecto que un autómata Aho-Corasick para esto).
+    """
+    end = node.get(_END)
+    if end == "prefix":
+        # Cualquier continuación también coincide; basta con llegar aquí
+        return ""
+    alternatives = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != _END]
+    if end == "word":
+        alternatives.append(r"(?!\w)")
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+class KeywordMatcher:
+    """
+    Reglas palabra clave -> tipo de tarea compiladas en una sola expresión regular.
+
+    Sin distinguir tildes ni mayúsculas ("codigo" == "Código") y por palabra completa
+    ("lista" no coincide con "especialista"), salvo las palabras terminadas en "*",
+    que se comparan como prefijo. `classify` recorre la consulta una sola vez; si
+    coinciden varios tipos gana el primero de las reglas.
+    """
+
+    def __init__(self, rules: Dict[str, List[str]]):
+        self.task_types = [task_type for task_type, keywords in rules.items() if keywords]
+        groups = []
+        for index, task_type in enumerate(self.task_types):
+            trie = {}
+            for keyword in rules[task_type]:
+                keyword = _fold(keyword.strip())
+                prefix = keyword.endswith("*")
+                keyword = keyword.rstrip("*").strip()
+                if not keyword:
+                    continue
+                node = trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                if node.get(_END) != "prefix":
+                    node[_END] = "prefix" if prefix else "word"
+            if trie:
+                groups.append(f"(?P<t{index}>{_trie_pattern(trie)})")
+        # Lookahead: las coincidencias no consumen texto, así una palabra clave larga de un tipo no tapa
+        # otra del tipo prioritario que empiece dentro de ella
+        self._regex = re.compile(r"(?<!\w)(?=" + "|".join(groups) + ")") if groups else None
+
+    def classify(self, query: str) -> Optional[str]:
+        if self._regex is None:
+            return None
+        found = {int(match.lastgroup[1:]) for match in self._regex.finditer(_fold(query))}
+        return self.task_types[min(found)] if found else None
+
+
+class KeywordMatcherCache:
+    """Matchers compilados por clave (bot, versión de configuración); LRU acotado."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._matchers: "OrderedDict[Hashable, KeywordMatcher]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._default = KeywordMatcher(DEFAULT_KEYWORD_RULES)
+
+    def get(self, key: Hashable, rules: Optional[Dict[str, List[str]]]) -> KeywordMatcher:
+        if not rules:
+            return self._default
+        with self._lock:
+            matcher = self._matchers.get(key)
+            if matcher is not None:
+                self._matchers.move_to_end(key)
+                return matcher
+        # Compilar fuera del lock: dos hilos pueden compilar la misma versión, el resultado es el mismo
+        matcher = KeywordMatcher(rules)
+        with self._lock:
+            self._matchers[key] = matcher
+            while len(self._matchers) > self.max_entries:
+                self._matchers.popitem(last=False)
+        return matcher
@@ -0,0 +1,58 @@
+# app/core/latency_tracker.py
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional
+
+import numpy as np
+
+from app.config import settings
+
+
+class LatencyTracker:
+    """
+    Ventana deslizante de latencias (p. ej. tiempo al primer trozo, en ms) por clave,
+    en memoria del proceso. Se usa para calcular percentiles recientes por bot y
+    por modelo sin ir a la base de datos.
+    """
+
+    def __init__(self, max_samples: int = 500, min_samples: int = 20):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._samples: Dict[Hashable, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Hashable, value_ms: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.max_samples)
+            samples.append(value_ms)
+
+    def percentile(self, key: Hashable, q: float) -> Optional[float]:
+        """Percentil `q` (0-100) de la clave, o None si aún no hay `min_samples` muestras."""
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.percentile(samples, q))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+        return {
+            "/".join(str(part) for part in (key if isinstance(key, tuple) else (key,))): {
+                "samples": len(samples),
+                "p50_ms": round(float(np.percentile(samples, 50)), 1),
+                "p90_ms": round(float(np.percentile(samples, 90)), 1),
+                "p99_ms": round(float(np.percentile(samples, 99)), 1),
+            }
+            for key, samples in snapshot.items() if samples
+        }
+
+
+# Tiempo al primer trozo por (bot, proveedor, modelo) y por (proveedor, modelo)
+ttft_tracker = LatencyTracker(
+    max_samples=settings.HEDGING_TTFT_WINDOW,
+    min_samples=settings.HEDGING_MIN_SAMPLES,
+)
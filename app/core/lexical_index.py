@@ -0,0 +1,170 @@
+# app/core/lexical_index.py
+
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.text_utils import fold_accents
+
+# Términos con separadores internos se conservan enteros: "AB-123", "v2.1", "ref_88"
+_TOKEN_RE = re.compile(r"[0-9a-zñ]+(?:[-_./][0-9a-zñ]+)*")
+_SEPARATORS_RE = re.compile(r"[-_./]")
+
+_STOPWORDS = frozenset("""
+a al algo como con cual cuales de del donde el ella ellas ellos en era es esa ese eso esta este esto
+ha hay la las le les lo los mas me mi mis muy no nos o para pero por que quien se sea ser si sin
+sobre son su sus te tu tus un una uno unos y ya
+an and are as at be by for from how in is it of on or the this to what when where which who with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokens para el índice léxico: minúsculas, sin tildes, sin stopwords.
+    Los códigos compuestos ("AB-123") generan además sus partes y la forma
+    sin separadores ("ab", "123", "ab123") para que coincidan escritos de otra manera.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(fold_accents(text.lower())):
+        if token in _STOPWORDS or (len(token) == 1 and not token.isdigit()):
+            continue
+        tokens.append(token)
+        parts = _SEPARATORS_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in _STOPWORDS)
+            tokens.append("".join(parts))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Combina varias listas ordenadas de ids con Reciprocal Rank Fusion:
+    score(id) = Σ 1 / (k + posición). Devuelve (id, score) de mayor a menor.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for position, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + position)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    Índice invertido BM25 de los chunks de un bot, guardado junto al índice vectorial.
+
+    Formato compacto en arrays planos (se abren con mmap, como MmapChunkStore):
+      - bm25_terms.json: vocabulario ordenado + estadísticas (avgdl, k1, b)
+      - bm25_offsets.npy: inicio de las postings de cada término (n_terms + 1)
+      - bm25_postings.npy: fila del chunk de cada posting (int32)
+      - bm25_tfs.npy: frecuencia del término en el chunk (uint16)
+      - bm25_doc_ids.npy / bm25_doc_lens.npy: id de vector y longitud de cada fila
+    Se reconstruye completo al guardar el índice del bot (tokenizar es barato
+    comparado con vectorizar).
+    """
+
+    TERMS_FILE = "bm25_terms.json"
+    OFFSETS_FILE = "bm25_offsets.npy"
+    POSTINGS_FILE = "bm25_postings.npy"
+    TFS_FILE = "bm25_tfs.npy"
+    DOC_IDS_FILE = "bm25_doc_ids.npy"
+    DOC_LENS_FILE = "bm25_doc_lens.npy"
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, postings: np.ndarray, tfs: np.ndarray,
+                 doc_ids: np.ndarray, doc_lens: np.ndarray, avgdl: float, k1: float = 1.2, b: float = 0.75):
+        self.term_index = {term: position for position, term in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_ids = doc_ids
+        self.doc_lens = doc_lens
+        self.avgdl = avgdl or 1.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, chunks: Dict[int, str]) -> "LexicalIndex":
+        doc_ids = np.array(sorted(chunks), dtype=np.int64)
+        doc_lens = np.zeros(len(doc_ids), dtype=np.int32)
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        for row, vector_id in enumerate(doc_ids.tolist()):
+            counts = Counter(tokenize(chunks[vector_id]))
+            doc_lens[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_postings.setdefault(term, []).append((row, min(tf, 65535)))
+
+        terms = sorted(term_postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_postings[term]) for term in terms])
+        postings = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for position, term in enumerate(terms):
+            rows, freqs = zip(*term_postings[term])
+            postings[offsets[position]:offsets[position + 1]] = rows
+            tfs[offsets[position]:offsets[position + 1]] = freqs
+
+        avgdl = float(doc_lens.mean()) if len(doc_lens) else 1.0
+        return cls(terms, offsets, postings, tfs, doc_ids, doc_lens, avgdl)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, cls.TERMS_FILE))
+
+    @classmethod
+    def open(cls, path: str) -> "LexicalIndex":
+        with open(os.path.join(path, cls.TERMS_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = [
+            np.load(os.path.join(path, file_name), mmap_mode="r")
+            for file_name in (cls.OFFSETS_FILE, cls.POSTINGS_FILE, cls.TFS_FILE, cls.DOC_IDS_FILE, cls.DOC_LENS_FILE)
+        ]
+        return cls(meta["terms"], *arrays, avgdl=meta["avgdl"], k1=meta["k1"], b=meta["b"])
+
+    def write(self, path: str):
+        """Escribe los arrays y el vocabulario en `path` (la generación nueva del índice del bot)."""
+        for file_name, array in ((self.OFFSETS_FILE, self.offsets), (self.POSTINGS_FILE, self.postings),
+                                 (self.TFS_FILE, self.tfs), (self.DOC_IDS_FILE, self.doc_ids),
+                                 (self.DOC_LENS_FILE, self.doc_lens)):
+            np.save(os.path.join(path, file_name), array)
+
+        with open(os.path.join(path, self.TERMS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"terms": self.terms, "avgdl": self.avgdl, "k1": self.k1, "b": self.b}, f, ensure_ascii=False)
+
+    def search(self, query: str, k: int = 20,
+               accept: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """
+        Devuelve hasta `k` pares (vector_id, score BM25) de mayor a menor.
+        `accept(vector_id)` permite descartar chunks (documentos borrados o no completados).
+        """
+        n_docs = len(self.doc_ids)
+        if not n_docs:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            position = self.term_index.get(term)
+            if position is None:
+                continue
+            start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+            rows = np.asarray(self.postings[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype="float32")
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lens[rows]) / self.avgdl)
+            for row, value in zip(rows.tolist(), (idf * tf * (self.k1 + 1) / (tf + norm)).tolist()):
+                scores[row] = scores.get(row, 0.0) + value
+
+        results = []
+        for row, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            vector_id = int(self.doc_ids[row])
+            if accept is not None and not accept(vector_id):
+                continue
+            results.append((vector_id, score))
+            if len(results) == k:
+                break
+        return results
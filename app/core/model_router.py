@@ -1,24 +1,68 @@
+import random
 import logging
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.core.model_stats import ModelStats, model_stats
+from app.core.keyword_matcher import KeywordMatcherCache
+from app.services.pricing import PricingResolver, pricing_resolver
 
 logging.basicConfig(level=logging.INFO)
 
+# Objetivos de enrutado por bot (Bot.routing_objective)
+#   keywords: comportamiento clásico, modelo 'complex' si la consulta lo pide y si no el 'general'
+#   cheapest: el más barato cuyo TTFT p95 reciente cumple el SLO de latencia del bot
+#   fastest:  el de menor TTFT p95 reciente
+ROUTING_OBJECTIVES = ("keywords", "cheapest", "fastest")
+
+# Tokens supuestos por pregunta mientras un modelo no tiene estadísticas (igual que MetricsService.get_model_info)
+DEFAULT_PROMPT_TOKENS = 150
+DEFAULT_COMPLETION_TOKENS = 100
+
+
 class ModelRouter:
-    def __init__(self):
-        self.complex_keywords = [
-            "analiza", "resume", "traduce", "explica", "código", 
-            "tabla", "lista", "optimiza", "compara", "crea"
-        ]
+    def __init__(self, stats: ModelStats = None, prices: Dict[Tuple[str, str], Tuple[float, float]] = None,
+                 exploration_rate: float = None, seed: int = None):
+        # Reglas palabra clave -> tipo de tarea compiladas por (bot, versión de configuración)
+        self.keyword_matchers = KeywordMatcherCache()
+        self.stats = stats or model_stats
+        # Precios fijos (simulador) o None = la tabla de precios del proceso
+        self.pricing = PricingResolver(loader=lambda: dict(prices)) if prices is not None else pricing_resolver
+        self.exploration_rate = settings.ROUTER_EXPLORATION_RATE if exploration_rate is None else exploration_rate
+        self._random = random.Random(seed)
+        self.decisions = Counter()
         logging.info("ModelRouter (Toolbox) inicializado.")
 
-    def select_model(self, query: str, available_models: list):
-        lower_query = query.lower()
-        # 1. Buscar modelo complejo si la consulta lo requiere
-        for keyword in self.complex_keywords:
-            if keyword in lower_query:
-                for model_config in available_models:
-                    if model_config['task_type'] == 'complex' and model_config['is_active']:
-                        logging.info(f"ModelRouter: Consulta compleja. Usando modelo 'complex': {model_config['model_id']}")
-                        return model_config
+    def select_model(self, query: str, available_models: list, objective: str = None, latency_slo_ms: int = None,
+                     keyword_rules: dict = None, rules_key=None, task_type: str = None):
+        """
+        Elige el modelo para la consulta. `keyword_rules` son las reglas del bot
+        ({tipo de tarea: [palabras]}, None = DEFAULT_KEYWORD_RULES) y `rules_key` la clave
+        con la que se cachea su compilación (p. ej. (bot_id, config_version)).
+        `task_type` es el tipo ya clasificado por otro medio (p. ej. IntentClassifier);
+        si llega, no se miran las palabras clave.
+        """
+        if task_type is None:
+            task_type = self.keyword_matchers.get(rules_key, keyword_rules).classify(query)
+        if objective in (None, "keywords"):
+            return self._select_by_keywords(task_type, available_models)
+
+        candidates = self._eligible(task_type, available_models)
+        if not candidates:
+            logging.warning("ModelRouter: No se encontró un modelo adecuado en la configuración del bot.")
+            return None
+        model_config = self._choose(candidates, objective, latency_slo_ms or settings.ROUTER_DEFAULT_LATENCY_SLO_MS)
+        logging.info(f"ModelRouter: objetivo '{objective}', se usa {model_config['provider']}/{model_config['model_id']}")
+        return model_config
+
+    def _select_by_keywords(self, task_type: str, available_models: list):
+        # 1. Buscar modelo del tipo que piden las palabras clave de la consulta (p. ej. 'complex')
+        if task_type:
+            for model_config in available_models:
+                if model_config['task_type'] == task_type and model_config['is_active']:
+                    logging.info(f"ModelRouter: Consulta de tipo '{task_type}'. Usando modelo: {model_config['model_id']}")
+                    return model_config
 
         # 2. Buscar modelo simple/general
         for model_config in available_models:
@@ -35,3 +79,65 @@ class ModelRouter:
         logging.warning("ModelRouter: No se encontró un modelo adecuado en la configuración del bot.")
         return None
 
+    def _eligible(self, task_type: str, available_models: list) -> list:
+        """Modelos activos del tipo que pide la consulta; si el bot no tiene ninguno de ese tipo, todos los activos."""
+        active = [m for m in available_models if m['is_active']]
+        task_types = [task_type] if task_type else ['general', 'simple']
+        return [m for m in active if m['task_type'] in task_types] or active
+
+    def _choose(self, candidates: list, objective: str, latency_slo_ms: int) -> dict:
+        if len(candidates) == 1:
+            return candidates[0]
+        if self._random.random() < self.exploration_rate:
+            # Exploración: sin ella un modelo descartado no vuelve a medirse nunca
+            self.decisions["explore"] += 1
+            return self._random.choice(candidates)
+
+        snapshots = [(config, self.stats.snapshot(config['provider'], config['model_id'])) for config in candidates]
+        # Sin estadísticas suficientes se asume que el modelo cumple (así empieza a recibir tráfico y se mide)
+        healthy = [
+            (config, snapshot) for config, snapshot in snapshots
+            if snapshot is None or snapshot["error_rate"] <= settings.ROUTER_MAX_ERROR_RATE
+        ] or snapshots
+
+        def ttft_p95(item):
+            snapshot = item[1]
+            return (snapshot or {}).get("ttft_p95_ms") or 0.0
+
+        if objective == "fastest":
+            self.decisions["fastest"] += 1
+            return min(healthy, key=ttft_p95)[0]
+
+        within_slo = [item for item in healthy if ttft_p95(item) <= latency_slo_ms]
+        if not within_slo:
+            # Ninguno cumple el SLO: el más rápido es el que menos lo incumple
+            self.decisions["slo_miss"] += 1
+            return min(healthy, key=ttft_p95)[0]
+        self.decisions["cheapest"] += 1
+        return min(within_slo, key=lambda item: self.expected_cost(item[0]['provider'], item[0]['model_id'], item[1]))[0]
+
+    def price(self, provider: str, model_id: str) -> Tuple[float, float]:
+        """USD por 1K tokens (entrada, salida) según la tabla de precios en memoria."""
+        return self.pricing.price(provider, model_id)
+
+    def expected_cost(self, provider: str, model_id: str, snapshot: Optional[dict] = None) -> float:
+        """Costo esperado por pregunta en USD según los tokens medios recientes del modelo."""
+        input_cost_per_1k, output_cost_per_1k = self.price(provider, model_id)
+        prompt_tokens = (snapshot or {}).get("avg_prompt_tokens") or DEFAULT_PROMPT_TOKENS
+        completion_tokens = (snapshot or {}).get("avg_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+        return prompt_tokens / 1000 * input_cost_per_1k + completion_tokens / 1000 * output_cost_per_1k
+
+    def routing_stats(self) -> dict:
+        """Estadísticas por modelo con su precio y costo esperado, y el recuento de decisiones del router."""
+        models_stats = self.stats.stats()
+        for key, summary in models_stats.items():
+            provider, model_id = key.split("/", 1)
+            input_cost_per_1k, output_cost_per_1k = self.price(provider, model_id)
+            summary["input_cost_per_1k"] = input_cost_per_1k
+            summary["output_cost_per_1k"] = output_cost_per_1k
+            summary["expected_cost_per_query_usd"] = round(self.expected_cost(provider, model_id, summary), 6)
+        return {"models": models_stats, "decisions": dict(self.decisions)}
+
+
+# Instancia única para todo el proceso (guarda precios y decisiones; las estadísticas están en model_stats)
+model_router = ModelRouter()
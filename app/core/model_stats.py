@@ -0,0 +1,74 @@
+# app/core/model_stats.py
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+
+class ModelStats:
+    """
+    Estadísticas recientes por (proveedor, modelo) en memoria del proceso: tiempo al
+    primer trozo, tokens por segundo, tokens de prompt/respuesta y tasa de error sobre
+    las últimas `window` llamadas. Las usa el ModelRouter para elegir modelo.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 10):
+        self.window = window
+        self.min_samples = min_samples
+        # (proveedor, modelo) -> deque de llamadas: (ok, ttft_ms, tokens_por_s, prompt_tokens, completion_tokens)
+        self._calls: Dict[Tuple[str, str], Deque[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, provider: str, model_id: str) -> Deque[tuple]:
+        key = (provider, model_id)
+        calls = self._calls.get(key)
+        if calls is None:
+            calls = self._calls[key] = deque(maxlen=self.window)
+        return calls
+
+    def record_success(self, provider: str, model_id: str, ttft_ms: float, tokens_per_second: Optional[float],
+                       prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self._window(provider, model_id).append(
+                (True, ttft_ms, tokens_per_second, prompt_tokens, completion_tokens)
+            )
+
+    def record_failure(self, provider: str, model_id: str):
+        with self._lock:
+            self._window(provider, model_id).append((False, None, None, None, None))
+
+    def snapshot(self, provider: str, model_id: str) -> Optional[Dict[str, Any]]:
+        """Resumen del modelo, o None si aún no tiene `min_samples` llamadas."""
+        with self._lock:
+            calls = list(self._calls.get((provider, model_id), ()))
+        if len(calls) < self.min_samples:
+            return None
+        return self._summary(calls)
+
+    @staticmethod
+    def _summary(calls: list) -> Dict[str, Any]:
+        ok = [call for call in calls if call[0]]
+        ttfts = [call[1] for call in ok]
+        rates = [call[2] for call in ok if call[2]]
+        return {
+            "samples": len(calls),
+            "error_rate": round(1 - len(ok) / len(calls), 4),
+            "ttft_p50_ms": round(float(np.percentile(ttfts, 50)), 1) if ttfts else None,
+            "ttft_p95_ms": round(float(np.percentile(ttfts, 95)), 1) if ttfts else None,
+            "tokens_per_second": round(float(np.mean(rates)), 1) if rates else None,
+            "avg_prompt_tokens": round(float(np.mean([call[3] for call in ok])), 1) if ok else None,
+            "avg_completion_tokens": round(float(np.mean([call[4] for call in ok])), 1) if ok else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {key: list(calls) for key, calls in self._calls.items()}
+        return {f"{provider}/{model_id}": self._summary(calls) for (provider, model_id), calls in snapshot.items() if calls}
+
+
+# Instancia única para todo el proceso
+model_stats = ModelStats(window=settings.ROUTER_STATS_WINDOW, min_samples=settings.ROUTER_MIN_SAMPLES)
@@ -1,47 +1,267 @@
+import copy
+import time
+import asyncio
 import logging
+from collections import Counter
+from contextlib import aclosing
 from sqlalchemy.orm import Session
 from app.core.rag_retriever import RAGRetriever
-from app.core.model_router import ModelRouter
-from app.connectors.google_connector import GoogleConnector
-from app.connectors.openai_connector import OpenAIConnector
-from app.connectors.deepseek_connector import DeepSeekConnector
+from app.core.context_builder import build_context
+from app.core.cache_manager import response_cache
+from app.core.semantic_cache import semantic_cache
+from app.core.single_flight import single_flight
+from app.core.circuit_breaker import circuit_breaker
+from app.core.latency_tracker import ttft_tracker
+from app.core.model_stats import model_stats
+from app.core.intent_classifier import intent_classifier
+from app.core.text_utils import estimate_tokens
+from app.core.embedding_cache import query_embedding_cache
+from app.embeddings import get_embedding_backend
+from app.core.model_router import model_router
+from app.connectors.registry import connector_registry
+from app.connectors.base_connector import ConnectorError, is_error_response
 from app.services.metrics_service import MetricsService
+from app.services.pricing import pricing_resolver
+from app.database import SessionLocal
+from app.config import settings
 from app import schemas
 
+# Componentes sin estado por petición: se crean una sola vez por proceso
+_retriever = RAGRetriever()
+
+# Contadores de hedging del proceso (ver Orchestrator._hedged)
+hedging_counts = Counter()
+
+NO_PROVIDER_RESPONSE = "Lo siento, ahora mismo no puedo conectar con ningún modelo de IA. Inténtalo de nuevo en unos minutos."
+
+
+async def _with_first_chunk_timeout(stream, timeout: float):
+    """Reenvía `stream`, lanzando ConnectorError si el primer trozo tarda más de `timeout` segundos."""
+    try:
+        if timeout:
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise ConnectorError(f"sin respuesta en {timeout:g}s")
+            yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+
+
 class Orchestrator:
     def __init__(self, db: Session, bot_config: dict, bot_id: int, user_id: int = None):
         self.db = db
         self.bot_config = bot_config
         self.bot_id = bot_id
         self.user_id = user_id
-        self.router = ModelRouter()
-        self.retriever = RAGRetriever()
+        self.router = model_router
+        self.retriever = _retriever
         self.metrics_service = MetricsService(db)
-        
-        self.connectors = {
-            "google": GoogleConnector(),
-            "openai": OpenAIConnector(),
-            "deepseek": DeepSeekConnector()
-        }
+        # Los conectores se construyen bajo demanda y se comparten (ver app/connectors/registry.py)
+        self.connectors = connector_registry
         logging.info(f"Orquestador inicializado para el bot {bot_id}.")
 
-    def handle_query(self, user_id: str, query: str, track_metrics: bool = True):
+    def _get_connector(self, provider_name: str):
+        """Conector compartido del proveedor, o None si no existe o no se pudo inicializar."""
+        try:
+            return self.connectors.get(provider_name)
+        except (KeyError, ValueError) as e:
+            logging.error(str(e))
+            return None
+
+    def _retrieve_context(self, query: str):
+        """
+        Recupera los chunks relevantes y arma el contexto dentro del presupuesto de
+        tokens del bot (None = presupuesto global, 0 = sin límite).
+        Devuelve None si no hay contexto.
         """
-        Maneja una consulta con soporte para métricas opcionales
+        chunks = self.retriever.search_chunks(
+            db=self.db, bot_id=self.bot_id, query=query,
+            mode=self.bot_config.get("retrieval_mode", "vector")
+        )
+        if not chunks:
+            return None
+
+        budget = self.bot_config.get("context_token_budget")
+        if budget is None:
+            budget = settings.RAG_CONTEXT_TOKEN_BUDGET
+        context = build_context(chunks, budget_tokens=budget)
+        context["chunk_ids"] = [chunk["id"] for chunk in chunks]
+        logging.info(
+            f"Contexto: {context['chunks_used']}/{len(chunks)} chunks, "
+            f"{context['context_tokens']} tokens ({context['tokens_saved']} ahorrados)"
+        )
+        return context
+
+    def _semantic_cache_params(self, query: str):
+        """
+        Umbral, modelo de embeddings y vector de la pregunta para la caché semántica,
+        o None si el bot no la tiene activada. El vector sale de la caché de embeddings
+        (ya se calculó en la recuperación).
+        """
+        threshold = self.bot_config.get("semantic_cache_threshold") or settings.SEMANTIC_CACHE_THRESHOLD
+        if not threshold:
+            return None
+        try:
+            backend = get_embedding_backend(self.bot_config.get("embedding_backend") or settings.DEFAULT_EMBEDDING_BACKEND)
+            vector = query_embedding_cache.get_or_embed(query, backend.embed_query, model=backend.cache_key)
+        except Exception as e:
+            logging.warning(f"Caché semántica desactivada para esta petición: {e}")
+            return None
+        return {"threshold": threshold, "model": backend.cache_key, "vector": vector}
+
+    async def _serve_cached(self, user_id: str, query: str, cached: dict, track_metrics: bool):
+        """Entrega en stream una respuesta cacheada y la registra como acierto de caché."""
+        if track_metrics and self.user_id and isinstance(self.user_id, int):
+            await asyncio.to_thread(
+                self.metrics_service.record_cache_hit,
+                user_id=self.user_id,
+                bot_id=self.bot_id,
+                user_anon_id=user_id if not isinstance(self.user_id, int) else None,
+                query=query,
+                provider=cached["provider"],
+                model_id=cached["model_id"]
+            )
+        for piece in response_cache.stream(cached["response"]):
+            yield piece
+
+    def _store_response(self, cache_key, semantic, query: str, response_text: str, provider: str, model_id: str):
+        """Guarda una respuesta válida en la caché exacta y, si aplica, en la semántica."""
+        if not response_text or is_error_response(response_text):
+            return
+        if cache_key:
+            response_cache.set(cache_key, response_text, provider, model_id)
+        if semantic:
+            semantic_cache.add(
+                self.bot_id, self.bot_config.get("config_version", 1), semantic["model"],
+                semantic["vector"], query, response_text, provider, model_id
+            )
+
+    async def handle_query(self, user_id: str, query: str, track_metrics: bool = True):
+        """
+        Maneja una consulta con soporte para métricas opcionales (generador asíncrono:
+        la generación del modelo no ocupa un hilo del servidor; las partes bloqueantes
+        como la recuperación, Redis o la base de datos se ejecutan en hilos)
         
         Args:
             user_id: ID del usuario (puede ser anónimo)
             query: Consulta del usuario
             track_metrics: Si True, registra métricas (requiere user_id numérico para facturación)
+
+        Las preguntas idénticas que llegan mientras otra igual está en curso (mismo bot y
+        misma configuración) no vuelven a llamar al modelo: reciben el mismo stream. El
+        límite de tokens se comprueba antes, así que también se aplica a esas peticiones.
         """
         logging.info(f"\n--- Petición para el Bot ID: {self.bot_id} ---")
 
-        relevant_chunks = self.retriever.search(db=self.db, bot_id=self.bot_id, query=query)
+        # Usuarios con facturación: reserva del costo estimado antes de responder
+        billed = track_metrics and self.user_id and isinstance(self.user_id, int)
+        reservation = None
+        if billed:
+            limit_check = await asyncio.to_thread(self._reserve_quota, query)
+            if not limit_check["allowed"]:
+                yield "Lo siento, has alcanzado el límite de tokens de tu plan gratuito. Por favor, actualiza tu plan para continuar."
+                return
+            reservation = limit_check.get("reservation")
+
+        try:
+            if not settings.SINGLE_FLIGHT_ENABLED:
+                async with aclosing(self._answer_query(user_id, query, track_metrics, reservation)) as chunks:
+                    async for chunk in chunks:
+                        yield chunk
+                return
+
+            key = single_flight.make_key(self.bot_id, self.bot_config.get("config_version", 1), query)
+
+            async def on_follow(meta: dict):
+                # Respuesta compartida con otra petición: acierto de caché con el modelo que respondió al líder
+                logging.info("Respuesta compartida con una petición idéntica en curso (single-flight)")
+                if billed:
+                    await asyncio.to_thread(
+                        self.metrics_service.record_cache_hit,
+                        user_id=self.user_id,
+                        bot_id=self.bot_id,
+                        user_anon_id=None,
+                        query=query,
+                        provider=meta.get("provider", "unknown"),
+                        model_id=meta.get("model_id", "unknown")
+                    )
+
+            async def on_model(provider_name: str, model_id_name: str):
+                await single_flight.annotate(key, {"provider": provider_name, "model_id": model_id_name})
+
+            shared = single_flight.stream(
+                key, lambda: self._answer_query_detached(user_id, query, track_metrics, reservation, on_model),
+                on_follow=on_follow
+            )
+            async with aclosing(shared):
+                async for chunk in shared:
+                    yield chunk
+        finally:
+            # Lo que no liquidó ningún consumo (caché, respuesta compartida o ningún modelo respondió) vuelve al saldo
+            if reservation:
+                await asyncio.to_thread(self.metrics_service.release_bytokens, self.user_id, reservation)
+
+    async def _answer_query_detached(self, user_id: str, query: str, track_metrics: bool,
+                                     reservation: str, on_model):
+        """
+        `_answer_query` para single-flight. La generación corre en una tarea aparte que
+        sigue mientras alguna suscriptora lea, aunque la petición que la lanzó ya haya
+        terminado y cerrado su sesión: usa una sesión propia de la base de datos.
+        """
+        db = SessionLocal()
+        producer = copy.copy(self)
+        producer.db = db
+        producer.metrics_service = MetricsService(db)
+        try:
+            async with aclosing(producer._answer_query(user_id, query, track_metrics, reservation, on_model)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await asyncio.to_thread(db.close)
+
+    def _reserve_quota(self, query: str) -> dict:
+        """
+        Reserva en el saldo de Redis el costo estimado de responder `query` (o, si no está
+        disponible, lo verifica en la base de datos). Aún no se sabe qué modelo responderá:
+        se estima con el system prompt, la pregunta y el presupuesto de contexto del bot,
+        al precio del modelo activo más caro del bot.
+        Returns: {"allowed": bool, "reservation": id o None, ...}
+        """
+        budget = self.bot_config.get("context_token_budget")
+        if budget is None:
+            budget = settings.RAG_CONTEXT_TOKEN_BUDGET
+        estimated_tokens = estimate_tokens(self.bot_config.get("system_prompt", "") + query) + (budget or 0)
+
+        active = [config for config in self.bot_config.get("model_configs", []) if config.get("is_active")]
+        priciest = max(
+            active, key=lambda config: sum(pricing_resolver.price(config.get("provider"), config.get("model_id"))),
+            default={}
+        )
+        limit_check = self.metrics_service.reserve_bytokens(
+            self.user_id, priciest.get("provider"), priciest.get("model_id") or "default", estimated_tokens
+        )
+        if limit_check is None:
+            limit_check = self.metrics_service.check_token_limit(self.user_id, estimated_tokens)
+        return limit_check
+
+    async def _answer_query(self, user_id: str, query: str, track_metrics: bool = True,
+                            reservation: str = None, on_model=None):
+        """
+        Recuperación, cachés y llamada al modelo para una consulta (ver handle_query).
+        `reservation` es la reserva de BytTokens que liquida el consumo; `await on_model(proveedor,
+        modelo)` se llama con el modelo (o la entrada de caché) que dio la respuesta.
+        """
+
+        retrieved = await asyncio.to_thread(self._retrieve_context, query)
         
         # Construir el prompt según si hay contexto o no
-        if relevant_chunks:
-            context = "\n".join(relevant_chunks)
-            logging.info(f"Contexto recuperado para la pregunta: {len(relevant_chunks)} chunks")
+        if retrieved:
+            context = retrieved["context"]
             prompt_package = {
                 "system_prompt": self.bot_config.get("system_prompt", "Eres un asistente de IA."),
                 "user_question": f"Usando el siguiente contexto, responde la pregunta.\n\nCONTEXTO:\n{context}\n\nPREGUNTA:\n{query}"
@@ -57,83 +277,333 @@ class Orchestrator:
                 )
             }
 
-        available_models = self.bot_config.get("model_configs", [])
-        chosen_model_config = self.router.select_model(query, available_models)
+        # Caché de respuestas exactas: misma pregunta, mismos chunks y misma configuración del bot
+        cache_key = None
+        if settings.RESPONSE_CACHE_ENABLED:
+            cache_key = response_cache.make_key(
+                self.bot_id, self.bot_config.get("config_version", 1), query,
+                retrieved["chunk_ids"] if retrieved else []
+            )
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached:
+                logging.info(f"Respuesta servida desde la caché ({cached['provider']}/{cached['model_id']})")
+                if on_model:
+                    await on_model(cached["provider"], cached["model_id"])
+                async with aclosing(self._serve_cached(user_id, query, cached, track_metrics)) as pieces:
+                    async for piece in pieces:
+                        yield piece
+                return
 
-        if not chosen_model_config:
+        # Caché semántica: preguntas parafraseadas de otra ya respondida por este bot
+        semantic = await asyncio.to_thread(self._semantic_cache_params, query)
+        if semantic:
+            cached = await asyncio.to_thread(
+                semantic_cache.lookup,
+                self.bot_id, self.bot_config.get("config_version", 1), semantic["model"],
+                semantic["vector"], query, semantic["threshold"]
+            )
+            if cached:
+                logging.info(f"Respuesta servida desde la caché semántica (similitud {cached['similarity']:.3f})")
+                if on_model:
+                    await on_model(cached["provider"], cached["model_id"])
+                async with aclosing(self._serve_cached(user_id, query, cached, track_metrics)) as pieces:
+                    async for piece in pieces:
+                        yield piece
+                return
+
+        # En un hilo: el router adaptativo refresca los precios de ModelPricing de vez en cuando
+        chain = await asyncio.to_thread(self._model_chain, query)
+        if not chain:
             yield "No tengo un modelo de IA configurado para responder."
             return
 
-        provider_name = chosen_model_config.get("provider")
-        model_id_name = chosen_model_config.get("model_id")
-        connector = self.connectors.get(provider_name)
-        
-        if not connector:
-            yield f"Error: Conector para '{provider_name}' no encontrado."
-            return
-        
-        logging.info(f"Modelo seleccionado: {model_id_name} via {provider_name}")
+        # Usuarios con facturación (el límite ya se comprobó en handle_query): consumo real al terminar
+        billed = track_metrics and self.user_id and isinstance(self.user_id, int)
 
-        # Decidir si usar streaming o métricas
-        if track_metrics and self.user_id and isinstance(self.user_id, int):
-            # Verificar límites antes de procesar
-            # Estimar tokens del prompt para verificación previa
-            estimated_tokens = connector.estimate_tokens(
-                prompt_package["system_prompt"] + prompt_package["user_question"]
+        def record_usage(provider_name: str, model_id_name: str, metrics: dict):
+            self.metrics_service.record_token_usage(
+                user_id=self.user_id,
+                bot_id=self.bot_id,
+                user_anon_id=user_id if not isinstance(self.user_id, int) else None,
+                query=query,
+                provider=provider_name,
+                model_id=model_id_name,
+                prompt_tokens=metrics["prompt_tokens"],
+                completion_tokens=metrics["completion_tokens"],
+                response_time_ms=metrics.get("response_time_ms"),
+                context_tokens_saved=retrieved["tokens_saved"] if retrieved else 0,
+                reservation=reservation
             )
-            
-            limit_check = self.metrics_service.check_token_limit(self.user_id, estimated_tokens)
-            
-            if not limit_check["allowed"]:
-                yield "Lo siento, has alcanzado el límite de tokens de tu plan gratuito. Por favor, actualiza tu plan para continuar."
-                return
-            
-            # Usar método con métricas
-            try:
-                response_text, metrics = connector.get_response_with_metrics(
-                    prompt_package=prompt_package,
-                    model_id=model_id_name,
-                    temperature=self.bot_config.get("temperature", 0.7)
-                )
-                
-                # Registrar uso de tokens
-                self.metrics_service.record_token_usage(
-                    user_id=self.user_id,
-                    bot_id=self.bot_id,
-                    user_anon_id=user_id if not isinstance(self.user_id, int) else None,
-                    query=query,
-                    provider=provider_name,
-                    model_id=model_id_name,
-                    prompt_tokens=metrics["prompt_tokens"],
-                    completion_tokens=metrics["completion_tokens"],
-                    response_time_ms=metrics.get("response_time_ms")
+
+        # Cadena de fallback: si un modelo falla antes de entregar el primer trozo se prueba el siguiente;
+        # los proveedores con el circuito abierto se omiten sin llamarlos
+        remaining = iter(chain)
+        # Modelo cuya respuesta se completó (con hedging, el ganador)
+        answered = {}
+
+        async def start_next():
+            """Siguiente modelo disponible de la cadena: (model_config, stream) o None."""
+            for model_config in remaining:
+                provider_name = model_config.get("provider")
+                model_id_name = model_config.get("model_id")
+                connector = self._get_connector(provider_name)
+                if not connector:
+                    continue
+                # True, o el token de la petición de prueba si el circuito está semiabierto
+                permit = await circuit_breaker.allow(provider_name) if circuit_breaker else True
+                if not permit:
+                    logging.warning(f"Proveedor '{provider_name}' con el circuito abierto: se omite {model_id_name}")
+                    continue
+                logging.info(f"Modelo seleccionado: {model_id_name} via {provider_name}")
+                # Streaming con consumo real: el uso se registra al cerrar el stream (también si el cliente se desconecta)
+                return model_config, self._handle_streaming_response(
+                    connector, prompt_package, model_id_name, provider_name,
+                    on_complete=lambda text, p=provider_name, m=model_id_name: (
+                        answered.update(provider=p, model_id=m),
+                        self._store_response(cache_key, semantic, query, text, p, m)
+                    ),
+                    on_usage=(lambda metrics, p=provider_name, m=model_id_name: record_usage(p, m, metrics)) if billed else None,
+                    circuit_permit=permit
                 )
-                
-                # Entregar respuesta completa
-                yield response_text
-                
-            except Exception as e:
-                logging.error(f"Error al obtener respuesta con métricas: {e}")
-                # Fallback a streaming sin métricas
-                yield from self._handle_streaming_response(connector, prompt_package, model_id_name)
-        else:
-            # Usar streaming sin métricas (para usuarios anónimos o cuando no se requieren métricas)
-            yield from self._handle_streaming_response(connector, prompt_package, model_id_name)
+            return None
 
-    def _handle_streaming_response(self, connector, prompt_package: dict, model_id: str):
-        """Maneja la respuesta en streaming sin métricas"""
+        while True:
+            attempt = await start_next()
+            if attempt is None:
+                break
+            model_config, stream = attempt
+            delay_ms = self._hedge_delay_ms(model_config)
+            if delay_ms is not None:
+                stream = self._hedged(stream, start_next, delay_ms)
+            try:
+                # Cerrarlo al salir (también si se cancela esta petición): sus finally liberan la conexión y facturan
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        yield chunk
+            except ConnectorError as e:
+                logging.warning(f"{model_config.get('provider')}/{model_config.get('model_id')} falló antes de responder ({e}); se prueba el siguiente modelo")
+                continue
+            if on_model:
+                # Si se cortó a mitad no hay ganador anotado: se usa el modelo que se lanzó
+                await on_model(answered.get("provider", model_config.get("provider")),
+                               answered.get("model_id", model_config.get("model_id")))
+            return
+
+        yield NO_PROVIDER_RESPONSE
+
+    def _hedge_delay_ms(self, model_config: dict):
+        """
+        Espera antes de lanzar el segundo modelo: el percentil `hedge_percentile` del bot
+        sobre el TTFT reciente del modelo (del bot; si hay pocas muestras, global).
+        None si el bot no usa hedging.
+        """
+        percentile = self.bot_config.get("hedge_percentile")
+        if not percentile:
+            return None
+        provider_name, model_id_name = model_config.get("provider"), model_config.get("model_id")
+        delay = ttft_tracker.percentile((self.bot_id, provider_name, model_id_name), percentile)
+        if delay is None:
+            delay = ttft_tracker.percentile((provider_name, model_id_name), percentile)
+        if delay is None:
+            delay = settings.HEDGING_DEFAULT_DELAY_MS
+        return max(delay, settings.HEDGING_MIN_DELAY_MS)
+
+    async def _hedged(self, primary, start_secondary, delay_ms: float):
+        """
+        Stream del primer modelo; si no entrega su primer trozo en `delay_ms`, lanza la
+        misma petición al siguiente modelo de la cadena y se queda con el que responda
+        primero. El perdedor se cancela y registra su consumo al cerrarse.
+        """
+        racers = {asyncio.ensure_future(primary.__anext__()): primary}
+        hedged = False
+        winner = first_chunk = error = None
         try:
-            stream = connector.get_response_stream(
+            done, _ = await asyncio.wait(racers, timeout=delay_ms / 1000)
+            if not done:
+                secondary = await start_secondary()
+                if secondary is not None:
+                    hedging_counts["hedged"] += 1
+                    logging.info(f"Hedging: sin primer trozo en {delay_ms:.0f} ms, se lanza {secondary[0].get('model_id')}")
+                    racers[asyncio.ensure_future(secondary[1].__anext__())] = secondary[1]
+            hedged = len(racers) > 1
+
+            while racers and winner is None:
+                done, _ = await asyncio.wait(racers, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stream = racers.pop(task)
+                    try:
+                        first_chunk = task.result()
+                    except StopAsyncIteration:
+                        first_chunk = None
+                    except ConnectorError as e:
+                        error = e
+                        continue
+                    winner = stream
+                    break
+        finally:
+            for task in racers:
+                task.cancel()
+            await asyncio.gather(*racers, return_exceptions=True)
+            for stream in racers.values():
+                await stream.aclose()
+
+        if winner is None:
+            raise error or ConnectorError("ningún modelo respondió")
+        if hedged:
+            hedging_counts["primary_wins" if winner is primary else "secondary_wins"] += 1
+
+        try:
+            if first_chunk is None:
+                return
+            yield first_chunk
+            async for chunk in winner:
+                yield chunk
+        finally:
+            await winner.aclose()
+
+    def _select_model(self, query: str):
+        """Modelo principal según el objetivo de enrutado del bot (ver ModelRouter)."""
+        return self.router.select_model(
+            query, self.bot_config.get("model_configs", []),
+            objective=self.bot_config.get("routing_objective"),
+            latency_slo_ms=self.bot_config.get("latency_slo_ms"),
+            keyword_rules=self.bot_config.get("routing_keywords"),
+            rules_key=(self.bot_id, self.bot_config.get("config_version", 1)),
+            task_type=self._classify_intent(query)
+        )
+
+    def _classify_intent(self, query: str):
+        """
+        Tipo de tarea por el clasificador de embeddings (bots con task_classifier=embedding),
+        o None para usar las palabras clave. El vector sale de la caché de embeddings
+        (ya se calculó en la recuperación).
+        """
+        if self.bot_config.get("task_classifier") != "embedding":
+            return None
+        try:
+            backend = get_embedding_backend(self.bot_config.get("embedding_backend") or settings.DEFAULT_EMBEDDING_BACKEND)
+            vector = query_embedding_cache.get_or_embed(query, backend.embed_query, model=backend.cache_key)
+            return intent_classifier.classify(
+                self.db, self.bot_id, self.bot_config.get("config_version", 1), backend.cache_key, vector
+            )
+        except Exception as e:
+            logging.warning(f"Clasificador de intención no disponible, se usan las palabras clave: {e}")
+            return None
+
+    def _model_chain(self, query: str) -> list:
+        """
+        Modelos a intentar en orden: el que elige el router y después las configuraciones
+        activas del bot con `fallback_order` (de menor a mayor).
+        """
+        available_models = self.bot_config.get("model_configs", [])
+        primary = self._select_model(query)
+        fallbacks = sorted(
+            (config for config in available_models
+             if config is not primary and config.get("is_active") and config.get("fallback_order") is not None),
+            key=lambda config: config["fallback_order"]
+        )
+        return ([primary] if primary else []) + fallbacks
+
+    @staticmethod
+    def _final_usage(connector, usage: dict, prompt_package: dict, response_text: str, model_id: str, start_time: float) -> dict:
+        """
+        Consumo de un stream terminado: el informado por el proveedor o, si no llegó
+        (proveedor sin uso en streaming, error o desconexión), una estimación con el
+        prompt completo y el texto generado hasta el momento.
+        """
+        metrics = dict(usage)
+        if "prompt_tokens" not in metrics:
+            logging.info(f"Uso de tokens estimado para {model_id} (el proveedor no lo informó)")
+            prompt_tokens = connector.estimate_tokens(prompt_package["system_prompt"] + prompt_package["user_question"])
+            completion_tokens = connector.estimate_tokens(response_text)
+            metrics = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "model_used": model_id,
+            }
+        metrics["response_time_ms"] = int((time.time() - start_time) * 1000)
+        return metrics
+
+    async def _handle_streaming_response(self, connector, prompt_package: dict, model_id: str, provider: str = None,
+                                         on_complete=None, on_usage=None, circuit_permit=True):
+        """
+        Maneja la respuesta en streaming. `on_complete(texto)` se llama (en un hilo) con la
+        respuesta completa al terminar (p. ej. para guardarla en caché). Si se pasa
+        `on_usage(metrics)`, se pide al conector el consumo real y se llama al cerrar el
+        stream, aunque el cliente se haya desconectado a mitad.
+
+        Si el proveedor falla antes del primer trozo se lanza ConnectorError (sin facturar
+        nada) para que el llamador pruebe otro modelo; si falla a mitad, se avisa en el
+        texto. El resultado se anota en el circuit breaker del proveedor (`circuit_permit`
+        es lo que devolvió su `allow`) y el tiempo al primer trozo en ttft_tracker.
+        """
+        usage = {} if on_usage else None
+        pieces = []
+        completed = failed = False
+        start_time = time.time()
+        first_chunk_ms = None
+        chunks = _with_first_chunk_timeout(
+            connector.aget_response_stream(
                 prompt_package=prompt_package, 
                 model_id=model_id,
-                temperature=self.bot_config.get("temperature", 0.7)
-            )
-            
-            for chunk in stream:
-                yield chunk
+                temperature=self.bot_config.get("temperature", 0.7),
+                usage=usage
+            ),
+            settings.FALLBACK_FIRST_CHUNK_TIMEOUT_SECONDS
+        )
+        try:
+            # El stream del conector se cierra al salir (también si se cancela), antes de facturar: libera ya la conexión
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if first_chunk_ms is None:
+                        first_chunk_ms = (time.time() - start_time) * 1000
+                        self._record_ttft(provider, model_id, first_chunk_ms)
+                    pieces.append(chunk)
+                    yield chunk
+            completed = True
         except Exception as e:
+            failed = True
+            model_stats.record_failure(provider, model_id)
+            if circuit_breaker and provider:
+                await circuit_breaker.record_failure(provider)
+            if not pieces:
+                raise ConnectorError(str(e)) from e
             logging.error(f"Error en streaming: {e}")
             yield f"Error al procesar la solicitud: {str(e)}"
+        finally:
+            if first_chunk_ms is None and not failed:
+                # Cancelado antes del primer trozo (hedging perdido o desconexión): el TTFT real es
+                # al menos lo esperado; sin esta muestra el percentil quedaría sesgado a la baja
+                self._record_ttft(provider, model_id, (time.time() - start_time) * 1000)
+            # Un error antes de responder no se factura; una cancelación sí (el proveedor ya recibió el prompt)
+            if on_usage and (pieces or usage or not failed):
+                metrics = self._final_usage(connector, usage, prompt_package, "".join(pieces), model_id, start_time)
+                # El hilo termina de registrar aunque esta tarea se cancele por la desconexión
+                await asyncio.to_thread(on_usage, metrics)
+
+        if not completed:
+            return
+        ttft_ms = first_chunk_ms or (time.time() - start_time) * 1000
+        if circuit_breaker and provider:
+            await circuit_breaker.record_success(provider, ttft_ms, circuit_permit)
+        self._record_model_stats(connector, usage, prompt_package, "".join(pieces), provider, model_id, start_time, ttft_ms)
+        if on_complete:
+            await asyncio.to_thread(on_complete, "".join(pieces))
+
+    def _record_model_stats(self, connector, usage, prompt_package: dict, response_text: str,
+                            provider: str, model_id: str, start_time: float, ttft_ms: float):
+        """Anota una respuesta completa en model_stats (TTFT, tokens/s y tokens) para el router adaptativo."""
+        metrics = self._final_usage(connector, usage or {}, prompt_package, response_text, model_id, start_time)
+        generation_seconds = (metrics["response_time_ms"] - ttft_ms) / 1000
+        tokens_per_second = metrics["completion_tokens"] / generation_seconds if generation_seconds > 0 else None
+        model_stats.record_success(
+            provider, model_id, ttft_ms, tokens_per_second, metrics["prompt_tokens"], metrics["completion_tokens"]
+        )
+
+    def _record_ttft(self, provider: str, model_id: str, ttft_ms: float):
+        ttft_tracker.record((self.bot_id, provider, model_id), ttft_ms)
+        ttft_tracker.record((provider, model_id), ttft_ms)
 
     def handle_query_with_full_metrics(self, user_id: str, query: str):
         """
@@ -144,10 +614,10 @@ class Orchestrator:
             raise ValueError("Se requiere user_id numérico para tracking completo de métricas")
         
         # Igual lógica que handle_query pero siempre con métricas
-        relevant_chunks = self.retriever.search(db=self.db, bot_id=self.bot_id, query=query)
+        retrieved = self._retrieve_context(query)
         
-        if relevant_chunks:
-            context = "\n".join(relevant_chunks)
+        if retrieved:
+            context = retrieved["context"]
             prompt_package = {
                 "system_prompt": self.bot_config.get("system_prompt", "Eres un asistente de IA."),
                 "user_question": f"Usando el siguiente contexto, responde la pregunta.\n\nCONTEXTO:\n{context}\n\nPREGUNTA:\n{query}"
@@ -159,14 +629,14 @@ class Orchestrator:
             }
 
         available_models = self.bot_config.get("model_configs", [])
-        chosen_model_config = self.router.select_model(query, available_models)
+        chosen_model_config = self._select_model(query)
 
         if not chosen_model_config:
             raise ValueError("No hay modelo configurado")
 
         provider_name = chosen_model_config.get("provider")
         model_id_name = chosen_model_config.get("model_id")
-        connector = self.connectors.get(provider_name)
+        connector = self._get_connector(provider_name)
         
         if not connector:
             raise ValueError(f"Conector para '{provider_name}' no encontrado")
@@ -188,7 +658,8 @@ class Orchestrator:
             model_id=model_id_name,
             prompt_tokens=metrics["prompt_tokens"],
             completion_tokens=metrics["completion_tokens"],
-            response_time_ms=metrics.get("response_time_ms")
+            response_time_ms=metrics.get("response_time_ms"),
+            context_tokens_saved=retrieved["tokens_saved"] if retrieved else 0
         )
         
         return {
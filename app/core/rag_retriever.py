@@ -1,8 +1,6 @@
 # app/core/rag_retriever.py
 
 import os
-import faiss
-import numpy as np
 import logging
 from sqlalchemy.orm import Session
 from typing import List
@@ -10,69 +8,78 @@ from typing import List
 # Importaciones de tu proyecto y de LangChain
 from app import crud, models
 from app.config import settings # Corregido para apuntar a la ruta correcta
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from app.core.index_cache import index_cache
+from app.core.embedding_cache import query_embedding_cache
+from app.core.vector_index import BotVectorIndex, bot_index_path
+from app.embeddings import get_embedding_backend
 
 logging.basicConfig(level=logging.INFO)
 
-# Inicializamos el modelo de embeddings una sola vez
-embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
 
 class RAGRetriever:
     def __init__(self):
         """
         El Retriever ahora es dinámico: no carga un solo índice,
-        sino que los busca y carga bajo demanda para cada bot.
+        sino que busca y carga bajo demanda el índice consolidado de cada bot.
+        Los índices cargados quedan residentes en `index_cache` (compartida por el proceso).
         """
         logging.info("RAGRetriever (dinámico) inicializado.")
 
-    def search(self, db: Session, bot_id: int, query: str, k: int = 5) -> List[str]:
+    def search(self, db: Session, bot_id: int, query: str, k: int = 5, mode: str = "vector") -> List[str]:
         """
         Busca en todos los documentos de un bot para encontrar los chunks más relevantes.
+        `mode` es "vector" (solo embeddings) o "hybrid" (embeddings + BM25).
+        """
+        return [chunk["text"] for chunk in self.search_chunks(db, bot_id=bot_id, query=query, k=k, mode=mode)]
+
+    def search_chunks(self, db: Session, bot_id: int, query: str, k: int = 5, mode: str = "vector") -> List[dict]:
+        """
+        Igual que `search`, pero devuelve cada chunk con su id, documento, distancia L2
+        (`score`, menor es mejor) y `relevance` (mayor es mejor).
         """
         # 1. Obtener todos los documentos con estado 'completed' para el bot
         bot_docs = crud.get_documents_by_bot(db, bot_id=bot_id)
-        completed_docs = [doc for doc in bot_docs if doc.status == models.DocumentStatus.COMPLETED and doc.vector_index_path]
+        completed_doc_ids = {
+            doc.id for doc in bot_docs
+            if doc.status == models.DocumentStatus.COMPLETED and doc.vector_index_path
+        }
 
-        if not completed_docs:
+        if not completed_doc_ids:
             logging.warning(f"No se encontraron documentos procesados para el bot {bot_id}.")
             # Devolver lista vacía para permitir que el modelo use su conocimiento base
             return []
 
-        all_chunks = []
-        logging.info(f"Buscando en {len(completed_docs)} documento(s) para el bot {bot_id}.")
+        # 2. Obtener el índice consolidado del bot (desde la caché o el disco)
+        index_path = bot_index_path(bot_id)
+        if not BotVectorIndex.exists(index_path):
+            logging.warning(f"La ruta del índice no existe: {index_path}")
+            return []
+
+        try:
+            # La caché se indexa por generación: una generación publicada nunca cambia
+            generation_path = BotVectorIndex.generation_path(index_path)
+            bot_index = index_cache.get_or_load(bot_id, generation_path, BotVectorIndex.open_readonly)
+            # La consulta se vectoriza con el mismo backend con el que se construyó el índice;
+            # las preguntas repetidas no vuelven a llamar al modelo de embeddings
+            backend = get_embedding_backend(bot_index.embedding_backend)
+            query_vector = query_embedding_cache.get_or_embed(query, backend.embed_query, model=backend.cache_key)
 
-        # 2. Cargar cada índice y buscar los chunks relevantes
-        for doc in completed_docs:
-            index_path = doc.vector_index_path
-            if os.path.exists(index_path):
-                try:
-                    # Cargar el vector store de FAISS, permitiendo la deserialización
-                    vector_store = FAISS.load_local(
-                        index_path, 
-                        embeddings_model, 
-                        allow_dangerous_deserialization=True # <-- ESTA ES LA LÍNEA CLAVE
-                    )
-                    
-                    # Buscar documentos similares y añadir los resultados
-                    results = vector_store.similarity_search_with_score(query, k=k)
-                    all_chunks.extend(results)
-                except Exception as e:
-                    logging.error(f"Error al cargar o buscar en el índice {index_path}: {e}")
+            # 3. Una sola búsqueda sobre todos los documentos; solo cuentan los documentos completados
+            if mode == "hybrid":
+                results = bot_index.search_hybrid(
+                    query_vector, query, k=k, allowed_document_ids=completed_doc_ids,
+                    candidates=settings.RAG_HYBRID_CANDIDATES, rrf_k=settings.RAG_HYBRID_RRF_K,
+                )
             else:
-                logging.warning(f"La ruta del índice no existe: {index_path}")
-        
-        if not all_chunks:
+                results = bot_index.search(query_vector, k=k, allowed_document_ids=completed_doc_ids)
+        except Exception as e:
+            logging.error(f"Error al cargar o buscar en el índice {index_path}: {e}")
+            return []
+
+        if not results:
             logging.info(f"No se encontraron chunks relevantes para la consulta: {query}")
             # Devolver lista vacía para permitir que el modelo use su conocimiento base
             return []
 
-        # 3. Ordenar todos los chunks por relevancia (menor puntuación es mejor)
-        all_chunks.sort(key=lambda x: x[1])
-        
-        # Devolver el contenido de los 'k' mejores chunks
-        top_k_chunks = [chunk[0].page_content for chunk in all_chunks[:k]]
-        logging.info(f"Chunks más relevantes encontrados: {len(top_k_chunks)} chunks")
-        
-        return top_k_chunks
\ No newline at end of file
+        logging.info(f"Chunks más relevantes encontrados: {len(results)} chunks en {len(completed_doc_ids)} documento(s)")
+        return results
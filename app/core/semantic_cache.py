@@ -0,0 +1,290 @@
+# app/core/semantic_cache.py
+
+import json
+import time
+import uuid
+import base64
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+import redis
+
+from app.config import settings
+
+
+class _BotIndex:
+    """Índice FAISS local de un bot y sus entradas, en el mismo orden que los vectores."""
+
+    def __init__(self, generation: Optional[str], config_version: int, model: str, position: int):
+        self.generation = generation
+        self.config_version = config_version
+        self.model = model
+        # Altas del log de Redis ya añadidas al índice
+        self.position = position
+        self.index = None
+        self.entries: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def add(self, entries: List[Dict[str, Any]], vectors: List[np.ndarray]):
+        if not vectors:
+            return
+        if self.index is None:
+            self.index = faiss.IndexFlatIP(len(vectors[0]))
+        self.index.add(np.vstack(vectors))
+        self.entries.extend(entries)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """Las `k` entradas más parecidas, de mayor a menor similitud."""
+        if self.index is None:
+            return []
+        similarities, positions = self.index.search(vector, min(k, self.index.ntotal))
+        return [
+            (float(similarity), self.entries[position])
+            for similarity, position in zip(similarities[0], positions[0]) if position >= 0
+        ]
+
+
+class SemanticCache:
+    """
+    Caché semántica de respuestas por bot: si una pregunta nueva es casi idéntica
+    (similitud coseno >= umbral del bot) a una ya respondida, se devuelve esa respuesta.
+
+    Las entradas (embedding de la pregunta, respuesta) viven en Redis, compartidas
+    por todos los workers. Cada proceso mantiene un índice FAISS pequeño por bot
+    (producto interno sobre vectores normalizados). Las entradas nuevas se anotan en
+    un log del bot y cada proceso añade solo esas a su índice; el índice se
+    reconstruye entero únicamente cuando cambia la generación del bot (desalojos y
+    falsos aciertos marcados) o su configuración.
+
+    Solo se consideran entradas de la versión de configuración actual del bot y
+    del mismo modelo de embeddings. Cada acierto se guarda en una muestra para
+    auditoría; marcar un acierto como falso borra la entrada que lo produjo.
+    """
+
+    # Al superar el máximo se desaloja hasta el 90%: cada desalojo obliga a todos los
+    # workers a reconstruir el índice, así que se hace por lotes y no en cada alta
+    EVICTION_LOW_WATERMARK = 0.9
+    # Candidatos que se miran en cada búsqueda (los caducados se saltan)
+    SEARCH_CANDIDATES = 4
+
+    def __init__(self, redis_url: str, max_entries_per_bot: int, ttl_seconds: int,
+                 audit_sample_size: int = 200, namespace: str = "bytchat:semantic_cache"):
+        self.max_entries_per_bot = max_entries_per_bot
+        self.ttl_seconds = ttl_seconds
+        self.audit_sample_size = audit_sample_size
+        self.namespace = namespace
+        self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self._local: Dict[int, _BotIndex] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, bot_id: int, name: str) -> str:
+        return f"{self.namespace}:{bot_id}:{name}"
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.ascontiguousarray(vector, dtype="float32").reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        return vector
+
+    @staticmethod
+    def _decode(entry_id: str, raw: str) -> Tuple[Dict[str, Any], np.ndarray]:
+        entry = json.loads(raw)
+        entry["id"] = entry_id
+        return entry, np.frombuffer(base64.b64decode(entry.pop("vector")), dtype="float32")
+
+    def _local_index(self, bot_id: int, config_version: int, model: str) -> _BotIndex:
+        """Índice local del bot, al día con Redis: añade las altas del log o, si cambió la generación, lo reconstruye."""
+        with self._lock:
+            local = self._local.get(bot_id)
+        if local is None or (local.config_version, local.model) != (config_version, model):
+            return self._rebuild(bot_id, config_version, model)
+
+        # MULTI: la generación y las altas se leen a la vez
+        pipe = self._redis.pipeline()
+        pipe.get(self._key(bot_id, "generation"))
+        pipe.lrange(self._key(bot_id, "log"), local.position, -1)
+        generation, new_ids = pipe.execute()
+        if generation != local.generation:
+            return self._rebuild(bot_id, config_version, model)
+        if not new_ids:
+            return local
+
+        entries, vectors = [], []
+        for entry_id, raw in zip(new_ids, self._redis.hmget(self._key(bot_id, "entries"), new_ids)):
+            if raw is None:
+                continue
+            entry, vector = self._decode(entry_id, raw)
+            if entry["config_version"] == config_version and entry["model"] == model:
+                entries.append(entry)
+                vectors.append(vector)
+        position = local.position
+        with local.lock:
+            # Otro hilo pudo añadir ya estas altas
+            if local.position == position:
+                local.add(entries, vectors)
+                local.position = position + len(new_ids)
+        return local
+
+    def _rebuild(self, bot_id: int, config_version: int, model: str) -> _BotIndex:
+        # MULTI: entradas, generación y longitud del log son de un mismo instante
+        pipe = self._redis.pipeline()
+        pipe.get(self._key(bot_id, "generation"))
+        pipe.hgetall(self._key(bot_id, "entries"))
+        pipe.llen(self._key(bot_id, "log"))
+        generation, raw_entries, position = pipe.execute()
+
+        now = time.time()
+        entries, vectors = [], []
+        for entry_id, raw in raw_entries.items():
+            entry, vector = self._decode(entry_id, raw)
+            if entry["config_version"] != config_version or entry["model"] != model:
+                continue
+            if now - entry["created_at"] > self.ttl_seconds:
+                continue
+            entries.append(entry)
+            vectors.append(vector)
+
+        local = _BotIndex(generation, config_version, model, position)
+        local.add(entries, vectors)
+        with self._lock:
+            self._local[bot_id] = local
+        return local
+
+    def lookup(self, bot_id: int, config_version: int, model: str, query_vector: np.ndarray,
+               query: str, threshold: float) -> Optional[Dict[str, Any]]:
+        """
+        Busca la pregunta cacheada más parecida. Devuelve la entrada (con `similarity`
+        y `hit_id` para auditoría) si supera `threshold`; si no, None.
+        """
+        try:
+            self._redis.hincrby(self._key(bot_id, "stats"), "lookups", 1)
+            local = self._local_index(bot_id, config_version, model)
+            with local.lock:
+                candidates = local.search(self._normalize(query_vector), self.SEARCH_CANDIDATES)
+
+            now = time.time()
+            # Las entradas añadidas sin reconstruir el índice pueden haber caducado desde entonces
+            match = next(
+                ((similarity, entry) for similarity, entry in candidates
+                 if similarity >= threshold and now - entry["created_at"] <= self.ttl_seconds),
+                None
+            )
+            if match is None:
+                return None
+
+            similarity, entry = match
+            entry = dict(entry, similarity=similarity, hit_id=uuid.uuid4().hex[:12])
+            pipe = self._redis.pipeline()
+            pipe.hincrby(self._key(bot_id, "stats"), "hits", 1)
+            pipe.lpush(self._key(bot_id, "hits"), json.dumps({
+                "hit_id": entry["hit_id"],
+                "entry_id": entry["id"],
+                "query": query,
+                "cached_query": entry["query"],
+                "similarity": round(similarity, 4),
+                "created_at": time.time(),
+            }, ensure_ascii=False))
+            pipe.ltrim(self._key(bot_id, "hits"), 0, self.audit_sample_size - 1)
+            pipe.execute()
+            return entry
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"SemanticCache: Redis no disponible ({e}).")
+            return None
+
+    def add(self, bot_id: int, config_version: int, model: str, query_vector: np.ndarray,
+            query: str, response: str, provider: str, model_id: str):
+        """
+        Guarda una respuesta nueva y la anota en el log del bot (los workers la añaden a
+        su índice sin reconstruirlo). Al superar el máximo por bot se desalojan las más
+        viejas por lotes, hasta EVICTION_LOW_WATERMARK del máximo.
+        """
+        entry_id = uuid.uuid4().hex[:12]
+        created_at = time.time()
+        entry = {
+            "vector": base64.b64encode(self._normalize(query_vector).tobytes()).decode("ascii"),
+            "query": query,
+            "response": response,
+            "provider": provider,
+            "model_id": model_id,
+            "model": model,
+            "config_version": config_version,
+            "created_at": created_at,
+        }
+        entries_key, order_key = self._key(bot_id, "entries"), self._key(bot_id, "order")
+        try:
+            # MULTI: la entrada y su alta en el log se ven a la vez
+            pipe = self._redis.pipeline()
+            pipe.hset(entries_key, entry_id, json.dumps(entry, ensure_ascii=False))
+            pipe.zadd(order_key, {entry_id: created_at})
+            pipe.rpush(self._key(bot_id, "log"), entry_id)
+            pipe.set(self._key(bot_id, "generation"), uuid.uuid4().hex, nx=True)
+            pipe.zcard(order_key)
+            # Los bots que dejan de recibir tráfico liberan su memoria en Redis
+            for name in ("entries", "order", "log", "generation"):
+                pipe.expire(self._key(bot_id, name), self.ttl_seconds)
+            size = pipe.execute()[4]
+
+            if size > self.max_entries_per_bot:
+                keep = int(self.max_entries_per_bot * self.EVICTION_LOW_WATERMARK)
+                oldest = [member for member, _ in self._redis.zpopmin(order_key, size - keep)]
+                self._new_generation(bot_id, oldest)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"SemanticCache: no se pudo guardar la respuesta ({e}).")
+
+    def _new_generation(self, bot_id: int, removed: List[str]):
+        """Borra entradas y empieza una generación nueva: los workers reconstruyen su índice."""
+        pipe = self._redis.pipeline()
+        if removed:
+            pipe.hdel(self._key(bot_id, "entries"), *removed)
+        pipe.set(self._key(bot_id, "generation"), uuid.uuid4().hex, ex=self.ttl_seconds)
+        # Las altas anteriores ya están en las entradas que leerá la reconstrucción
+        pipe.delete(self._key(bot_id, "log"))
+        pipe.execute()
+
+    def flag_false_hit(self, bot_id: int, hit_id: str) -> bool:
+        """Marca un acierto como incorrecto y borra la entrada que lo produjo."""
+        for raw in self._redis.lrange(self._key(bot_id, "hits"), 0, -1):
+            hit = json.loads(raw)
+            if hit["hit_id"] != hit_id:
+                continue
+            if not self._redis.sadd(self._key(bot_id, "false_hits"), hit_id):
+                return True  # ya estaba marcado
+            pipe = self._redis.pipeline()
+            pipe.hincrby(self._key(bot_id, "stats"), "false_hits", 1)
+            pipe.zrem(self._key(bot_id, "order"), hit["entry_id"])
+            pipe.execute()
+            self._new_generation(bot_id, [hit["entry_id"]])
+            return True
+        return False
+
+    def audit(self, bot_id: int, limit: int = 50) -> Dict[str, Any]:
+        """Tasa de aciertos, tasa de falsos aciertos marcados y los aciertos recientes."""
+        stats = self._redis.hgetall(self._key(bot_id, "stats"))
+        lookups, hits = int(stats.get("lookups", 0)), int(stats.get("hits", 0))
+        false_hits = int(stats.get("false_hits", 0))
+        flagged = self._redis.smembers(self._key(bot_id, "false_hits"))
+        return {
+            "bot_id": bot_id,
+            "entries": self._redis.hlen(self._key(bot_id, "entries")),
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "false_hits": false_hits,
+            "false_hit_rate": round(false_hits / hits, 4) if hits else 0.0,
+            "recent_hits": [
+                dict(hit, false_hit=hit["hit_id"] in flagged)
+                for hit in (json.loads(raw) for raw in self._redis.lrange(self._key(bot_id, "hits"), 0, limit - 1))
+            ],
+        }
+
+
+# Instancia única para todo el proceso
+semantic_cache = SemanticCache(
+    redis_url=settings.REDIS_URL,
+    max_entries_per_bot=settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_BOT,
+    ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+    audit_sample_size=settings.SEMANTIC_CACHE_AUDIT_SAMPLE,
+)
@@ -0,0 +1,274 @@
+# app/core/single_flight.py
+
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from app.config import settings
+from app.core.text_utils import normalize_query
+
+
+class _Flight:
+    """Una respuesta en curso: los trozos ya producidos y su estado."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.abandoned = False
+        # Peticiones leyendo el stream (líder incluido); si llega a 0 se cancela la generación
+        self.consumers = 0
+        self.remote = False
+        # Este worker es el líder global y publica los trozos en Redis
+        self.publishing = False
+        # Datos del líder para las suscriptoras (p. ej. el proveedor y el modelo que respondió)
+        self.meta: Dict[str, str] = {}
+        self.error: Optional[Exception] = None
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Deduplicación de peticiones idénticas en curso (single-flight), sobre asyncio.
+
+    La primera petición para una clave (líder) lanza la generación en una tarea propia;
+    ella y las que llegan mientras tanto (suscriptoras) leen los mismos trozos del
+    stream, desde el principio, sin volver a llamar al modelo.
+
+    Con `redis_url` además se coordina entre workers: un solo líder global (SET NX)
+    publica los trozos en una lista de Redis y los anuncia por pub/sub; en los demás
+    workers la tarea del líder local los reenvía a sus propias suscriptoras.
+
+    La generación sigue mientras quede alguna petición leyendo (aunque el cliente del
+    líder se desconecte) y se cancela cuando ya no queda ninguna. Si se corta por un
+    error, las suscriptoras que no recibieron nada generan la respuesta por su cuenta.
+
+    El productor puede anotar datos de la respuesta con `annotate` (también llegan a
+    las suscriptoras de otros workers); `on_follow` los recibe.
+    """
+
+    DONE = "__done__"
+    ABANDONED = "__abandoned__"
+    META = "__meta__:"
+
+    def __init__(self, redis_url: Optional[str] = None, wait_seconds: int = 60,
+                 namespace: str = "bytchat:single_flight"):
+        self.wait_seconds = wait_seconds
+        self.namespace = namespace
+        self._redis = aioredis.Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def make_key(self, bot_id: int, config_version: int, query: str) -> str:
+        payload = json.dumps([bot_id, config_version, normalize_query(query)])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    async def stream(self, key: str, producer: Callable[[], AsyncIterator[str]],
+                     on_follow: Optional[Callable[[Dict[str, str]], Awaitable[None]]] = None) -> AsyncIterator[str]:
+        """
+        Devuelve el stream de la respuesta para `key`. `producer()` solo se ejecuta
+        si esta petición es la líder; `await on_follow(meta)` se llama si se sirvió como
+        suscriptora, con lo que el líder anotó con `annotate`.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._produce(key, flight, producer))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        received = 0
+        follow = self._follow(flight)
+        try:
+            async for chunk in follow:
+                received += 1
+                yield chunk
+        finally:
+            # Cerrarlo ya (no al recolectarlo) para que cuente como lectora menos
+            await follow.aclose()
+
+        if leader and flight.error is not None:
+            # El error del productor se propaga a la petición que lo lanzó
+            raise flight.error
+        if flight.abandoned and received == 0 and not leader:
+            # El líder se cortó sin producir nada: esta petición toma el relevo
+            async with aclosing(self.stream(key, producer, on_follow)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        elif on_follow and (not leader or flight.remote):
+            await on_follow(dict(flight.meta))
+
+    async def annotate(self, key: str, meta: Dict[str, str]):
+        """Anota datos de la respuesta en curso de `key` para sus suscriptoras (lo llama el productor)."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return
+        flight.meta.update(meta)
+        if flight.publishing:
+            await self._safe_push(
+                f"{self.namespace}:{key}:chunks", f"{self.namespace}:{key}", self.META + json.dumps(meta)
+            )
+
+    async def _produce(self, key: str, flight: _Flight, producer: Callable[[], AsyncIterator[str]]):
+        """Tarea del líder: consume el origen y publica los trozos para todas las lectoras."""
+        completed = False
+        try:
+            # Al cancelar la tarea, el origen se cierra ya (y con él el productor y su conector)
+            async with aclosing(self._source(key, producer, flight)) as source:
+                async for chunk in source:
+                    async with flight.condition:
+                        flight.chunks.append(chunk)
+                        flight.condition.notify_all()
+            completed = True
+        except asyncio.CancelledError:
+            logging.info("SingleFlight: generación cancelada (no quedan peticiones leyendo).")
+        except Exception as e:
+            logging.error(f"SingleFlight: error al generar la respuesta: {e}")
+            flight.error = e
+        finally:
+            self._flights.pop(key, None)
+            async with flight.condition:
+                flight.done = True
+                flight.abandoned = not completed
+                flight.condition.notify_all()
+
+    async def _follow(self, flight: _Flight) -> AsyncIterator[str]:
+        flight.consumers += 1
+        position = 0
+        try:
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(lambda: position < len(flight.chunks) or flight.done)
+                    pending = flight.chunks[position:]
+                    finished = flight.done
+                for chunk in pending:
+                    yield chunk
+                position += len(pending)
+                if finished and position >= len(flight.chunks):
+                    return
+        finally:
+            flight.consumers -= 1
+            if flight.consumers == 0 and not flight.done and flight.task is not None:
+                flight.task.cancel()
+
+    # --- Coordinación entre workers (Redis) ---
+
+    async def _source(self, key: str, producer: Callable[[], AsyncIterator[str]],
+                      flight: _Flight) -> AsyncIterator[str]:
+        """
+        Origen de los trozos del líder local: el productor real (publicando en Redis si
+        está activo) o, si el líder global está en otro worker, su stream remoto
+        (`flight.remote` queda en True mientras se sirva desde allí).
+        """
+        source = None
+        if self._redis is not None:
+            leader_key = f"{self.namespace}:{key}:leader"
+            try:
+                if await self._redis.set(leader_key, uuid.uuid4().hex, nx=True, ex=self.wait_seconds * 2):
+                    flight.publishing = True
+                    source = self._publish(key, producer())
+                else:
+                    flight.remote = True
+                    source = self._remote(key, producer, flight)
+            except redis.exceptions.RedisError as e:
+                logging.warning(f"SingleFlight: Redis no disponible ({e}); solo deduplicación local.")
+        if source is None:
+            source = producer()
+        async with aclosing(source):
+            async for chunk in source:
+                yield chunk
+
+    async def _publish(self, key: str, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        list_key, channel = f"{self.namespace}:{key}:chunks", f"{self.namespace}:{key}"
+        completed = False
+        try:
+            async with aclosing(source):
+                async for chunk in source:
+                    await self._safe_push(list_key, channel, chunk)
+                    yield chunk
+            completed = True
+        finally:
+            await self._safe_push(list_key, channel, self.DONE if completed else self.ABANDONED)
+            try:
+                # La lista queda unos segundos para suscriptores que llegan justo al final
+                await self._redis.expire(list_key, 10)
+                await self._redis.delete(f"{self.namespace}:{key}:leader")
+            except redis.exceptions.RedisError:
+                pass
+
+    async def _safe_push(self, list_key: str, channel: str, chunk: str):
+        try:
+            async with self._redis.pipeline() as pipe:
+                pipe.rpush(list_key, chunk)
+                pipe.expire(list_key, self.wait_seconds * 2)
+                pipe.publish(channel, "1")
+                await pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"SingleFlight: no se pudo publicar un trozo ({e}).")
+
+    async def _remote(self, key: str, producer: Callable[[], AsyncIterator[str]],
+                      flight: _Flight) -> AsyncIterator[str]:
+        """Sigue el stream de un líder de otro worker; si no llega nada a tiempo, genera la respuesta."""
+        list_key, channel = f"{self.namespace}:{key}:chunks", f"{self.namespace}:{key}"
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        position = received = 0
+        finished = take_over = False
+        deadline = time.monotonic() + self.wait_seconds
+        try:
+            # Suscribirse antes de leer la lista evita perder avisos entre ambos pasos
+            await pubsub.subscribe(channel)
+            while not finished and time.monotonic() < deadline:
+                for chunk in await self._redis.lrange(list_key, position, -1):
+                    position += 1
+                    if chunk.startswith(self.META):
+                        flight.meta.update(json.loads(chunk[len(self.META):]))
+                        continue
+                    if chunk in (self.DONE, self.ABANDONED):
+                        # Un líder abandonado a medias deja la respuesta parcial (como en local)
+                        finished = True
+                        take_over = chunk == self.ABANDONED and received == 0
+                        break
+                    # Cada trozo recibido extiende la espera
+                    deadline = time.monotonic() + self.wait_seconds
+                    received += 1
+                    yield chunk
+                else:
+                    await pubsub.get_message(timeout=1.0)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"SingleFlight: se perdió el stream remoto ({e}).")
+        finally:
+            await pubsub.aclose()
+
+        if take_over or (not finished and received == 0):
+            logging.warning("SingleFlight: el líder remoto no respondió; se genera la respuesta localmente.")
+            flight.remote = False
+            flight.meta.clear()
+            async with aclosing(producer()) as source:
+                async for chunk in source:
+                    yield chunk
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "redis_enabled": self._redis is not None,
+        }
+
+
+# Instancia única para todo el proceso
+single_flight = SingleFlight(
+    redis_url=settings.REDIS_URL if settings.SINGLE_FLIGHT_REDIS else None,
+    wait_seconds=settings.SINGLE_FLIGHT_WAIT_SECONDS,
+)
@@ -0,0 +1,31 @@
+# app/core/text_utils.py
+
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Signos que no cambian el sentido de la pregunta ("¿Horario?" == "horario")
+_EDGE_PUNCTUATION = "¿?¡!.,;: \t\n"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Forma canónica de una pregunta para usarla como clave de caché:
+    Unicode NFKC, minúsculas, espacios colapsados y sin signos de puntuación
+    al principio o al final. No se quitan acentos ni palabras.
+    """
+    text = unicodedata.normalize("NFKC", query or "")
+    text = _WHITESPACE_RE.sub(" ", text.lower())
+    return text.strip(_EDGE_PUNCTUATION)
+
+
+def fold_accents(text: str) -> str:
+    """Quita tildes y diacríticos ("canción" -> "cancion"); conserva la ñ."""
+    decomposed = unicodedata.normalize("NFD", text.replace("ñ", "\0").replace("Ñ", "\1"))
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return unicodedata.normalize("NFC", stripped).replace("\0", "ñ").replace("\1", "Ñ")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación de tokens igual a BaseConnector.estimate_tokens (~0.75 tokens por palabra)."""
+    return int(len(text.split()) * 0.75)
@@ -0,0 +1,539 @@
+# app/core/vector_index.py
+
+import os
+import json
+import mmap
+import shutil
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import faiss
+import numpy as np
+import redis
+
+from app.config import settings
+from app.core.index_factory import (
+    build_faiss_index, choose_index_strategy, default_search_params, make_search_params
+)
+from app.core.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+# Cada vector lleva el id de su documento en los bits altos de su id FAISS:
+#   vector_id = (document_id << CHUNK_BITS) | número_de_chunk
+# Así una búsqueda sabe a qué documento pertenece cada resultado sin consultas extra.
+CHUNK_BITS = 24
+
+
+def make_vector_ids(document_id: int, count: int) -> np.ndarray:
+    return (np.int64(document_id) << CHUNK_BITS) + np.arange(count, dtype=np.int64)
+
+
+def document_id_from_vector_id(vector_id: int) -> int:
+    return int(vector_id) >> CHUNK_BITS
+
+
+def read_index_mmap(index_file: str) -> faiss.Index:
+    """
+    Abre un índice FAISS en modo solo lectura y memory-mapped: los datos del índice
+    no se copian al heap del proceso, así que varios workers de uvicorn en el mismo
+    nodo comparten las mismas páginas físicas (page cache).
+    """
+    # IO_FLAG_MMAP_IFC (FAISS >= 1.8) mapea también los códigos de los índices planos;
+    # IO_FLAG_MMAP solo mapea las listas invertidas de los índices IVF.
+    for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        flag = getattr(faiss, flag_name, None)
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(index_file, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logging.debug(f"read_index con {flag_name} no disponible para {index_file}: {e}")
+    logging.warning(f"No se pudo mapear en memoria {index_file}; se carga completo.")
+    return faiss.read_index(index_file)
+
+
+def bot_index_path(bot_id: int) -> str:
+    """Ruta del índice consolidado de un bot."""
+    return os.path.join("storage", f"bot_{bot_id}", "index")
+
+
+@contextmanager
+def bot_index_lock(bot_id: int, timeout: int = 600):
+    """
+    Lock distribuido (Redis) para que dos tareas de Celery no reescriban
+    el índice del mismo bot al mismo tiempo.
+    """
+    client = redis.Redis.from_url(settings.REDIS_URL)
+    lock = client.lock(f"bytchat:bot_index_lock:{bot_id}", timeout=timeout, blocking_timeout=timeout)
+    if not lock.acquire():
+        raise TimeoutError(f"No se pudo obtener el lock del índice del bot {bot_id}")
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockError:
+            logging.warning(f"El lock del índice del bot {bot_id} expiró antes de liberarse.")
+
+
+class MmapChunkStore:
+    """
+    Almacén de solo lectura con el texto de los chunks, pensado para mmap.
+
+    Reemplaza al pickle del docstore de LangChain: tres archivos planos
+      - chunk_ids.npy: ids de vector ordenados (int64)
+      - chunk_offsets.npy: desplazamientos de cada texto en chunks.bin (int64, n + 1)
+      - chunks.bin: los textos en UTF-8, concatenados
+    Leer un chunk es una búsqueda binaria sobre los ids y un slice del mmap.
+    """
+
+    IDS_FILE = "chunk_ids.npy"
+    OFFSETS_FILE = "chunk_offsets.npy"
+    DATA_FILE = "chunks.bin"
+
+    def __init__(self, path: str):
+        self.ids = np.load(os.path.join(path, self.IDS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, self.OFFSETS_FILE), mmap_mode="r")
+        data_file = os.path.join(path, self.DATA_FILE)
+        if os.path.getsize(data_file) > 0:
+            with open(data_file, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get(self, vector_id: int) -> Optional[str]:
+        pos = int(np.searchsorted(self.ids, vector_id))
+        if pos >= len(self.ids) or int(self.ids[pos]) != vector_id:
+            return None
+        return self._data[int(self.offsets[pos]):int(self.offsets[pos + 1])].decode("utf-8")
+
+    def to_dict(self) -> Dict[int, str]:
+        return {int(vector_id): self.get(int(vector_id)) for vector_id in self.ids}
+
+    @classmethod
+    def write(cls, path: str, chunks: Dict[int, str]):
+        """Escribe el almacén en `path`, un directorio de generación aún sin publicar (ver BotVectorIndex.save)."""
+        ids = np.array(sorted(chunks), dtype=np.int64)
+        encoded = [chunks[int(vector_id)].encode("utf-8") for vector_id in ids]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+        with open(os.path.join(path, cls.DATA_FILE), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(path, cls.OFFSETS_FILE), offsets)
+        np.save(os.path.join(path, cls.IDS_FILE), ids)
+
+
+class BotVectorIndex:
+    """
+    Índice vectorial único por bot: un índice FAISS con ids explícitos que contiene
+    todos los chunks de todos sus documentos, más un almacén con el texto de cada
+    chunk (el documento se deduce del id del vector).
+
+    El tipo de índice (flat, HNSW, IVF-SQ8, IVF-PQ) se elige al (re)construirlo según
+    la estrategia del bot y la cantidad de vectores; ver app/core/index_factory.py.
+    Los vectores originales se guardan aparte para poder reconstruir el índice con
+    otra estrategia sin volver a llamar a la API de embeddings. El manifest registra
+    el backend de embeddings con el que se calcularon (ver app/embeddings); las
+    consultas se vectorizan siempre con ese mismo backend.
+
+    Hay dos formas de abrirlo:
+      - `load`: copia editable en memoria, para el worker que añade o borra documentos.
+      - `open_readonly`: índice y textos memory-mapped, para la búsqueda en los workers web.
+
+    Los documentos eliminados se marcan como tombstones (se filtran en la búsqueda)
+    y se eliminan físicamente del índice al compactar.
+
+    Junto al índice vectorial se guarda un índice léxico BM25 de los mismos chunks
+    (ver app/core/lexical_index.py) para la búsqueda híbrida.
+
+    En disco, cada `save` escribe todos los archivos en un directorio nuevo
+    `<path>/gen_<n>/` y lo publica reemplazando `<path>/CURRENT`, que contiene el
+    nombre de la generación vigente. Los índices guardados antes de existir las
+    generaciones tienen los archivos directamente en `<path>`.
+    """
+
+    INDEX_FILE = "vectors.faiss"
+    VECTORS_FILE = "chunk_vectors.npy"
+    MANIFEST_FILE = "manifest.json"
+    CURRENT_FILE = "CURRENT"
+    GENERATION_PREFIX = "gen_"
+
+    def __init__(self, index: faiss.Index, chunks, tombstones: Optional[Set[int]] = None,
+                 read_only: bool = False, manifest: Optional[dict] = None,
+                 vectors: Optional[Dict[int, np.ndarray]] = None):
+        manifest = manifest or {}
+        self.index = index
+        # Editable: dict {vector_id: texto}; solo lectura: MmapChunkStore
+        self.chunks = chunks
+        # Solo en modo editable: {vector_id: vector original}
+        self.vectors = vectors if vectors is not None else {}
+        self.tombstones = set(tombstones or [])
+        self.read_only = read_only
+        self.strategy = manifest.get("strategy", "flat")
+        self.requested_strategy = manifest.get("requested_strategy", "auto")
+        self.search_params = manifest.get("search_params", {})
+        self.built_size = manifest.get("built_size", index.ntotal)
+        # Solo en modo lectura (None si el índice se guardó antes de existir BM25)
+        self.lexical: Optional[LexicalIndex] = None
+        # Los índices anteriores a los backends configurables se crearon con Google
+        self.embedding_backend = manifest.get("embedding_backend", "google")
+        self._needs_rebuild = False
+
+    @classmethod
+    def create(cls, dim: int, embedding_backend: str = "google") -> "BotVectorIndex":
+        empty = np.zeros((0, dim), dtype="float32")
+        return cls(build_faiss_index(empty, np.zeros(0, dtype=np.int64), "flat"), {},
+                   manifest={"embedding_backend": embedding_backend})
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(cls.generation_path(path), cls.MANIFEST_FILE))
+
+    @classmethod
+    def generation_path(cls, path: str) -> str:
+        """
+        Directorio con la generación vigente del índice. Una generación no se modifica
+        después de publicarse: quien la abre lee siempre archivos del mismo guardado.
+        """
+        try:
+            with open(os.path.join(path, cls.CURRENT_FILE), "r", encoding="utf-8") as f:
+                return os.path.join(path, f.read().strip())
+        except FileNotFoundError:
+            return path
+
+    @classmethod
+    def _current_generation(cls, path: str) -> int:
+        name = os.path.basename(cls.generation_path(path))
+        if name.startswith(cls.GENERATION_PREFIX) and name[len(cls.GENERATION_PREFIX):].isdigit():
+            return int(name[len(cls.GENERATION_PREFIX):])
+        return 0
+
+    @classmethod
+    def load(cls, path: str) -> "BotVectorIndex":
+        """Carga una copia editable del índice (uso del worker)."""
+        path = cls.generation_path(path)
+        index = faiss.read_index(os.path.join(path, cls.INDEX_FILE))
+        store = MmapChunkStore(path)
+        manifest = cls._read_manifest(path)
+        vectors = cls._load_vectors(path, store.ids, index)
+        return cls(index, store.to_dict(), manifest.get("tombstones", []), manifest=manifest, vectors=vectors)
+
+    @classmethod
+    def _load_vectors(cls, path: str, ids: np.ndarray, index: faiss.Index) -> Dict[int, np.ndarray]:
+        vectors_file = os.path.join(path, cls.VECTORS_FILE)
+        if os.path.exists(vectors_file):
+            matrix = np.load(vectors_file)
+            return {int(vector_id): matrix[row] for row, vector_id in enumerate(ids)}
+
+        # Índices planos guardados antes de existir chunk_vectors.npy: se reconstruyen
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if not isinstance(inner, faiss.IndexFlat):
+            raise ValueError(f"El índice en {path} no tiene vectores originales para reconstruirlo")
+        stored_ids = faiss.vector_to_array(index.id_map)
+        matrix = inner.reconstruct_n(0, index.ntotal)
+        return {int(vector_id): matrix[row] for row, vector_id in enumerate(stored_ids)}
+
+    @classmethod
+    def open_readonly(cls, path: str) -> "BotVectorIndex":
+        """
+        Abre el índice para búsqueda sin copiarlo al heap: FAISS y los textos quedan
+        memory-mapped, así el RSS de cada worker no crece con los documentos del bot.
+        `path` puede ser la raíz del índice o el directorio de una generación.
+        """
+        path = cls.generation_path(path)
+        index = read_index_mmap(os.path.join(path, cls.INDEX_FILE))
+        manifest = cls._read_manifest(path)
+        bot_index = cls(index, MmapChunkStore(path), manifest.get("tombstones", []), read_only=True, manifest=manifest)
+        if LexicalIndex.exists(path):
+            bot_index.lexical = LexicalIndex.open(path)
+
+        # Ajustes globales de búsqueda (0 = usar los del manifest)
+        if settings.RAG_HNSW_EF_SEARCH:
+            bot_index.search_params["efSearch"] = settings.RAG_HNSW_EF_SEARCH
+        if settings.RAG_IVF_NPROBE:
+            bot_index.search_params["nprobe"] = settings.RAG_IVF_NPROBE
+        return bot_index
+
+    @classmethod
+    def stored_embedding_backend(cls, path: str) -> Optional[str]:
+        """Backend de embeddings con el que se construyó el índice en disco (None si no existe)."""
+        if not cls.exists(path):
+            return None
+        return cls._read_manifest(cls.generation_path(path)).get("embedding_backend", "google")
+
+    @classmethod
+    def _read_manifest(cls, path: str) -> dict:
+        with open(os.path.join(path, cls.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, path: str, strategy: Optional[str] = None, force_rebuild: bool = False):
+        """
+        Guarda el índice en disco, reconstruyéndolo antes si cambió la estrategia que
+        corresponde a su tamaño. `strategy` es la estrategia pedida por el bot (None
+        mantiene la última guardada).
+
+        Todos los archivos se escriben en un directorio de generación nuevo y se publican
+        juntos con un único os.replace de `CURRENT`: un lector abre la generación anterior
+        o la nueva, nunca archivos de guardados distintos (p. ej. vectores nuevos con
+        textos viejos). Se conserva la generación anterior para quien acaba de leer
+        `CURRENT`; las más antiguas se borran (los lectores que aún las tienen mapeadas
+        siguen leyendo sus inodes).
+        """
+        self._check_writable()
+        if strategy is not None:
+            self.requested_strategy = strategy
+        self._ensure_strategy(force_rebuild)
+        os.makedirs(path, exist_ok=True)
+
+        generation = self._current_generation(path) + 1
+        generation_name = f"{self.GENERATION_PREFIX}{generation}"
+        generation_dir = os.path.join(path, generation_name)
+        # Restos de un guardado que murió antes de publicarse
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        os.makedirs(generation_dir)
+
+        faiss.write_index(self.index, os.path.join(generation_dir, self.INDEX_FILE))
+        np.save(os.path.join(generation_dir, self.VECTORS_FILE), self._stack_vectors(sorted(self.vectors)))
+        MmapChunkStore.write(generation_dir, self.chunks)
+        LexicalIndex.build(self.chunks).write(generation_dir)
+        with open(os.path.join(generation_dir, self.MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.index.d,
+                "ntotal": self.index.ntotal,
+                "strategy": self.strategy,
+                "requested_strategy": self.requested_strategy,
+                "search_params": self.search_params,
+                "built_size": self.built_size,
+                "embedding_backend": self.embedding_backend,
+                "tombstones": sorted(self.tombstones),
+            }, f, ensure_ascii=False)
+
+        current_file = os.path.join(path, self.CURRENT_FILE)
+        with open(current_file + ".tmp", "w", encoding="utf-8") as f:
+            f.write(generation_name)
+        os.replace(current_file + ".tmp", current_file)
+        self._remove_old_generations(path, generation)
+
+    def _remove_old_generations(self, path: str, generation: int):
+        for name in os.listdir(path):
+            entry = os.path.join(path, name)
+            number = name[len(self.GENERATION_PREFIX):]
+            if name.startswith(self.GENERATION_PREFIX) and number.isdigit():
+                if int(number) < generation - 1:
+                    shutil.rmtree(entry, ignore_errors=True)
+            elif generation > 1 and name != self.CURRENT_FILE and os.path.isfile(entry):
+                # Archivos del formato anterior a las generaciones (hacen de generación 0)
+                try:
+                    os.remove(entry)
+                except FileNotFoundError:
+                    pass
+
+    def _ensure_strategy(self, force_rebuild: bool = False):
+        target = choose_index_strategy(
+            len(self.vectors), self.requested_strategy,
+            flat_max=settings.RAG_FLAT_MAX_VECTORS,
+            hnsw_max=settings.RAG_HNSW_MAX_VECTORS,
+            ivf_sq8_max=settings.RAG_IVF_SQ8_MAX_VECTORS,
+        )
+        # Los centroides IVF se entrenaron con `built_size` vectores; si el índice creció
+        # mucho desde entonces, las listas quedan desbalanceadas y conviene reentrenar.
+        outgrown = target.startswith("ivf") and len(self.vectors) > 4 * max(self.built_size, 1)
+        if force_rebuild or self._needs_rebuild or target != self.strategy or outgrown:
+            self._rebuild(target)
+
+    def _rebuild(self, strategy: str):
+        ordered_ids = sorted(self.vectors)
+        self.index = build_faiss_index(
+            self._stack_vectors(ordered_ids), np.array(ordered_ids, dtype=np.int64), strategy
+        )
+        logging.info(f"Índice reconstruido con estrategia '{strategy}' ({len(ordered_ids)} vectores).")
+        self.strategy = strategy
+        self.search_params = default_search_params(strategy, len(ordered_ids))
+        self.built_size = len(ordered_ids)
+        self._needs_rebuild = False
+
+    def reembed(self, embed_documents: Callable[[List[str]], np.ndarray], embedding_backend: str,
+                batch_size: int = 256):
+        """
+        Vuelve a vectorizar todos los chunks (a partir de su texto guardado) con otro
+        backend de embeddings. La dimensión puede cambiar: el índice se reconstruye al guardar.
+        """
+        self._check_writable()
+        ordered_ids = sorted(self.chunks)
+        vectors: Dict[int, np.ndarray] = {}
+        for start in range(0, len(ordered_ids), batch_size):
+            batch_ids = ordered_ids[start:start + batch_size]
+            matrix = np.asarray(embed_documents([self.chunks[vector_id] for vector_id in batch_ids]), dtype="float32")
+            vectors.update(zip(batch_ids, matrix))
+        if vectors:
+            dim = next(iter(vectors.values())).shape[0]
+            self.index = build_faiss_index(np.zeros((0, dim), dtype="float32"), np.zeros(0, dtype=np.int64), "flat")
+            self.strategy = "flat"
+        self.vectors = vectors
+        self.embedding_backend = embedding_backend
+        self._needs_rebuild = True
+
+    def _stack_vectors(self, ordered_ids: List[int]) -> np.ndarray:
+        if not ordered_ids:
+            return np.zeros((0, self.index.d), dtype="float32")
+        return np.stack([self.vectors[vector_id] for vector_id in ordered_ids]).astype("float32")
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("El índice se abrió en modo solo lectura")
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def document_ids(self) -> Set[int]:
+        self._check_writable()
+        return {document_id_from_vector_id(vector_id) for vector_id in self.chunks}
+
+    def add_document(self, document_id: int, texts: List[str], vectors: np.ndarray):
+        """Añade (o reemplaza, si se reprocesa) los chunks de un documento."""
+        self._check_writable()
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if vectors.shape[0] != len(texts):
+            raise ValueError("La cantidad de vectores no coincide con la cantidad de chunks")
+        if vectors.shape[0] >= (1 << CHUNK_BITS):
+            raise ValueError(f"El documento {document_id} tiene demasiados chunks")
+
+        if document_id in self.document_ids():
+            self._purge_documents({document_id})
+        self.tombstones.discard(document_id)
+
+        ids = make_vector_ids(document_id, len(texts))
+        if not self._needs_rebuild:
+            # Flat, HNSW e IVF (ya entrenado) admiten inserciones incrementales
+            self.index.add_with_ids(vectors, ids)
+        for row, (vector_id, text) in enumerate(zip(ids.tolist(), texts)):
+            self.chunks[vector_id] = text
+            self.vectors[vector_id] = vectors[row]
+
+    def remove_document(self, document_id: int):
+        """Marca un documento como eliminado; sus vectores se borran al compactar."""
+        self._check_writable()
+        if document_id in self.document_ids():
+            self.tombstones.add(document_id)
+
+    def tombstone_ratio(self) -> float:
+        self._check_writable()
+        if not self.chunks:
+            return 0.0
+        dead = sum(1 for vector_id in self.chunks if document_id_from_vector_id(vector_id) in self.tombstones)
+        return dead / len(self.chunks)
+
+    def compact(self) -> int:
+        """Elimina físicamente los vectores de los documentos marcados. Devuelve cuántos se borraron."""
+        self._check_writable()
+        if not self.tombstones:
+            return 0
+        removed = self._purge_documents(self.tombstones)
+        self.tombstones.clear()
+        return removed
+
+    def _purge_documents(self, document_ids: Iterable[int]) -> int:
+        document_ids = set(document_ids)
+        ids = np.array(
+            [vector_id for vector_id in self.chunks if document_id_from_vector_id(vector_id) in document_ids],
+            dtype=np.int64
+        )
+        if ids.size:
+            if not self._needs_rebuild:
+                try:
+                    self.index.remove_ids(ids)
+                except RuntimeError:
+                    # HNSW no soporta borrados: se reconstruye al guardar
+                    self._needs_rebuild = True
+            for vector_id in ids.tolist():
+                del self.chunks[vector_id]
+                self.vectors.pop(vector_id, None)
+        return int(ids.size)
+
+    def _accepts(self, allowed_document_ids: Optional[Set[int]]) -> Callable[[int], bool]:
+        """Filtro de chunks: descarta documentos borrados y, si se indica, los no permitidos."""
+        def accept(vector_id: int) -> bool:
+            document_id = document_id_from_vector_id(vector_id)
+            if document_id in self.tombstones:
+                return False
+            return allowed_document_ids is None or document_id in allowed_document_ids
+        return accept
+
+    def _result(self, vector_id: int, text: str, distance: Optional[float], relevance: float) -> dict:
+        return {
+            "id": int(vector_id),
+            "document_id": document_id_from_vector_id(vector_id),
+            "text": text,
+            "score": distance,
+            "relevance": relevance,
+        }
+
+    def search(self, query_vector: np.ndarray, k: int = 5,
+               allowed_document_ids: Optional[Set[int]] = None) -> List[dict]:
+        """
+        Una sola búsqueda ANN sobre todos los documentos del bot.
+        Devuelve hasta `k` chunks ordenados por distancia (`score`, menor es mejor);
+        `relevance` = 1 / (1 + distancia), mayor es mejor.
+        """
+        if self.index.ntotal == 0:
+            return []
+
+        query = np.ascontiguousarray(query_vector, dtype="float32").reshape(1, -1)
+        filtering = bool(self.tombstones) or allowed_document_ids is not None
+        accept = self._accepts(allowed_document_ids)
+        # Si hay que filtrar documentos, pedimos más candidatos para no quedarnos cortos
+        fetch_k = min(self.index.ntotal, k * 4 if filtering else k)
+
+        while True:
+            params = make_search_params(self.strategy, self.search_params, fetch_k)
+            distances, ids = self.index.search(query, fetch_k, params=params)
+            results = []
+            for distance, vector_id in zip(distances[0], ids[0]):
+                if vector_id == -1 or not accept(int(vector_id)):
+                    continue
+                text = self.chunks.get(int(vector_id))
+                if text is None:
+                    continue
+                results.append(self._result(vector_id, text, float(distance), 1.0 / (1.0 + float(distance))))
+                if len(results) == k:
+                    return results
+
+            if fetch_k >= self.index.ntotal:
+                return results
+            fetch_k = min(self.index.ntotal, fetch_k * 4)
+
+    def search_hybrid(self, query_vector: np.ndarray, query_text: str, k: int = 5,
+                      allowed_document_ids: Optional[Set[int]] = None,
+                      candidates: int = 20, rrf_k: int = 60) -> List[dict]:
+        """
+        Búsqueda híbrida: `candidates` resultados vectoriales y `candidates` resultados
+        BM25, combinados con Reciprocal Rank Fusion. Un chunk que coincide por un
+        término exacto (SKU, código) sube aunque su vector quede lejos.
+        `relevance` es el puntaje RRF; `score` es la distancia L2 si el chunk salió
+        también en la búsqueda vectorial.
+        """
+        vector_hits = self.search(query_vector, k=max(k, candidates), allowed_document_ids=allowed_document_ids)
+        if self.lexical is None:
+            return vector_hits[:k]
+
+        lexical_hits = self.lexical.search(query_text, k=max(k, candidates), accept=self._accepts(allowed_document_ids))
+        distances = {hit["id"]: hit["score"] for hit in vector_hits}
+        fused = reciprocal_rank_fusion(
+            [[hit["id"] for hit in vector_hits], [vector_id for vector_id, _ in lexical_hits]], k=rrf_k
+        )
+
+        results = []
+        for vector_id, relevance in fused:
+            text = self.chunks.get(vector_id)
+            if text is None:
+                continue
+            results.append(self._result(vector_id, text, distances.get(vector_id), relevance))
+            if len(results) == k:
+                break
+        return results
@@ -114,6 +114,15 @@ def toggle_user_approval(db: Session, user_id: int, toggled_by: str):
     return user
 
 # --- Bot CRUD ---
+def bump_bot_config_version(db: Session, bot_id: int):
+    """
+    Incrementa la versión de configuración del bot (sin commit). Se llama en cada
+    cambio que puede alterar sus respuestas; invalida la caché de respuestas.
+    """
+    db.query(models.Bot).filter(models.Bot.id == bot_id).update(
+        {models.Bot.config_version: models.Bot.config_version + 1}, synchronize_session=False
+    )
+
 def get_bots_by_user(db: Session, user_id: int):
     return db.query(models.Bot).filter(models.Bot.owner_id == user_id).all()
 
@@ -128,6 +137,7 @@ def update_bot(db: Session, bot: models.Bot, bot_update: schemas.BotUpdate):
     update_data = bot_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(bot, key, value)
+    bump_bot_config_version(db, bot.id)
     db.commit()
     db.refresh(bot)
     return bot
@@ -143,6 +153,7 @@ def delete_bot(db: Session, bot_id: int):
 def add_model_config_to_bot(db: Session, config: schemas.BotModelConfigCreate, bot_id: int):
     db_config = models.BotModelConfig(**config.dict(), bot_id=bot_id)
     db.add(db_config)
+    bump_bot_config_version(db, bot_id)
     db.commit()
     db.refresh(db_config)
     return db_config
@@ -150,10 +161,41 @@ def add_model_config_to_bot(db: Session, config: schemas.BotModelConfigCreate, b
 def delete_bot_model_config(db: Session, model_config_id: int):
     config = db.query(models.BotModelConfig).filter(models.BotModelConfig.id == model_config_id).first()
     if config:
+        bump_bot_config_version(db, config.bot_id)
         db.delete(config)
         db.commit()
     return config
 
+# --- BotIntentExample CRUD ---
+def add_intent_examples(db: Session, bot_id: int, task_type: str, texts: List[str], embedding_model: str, vectors):
+    """Guarda ejemplos etiquetados con su embedding (float32) e invalida la configuración del bot."""
+    examples = [
+        models.BotIntentExample(
+            bot_id=bot_id, task_type=task_type, text=text,
+            embedding_model=embedding_model, embedding=vector.astype("float32").tobytes()
+        )
+        for text, vector in zip(texts, vectors)
+    ]
+    db.add_all(examples)
+    bump_bot_config_version(db, bot_id)
+    db.commit()
+    for example in examples:
+        db.refresh(example)
+    return examples
+
+def get_intent_examples(db: Session, bot_id: int):
+    return db.query(models.BotIntentExample).filter(
+        models.BotIntentExample.bot_id == bot_id
+    ).order_by(models.BotIntentExample.task_type, models.BotIntentExample.id).all()
+
+def delete_intent_example(db: Session, example_id: int):
+    example = db.query(models.BotIntentExample).filter(models.BotIntentExample.id == example_id).first()
+    if example:
+        bump_bot_config_version(db, example.bot_id)
+        db.delete(example)
+        db.commit()
+    return example
+
 # --- Document CRUD ---
 def create_document(db: Session, doc: schemas.DocumentCreate):
     """
@@ -167,6 +209,7 @@ def create_document(db: Session, doc: schemas.DocumentCreate):
         status=models.DocumentStatus.PENDING # Estado inicial
     )
     db.add(db_doc)
+    bump_bot_config_version(db, doc.bot_id)
     db.commit()
     db.refresh(db_doc)
     return db_doc
@@ -182,9 +225,29 @@ def update_document_status(db: Session, doc_id: int, status: models.DocumentStat
         db.refresh(db_doc)
     return db_doc
 
+def delete_document(db: Session, doc_id: int):
+    """
+    Elimina el registro de un documento. Sus vectores se retiran del índice
+    del bot de forma asíncrona (ver remove_document_from_index_task).
+    """
+    db_doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
+    if db_doc:
+        bump_bot_config_version(db, db_doc.bot_id)
+        db.delete(db_doc)
+        db.commit()
+    return db_doc
+
 # === NUEVAS FUNCIONES CRUD PARA MÉTRICAS ===
 
 # --- UserPlan CRUD ---
+def _invalidate_bytoken_balance(user_id: int):
+    """Tras cambiar el saldo en user_plans, el saldo de Redis se recarga en el siguiente chat"""
+    from .config import settings
+    from .services.token_ledger import token_ledger
+
+    if settings.BYTOKEN_LEDGER_ENABLED:
+        token_ledger.invalidate(user_id)
+
 def get_user_plan(db: Session, user_id: int):
     """Obtiene el plan de un usuario"""
     return db.query(models.UserPlan).filter(models.UserPlan.user_id == user_id).first()
@@ -206,13 +269,18 @@ def update_user_plan(db: Session, user_id: int, plan_update: schemas.UserPlanUpd
             setattr(user_plan, key, value)
         db.commit()
         db.refresh(user_plan)
+        _invalidate_bytoken_balance(user_id)
     return user_plan
 
 # --- TokenUsage CRUD ---
 def create_token_usage(db: Session, usage: schemas.TokenUsageCreate):
     """Registra un nuevo uso de tokens"""
-    db_usage = models.TokenUsage(**usage.dict())
+    from .services.usage_rollups import apply_usage_rows
+
+    usage_row = dict(usage.dict(), created_at=datetime.utcnow())
+    db_usage = models.TokenUsage(**usage_row)
     db.add(db_usage)
+    apply_usage_rows(db, [usage_row])
     db.commit()
     db.refresh(db_usage)
     return db_usage
@@ -304,6 +372,7 @@ def get_all_users_with_plans(db: Session, skip: int = 0, limit: int = 100):
     """
     from sqlalchemy.orm import joinedload
     from datetime import datetime, timedelta
+    from .services.usage_rollups import usage_totals
     
     # Obtener usuarios con sus planes
     users = db.query(models.User).options(joinedload(models.User.bots)).offset(skip).limit(limit).all()
@@ -315,14 +384,11 @@ def get_all_users_with_plans(db: Session, skip: int = 0, limit: int = 100):
         
         # Calcular estadísticas de uso (últimos 30 días) - Corregido para usar BytTokens
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        tokens_used_30_days = db.query(func.sum(models.TokenUsage.bytokens_cost)).filter(
-            models.TokenUsage.user_id == user.id,
-            models.TokenUsage.created_at >= thirty_days_ago
-        ).scalar() or 0
+        tokens_used_30_days = usage_totals(db, thirty_days_ago, ("bytokens_cost",), user_id=user.id)[0][0]
         
         # Última actividad
-        last_activity = db.query(func.max(models.TokenUsage.created_at)).filter(
-            models.TokenUsage.user_id == user.id
+        last_activity = db.query(func.max(models.UsageRollupDaily.last_used_at)).filter(
+            models.UsageRollupDaily.user_id == user.id
         ).scalar()
         
         user_data = {
@@ -394,6 +460,7 @@ def admin_change_user_plan(db: Session, user_id: int, new_plan_type: models.Plan
     
     db.commit()
     db.refresh(user_plan)
+    _invalidate_bytoken_balance(user_id)
     
     return {
         "updated_plan": user_plan,
@@ -444,6 +511,7 @@ def admin_modify_user_tokens(db: Session, user_id: int, tokens_to_add: int,
     
     db.commit()
     db.refresh(user_plan)
+    _invalidate_bytoken_balance(user_id)
     
     return {
         "updated_plan": user_plan,
@@ -456,33 +524,28 @@ def get_user_plan_details(db: Session, user_id: int):
     Obtiene detalles completos del plan de un usuario para administradores
     """
     from datetime import datetime, timedelta
+    from .services.usage_rollups import usage_totals
     
     user_plan = db.query(models.UserPlan).filter(models.UserPlan.user_id == user_id).first()
     if not user_plan:
         return None
     
-    # Obtener estadísticas de uso
+    # Obtener estadísticas de uso (agregados de token_usage: siguen completos aunque
+    # se borren particiones antiguas de token_usage)
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
     
     # Uso total de tokens
-    total_tokens_used = db.query(func.sum(models.TokenUsage.total_tokens)).filter(
-        models.TokenUsage.user_id == user_id
+    total_tokens_used = db.query(func.sum(models.UsageRollupDaily.total_tokens)).filter(
+        models.UsageRollupDaily.user_id == user_id
     ).scalar() or 0
     
     # Uso últimos 30 días
-    tokens_last_30_days = db.query(func.sum(models.TokenUsage.total_tokens)).filter(
-        models.TokenUsage.user_id == user_id,
-        models.TokenUsage.created_at >= thirty_days_ago
-    ).scalar() or 0
+    tokens_last_30_days = usage_totals(db, thirty_days_ago, ("total_tokens",), user_id=user_id)[0][0]
     
     # Uso por proveedor (últimos 30 días)
-    usage_by_provider = db.query(
-        models.TokenUsage.provider,
-        func.sum(models.TokenUsage.total_tokens).label('total_tokens')
-    ).filter(
-        models.TokenUsage.user_id == user_id,
-        models.TokenUsage.created_at >= thirty_days_ago
-    ).group_by(models.TokenUsage.provider).all()
+    usage_by_provider = usage_totals(
+        db, thirty_days_ago, ("total_tokens",), group_by=("provider",), user_id=user_id
+    )
     
     provider_usage = {provider: tokens for provider, tokens in usage_by_provider}
     
@@ -503,6 +566,12 @@ def get_user_plan_details(db: Session, user_id: int):
 
 # === Funciones para ModelPricing ===
 
+def _notify_pricing_change():
+    """Los procesos recargan su tabla de precios en memoria (aviso por Redis)"""
+    from .services.pricing import pricing_resolver
+
+    pricing_resolver.publish_change()
+
 def get_all_model_pricing(db: Session) -> List[models.ModelPricing]:
     """Obtiene todos los precios de modelos"""
     return db.query(models.ModelPricing).filter(
@@ -529,6 +598,7 @@ def create_model_pricing(db: Session, pricing: schemas.ModelPricingCreate) -> mo
     db.add(db_pricing)
     db.commit()
     db.refresh(db_pricing)
+    _notify_pricing_change()
     return db_pricing
 
 def update_model_pricing(db: Session, pricing_id: int, pricing_update: schemas.ModelPricingUpdate) -> models.ModelPricing:
@@ -544,6 +614,7 @@ def update_model_pricing(db: Session, pricing_id: int, pricing_update: schemas.M
     
     db.commit()
     db.refresh(db_pricing)
+    _notify_pricing_change()
     return db_pricing
 
 def bulk_update_model_pricing(db: Session, updates: List[Dict], updated_by: str):
@@ -573,6 +644,8 @@ def bulk_update_model_pricing(db: Session, updates: List[Dict], updated_by: str)
         updated_count += 1
     
     db.commit()
+    if updated_count:
+        _notify_pricing_change()
     return {"updated_count": updated_count}
 
 def initialize_default_model_pricing(db: Session):
@@ -611,4 +684,5 @@ def initialize_default_model_pricing(db: Session):
         db.add(db_pricing)
     
     db.commit()
+    _notify_pricing_change()
     return True
\ No newline at end of file
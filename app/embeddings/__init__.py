@@ -0,0 +1,6 @@
+# app/embeddings/__init__.py
+
+from .base import EmbeddingBackend
+from .registry import EMBEDDING_BACKENDS, get_embedding_backend
+
+__all__ = ["EmbeddingBackend", "EMBEDDING_BACKENDS", "get_embedding_backend"]
@@ -0,0 +1,31 @@
+# app/embeddings/base.py
+
+from abc import ABC, abstractmethod
+from typing import List
+
+import numpy as np
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interfaz común de los modelos de embeddings usados por el sistema RAG.
+
+    `name` identifica el backend por bot (columna bots.embedding_backend y manifest
+    del índice); `model_name` identifica el modelo concreto y forma parte de las
+    claves de caché, así nunca se mezclan vectores de modelos distintos.
+    """
+
+    name: str = ""
+    model_name: str = ""
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.name}:{self.model_name}"
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Vectoriza los chunks de un documento. Devuelve una matriz float32 (n, dim)."""
+
+    @abstractmethod
+    def embed_query(self, text: str) -> np.ndarray:
+        """Vectoriza una consulta del usuario. Devuelve un vector float32 (dim,)."""
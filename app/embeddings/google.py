@@ -0,0 +1,29 @@
+# app/embeddings/google.py
+
+from typing import List
+
+import numpy as np
+
+from app.config import settings
+from .base import EmbeddingBackend
+
+
+class GoogleEmbeddingBackend(EmbeddingBackend):
+    """Embeddings remotos de Google (API de Generative AI)."""
+
+    name = "google"
+
+    def __init__(self, model_name: str = "models/embedding-001"):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        # Asegúrate de que GOOGLE_API_KEY está en tu archivo .env
+        if not settings.GOOGLE_API_KEY:
+            raise ValueError("La GOOGLE_API_KEY no se encontró en las variables de entorno.")
+        self.model_name = model_name
+        self._model = GoogleGenerativeAIEmbeddings(model=model_name)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return np.array(self._model.embed_documents(texts), dtype="float32")
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return np.array(self._model.embed_query(text), dtype="float32")
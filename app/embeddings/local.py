@@ -0,0 +1,66 @@
+# app/embeddings/local.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from .base import EmbeddingBackend
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings locales en CPU con sentence-transformers (mismo modelo que indexer.py).
+
+    Los textos se parten en lotes de `batch_size` que se codifican en un pool de
+    hilos (la inferencia libera el GIL), así un documento grande usa varios núcleos
+    sin bloquear al resto. Con `onnx_file` se intenta cargar el modelo exportado a
+    ONNX (p. ej. la variante cuantizada int8); si el entorno no lo soporta se usa
+    el modelo normal de PyTorch.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name: str, batch_size: int = 32, max_workers: int = 2,
+                 onnx_file: Optional[str] = None):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self._model = self._load_model(model_name, onnx_file)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="local-embeddings")
+
+    @staticmethod
+    def _load_model(model_name: str, onnx_file: Optional[str]):
+        from sentence_transformers import SentenceTransformer
+
+        if onnx_file:
+            try:
+                # Requiere sentence-transformers >= 3.2 y `optimum[onnxruntime]`
+                model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": onnx_file})
+                logging.info(f"Modelo de embeddings local cargado con ONNX ({onnx_file}).")
+                return model
+            except Exception as e:
+                logging.warning(f"No se pudo cargar {model_name} con ONNX ({e}); se usa PyTorch.")
+        return SentenceTransformer(model_name, device="cpu")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return np.asarray(vectors, dtype="float32")
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self._model.get_sentence_embedding_dimension()), dtype="float32")
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._encode(batches[0])
+        return np.vstack(list(self._executor.map(self._encode, batches)))
+
+    def embed_query(self, text: str) -> np.ndarray:
+        # Las consultas son cortas: se codifican en el hilo de la petición
+        return self._encode([text])[0]
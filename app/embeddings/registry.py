@@ -0,0 +1,42 @@
+# app/embeddings/registry.py
+
+import threading
+from typing import Dict
+
+from app.config import settings
+from .base import EmbeddingBackend
+
+# Backends seleccionables por bot (columna bots.embedding_backend)
+EMBEDDING_BACKENDS = ("google", "local")
+
+_backends: Dict[str, EmbeddingBackend] = {}
+_lock = threading.Lock()
+
+
+def _create_backend(name: str) -> EmbeddingBackend:
+    if name == "google":
+        from .google import GoogleEmbeddingBackend
+        return GoogleEmbeddingBackend(settings.GOOGLE_EMBEDDING_MODEL)
+    if name == "local":
+        from .local import LocalEmbeddingBackend
+        return LocalEmbeddingBackend(
+            settings.LOCAL_EMBEDDING_MODEL,
+            batch_size=settings.LOCAL_EMBEDDING_BATCH_SIZE,
+            max_workers=settings.LOCAL_EMBEDDING_THREADS,
+            onnx_file=settings.LOCAL_EMBEDDING_ONNX_FILE or None,
+        )
+    raise ValueError(f"Backend de embeddings no soportado: {name}")
+
+
+def get_embedding_backend(name: str) -> EmbeddingBackend:
+    """
+    Devuelve la instancia del backend `name`, creándola la primera vez.
+    Los modelos se cargan una sola vez por proceso y se comparten entre peticiones.
+    """
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+    with _lock:
+        if name not in _backends:
+            _backends[name] = _create_backend(name)
+        return _backends[name]
@@ -6,27 +6,55 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from typing import List
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime, timedelta
 import json
 import logging
+from contextlib import asynccontextmanager
 
 # --- Imports de nuestra aplicación ---
 from . import auth, crud, models, schemas
 from .database import engine, get_db
-from .core.orchestrator import Orchestrator
+from .config import settings
+from .core.orchestrator import Orchestrator, hedging_counts
+from .core.model_router import model_router
+from .core.latency_tracker import ttft_tracker
 from .worker import celery_app
 from .services.metrics_service import MetricsService
+from .services.usage_writer import usage_writer
+from .services.token_ledger import token_ledger
+from .services.pricing import pricing_resolver
+from .services.usage_rollups import usage_totals
+from .core.index_cache import index_cache
+from .core.embedding_cache import query_embedding_cache
+from .core.cache_manager import response_cache
+from .core.semantic_cache import semantic_cache
+from .core.single_flight import single_flight
+from .core.circuit_breaker import circuit_breaker
+from .connectors.registry import connector_registry
+from .connectors.http_client import http_pool_stats
+from .embeddings import get_embedding_backend
 
 
 # Crea las tablas en la base de datos si no existen
 models.Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Escritura diferida del uso: se arranca con el worker y al apagar se vacía la cola
+    usage_writer.start()
+    # Tabla de precios en memoria y suscripción a sus cambios, antes del primer chat
+    await run_in_threadpool(pricing_resolver.reload)
+    yield
+    await run_in_threadpool(usage_writer.stop)
+
 app = FastAPI(
     title="Bytchat SaaS API",
     description="API para la plataforma multi-tenant de Bytchat.",
-    version="1.4.0"
+    version="1.4.0",
+    lifespan=lifespan
 )
 
 # Montar la carpeta de archivos estáticos
@@ -266,7 +294,16 @@ def update_bot_details(
     current_user: models.User = Depends(auth.get_current_user),
 ):
     db_bot = get_bot(db, bot_id=bot_id, user_id=current_user.id)
-    return crud.update_bot(db=db, bot=db_bot, bot_update=bot_update)
+    previous_strategy = db_bot.index_strategy
+    previous_backend = db_bot.embedding_backend
+    updated_bot = crud.update_bot(db=db, bot=db_bot, bot_update=bot_update)
+    if updated_bot.embedding_backend != previous_backend:
+        # Volver a vectorizar los chunks con el nuevo backend (también aplica la estrategia)
+        celery_app.send_task('reembed_bot_index_task', args=[bot_id])
+    elif updated_bot.index_strategy != previous_strategy:
+        # Reconstruir el índice vectorial con la nueva estrategia
+        celery_app.send_task('rebuild_bot_index_task', args=[bot_id])
+    return updated_bot
 
 @app.delete("/bots/{bot_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Bots"])
 def delete_bot(bot_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
@@ -305,6 +342,58 @@ def remove_model_from_bot(
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@app.get("/bots/{bot_id}/intent-examples/", response_model=List[schemas.IntentExample], tags=["Bots"])
+def list_intent_examples(
+    bot_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Consultas de ejemplo por tipo de tarea del clasificador por embeddings (task_classifier=embedding)"""
+    get_bot(db=db, bot_id=bot_id, user_id=current_user.id)
+    return crud.get_intent_examples(db, bot_id=bot_id)
+
+@app.post("/bots/{bot_id}/intent-examples/", response_model=List[schemas.IntentExample], tags=["Bots"])
+def add_intent_examples(
+    bot_id: int,
+    examples: schemas.IntentExampleCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Añade consultas de ejemplo de un tipo de tarea; se vectorizan con el backend de embeddings del bot"""
+    bot = get_bot(db=db, bot_id=bot_id, user_id=current_user.id)
+    backend = get_embedding_backend(bot.embedding_backend or settings.DEFAULT_EMBEDDING_BACKEND)
+    try:
+        # Igual que las consultas reales (embed_query y misma caché), así los vectores son comparables
+        vectors = [
+            query_embedding_cache.get_or_embed(text, backend.embed_query, model=backend.cache_key)
+            for text in examples.texts
+        ]
+    except Exception as e:
+        logging.error(f"Error vectorizando ejemplos de intención: {e}")
+        raise HTTPException(status_code=502, detail="No se pudieron vectorizar los ejemplos")
+    return crud.add_intent_examples(
+        db, bot_id=bot_id, task_type=examples.task_type, texts=examples.texts,
+        embedding_model=backend.cache_key, vectors=vectors
+    )
+
+@app.delete("/bots/{bot_id}/intent-examples/{example_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Bots"])
+def remove_intent_example(
+    bot_id: int,
+    example_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    get_bot(db=db, bot_id=bot_id, user_id=current_user.id)
+    example = db.query(models.BotIntentExample).filter(
+        models.BotIntentExample.id == example_id,
+        models.BotIntentExample.bot_id == bot_id
+    ).first()
+    if not example:
+        raise HTTPException(status_code=404, detail="Ejemplo no encontrado para este bot")
+    crud.delete_intent_example(db, example_id=example_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @app.post("/bots/{bot_id}/train", tags=["Bots"])
 def train_bot_with_document(
     bot_id: int,
@@ -334,8 +423,8 @@ def train_bot_with_document(
     
     # Enviar tarea a Celery
     task = celery_app.send_task(
-        'app.worker.process_document',
-        args=[document.id, temp_file_path]
+        'process_document_task',
+        args=[bot_id, temp_file_path, document.id]
     )
     
     return {"message": "Documento enviado para procesamiento", "document_id": document.id, "task_id": task.id}
@@ -350,9 +439,36 @@ def get_bot_documents(
     bot = get_bot(db=db, bot_id=bot_id, user_id=current_user.id)
     return bot.documents
 
+@app.delete("/bots/{bot_id}/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Bots"])
+def delete_bot_document(
+    bot_id: int,
+    document_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # Verificar que el bot pertenece al usuario
+    bot = get_bot(db=db, bot_id=bot_id, user_id=current_user.id)
+    document = db.query(models.Document).filter(
+        models.Document.id == document_id,
+        models.Document.bot_id == bot_id
+    ).first()
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Documento no encontrado para este bot")
+
+    crud.delete_document(db=db, doc_id=document_id)
+    # Retirar sus vectores del índice consolidado del bot (tombstone + compactación)
+    celery_app.send_task('remove_document_from_index_task', args=[bot_id, document_id])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
 # === Endpoint para Chat Autenticado ===
+def load_bot_config(db: Session, bot_id: int, user_id: int) -> dict:
+    """Verifica que el bot pertenece al usuario y lo convierte a diccionario para el orquestador"""
+    bot = get_bot(db=db, bot_id=bot_id, user_id=user_id)
+    return schemas.Bot.from_orm(bot).model_dump()
+
 @app.post("/bots/{bot_id}/chat", tags=["Bots"])
-def chat_with_bot(
+async def chat_with_bot(
     bot_id: int,
     chat_query: schemas.ChatQuery,
     db: Session = Depends(get_db),
@@ -360,12 +476,10 @@ def chat_with_bot(
 ):
     """
     Endpoint de chat para usuarios autenticados con tracking de métricas.
+    Es asíncrono: cada stream en curso no ocupa un hilo del servidor.
     """
-    # Verificar que el bot pertenece al usuario
-    bot = get_bot(db=db, bot_id=bot_id, user_id=current_user.id)
-    
-    # Convertir el bot a diccionario para el orquestador
-    bot_config_dict = schemas.Bot.from_orm(bot).model_dump()
+    # Las consultas a la base de datos son bloqueantes: se hacen en el threadpool
+    bot_config_dict = await run_in_threadpool(load_bot_config, db, bot_id, current_user.id)
     
     # Crear orquestador con user_id para métricas
     orchestrator = Orchestrator(db=db, bot_config=bot_config_dict, bot_id=bot_id, user_id=current_user.id)
@@ -488,14 +602,15 @@ def get_admin_analytics_overview(
     for plan_type, count in plan_stats:
         users_by_plan[plan_type.value] = count
     
-    # Top 5 bots más usados
+    # Top 5 bots más usados (agregados diarios de token_usage)
+    usage_count = func.sum(models.UsageRollupDaily.requests)
     top_bots = db.query(
         models.Bot.name,
-        func.count(models.TokenUsage.id).label('usage_count')
-    ).join(models.TokenUsage).filter(
-        models.TokenUsage.created_at >= month_start
+        usage_count.label('usage_count')
+    ).join(models.UsageRollupDaily, models.UsageRollupDaily.bot_id == models.Bot.id).filter(
+        models.UsageRollupDaily.bucket >= month_start
     ).group_by(models.Bot.id, models.Bot.name).order_by(
-        func.count(models.TokenUsage.id).desc()
+        usage_count.desc()
     ).limit(5).all()
     
     return {
@@ -550,6 +665,60 @@ def get_revenue_analytics(
         }
     }
 
+@app.get("/admin/rag/index-cache/", tags=["Admin Analytics"])
+def get_rag_index_cache_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Estadísticas de la caché de índices FAISS de este proceso (aciertos, fallos, expulsiones)"""
+    return index_cache.stats()
+
+@app.get("/admin/rag/embedding-cache/", tags=["Admin Analytics"])
+def get_rag_embedding_cache_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Estadísticas de la caché de embeddings de consultas de este proceso"""
+    return query_embedding_cache.stats()
+
+@app.get("/admin/chat/response-cache/", tags=["Admin Analytics"])
+def get_response_cache_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Estadísticas de la caché de respuestas del chat (aciertos de este proceso y entradas en Redis)"""
+    stats = response_cache.stats()
+    stats["single_flight"] = single_flight.stats()
+    return stats
+
+@app.get("/admin/chat/circuit-breakers/", tags=["Admin Analytics"])
+async def get_circuit_breaker_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Estado del circuit breaker de cada proveedor (compartido entre workers)"""
+    if circuit_breaker is None:
+        return {"enabled": False}
+    return {"enabled": True, **await circuit_breaker.stats(connector_registry.providers())}
+
+@app.get("/admin/chat/hedging/", tags=["Admin Analytics"])
+def get_hedging_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Peticiones con hedging (y qué modelo ganó) y percentiles recientes del tiempo al primer trozo"""
+    return {
+        "hedged": hedging_counts["hedged"],
+        "primary_wins": hedging_counts["primary_wins"],
+        "secondary_wins": hedging_counts["secondary_wins"],
+        "ttft": ttft_tracker.stats(),
+    }
+
+@app.get("/admin/chat/routing/", tags=["Admin Analytics"])
+def get_routing_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Estadísticas recientes por modelo (TTFT, tokens/s, tasa de error, precio) y decisiones del router adaptativo"""
+    return model_router.routing_stats()
+
+@app.get("/admin/usage-writer/", tags=["Admin Analytics"])
+def get_usage_writer_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Escritura diferida del uso: registros pendientes, escritos, lotes, escrituras síncronas y fallos"""
+    return usage_writer.stats()
+
+@app.get("/admin/bytoken-ledger/", tags=["Admin Analytics"])
+def get_bytoken_ledger_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Saldo de BytTokens en Redis: reservas, rechazos por saldo, liquidaciones, devoluciones y usuarios por reconciliar"""
+    return token_ledger.stats()
+
+@app.get("/admin/http-pools/", tags=["Admin Analytics"])
+def get_http_pool_stats(current_user: models.User = Depends(auth.require_admin_role)):
+    """Métricas de los pools HTTP hacia los proveedores (conexiones activas/ociosas, espera del pool, reutilización)"""
+    return http_pool_stats()
+
 # === Endpoints de Analytics para Usuarios ===
 @app.get("/bots/{bot_id}/analytics", tags=["Analytics"])
 def get_bot_analytics(
@@ -572,47 +741,74 @@ def get_bot_analytics(
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Obtener eventos de chat
-    chat_events = db.query(models.AnalyticsEvent).filter(
+    chat_filter = (
         models.AnalyticsEvent.bot_id == bot_id,
         models.AnalyticsEvent.event_type == models.EventType.CHAT_MESSAGE,
         models.AnalyticsEvent.created_at >= start_date
-    ).order_by(models.AnalyticsEvent.created_at.desc()).all()
-    
-    # Contar mensajes por día
-    from collections import defaultdict
-    daily_usage = defaultdict(int)
+    )
     
-    for event in chat_events:
-        date_key = event.created_at.date().isoformat()
-        daily_usage[date_key] += 1
+    # Mensajes por día, contados en la base de datos (solo lee el índice bot_id/event_type/created_at)
+    message_day = func.date(func.timezone("UTC", models.AnalyticsEvent.created_at))
+    daily_usage = {
+        day.isoformat(): count
+        for day, count in db.query(message_day, func.count()).filter(*chat_filter).group_by(message_day).all()
+    }
     
-    # Obtener uso de tokens si existe
-    token_usage = db.query(models.TokenUsage).filter(
-        models.TokenUsage.bot_id == bot_id,
-        models.TokenUsage.created_at >= start_date
-    ).all()
+    # Solo los últimos mensajes se leen completos
+    recent_events = db.query(models.AnalyticsEvent).filter(*chat_filter).order_by(
+        models.AnalyticsEvent.created_at.desc()
+    ).limit(10).all()
     
-    total_tokens = sum(usage.total_tokens for usage in token_usage)
-    total_cost = sum(usage.total_cost for usage in token_usage)
+    # Uso de tokens desde los agregados de token_usage
+    total_tokens, total_cost, context_tokens_saved, cache_hits = usage_totals(
+        db, start_date, ("total_tokens", "total_cost", "context_tokens_saved", "cache_hits"), bot_id=bot_id
+    )[0]
     
     return {
         "bot_id": bot_id,
         "bot_name": bot.name,
         "period_days": days,
-        "total_messages": len(chat_events),
+        "total_messages": sum(daily_usage.values()),
         "total_tokens": total_tokens,
         "total_cost_cents": total_cost,
-        "daily_usage": dict(daily_usage),
+        "context_tokens_saved": context_tokens_saved,
+        "cache_hits": cache_hits,
+        "daily_usage": daily_usage,
         "recent_messages": [
             {
                 "timestamp": event.created_at.isoformat(),
                 "data": json.loads(event.event_data) if event.event_data else {}
             }
-            for event in chat_events[:10]
+            for event in recent_events
         ]
     }
 
+@app.get("/bots/{bot_id}/semantic-cache/audit", tags=["Analytics"])
+def get_semantic_cache_audit(
+    bot_id: int,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Tasa de aciertos y de falsos aciertos de la caché semántica del bot, con los aciertos recientes"""
+    db_bot = get_bot(db, bot_id=bot_id, user_id=current_user.id)
+    audit = semantic_cache.audit(bot_id, limit=limit)
+    audit["threshold"] = db_bot.semantic_cache_threshold or settings.SEMANTIC_CACHE_THRESHOLD
+    return audit
+
+@app.post("/bots/{bot_id}/semantic-cache/hits/{hit_id}/false-hit", tags=["Analytics"])
+def flag_semantic_cache_false_hit(
+    bot_id: int,
+    hit_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Marca un acierto de la caché semántica como incorrecto (borra la respuesta cacheada que lo causó)"""
+    get_bot(db, bot_id=bot_id, user_id=current_user.id)
+    if not semantic_cache.flag_false_hit(bot_id, hit_id):
+        raise HTTPException(status_code=404, detail="Acierto no encontrado en la muestra de auditoría")
+    return {"message": "Acierto marcado como falso", "hit_id": hit_id}
+
 @app.get("/user/analytics/summary", tags=["Analytics"])
 def get_user_analytics_summary(
     days: int = 30,
@@ -627,22 +823,16 @@ def get_user_analytics_summary(
     user_bots = db.query(models.Bot).filter(models.Bot.owner_id == current_user.id).all()
     
     # Obtener eventos totales
-    total_events = db.query(models.AnalyticsEvent).filter(
+    total_events = db.query(func.count()).select_from(models.AnalyticsEvent).filter(
         models.AnalyticsEvent.user_id == current_user.id,
         models.AnalyticsEvent.event_type == models.EventType.CHAT_MESSAGE,
         models.AnalyticsEvent.created_at >= start_date
-    ).count()
-    
-    # Obtener uso de tokens total
-    total_tokens = db.query(func.sum(models.TokenUsage.total_tokens)).filter(
-        models.TokenUsage.user_id == current_user.id,
-        models.TokenUsage.created_at >= start_date
-    ).scalar() or 0
+    ).scalar()
     
-    total_cost = db.query(func.sum(models.TokenUsage.total_cost)).filter(
-        models.TokenUsage.user_id == current_user.id,
-        models.TokenUsage.created_at >= start_date
-    ).scalar() or 0
+    # Obtener uso de tokens total (agregados de token_usage)
+    total_tokens, total_cost = usage_totals(
+        db, start_date, ("total_tokens", "total_cost"), user_id=current_user.id
+    )[0]
     
     return {
         "user_id": current_user.id,
@@ -662,20 +852,11 @@ def get_user_analytics_summary(
     }
 
 # === Endpoint público para el widget con consumo de tokens para bots de usuarios de pago ===
-@app.post("/chat/widget/{bot_id}", tags=["Public Chat"])
-def widget_chat(bot_id: int, data: dict = Body(...), db: Session = Depends(get_db)):
+def resolve_widget_chat(db: Session, bot_id: int, user_anon_id: str, query: str):
     """
-    Endpoint público para el widget de chat. Recibe userAnonId y mensaje.
-    
-    LÓGICA DE TOKENS:
-    - Si el bot pertenece a un usuario de pago: SÍ consume tokens del propietario
-    - Si el bot no tiene propietario o es demo: NO consume tokens
+    Prepara una petición del widget: registra la métrica básica y decide si consume
+    tokens del propietario. Devuelve (bot_config_dict, orchestrator_user_id, should_track_metrics).
     """
-    user_anon_id = data.get('userAnonId')
-    query = data.get('query')
-    if not user_anon_id or not query:
-        raise HTTPException(status_code=400, detail="Faltan datos obligatorios")
-    
     # Guardar la métrica básica
     with open('chat_metrics.log', 'a') as f:
         f.write(f"{datetime.utcnow().isoformat()} | bot_id={bot_id} | userAnonId={user_anon_id} | mensaje={query}\n")
@@ -708,6 +889,25 @@ def widget_chat(bot_id: int, data: dict = Body(...), db: Session = Depends(get_d
             f.write(f"  -> NO consumirá tokens (bot sin propietario)\n")
     
     bot_config_dict = schemas.Bot.from_orm(bot).model_dump()
+    return bot_config_dict, orchestrator_user_id, should_track_metrics
+
+@app.post("/chat/widget/{bot_id}", tags=["Public Chat"])
+async def widget_chat(bot_id: int, data: dict = Body(...), db: Session = Depends(get_db)):
+    """
+    Endpoint público para el widget de chat. Recibe userAnonId y mensaje.
+    
+    LÓGICA DE TOKENS:
+    - Si el bot pertenece a un usuario de pago: SÍ consume tokens del propietario
+    - Si el bot no tiene propietario o es demo: NO consume tokens
+    """
+    user_anon_id = data.get('userAnonId')
+    query = data.get('query')
+    if not user_anon_id or not query:
+        raise HTTPException(status_code=400, detail="Faltan datos obligatorios")
+    
+    bot_config_dict, orchestrator_user_id, should_track_metrics = await run_in_threadpool(
+        resolve_widget_chat, db, bot_id, user_anon_id, query
+    )
     
     # Crear orquestador con o sin métricas según el plan del propietario
     orchestrator = Orchestrator(
@@ -727,8 +927,36 @@ def widget_chat(bot_id: int, data: dict = Body(...), db: Session = Depends(get_d
     return StreamingResponse(text_stream_generator, media_type="text/plain; charset=utf-8")
 
 # === Endpoint autenticado para chat con métricas completas ===
+def resolve_authenticated_chat(db: Session, bot_id: int, current_user: models.User, query: str) -> dict:
+    """Verifica permisos sobre el bot, registra el evento de analytics y devuelve la configuración del bot"""
+    # Verificar que el bot pertenece al usuario o es público
+    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+    if not bot:
+        raise HTTPException(status_code=404, detail="Bot no encontrado")
+    
+    # Verificar permisos: el bot debe pertenecer al usuario actual
+    if bot.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="No tienes permisos para usar este bot")
+    
+    bot_config_dict = schemas.Bot.from_orm(bot).model_dump()
+    
+    # Registrar evento de análisis (en lote con el UsageWriter)
+    try:
+        MetricsService(db).record_analytics_event(
+            user_id=current_user.id,
+            bot_id=bot_id,
+            event_type=models.EventType.CHAT_MESSAGE,
+            event_data=json.dumps({"query_length": len(query), "query_preview": query[:50]}),
+            deferred=True
+        )
+    except Exception as e:
+        logging.warning(f"Error registrando evento de analytics: {e}")
+        db.rollback()
+    
+    return bot_config_dict
+
 @app.post("/chat/{bot_id}", tags=["Chat"])
-def authenticated_chat(
+async def authenticated_chat(
     bot_id: int,
     data: dict = Body(...),
     db: Session = Depends(get_db),
@@ -741,16 +969,7 @@ def authenticated_chat(
     if not query:
         raise HTTPException(status_code=400, detail="La consulta es obligatoria")
     
-    # Verificar que el bot pertenece al usuario o es público
-    bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
-    if not bot:
-        raise HTTPException(status_code=404, detail="Bot no encontrado")
-    
-    # Verificar permisos: el bot debe pertenecer al usuario actual
-    if bot.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="No tienes permisos para usar este bot")
-    
-    bot_config_dict = schemas.Bot.from_orm(bot).model_dump()
+    bot_config_dict = await run_in_threadpool(resolve_authenticated_chat, db, bot_id, current_user, query)
     
     # Crear orquestador CON métricas completas
     orchestrator = Orchestrator(db=db, bot_config=bot_config_dict, bot_id=bot_id, user_id=current_user.id)
@@ -762,21 +981,6 @@ def authenticated_chat(
         track_metrics=True
     )
     
-    # Registrar evento de análisis
-    try:
-        analytics_event = models.AnalyticsEvent(
-            user_id=current_user.id,
-            bot_id=bot_id,
-            event_type=models.EventType.CHAT_MESSAGE,
-            event_data=json.dumps({"query_length": len(query), "query_preview": query[:50]}),
-            created_at=datetime.utcnow()
-        )
-        db.add(analytics_event)
-        db.commit()
-    except Exception as e:
-        logging.warning(f"Error registrando evento de analytics: {e}")
-        db.rollback()
-    
     return StreamingResponse(text_stream_generator, media_type="text/plain; charset=utf-8")
 
 # === Endpoints para gestión de precios de modelos ===
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Enum, DateTime, func, Float, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, Text, Enum, DateTime, func, Float, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from .database import Base
 import enum
@@ -40,12 +40,39 @@ class Bot(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="bots")
 
+    # Estrategia del índice vectorial: auto, flat, hnsw, ivf_sq8, ivf_pq (ver app/core/index_factory.py)
+    index_strategy = Column(String, default="auto", server_default="auto", nullable=False)
+    # Backend de embeddings: google (API remota) o local (sentence-transformers, ver app/embeddings)
+    embedding_backend = Column(String, default="google", server_default="google", nullable=False)
+    # Modo de recuperación: vector (solo embeddings) o hybrid (embeddings + BM25)
+    retrieval_mode = Column(String, default="vector", server_default="vector", nullable=False)
+    # Presupuesto de tokens para el contexto RAG (NULL = RAG_CONTEXT_TOKEN_BUDGET, 0 = sin límite)
+    context_token_budget = Column(Integer, nullable=True)
+    # Se incrementa con cada cambio del bot, sus modelos o sus documentos (invalida la caché de respuestas)
+    config_version = Column(Integer, default=1, server_default="1", nullable=False)
+    # Umbral de similitud (0-1) de la caché semántica de respuestas; NULL = SEMANTIC_CACHE_THRESHOLD
+    semantic_cache_threshold = Column(Float, nullable=True)
+    # Hedging: si el primer modelo no responde dentro de este percentil de su TTFT reciente
+    # (p. ej. 95), se lanza la misma pregunta al siguiente modelo de la cadena. NULL = desactivado
+    hedge_percentile = Column(Integer, nullable=True)
+    # Objetivo del router: keywords (clásico), cheapest (más barato dentro del SLO) o fastest (ver app/core/model_router.py)
+    routing_objective = Column(String, default="keywords", server_default="keywords", nullable=False)
+    # SLO de latencia (TTFT p95 en ms) para routing_objective=cheapest; NULL = ROUTER_DEFAULT_LATENCY_SLO_MS
+    latency_slo_ms = Column(Integer, nullable=True)
+    # Reglas del router {tipo de tarea: [palabras clave]} (ver app/core/keyword_matcher.py); NULL = reglas por defecto
+    routing_keywords = Column(JSON, nullable=True)
+    # Clasificador del tipo de tarea de cada consulta: keywords (routing_keywords) o embedding
+    # (centroide más cercano de bot_intent_examples, ver app/core/intent_classifier.py)
+    task_classifier = Column(String, default="keywords", server_default="keywords", nullable=False)
+
     # --- LÍNEA CORREGIDA ---
     # Cambiamos 'back_pop_ulates' a 'back_populates'
     model_configs = relationship("BotModelConfig", back_populates="bot", cascade="all, delete-orphan")
 
     documents = relationship("Document", back_populates="bot", cascade="all, delete-orphan")
 
+    intent_examples = relationship("BotIntentExample", back_populates="bot", cascade="all, delete-orphan")
+
 class BotModelConfig(Base):
     __tablename__ = "bot_model_configs"
 
@@ -54,6 +81,8 @@ class BotModelConfig(Base):
     provider = Column(String, nullable=False)
     model_id = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    # Posición en la cadena de fallback del bot (NULL = no se usa como respaldo)
+    fallback_order = Column(Integer, nullable=True)
 
     bot_id = Column(Integer, ForeignKey("bots.id"))
     
@@ -61,6 +90,21 @@ class BotModelConfig(Base):
     # Cambiamos 'back_pop_ulates' a 'back_populates'
     bot = relationship("Bot", back_populates="model_configs")
 
+class BotIntentExample(Base):
+    """Consulta de ejemplo etiquetada con un tipo de tarea; los centroides por tipo clasifican las consultas del bot"""
+    __tablename__ = "bot_intent_examples"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"), nullable=False, index=True)
+    task_type = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    # Modelo de embeddings con el que se calculó el vector (EmbeddingBackend.cache_key) y vector float32
+    embedding_model = Column(String, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    bot = relationship("Bot", back_populates="intent_examples")
+
 class Document(Base):
     __tablename__ = 'documents'
 
@@ -142,10 +186,56 @@ class TokenUsage(Base):
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     response_time_ms = Column(Integer, nullable=True)  # Tiempo de respuesta
+    context_tokens_saved = Column(Integer, default=0)  # Tokens de contexto recortados por el presupuesto
+    cache_hit = Column(Boolean, default=False)  # Respuesta servida desde la caché (sin llamar al modelo)
     
     # Relaciones
     user = relationship("User")
     bot = relationship("Bot")
+    
+    # En PostgreSQL la tabla está particionada por mes de created_at (migrate_partition_usage_tables.sql)
+    __table_args__ = (
+        Index('idx_token_usage_user_created', 'user_id', 'created_at'),
+        Index('idx_token_usage_bot_created', 'bot_id', 'created_at'),
+    )
+
+class UsageRollupMixin:
+    """Agregado de token_usage por (período, usuario, bot, proveedor, modelo)"""
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, nullable=False)  # Inicio de la hora/día (UTC)
+    user_id = Column(Integer, nullable=False)
+    bot_id = Column(Integer, nullable=False)
+    provider = Column(String, nullable=False)
+    model_id = Column(String, nullable=False)
+
+    requests = Column(Integer, nullable=False, default=0)  # Filas de token_usage (mensajes)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Integer, nullable=False, default=0)  # En centavos
+    bytokens_cost = Column(Integer, nullable=False, default=0)
+    context_tokens_saved = Column(Integer, nullable=False, default=0)
+    response_time_ms_total = Column(BigInteger, nullable=False, default=0)  # Suma, para la media por mensaje
+    last_used_at = Column(DateTime, nullable=True)
+
+class UsageRollupHourly(UsageRollupMixin, Base):
+    __tablename__ = "usage_rollup_hourly"
+
+    __table_args__ = (
+        Index('idx_usage_rollup_hourly_key', 'bucket', 'user_id', 'bot_id', 'provider', 'model_id', unique=True),
+        Index('idx_usage_rollup_hourly_user', 'user_id', 'bucket'),
+        Index('idx_usage_rollup_hourly_bot', 'bot_id', 'bucket'),
+    )
+
+class UsageRollupDaily(UsageRollupMixin, Base):
+    __tablename__ = "usage_rollup_daily"
+
+    __table_args__ = (
+        Index('idx_usage_rollup_daily_key', 'bucket', 'user_id', 'bot_id', 'provider', 'model_id', unique=True),
+        Index('idx_usage_rollup_daily_user', 'user_id', 'bucket'),
+        Index('idx_usage_rollup_daily_bot', 'bot_id', 'bucket'),
+    )
 
 class BillingRecord(Base):
     __tablename__ = "billing_records"
@@ -217,6 +307,12 @@ class AnalyticsEvent(Base):
     # Relaciones
     user = relationship("User")
     bot = relationship("Bot")
+    
+    # En PostgreSQL la tabla está particionada por mes de created_at (migrate_partition_usage_tables.sql)
+    __table_args__ = (
+        Index('idx_analytics_events_user_type_created', 'user_id', 'event_type', 'created_at'),
+        Index('idx_analytics_events_bot_type_created', 'bot_id', 'event_type', 'created_at'),
+    )
 
 class ModelPricing(Base):
     __tablename__ = "model_pricing"
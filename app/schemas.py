@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 from .models import DocumentStatus, UserRole, PlanType, EventType # Importar el Enum
 
@@ -9,6 +9,7 @@ class BotModelConfigBase(BaseModel):
     provider: str = Field(..., example="google")
     model_id: str = Field(..., example="gemini-1.5-pro-latest")
     task_type: str = "general" # Campo añadido para la lógica del frontend
+    fallback_order: Optional[int] = None # Orden como respaldo si falla el modelo elegido (None = no se usa)
 
 class BotModelConfigCreate(BotModelConfigBase):
     pass
@@ -54,20 +55,62 @@ class BotBase(BaseModel):
 class BotCreate(BotBase):
     pass
 
+IndexStrategy = Literal["auto", "flat", "hnsw", "ivf_sq8", "ivf_pq"]
+EmbeddingBackendName = Literal["google", "local"]
+RetrievalMode = Literal["vector", "hybrid"]
+RoutingObjective = Literal["keywords", "cheapest", "fastest"]
+TaskClassifier = Literal["keywords", "embedding"]
+
 class BotUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     system_prompt: Optional[str] = None
+    index_strategy: Optional[IndexStrategy] = None
+    embedding_backend: Optional[EmbeddingBackendName] = None
+    retrieval_mode: Optional[RetrievalMode] = None
+    context_token_budget: Optional[int] = Field(None, ge=0)
+    semantic_cache_threshold: Optional[float] = Field(None, ge=0, le=1)
+    hedge_percentile: Optional[int] = Field(None, ge=50, le=99)
+    routing_objective: Optional[RoutingObjective] = None
+    latency_slo_ms: Optional[int] = Field(None, ge=100)
+    routing_keywords: Optional[Dict[str, List[str]]] = Field(None, example={"complex": ["analiz*", "código", "compar*"]})
+    task_classifier: Optional[TaskClassifier] = None
 
 class Bot(BotBase):
     id: int
     owner_id: int
     system_prompt: str
+    index_strategy: str = "auto"
+    embedding_backend: str = "google"
+    retrieval_mode: str = "vector"
+    context_token_budget: Optional[int] = None
+    config_version: int = 1
+    semantic_cache_threshold: Optional[float] = None
+    hedge_percentile: Optional[int] = None
+    routing_objective: str = "keywords"
+    latency_slo_ms: Optional[int] = None
+    routing_keywords: Optional[Dict[str, List[str]]] = None
+    task_classifier: str = "keywords"
     model_configs: List[BotModelConfig] = [] 
     documents: List[Document] = [] 
     class Config:
         from_attributes = True  # Cambiado de orm_mode
 
+# --- Schemas de ejemplos de intención (clasificador por embeddings) ---
+class IntentExampleCreate(BaseModel):
+    task_type: str = Field(..., example="simple")
+    texts: List[str] = Field(..., min_length=1, example=["¿A qué hora abren?", "¿Dónde están ubicados?"])
+
+class IntentExample(BaseModel):
+    id: int
+    bot_id: int
+    task_type: str
+    text: str
+    embedding_model: str
+    created_at: datetime
+    class Config:
+        from_attributes = True
+
 # --- Schemas de User ---
 class UserBase(BaseModel):
     email: str
@@ -164,6 +207,8 @@ class TokenUsageCreate(TokenUsageBase):
     total_cost: int = 0
     bytokens_cost: int = 0  # Nuevo campo
     response_time_ms: Optional[int] = None
+    context_tokens_saved: int = 0
+    cache_hit: bool = False
 
 class TokenUsage(TokenUsageBase):
     id: int
@@ -174,6 +219,8 @@ class TokenUsage(TokenUsageBase):
     total_cost: int
     bytokens_cost: int  # Nuevo campo
     response_time_ms: Optional[int] = None
+    context_tokens_saved: Optional[int] = 0
+    cache_hit: Optional[bool] = False
     created_at: datetime
     
     class Config:
@@ -1,14 +1,17 @@
 import os
-import requests
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import json
 
+from ..connectors.http_client import get_http_client
+
 class CulqiService:
     def __init__(self):
         self.secret_key = os.getenv("CULQI_SECRET_KEY")
         self.public_key = os.getenv("CULQI_PUBLIC_KEY")
         self.base_url = "https://api.culqi.com/v2"
+        # Cliente compartido con keep-alive (evita un handshake TLS por llamada)
+        self.client = get_http_client("culqi")
         
         if not self.secret_key or not self.public_key:
             raise ValueError("Culqi keys not configured")
@@ -28,7 +31,7 @@ class CulqiService:
             "last_name": last_name
         }
         
-        response = requests.post(url, headers=self._get_headers(), json=data)
+        response = self.client.post(url, headers=self._get_headers(), json=data)
         response.raise_for_status()
         return response.json()
     
@@ -40,7 +43,7 @@ class CulqiService:
             "token_id": token_id
         }
         
-        response = requests.post(url, headers=self._get_headers(), json=data)
+        response = self.client.post(url, headers=self._get_headers(), json=data)
         response.raise_for_status()
         return response.json()
     
@@ -57,7 +60,7 @@ class CulqiService:
         if trial_days > 0:
             data["trial_days"] = trial_days
         
-        response = requests.post(url, headers=self._get_headers(), json=data)
+        response = self.client.post(url, headers=self._get_headers(), json=data)
         response.raise_for_status()
         return response.json()
     
@@ -73,7 +76,7 @@ class CulqiService:
             "interval_count": interval_count
         }
         
-        response = requests.post(url, headers=self._get_headers(), json=data)
+        response = self.client.post(url, headers=self._get_headers(), json=data)
         response.raise_for_status()
         return response.json()
     
@@ -81,7 +84,7 @@ class CulqiService:
         """Obtener información de una suscripción"""
         url = f"{self.base_url}/subscriptions/{subscription_id}"
         
-        response = requests.get(url, headers=self._get_headers())
+        response = self.client.get(url, headers=self._get_headers())
         response.raise_for_status()
         return response.json()
     
@@ -92,7 +95,7 @@ class CulqiService:
             "cancel_at_period_end": at_period_end
         }
         
-        response = requests.patch(url, headers=self._get_headers(), json=data)
+        response = self.client.patch(url, headers=self._get_headers(), json=data)
         response.raise_for_status()
         return response.json()
     
@@ -108,7 +111,7 @@ class CulqiService:
             "description": description
         }
         
-        response = requests.post(url, headers=self._get_headers(), json=data)
+        response = self.client.post(url, headers=self._get_headers(), json=data)
         response.raise_for_status()
         return response.json()
     
@@ -116,6 +119,6 @@ class CulqiService:
         """Obtener información de un cargo"""
         url = f"{self.base_url}/charges/{charge_id}"
         
-        response = requests.get(url, headers=self._get_headers())
+        response = self.client.get(url, headers=self._get_headers())
         response.raise_for_status()
         return response.json() 
\ No newline at end of file
@@ -4,35 +4,18 @@ Servicio central para métricas, tracking de tokens y facturación
 
 import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 
 from .. import models, schemas
+from ..config import settings
 from ..models import PlanType, EventType
-
-# Configuración de precios reales de modelos (USD por 1K tokens)
-MODEL_PRICING = {
-    # OpenAI
-    "gpt-4o": {"input": 0.005, "output": 0.015},
-    "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
-    "gpt-4-turbo": {"input": 0.01, "output": 0.03},
-    "o1-preview": {"input": 0.015, "output": 0.06},
-    "o1-mini": {"input": 0.003, "output": 0.012},
-    
-    # Google Gemini
-    "gemini-pro": {"input": 0.0015, "output": 0.0015},
-    "gemini-flash": {"input": 0.00015, "output": 0.0006},
-    "gemini-ultra": {"input": 0.003, "output": 0.003},
-    
-    # DeepSeek
-    "deepseek-v2": {"input": 0.0002, "output": 0.0002},
-    "deepseek-reasoner": {"input": 0.002, "output": 0.002},
-    
-    # Valores por defecto para modelos no listados
-    "default": {"input": 0.001, "output": 0.001}
-}
+from .usage_writer import usage_writer
+from .token_ledger import token_ledger
+from .pricing import pricing_resolver
+from .usage_rollups import apply_usage_rows, day_start
 
 # Configuración de planes con BytTokens
 PLAN_CONFIGS_BYTETOKENS = {
@@ -59,31 +42,15 @@ PLAN_CONFIGS_BYTETOKENS = {
 class MetricsService:
     """Servicio central para manejo de métricas y facturación"""
     
-    # Precios por token en centavos (actualizables desde configuración)
-    TOKEN_COSTS = {
-        "openai": {
-            "gpt-4": {"prompt": 0.003, "completion": 0.006},  # $0.03/$0.06 per 1K tokens
-            "gpt-4o": {"prompt": 0.0025, "completion": 0.01},  # $0.025/$0.10 per 1K tokens
-            "gpt-3.5-turbo": {"prompt": 0.0005, "completion": 0.0015},  # $0.0005/$0.0015 per 1K tokens
-        },
-        "google": {
-            "gemini-1.5-pro": {"prompt": 0.00125, "completion": 0.005},  # $0.00125/$0.005 per 1K tokens
-            "gemini-1.5-flash": {"prompt": 0.000075, "completion": 0.0003},  # $0.000075/$0.0003 per 1K tokens
-            "gemini-1.5-flash-latest": {"prompt": 0.000075, "completion": 0.0003},  # $0.000075/$0.0003 per 1K tokens
-            "gemini-1.5-pro-latest": {"prompt": 0.00125, "completion": 0.005},  # $0.00125/$0.005 per 1K tokens
-        },
-        "deepseek": {
-            "deepseek-chat": {"prompt": 0.00014, "completion": 0.00028},  # $0.00014/$0.00028 per 1K tokens
-        }
-    }
-    
-
-
     def __init__(self, db: Session):
         self.db = db
 
-    def get_or_create_user_plan(self, user_id: int) -> models.UserPlan:
-        """Obtiene o crea el plan de un usuario"""
+    def get_or_create_user_plan(self, user_id: int, commit: bool = True) -> models.UserPlan:
+        """
+        Obtiene o crea el plan de un usuario. Con commit=False el plan nuevo solo se
+        envía (flush) dentro de la transacción en curso: no confirma lo que el llamador
+        lleve hecho ni suelta sus bloqueos de fila.
+        """
         user_plan = self.db.query(models.UserPlan).filter(
             models.UserPlan.user_id == user_id
         ).first()
@@ -101,8 +68,11 @@ class MetricsService:
                 current_period_end=datetime.utcnow() + timedelta(days=30)
             )
             self.db.add(user_plan)
-            self.db.commit()
-            self.db.refresh(user_plan)
+            if commit:
+                self.db.commit()
+                self.db.refresh(user_plan)
+            else:
+                self.db.flush()
         
         return user_plan
 
@@ -113,14 +83,11 @@ class MetricsService:
         Returns: (prompt_cost, completion_cost, total_cost)
         """
         try:
-            costs = self.TOKEN_COSTS.get(provider, {}).get(model_id, {})
-            if not costs:
-                logging.warning(f"No hay costos definidos para {provider}:{model_id}")
-                return 0, 0, 0
+            input_cost_per_1k, output_cost_per_1k = pricing_resolver.price(provider, model_id)
             
             # Calcular costos (los precios están por 1K tokens, convertir a centavos)
-            prompt_cost = int((prompt_tokens / 1000) * costs["prompt"] * 100)
-            completion_cost = int((completion_tokens / 1000) * costs["completion"] * 100)
+            prompt_cost = int((prompt_tokens / 1000) * input_cost_per_1k * 100)
+            completion_cost = int((completion_tokens / 1000) * output_cost_per_1k * 100)
             total_cost = prompt_cost + completion_cost
             
             return prompt_cost, completion_cost, total_cost
@@ -131,26 +98,11 @@ class MetricsService:
 
     def calculate_bytetoken_cost(self, provider: str, model_id: str, prompt_tokens: int, completion_tokens: int) -> int:
         """
-        Calcula el costo en BytTokens basado en precios reales de modelos desde la BD
+        Calcula el costo en BytTokens basado en precios reales de modelos (model_pricing,
+        en memoria: no consulta la BD)
         1000 BytTokens = $1 USD
         """
-        # Intentar obtener precios desde la base de datos
-        model_pricing_db = self.db.query(models.ModelPricing).filter(
-            models.ModelPricing.provider == provider.lower(),
-            models.ModelPricing.model_id == model_id.lower(),
-            models.ModelPricing.is_active == True
-        ).first()
-        
-        if model_pricing_db:
-            # Usar precios de la base de datos
-            input_cost_per_1k = model_pricing_db.input_cost_per_1k
-            output_cost_per_1k = model_pricing_db.output_cost_per_1k
-        else:
-            # Fallback a precios hardcodeados
-            model_key = model_id.lower()
-            model_pricing = MODEL_PRICING.get(model_key, MODEL_PRICING["default"])
-            input_cost_per_1k = model_pricing["input"]
-            output_cost_per_1k = model_pricing["output"]
+        input_cost_per_1k, output_cost_per_1k = pricing_resolver.price(provider, model_id)
         
         # Calcular costo en USD
         prompt_cost_usd = (prompt_tokens / 1000.0) * input_cost_per_1k
@@ -163,23 +115,22 @@ class MetricsService:
         # Mínimo 1 BytToken para evitar uso "gratis"
         return max(1, bytokens_cost)
 
-    def get_model_info(self, model_id: str) -> dict:
+    def get_model_info(self, model_id: str, provider: Optional[str] = None) -> dict:
         """
         Obtiene información del modelo incluyendo costos estimados
         """
-        model_key = model_id.lower()
-        pricing = MODEL_PRICING.get(model_key, MODEL_PRICING["default"])
+        input_cost_per_1k, output_cost_per_1k = pricing_resolver.price(provider, model_id)
         
         # Calcular costo promedio por pregunta (estimación: 150 tokens input, 100 tokens output)
         estimated_input = 150
         estimated_output = 100
-        estimated_cost_usd = (estimated_input / 1000.0) * pricing["input"] + (estimated_output / 1000.0) * pricing["output"]
+        estimated_cost_usd = (estimated_input / 1000.0) * input_cost_per_1k + (estimated_output / 1000.0) * output_cost_per_1k
         estimated_bytokens = int(estimated_cost_usd * 1000)
         
         return {
             "model_id": model_id,
-            "input_cost_per_1k": pricing["input"],
-            "output_cost_per_1k": pricing["output"],
+            "input_cost_per_1k": input_cost_per_1k,
+            "output_cost_per_1k": output_cost_per_1k,
             "estimated_cost_per_query_usd": round(estimated_cost_usd, 4),
             "estimated_cost_per_query_bytokens": max(1, estimated_bytokens)
         }
@@ -217,6 +168,23 @@ class MetricsService:
             "overage_tokens": overage_tokens if will_overage else 0
         }
 
+    def reserve_bytokens(self, user_id: int, provider: str, model_id: str, prompt_tokens: int) -> Optional[Dict[str, Any]]:
+        """
+        Reserva en el saldo de Redis el costo estimado de una respuesta antes de llamar al modelo.
+        Returns: {"allowed": bool, "remaining": int, "reservation": id o None}, o None si el saldo
+        en Redis está desactivado o no responde (entonces se usa check_token_limit).
+        """
+        if not settings.BYTOKEN_LEDGER_ENABLED:
+            return None
+        estimated_bytokens = self.calculate_bytetoken_cost(
+            provider, model_id, prompt_tokens, settings.BYTOKEN_LEDGER_ESTIMATED_COMPLETION_TOKENS
+        )
+        return token_ledger.reserve(user_id, estimated_bytokens, lambda: self.get_or_create_user_plan(user_id))
+
+    def release_bytokens(self, user_id: int, reservation: str):
+        """Libera una reserva sin consumo (p. ej. ningún modelo respondió); no-op si ya se liquidó."""
+        token_ledger.refund(user_id, reservation)
+
     def record_token_usage(self, 
                           user_id: int, 
                           bot_id: int,
@@ -226,9 +194,13 @@ class MetricsService:
                           model_id: str,
                           prompt_tokens: int,
                           completion_tokens: int,
-                          response_time_ms: Optional[int] = None) -> models.TokenUsage:
+                          response_time_ms: Optional[int] = None,
+                          context_tokens_saved: int = 0,
+                          reservation: Optional[str] = None) -> models.TokenUsage:
         """
-        Registra el uso de tokens y actualiza el plan del usuario usando BytTokens
+        Registra el uso de tokens y actualiza el plan del usuario usando BytTokens.
+        `context_tokens_saved`: tokens de contexto que el presupuesto evitó enviar.
+        `reservation`: reserva de reserve_bytokens que este consumo liquida.
         """
         total_tokens = prompt_tokens + completion_tokens
         
@@ -243,7 +215,7 @@ class MetricsService:
         )
         
         # Crear registro de uso
-        token_usage = models.TokenUsage(
+        usage_row = self._usage_row(
             user_id=user_id,
             bot_id=bot_id,
             user_anon_id=user_anon_id,
@@ -257,14 +229,55 @@ class MetricsService:
             completion_cost=completion_cost,
             total_cost=total_cost,
             bytokens_cost=bytokens_cost,  # Nuevo campo
-            response_time_ms=response_time_ms
+            response_time_ms=response_time_ms,
+            context_tokens_saved=context_tokens_saved
         )
-        
+        event_data = json.dumps({
+            "provider": provider,
+            "model_id": model_id,
+            "total_tokens": total_tokens,
+            "total_cost": total_cost
+        })
+
+        # Con el saldo en Redis el descuento se liquida allí y el reconciliador lo lleva a user_plans
+        charged_in_ledger = settings.BYTOKEN_LEDGER_ENABLED and token_ledger.commit(user_id, reservation, bytokens_cost)
+
+        if settings.USAGE_WRITE_BEHIND:
+            # Escritura diferida: el uso, el descuento del plan y el evento se escriben en lote
+            usage_writer.submit_usage(usage_row, charge_bytokens=not charged_in_ledger)
+            usage_writer.submit_event(self._event_row(
+                event_type=EventType.CHAT_MESSAGE, user_id=user_id, bot_id=bot_id,
+                event_data=event_data, user_anon_id=user_anon_id
+            ))
+            return models.TokenUsage(**usage_row)
+
+        usage_row["created_at"] = datetime.now(timezone.utc)
+        token_usage = models.TokenUsage(**usage_row)
         self.db.add(token_usage)
+        apply_usage_rows(self.db, [usage_row])
         
         # Actualizar plan del usuario usando BytTokens
-        user_plan = self.get_or_create_user_plan(user_id)
+        if not charged_in_ledger:
+            user_plan = self.get_or_create_user_plan(user_id)
+            self.charge_plan(user_plan, bytokens_cost)
+        
+        self.db.commit()
+        self.db.refresh(token_usage)
+        
+        # Registrar evento analítico
+        self.record_analytics_event(
+            user_id=user_id,
+            bot_id=bot_id,
+            event_type=EventType.CHAT_MESSAGE,
+            event_data=event_data,
+            user_anon_id=user_anon_id
+        )
         
+        return token_usage
+
+    @staticmethod
+    def charge_plan(user_plan: models.UserPlan, bytokens_cost: int):
+        """Descuenta BytTokens del plan; lo que no alcance pasa a overage."""
         if user_plan.bytokens_remaining >= bytokens_cost:
             # Descontar del plan base
             user_plan.bytokens_remaining -= bytokens_cost
@@ -274,24 +287,56 @@ class MetricsService:
             user_plan.bytokens_remaining = 0
             user_plan.tokens_overage += overage_bytokens
             user_plan.overage_cost += int((overage_bytokens / 1000) * user_plan.overage_rate)
-        
-        self.db.commit()
-        self.db.refresh(token_usage)
-        
-        # Registrar evento analítico
-        self.record_analytics_event(
+
+    @staticmethod
+    def _usage_row(**values) -> Dict[str, Any]:
+        """Fila completa de token_usage (mismas columnas en todas, para el INSERT de varias filas)."""
+        row = {
+            "user_anon_id": None, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+            "prompt_cost": 0, "completion_cost": 0, "total_cost": 0, "bytokens_cost": 0,
+            "response_time_ms": None, "context_tokens_saved": 0, "cache_hit": False,
+        }
+        row.update(values)
+        return row
+
+    @staticmethod
+    def _event_row(**values) -> Dict[str, Any]:
+        row = {"user_id": None, "bot_id": None, "event_data": None, "user_anon_id": None,
+               "ip_address": None, "user_agent": None}
+        row.update(values)
+        return row
+
+    def record_cache_hit(self,
+                         user_id: int,
+                         bot_id: int,
+                         user_anon_id: Optional[str],
+                         query: str,
+                         provider: str,
+                         model_id: str) -> models.TokenUsage:
+        """
+        Registra una respuesta servida desde la caché. Queda como uso con cache_hit=True
+        y sin tokens ni BytTokens: no se llamó al modelo, así que no se descuenta del plan.
+        """
+        usage_row = self._usage_row(
             user_id=user_id,
             bot_id=bot_id,
-            event_type=EventType.CHAT_MESSAGE,
-            event_data=json.dumps({
-                "provider": provider,
-                "model_id": model_id,
-                "total_tokens": total_tokens,
-                "total_cost": total_cost
-            }),
-            user_anon_id=user_anon_id
+            user_anon_id=user_anon_id,
+            query=query,
+            provider=provider,
+            model_id=model_id,
+            response_time_ms=0,
+            cache_hit=True
         )
-        
+        if settings.USAGE_WRITE_BEHIND:
+            usage_writer.submit_usage(usage_row, charge_bytokens=False)
+            return models.TokenUsage(**usage_row)
+
+        usage_row["created_at"] = datetime.now(timezone.utc)
+        token_usage = models.TokenUsage(**usage_row)
+        self.db.add(token_usage)
+        apply_usage_rows(self.db, [usage_row])
+        self.db.commit()
+        self.db.refresh(token_usage)
         return token_usage
 
     def record_analytics_event(self,
@@ -301,8 +346,19 @@ class MetricsService:
                               event_data: Optional[str] = None,
                               user_anon_id: Optional[str] = None,
                               ip_address: Optional[str] = None,
-                              user_agent: Optional[str] = None):
-        """Registra un evento analítico"""
+                              user_agent: Optional[str] = None,
+                              deferred: bool = False):
+        """
+        Registra un evento analítico. Con `deferred` (eventos del chat) se encola en
+        el UsageWriter en lugar de escribirse en esta transacción.
+        """
+        if deferred and settings.USAGE_WRITE_BEHIND:
+            usage_writer.submit_event(self._event_row(
+                event_type=event_type, user_id=user_id, bot_id=bot_id, event_data=event_data,
+                user_anon_id=user_anon_id, ip_address=ip_address, user_agent=user_agent
+            ))
+            return
+
         event = models.AnalyticsEvent(
             user_id=user_id,
             bot_id=bot_id,
@@ -324,25 +380,28 @@ class MetricsService:
         now = datetime.utcnow()
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
+        # Agregados diarios de token_usage (no se recorre el detalle)
+        daily = models.UsageRollupDaily
+        
         # Uso de BytTokens este mes (corregido para usar bytokens_cost)
-        monthly_usage = self.db.query(func.sum(models.TokenUsage.bytokens_cost)).filter(
+        monthly_usage = self.db.query(func.sum(daily.bytokens_cost)).filter(
             and_(
-                models.TokenUsage.user_id == user_id,
-                models.TokenUsage.created_at >= month_start
+                daily.user_id == user_id,
+                daily.bucket >= month_start
             )
         ).scalar() or 0
         
         # Uso por proveedor (corregido para usar bytokens_cost)
         usage_by_provider = {}
         provider_usage = self.db.query(
-            models.TokenUsage.provider,
-            func.sum(models.TokenUsage.bytokens_cost).label('total')
+            daily.provider,
+            func.sum(daily.bytokens_cost).label('total')
         ).filter(
             and_(
-                models.TokenUsage.user_id == user_id,
-                models.TokenUsage.created_at >= month_start
+                daily.user_id == user_id,
+                daily.bucket >= month_start
             )
-        ).group_by(models.TokenUsage.provider).all()
+        ).group_by(daily.provider).all()
         
         for provider, total in provider_usage:
             usage_by_provider[provider] = total
@@ -350,18 +409,18 @@ class MetricsService:
         # Actividad diaria últimos 30 días (corregido para usar bytokens_cost)
         thirty_days_ago = now - timedelta(days=30)
         daily_usage = self.db.query(
-            func.date(models.TokenUsage.created_at).label('date'),
-            func.sum(models.TokenUsage.bytokens_cost).label('bytokens')
+            daily.bucket,
+            func.sum(daily.bytokens_cost).label('bytokens')
         ).filter(
             and_(
-                models.TokenUsage.user_id == user_id,
-                models.TokenUsage.created_at >= thirty_days_ago
+                daily.user_id == user_id,
+                daily.bucket >= day_start(thirty_days_ago)
             )
-        ).group_by(func.date(models.TokenUsage.created_at)).all()
+        ).group_by(daily.bucket).order_by(daily.bucket).all()
         
         daily_usage_list = [
-            {"date": date.isoformat(), "tokens": bytokens}  # tokens por compatibilidad con frontend
-            for date, bytokens in daily_usage
+            {"date": bucket.date().isoformat(), "tokens": bytokens}  # tokens por compatibilidad con frontend
+            for bucket, bytokens in daily_usage
         ]
         
         return {
@@ -422,6 +481,8 @@ class MetricsService:
         user_plan.overage_cost = 0
         
         self.db.commit()
+        if settings.BYTOKEN_LEDGER_ENABLED:
+            token_ledger.invalidate(user_id)
         
         # Registrar evento de upgrade
         self.record_analytics_event(
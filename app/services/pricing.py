@@ -0,0 +1,164 @@
+"""
+Precios de los modelos (USD por 1K tokens) cargados una vez por proceso
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import redis
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+
+Price = Tuple[float, float]  # (USD por 1K de entrada, USD por 1K de salida)
+
+# Precios de respaldo para modelos que no están en model_pricing (misma tabla para
+# el costo en centavos y en BytTokens). Se mantienen alineados con los que siembra
+# crud.initialize_default_model_pricing.
+DEFAULT_MODEL_PRICING: Dict[Tuple[str, str], Price] = {
+    # OpenAI
+    ("openai", "gpt-4o"): (0.005, 0.015),
+    ("openai", "gpt-4o-mini"): (0.00015, 0.0006),
+    ("openai", "gpt-4-turbo"): (0.01, 0.03),
+    ("openai", "gpt-4"): (0.03, 0.06),
+    ("openai", "gpt-3.5-turbo"): (0.0005, 0.0015),
+    ("openai", "o1-preview"): (0.015, 0.06),
+    ("openai", "o1-mini"): (0.003, 0.012),
+
+    # Google Gemini
+    ("google", "gemini-pro"): (0.0015, 0.0015),
+    ("google", "gemini-flash"): (0.00015, 0.0006),
+    ("google", "gemini-ultra"): (0.003, 0.003),
+    ("google", "gemini-1.5-pro"): (0.00125, 0.005),
+    ("google", "gemini-1.5-pro-latest"): (0.00125, 0.005),
+    ("google", "gemini-1.5-flash"): (0.000075, 0.0003),
+    ("google", "gemini-1.5-flash-latest"): (0.000075, 0.0003),
+
+    # DeepSeek
+    ("deepseek", "deepseek-chat"): (0.00014, 0.00028),
+    ("deepseek", "deepseek-v2"): (0.0002, 0.0002),
+    ("deepseek", "deepseek-reasoner"): (0.002, 0.002),
+
+    # Valores por defecto para modelos no listados
+    ("default", "default"): (0.001, 0.001),
+}
+
+
+def load_model_prices() -> Dict[Tuple[str, str], Price]:
+    """Precios activos de model_pricing: (proveedor, modelo) -> (USD por 1K de entrada, USD por 1K de salida)."""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.ModelPricing).filter(models.ModelPricing.is_active == True).all()
+        return {(row.provider.lower(), row.model_id.lower()): (row.input_cost_per_1k, row.output_cost_per_1k) for row in rows}
+    finally:
+        db.close()
+
+
+class PricingResolver:
+    """
+    Tabla de precios en memoria, indexada por (proveedor, modelo) y por modelo.
+
+    Se carga de model_pricing la primera vez que se pide un precio y se vuelve a
+    cargar cuando otro proceso avisa por el canal `channel` de Redis (lo publican
+    las funciones de crud que modifican precios). Consultar un precio no hace
+    consultas a la base de datos. Por si se pierde un aviso (Redis caído), la
+    tabla también se recarga si tiene más de `max_age_seconds`.
+
+    Orden de búsqueda: model_pricing por (proveedor, modelo), DEFAULT_MODEL_PRICING
+    por (proveedor, modelo), cualquiera de los dos solo por modelo y, por último,
+    la fila ("default", "default").
+    """
+
+    def __init__(self, loader: Callable[[], Dict[Tuple[str, str], Price]] = load_model_prices,
+                 redis_url: Optional[str] = None, max_age_seconds: int = 600,
+                 channel: str = "bytchat:model_pricing"):
+        self.loader = loader
+        self.max_age_seconds = max_age_seconds
+        self.channel = channel
+        self._redis = redis.Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        self._prices: Dict[Tuple[str, str], Price] = {}
+        self._by_model: Dict[str, Price] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self.reloads = 0
+
+    def price(self, provider: Optional[str], model_id: str) -> Price:
+        """USD por 1K tokens (entrada, salida) del modelo."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age_seconds:
+            self.reload()
+        key = ((provider or "").lower(), model_id.lower())
+        price = self._prices.get(key) or DEFAULT_MODEL_PRICING.get(key) or self._by_model.get(key[1])
+        if price is None:
+            price = self._prices.get(("default", "default")) or DEFAULT_MODEL_PRICING[("default", "default")]
+        return price
+
+    def reload(self):
+        """Carga model_pricing y sustituye la tabla de una vez (los lectores nunca ven una a medias)."""
+        with self._lock:
+            try:
+                prices = self.loader()
+            except Exception as e:
+                # Se sigue con la tabla anterior (o la de respaldo) y se reintenta en el siguiente ciclo
+                logging.warning(f"PricingResolver: no se pudieron cargar los precios de model_pricing ({e})")
+                prices = self._prices
+            by_model = {model_id: price for (_, model_id), price in DEFAULT_MODEL_PRICING.items()}
+            by_model.update({model_id: price for (_, model_id), price in prices.items()})
+            self._prices, self._by_model = prices, by_model
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+        self.start()
+
+    # --- Avisos de cambio entre procesos ---
+
+    def start(self):
+        """Arranca (una vez) el hilo que escucha los avisos de cambio de precios."""
+        if self._redis is None or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="pricing-listener", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Lo que cambió mientras no se escuchaba (arranque o reconexión)
+                self.reload()
+                for _ in pubsub.listen():
+                    logging.info("PricingResolver: precios modificados, se recarga la tabla")
+                    self.reload()
+            except redis.exceptions.RedisError as e:
+                logging.warning(f"PricingResolver: se perdió la suscripción a {self.channel} ({e}); se reintenta")
+                time.sleep(5)
+
+    def publish_change(self):
+        """Avisa a todos los procesos (incluido este) de que cambió model_pricing."""
+        self._loaded_at = None
+        if self._redis is None:
+            return
+        try:
+            self._redis.publish(self.channel, "1")
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"PricingResolver: no se pudo publicar el cambio de precios ({e}).")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "models": len(self._prices),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "reloads": self.reloads,
+            "listening": self._listener is not None,
+        }
+
+
+# Instancia única para todo el proceso
+pricing_resolver = PricingResolver(
+    redis_url=settings.REDIS_URL,
+    max_age_seconds=settings.PRICING_MAX_AGE_SECONDS,
+)
@@ -0,0 +1,299 @@
+"""
+Saldo de BytTokens en Redis: reserva antes de llamar al modelo y liquidación al terminar
+"""
+
+import time
+import uuid
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+
+# Campos del hash por usuario:
+#   base      bytokens_remaining de user_plans en la última carga/reconciliación
+#   unsynced  consumo liquidado en Redis que aún no está en user_plans
+#   syncing   consumo que el reconciliador está escribiendo en user_plans
+#   reserved  suma de las reservas abiertas (r:<id> = importe de cada una)
+#   overage   "1" si el plan permite pasar de cero (planes de pago)
+# Disponible = base - unsynced - syncing - reserved
+
+_EXPIRE_RESERVATIONS = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    local amount = tonumber(redis.call('HGET', KEYS[1], 'r:' .. id) or '0')
+    redis.call('HDEL', KEYS[1], 'r:' .. id)
+    redis.call('HINCRBY', KEYS[1], 'reserved', -amount)
+end
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+end
+"""
+
+_AVAILABLE = """
+local function available(key)
+    local h = redis.call('HMGET', key, 'base', 'unsynced', 'syncing', 'reserved')
+    return tonumber(h[1]) - tonumber(h[2] or '0') - tonumber(h[3] or '0') - tonumber(h[4] or '0')
+end
+"""
+
+# KEYS: hash, zset de vencimientos | ARGV: ahora_ms, id, importe, vence_ms
+# Devuelve {1, disponible} reservado, {0, disponible} sin saldo, {-1, 0} sin cargar
+RESERVE_SCRIPT = _AVAILABLE + """
+if redis.call('HEXISTS', KEYS[1], 'base') == 0 then
+    return {-1, 0}
+end
+""" + _EXPIRE_RESERVATIONS + """
+local amount = tonumber(ARGV[3])
+local free = available(KEYS[1])
+if free < amount and redis.call('HGET', KEYS[1], 'overage') ~= '1' then
+    return {0, free}
+end
+redis.call('HSET', KEYS[1], 'r:' .. ARGV[2], amount)
+redis.call('HINCRBY', KEYS[1], 'reserved', amount)
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[2])
+return {1, free - amount}
+"""
+
+# KEYS: hash, zset, usuarios pendientes de reconciliar | ARGV: id ('' sin reserva), consumo real, user_id
+# Libera la reserva (si sigue abierta) y anota el consumo real; devuelve el importe reservado liberado
+COMMIT_SCRIPT = """
+local amount = 0
+if ARGV[1] ~= '' then
+    amount = tonumber(redis.call('HGET', KEYS[1], 'r:' .. ARGV[1]) or '0')
+    if amount > 0 then
+        redis.call('HDEL', KEYS[1], 'r:' .. ARGV[1])
+        redis.call('HINCRBY', KEYS[1], 'reserved', -amount)
+    end
+    redis.call('ZREM', KEYS[2], ARGV[1])
+end
+if tonumber(ARGV[2]) > 0 then
+    redis.call('HINCRBY', KEYS[1], 'unsynced', ARGV[2])
+    redis.call('SADD', KEYS[3], ARGV[3])
+end
+return amount
+"""
+
+# KEYS: hash, zset | ARGV: id. Libera una reserva sin consumo (no-op si ya se liquidó)
+REFUND_SCRIPT = """
+local amount = tonumber(redis.call('HGET', KEYS[1], 'r:' .. ARGV[1]) or '0')
+if amount > 0 then
+    redis.call('HDEL', KEYS[1], 'r:' .. ARGV[1])
+    redis.call('HINCRBY', KEYS[1], 'reserved', -amount)
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+return amount
+"""
+
+# KEYS: hash. Pasa el consumo pendiente a "syncing" (incluido uno anterior que no terminó) y lo devuelve
+TAKE_SCRIPT = """
+local pending = tonumber(redis.call('HGET', KEYS[1], 'unsynced') or '0')
+local syncing = tonumber(redis.call('HINCRBY', KEYS[1], 'syncing', pending))
+redis.call('HSET', KEYS[1], 'unsynced', 0)
+return syncing
+"""
+
+# KEYS: hash | ARGV: bytokens_remaining ya con el consumo escrito. Si el saldo se invalidó
+# mientras tanto (cambio de plan), no se pisa: se recargará desde user_plans
+SETTLE_SCRIPT = """
+redis.call('HSET', KEYS[1], 'syncing', 0)
+if redis.call('HEXISTS', KEYS[1], 'base') == 1 then
+    redis.call('HSET', KEYS[1], 'base', ARGV[1])
+end
+return 1
+"""
+
+# KEYS: hash, usuarios pendientes | ARGV: user_id. La escritura en user_plans falló: se reintentará
+RESTORE_SCRIPT = """
+local syncing = tonumber(redis.call('HGET', KEYS[1], 'syncing') or '0')
+redis.call('HINCRBY', KEYS[1], 'unsynced', syncing)
+redis.call('HSET', KEYS[1], 'syncing', 0)
+redis.call('SADD', KEYS[2], ARGV[1])
+return syncing
+"""
+
+
+class TokenLedger:
+    """
+    Saldo de BytTokens por usuario en Redis, compartido por todos los workers.
+
+    Antes de llamar al modelo se reserva el costo estimado (`reserve`); al terminar se
+    liquida el consumo real (`commit`) o se libera la reserva (`refund`). Cada
+    operación es un script Lua, así que dos chats del mismo usuario no pueden gastar
+    el mismo saldo. Las reservas que nadie liquida vencen a los `reservation_ttl` s.
+
+    user_plans sigue siendo la fuente de verdad: `reconcile` (tarea periódica de
+    Celery) escribe en lotes el consumo liquidado, con bloqueo de fila, y vuelve a
+    tomar de allí el saldo base. Un cambio de plan llama a `invalidate` para que el
+    siguiente chat recargue el saldo. Si Redis no responde, los métodos devuelven
+    None/False y el chat vuelve al camino en base de datos.
+    """
+
+    def __init__(self, redis_url: str, reservation_ttl: int = 300,
+                 session_factory: Callable[[], Session] = SessionLocal,
+                 namespace: str = "bytchat:bytokens"):
+        self.reservation_ttl = reservation_ttl
+        self.session_factory = session_factory
+        self.namespace = namespace
+        self._redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self._reserve = self._redis.register_script(RESERVE_SCRIPT)
+        self._commit = self._redis.register_script(COMMIT_SCRIPT)
+        self._refund = self._redis.register_script(REFUND_SCRIPT)
+        self._take = self._redis.register_script(TAKE_SCRIPT)
+        self._settle = self._redis.register_script(SETTLE_SCRIPT)
+        self._restore = self._redis.register_script(RESTORE_SCRIPT)
+        self.reservations = 0
+        self.denied = 0
+        self.commits = 0
+        self.refunds = 0
+        self.errors = 0
+
+    def _key(self, user_id: int, name: str = "") -> str:
+        return f"{self.namespace}:{user_id}:{name}" if name else f"{self.namespace}:{user_id}"
+
+    @property
+    def _dirty_key(self) -> str:
+        return f"{self.namespace}:dirty"
+
+    # --- Camino caliente ---
+
+    def reserve(self, user_id: int, bytokens: int, plan_loader: Callable[[], models.UserPlan]) -> Optional[Dict[str, Any]]:
+        """
+        Reserva `bytokens` del saldo del usuario.
+        Returns: {"allowed": bool, "remaining": int, "reservation": id o None}, o None si Redis falla.
+        `plan_loader` solo se llama si el saldo del usuario no está cargado en Redis.
+        """
+        reservation_id = uuid.uuid4().hex
+        keys = [self._key(user_id), self._key(user_id, "reservations")]
+        try:
+            for _ in range(2):
+                now_ms = int(time.time() * 1000)
+                status, remaining = self._reserve(
+                    keys=keys, args=[now_ms, reservation_id, bytokens, now_ms + self.reservation_ttl * 1000]
+                )
+                if status != -1:
+                    break
+                self.load(plan_loader())
+            else:
+                return None
+        except redis.exceptions.RedisError as e:
+            self.errors += 1
+            logging.warning(f"TokenLedger: Redis no disponible al reservar ({e}); se usa la base de datos.")
+            return None
+
+        if status == 0:
+            self.denied += 1
+            return {"allowed": False, "remaining": max(0, remaining), "reservation": None}
+        self.reservations += 1
+        return {"allowed": True, "remaining": max(0, remaining), "reservation": reservation_id}
+
+    def load(self, user_plan: models.UserPlan):
+        """Carga el saldo del plan si no está en Redis (HSETNX: no pisa uno ya cargado)."""
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(self._key(user_plan.user_id), "base", user_plan.bytokens_remaining)
+        pipe.hset(self._key(user_plan.user_id), "overage", int(user_plan.plan_type != models.PlanType.FREE))
+        pipe.execute()
+
+    def commit(self, user_id: int, reservation: Optional[str], bytokens: int) -> bool:
+        """Liquida el consumo real (libera la reserva si sigue abierta). False si Redis falla."""
+        try:
+            self._commit(
+                keys=[self._key(user_id), self._key(user_id, "reservations"), self._dirty_key],
+                args=[reservation or "", bytokens, user_id],
+            )
+        except redis.exceptions.RedisError as e:
+            self.errors += 1
+            logging.warning(f"TokenLedger: Redis no disponible al liquidar ({e}); se descuenta en la base de datos.")
+            return False
+        self.commits += 1
+        return True
+
+    def refund(self, user_id: int, reservation: str):
+        """Libera una reserva que no llegó a consumirse (no-op si ya se liquidó)."""
+        try:
+            if self._refund(keys=[self._key(user_id), self._key(user_id, "reservations")], args=[reservation]):
+                self.refunds += 1
+        except redis.exceptions.RedisError as e:
+            # La reserva vence sola a los reservation_ttl segundos
+            logging.warning(f"TokenLedger: no se pudo liberar la reserva {reservation} ({e}).")
+
+    def invalidate(self, user_id: int):
+        """El plan cambió en user_plans: el siguiente chat recarga el saldo base (el consumo pendiente se conserva)."""
+        try:
+            self._redis.hdel(self._key(user_id), "base", "overage")
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"TokenLedger: no se pudo invalidar el saldo del usuario {user_id} ({e}).")
+
+    # --- Reconciliación con user_plans ---
+
+    def reconcile(self, batch_size: int = 500, max_batches: int = 20) -> int:
+        """Escribe en user_plans el consumo liquidado en Redis, por lotes. Devuelve los usuarios reconciliados."""
+        from .metrics_service import MetricsService
+
+        # Un solo reconciliador a la vez: "syncing" no admite dos escrituras en paralelo
+        lock_key = f"{self.namespace}:reconcile_lock"
+        if not self._redis.set(lock_key, "1", nx=True, ex=300):
+            return 0
+        reconciled = 0
+        try:
+            for _ in range(max_batches):
+                user_ids = [int(user_id) for user_id in self._redis.spop(self._dirty_key, batch_size) or []]
+                if not user_ids:
+                    break
+                charges = {user_id: int(self._take(keys=[self._key(user_id)])) for user_id in user_ids}
+
+                db = self.session_factory()
+                try:
+                    plans = {
+                        plan.user_id: plan for plan in db.query(models.UserPlan)
+                        .filter(models.UserPlan.user_id.in_(user_ids))
+                        .with_for_update()
+                    }
+                    for user_id, bytokens in charges.items():
+                        # Sin commit: se confirma todo junto, con los bloqueos de fila hasta el final
+                        plan = plans.get(user_id) or MetricsService(db).get_or_create_user_plan(user_id, commit=False)
+                        plans[user_id] = plan
+                        MetricsService.charge_plan(plan, bytokens)
+                    db.commit()
+                    remaining = {user_id: plan.bytokens_remaining for user_id, plan in plans.items()}
+                except Exception as e:
+                    db.rollback()
+                    logging.error(f"TokenLedger: error reconciliando {len(user_ids)} usuarios: {e}")
+                    for user_id in user_ids:
+                        self._restore(keys=[self._key(user_id), self._dirty_key], args=[user_id])
+                    break
+                finally:
+                    db.close()
+
+                for user_id in user_ids:
+                    self._settle(keys=[self._key(user_id)], args=[remaining[user_id]])
+                reconciled += len(user_ids)
+        finally:
+            self._redis.delete(lock_key)
+        return reconciled
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            pending_users = self._redis.scard(self._dirty_key)
+        except redis.exceptions.RedisError:
+            pending_users = None
+        return {
+            "enabled": settings.BYTOKEN_LEDGER_ENABLED,
+            "reservations": self.reservations,
+            "denied": self.denied,
+            "commits": self.commits,
+            "refunds": self.refunds,
+            "redis_errors": self.errors,
+            "users_pending_reconcile": pending_users,
+        }
+
+
+# Instancia única para todo el proceso
+token_ledger = TokenLedger(
+    redis_url=settings.REDIS_URL,
+    reservation_ttl=settings.BYTOKEN_LEDGER_RESERVATION_TTL_SECONDS,
+)
@@ -0,0 +1,174 @@
+"""
+Agregados por hora y por día de token_usage para las analíticas
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Type
+
+from sqlalchemy import Row, and_, case, delete, func, insert, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+
+ROLLUP_MODELS = (models.UsageRollupHourly, models.UsageRollupDaily)
+KEY_COLUMNS = ("bucket", "user_id", "bot_id", "provider", "model_id")
+SUM_COLUMNS = (
+    "requests", "cache_hits", "prompt_tokens", "completion_tokens", "total_tokens",
+    "total_cost", "bytokens_cost", "context_tokens_saved", "response_time_ms_total",
+)
+
+
+def to_naive_utc(moment: datetime) -> datetime:
+    """Los buckets se guardan en UTC sin zona: las fechas con zona se convierten a UTC antes."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def hour_start(moment: datetime) -> datetime:
+    return to_naive_utc(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment: datetime) -> datetime:
+    return to_naive_utc(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _truncate(rollup: Type[models.UsageRollupMixin], moment: datetime) -> datetime:
+    return hour_start(moment) if rollup is models.UsageRollupHourly else day_start(moment)
+
+
+def usage_totals(db: Session, since: datetime, sums: Sequence[str], group_by: Sequence[str] = (),
+                 **filters: Any) -> List[Row]:
+    """
+    Suma de las columnas `sums` del uso desde `since`, por las columnas `group_by` y
+    filtrada por igualdad (`filters`, p. ej. user_id=3). Filas: (*group_by, *sums).
+
+    Los días completos se leen de los agregados diarios; de los horarios solo las
+    horas del primer día si la ventana empieza a mitad de día (fuera de la retención
+    de los horarios se cuenta ese día entero).
+    """
+    first_day = day_start(since)
+    parts = []
+    retention_start = datetime.utcnow() - timedelta(days=settings.USAGE_ROLLUP_HOURLY_RETENTION_DAYS)
+    if since > first_day and since >= retention_start:
+        first_day += timedelta(days=1)
+        parts.append((models.UsageRollupHourly, hour_start(since), first_day))
+    parts.append((models.UsageRollupDaily, first_day, None))
+
+    selects = []
+    for rollup, start, end in parts:
+        conditions = [rollup.bucket >= start] + [getattr(rollup, column) == value for column, value in filters.items()]
+        if end is not None:
+            conditions.append(rollup.bucket < end)
+        selects.append(select(*[getattr(rollup, column) for column in (*group_by, *sums)]).where(and_(*conditions)))
+    rows = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+
+    query = select(
+        *[rows.c[column] for column in group_by],
+        *[func.coalesce(func.sum(rows.c[column]), 0) for column in sums],
+    )
+    if group_by:
+        query = query.group_by(*[rows.c[column] for column in group_by])
+    return db.execute(query).all()
+
+
+# --- Mantenimiento incremental (en la misma transacción que las filas de token_usage) ---
+
+def apply_usage_rows(db: Session, rows: Iterable[Dict[str, Any]]):
+    """
+    Suma las filas de token_usage (dicts con las columnas del modelo y created_at)
+    a los agregados por hora y por día. No hace commit: debe ir en la transacción
+    que inserta esas filas para que los agregados nunca se desvíen del detalle.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    for rollup in ROLLUP_MODELS:
+        totals: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: dict.fromkeys(SUM_COLUMNS, 0))
+        for row in rows:
+            created_at = row.get("created_at") or datetime.now(timezone.utc)
+            key = (_truncate(rollup, created_at), row["user_id"], row["bot_id"], row["provider"], row["model_id"])
+            total = totals[key]
+            total["requests"] += 1
+            total["cache_hits"] += int(bool(row.get("cache_hit")))
+            total["response_time_ms_total"] += row.get("response_time_ms") or 0
+            for column in SUM_COLUMNS[2:-1]:
+                total[column] += row.get(column) or 0
+            last_used_at = to_naive_utc(created_at)
+            total["last_used_at"] = max(total.get("last_used_at") or last_used_at, last_used_at)
+
+        # Orden fijo de claves: dos escritores que suman a las mismas filas no se bloquean en cruz
+        values = [dict(zip(KEY_COLUMNS, key), **totals[key]) for key in sorted(totals)]
+        table = rollup.__table__
+        stmt = pg_insert(table).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_={
+                **{column: table.c[column] + stmt.excluded[column] for column in SUM_COLUMNS},
+                "last_used_at": func.greatest(table.c.last_used_at, stmt.excluded.last_used_at),
+            },
+        )
+        db.execute(stmt)
+
+
+# --- Reconstrucción desde token_usage (backfill) ---
+
+def _aggregate_usage(unit: str, since: datetime, until: datetime):
+    """SELECT de token_usage agregado por período (`unit`: 'hour' o 'day', en UTC) en [since, until)."""
+    usage = models.TokenUsage
+    # created_at es timestamptz: los períodos se calculan en UTC
+    created_at_utc = func.timezone("UTC", usage.created_at)
+    bucket = func.date_trunc(unit, created_at_utc)
+    return select(
+        bucket, usage.user_id, usage.bot_id, usage.provider, usage.model_id,
+        func.count(usage.id),
+        func.coalesce(func.sum(case((usage.cache_hit == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(usage.prompt_tokens), 0),
+        func.coalesce(func.sum(usage.completion_tokens), 0),
+        func.coalesce(func.sum(usage.total_tokens), 0),
+        func.coalesce(func.sum(usage.total_cost), 0),
+        func.coalesce(func.sum(usage.bytokens_cost), 0),
+        func.coalesce(func.sum(usage.context_tokens_saved), 0),
+        func.coalesce(func.sum(usage.response_time_ms), 0),
+        func.max(created_at_utc),
+    ).where(
+        and_(created_at_utc >= since, created_at_utc < until)
+    ).group_by(bucket, usage.user_id, usage.bot_id, usage.provider, usage.model_id)
+
+
+def rebuild(db: Session, since: datetime, until: datetime) -> Dict[str, int]:
+    """
+    Recalcula desde token_usage los agregados por hora de [since, until) (redondeado a
+    horas) y los diarios de los días completos que toca el rango. Es idempotente:
+    borra y vuelve a insertar. No hace commit.
+
+    Los días sin ninguna fila en token_usage no se tocan: su detalle pudo borrarse
+    (particiones fuera de la retención) y el agregado diario es lo único que queda.
+    """
+    since, until = hour_start(since), hour_start(until)
+    columns = list(KEY_COLUMNS) + list(SUM_COLUMNS) + ["last_used_at"]
+
+    hourly = models.UsageRollupHourly
+    db.execute(delete(hourly).where(and_(hourly.bucket >= since, hourly.bucket < until)))
+    hourly_rows = db.execute(insert(hourly).from_select(columns, _aggregate_usage("hour", since, until))).rowcount
+
+    # Días completos, desde el detalle (los horarios pueden estar ya podados)
+    daily = models.UsageRollupDaily
+    first_day, end_day = day_start(since), day_start(until - timedelta(microseconds=1)) + timedelta(days=1)
+    from_usage = _aggregate_usage("day", first_day, end_day).subquery()
+    days_with_usage = select(from_usage.c[0]).distinct()
+    db.execute(delete(daily).where(and_(
+        daily.bucket >= first_day, daily.bucket < end_day, daily.bucket.in_(days_with_usage)
+    )))
+    daily_rows = db.execute(insert(daily).from_select(columns, select(from_usage))).rowcount
+    return {"hourly_rows": hourly_rows, "daily_rows": daily_rows}
+
+
+def prune_hourly(db: Session, retention_days: Optional[int] = None) -> int:
+    """Borra los agregados por hora fuera de la retención (los diarios se conservan). No hace commit."""
+    retention_days = settings.USAGE_ROLLUP_HOURLY_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = day_start(datetime.utcnow() - timedelta(days=retention_days))
+    return db.execute(delete(models.UsageRollupHourly).where(models.UsageRollupHourly.bucket < cutoff)).rowcount
@@ -0,0 +1,340 @@
+"""
+Escritura diferida (write-behind) del uso de tokens y de los eventos de analytics
+"""
+
+import os
+import glob
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import itertools
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from .usage_rollups import apply_usage_rows
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        # Un .replay con nuestro pid es de un proceso anterior (pids reutilizados en contenedores)
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class UsageWriter:
+    """
+    Cola acotada en memoria + hilo que escribe en lotes.
+
+    El chat encola las filas de token_usage / analytics_events y el descuento de
+    BytTokens del plan; el hilo las agrupa cada `flush_interval_ms` (o al llegar a
+    `batch_size`) y las escribe en una sola transacción: INSERT de varias filas por
+    tabla, los agregados por hora/día de token_usage y un UPDATE por usuario con el
+    descuento acumulado (con bloqueo de fila).
+
+    Durabilidad:
+      - Cola llena: la petición escribe su fila en el momento (se frena, no se pierde).
+      - Error de la base de datos: el lote se reintenta con espera creciente.
+      - Al apagar (`stop`) se vacía la cola; lo que no se pueda escribir se guarda en
+        `spill_path` (JSONL) y se vuelve a escribir al arrancar el siguiente proceso; las
+        líneas ilegibles se apartan en `<spill_path>.bad` y, si la base de datos sigue
+        caída, lo pendiente vuelve a `spill_path`.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, max_queue: int = 10000,
+                 batch_size: int = 500, flush_interval_ms: int = 200, spill_path: Optional[str] = None,
+                 max_retries: int = 5):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.spill_path = spill_path
+        self.max_retries = max_retries
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Lotes en escritura: stop() espera a que terminen antes de vaciar la cola
+        self._writing = threading.Lock()
+        self._replay_counter = itertools.count()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.failures = 0
+        self.spilled = 0
+
+    # --- Encolado ---
+
+    def submit_usage(self, usage: Dict[str, Any], charge_bytokens: bool = True):
+        """Fila de token_usage (columnas del modelo); si `charge_bytokens`, descuenta su costo del plan."""
+        self._submit({"kind": "usage", "row": usage, "charge": charge_bytokens})
+
+    def submit_event(self, event: Dict[str, Any]):
+        """Fila de analytics_events (columnas del modelo)."""
+        self._submit({"kind": "event", "row": event})
+
+    def _submit(self, item: Dict[str, Any]):
+        # created_at se fija al encolar: el lote puede escribirse cientos de ms después
+        item["row"].setdefault("created_at", datetime.now(timezone.utc))
+        self.start()
+        try:
+            self._queue.put_nowait(item)
+            self.enqueued += 1
+        except queue.Full:
+            logging.warning("UsageWriter: cola llena, se escribe de forma síncrona")
+            self.sync_writes += 1
+            self._write([item])
+
+    # --- Hilo de escritura ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._replay_spill()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                with self._writing:
+                    self._write_with_retries(batch)
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def flush(self):
+        """Escribe ya todo lo pendiente (p. ej. antes de medir o de leer lo recién registrado)."""
+        with self._writing:
+            items = self._drain()
+            for start in range(0, len(items), self.batch_size):
+                self._write_with_retries(items[start:start + self.batch_size])
+
+    def stop(self, timeout: float = 10.0):
+        """Detiene el hilo y vacía la cola; lo que no se pueda escribir se guarda en `spill_path`."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        with self._writing:
+            items = self._drain()
+            for start in range(0, len(items), self.batch_size):
+                # Un solo intento: apagando no hay tiempo para esperas; si falla, va a disco
+                self._write_with_retries(items[start:start + self.batch_size], retries=1)
+
+    def _write_with_retries(self, batch: List[Dict[str, Any]], retries: Optional[int] = None) -> bool:
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries):
+            try:
+                self._write(batch)
+                return True
+            except Exception as e:
+                self.failures += 1
+                logging.error(f"UsageWriter: error escribiendo {len(batch)} registros (intento {attempt + 1}): {e}")
+                # Espera interrumpible: si el proceso se apaga, el lote va a disco sin esperar
+                if attempt + 1 < retries and self._stop.wait(min(0.5 * 2 ** attempt, 10)):
+                    break
+        # Se agotaron los reintentos: a disco para no perderlo
+        self._spill(batch)
+        return False
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        usage_rows = [item["row"] for item in batch if item["kind"] == "usage"]
+        event_rows = [item["row"] for item in batch if item["kind"] == "event"]
+        charges = defaultdict(int)
+        for item in batch:
+            if item["kind"] == "usage" and item["charge"]:
+                charges[item["row"]["user_id"]] += item["row"].get("bytokens_cost") or 0
+
+        db = self.session_factory()
+        try:
+            if charges:
+                self._charge_plans(db, charges)
+            if usage_rows:
+                db.execute(insert(models.TokenUsage), usage_rows)
+                apply_usage_rows(db, usage_rows)
+            if event_rows:
+                db.execute(insert(models.AnalyticsEvent), event_rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.written += len(batch)
+        self.batches += 1
+
+    @staticmethod
+    def _charge_plans(db: Session, charges: Dict[int, int]):
+        from .metrics_service import MetricsService
+
+        # Bloqueo de fila: dos workers que descuentan al mismo usuario no se pisan
+        plans = {
+            plan.user_id: plan for plan in db.query(models.UserPlan)
+            .filter(models.UserPlan.user_id.in_(list(charges)))
+            .with_for_update()
+        }
+        for user_id, bytokens in charges.items():
+            # Sin commit: los descuentos, las filas y los agregados se confirman o deshacen juntos
+            plan = plans.get(user_id) or MetricsService(db).get_or_create_user_plan(user_id, commit=False)
+            MetricsService.charge_plan(plan, bytokens)
+
+    # --- Persistencia de emergencia ---
+
+    def _spill(self, batch: List[Dict[str, Any]]) -> bool:
+        if not self.spill_path:
+            logging.error(f"UsageWriter: se pierden {len(batch)} registros (sin USAGE_WRITER_SPILL_PATH)")
+            return False
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for item in batch:
+                    f.write(json.dumps(item, default=str, ensure_ascii=False) + "\n")
+            self.spilled += len(batch)
+            logging.warning(f"UsageWriter: {len(batch)} registros guardados en {self.spill_path}")
+            return True
+        except OSError as e:
+            logging.error(f"UsageWriter: no se pudo guardar en {self.spill_path}: {e}")
+            return False
+
+    def _replay_spill(self):
+        """Reescribe lo volcado a disco por procesos anteriores; nunca impide arrancar."""
+        if not self.spill_path:
+            return
+        for path in self._claim_spill_files():
+            try:
+                self._replay_file(path)
+            except OSError as e:
+                logging.error(f"UsageWriter: no se pudo leer {path}: {e}")
+
+    def _claim_spill_files(self) -> List[str]:
+        """
+        Renombra a `<spill>.<pid>.<n>.replay` los ficheros a recuperar: el volcado y los
+        `.replay` de procesos que murieron a mitad de su recuperación. Si otro worker
+        arranca a la vez, el renombrado solo le sale bien a uno.
+        """
+        prefix = f"{self.spill_path}."
+        candidates = [self.spill_path]
+        for path in glob.glob(f"{glob.escape(prefix)}*.replay"):
+            owner = path[len(prefix):].split(".")[0]
+            if owner.isdigit() and not _process_alive(int(owner)):
+                candidates.append(path)
+
+        claimed = []
+        for path in candidates:
+            replay_path = f"{prefix}{os.getpid()}.{next(self._replay_counter)}.replay"
+            try:
+                os.replace(path, replay_path)
+            except OSError:
+                continue
+            claimed.append(replay_path)
+        return claimed
+
+    def _replay_file(self, replay_path: str):
+        items, bad_lines = [], []
+        with open(replay_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    items.append(self._parse_spilled(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    # Típicamente la última línea, cortada si el proceso murió escribiendo el volcado
+                    logging.error(f"UsageWriter: línea ilegible en {replay_path}: {e}")
+                    bad_lines.append(line if line.endswith("\n") else line + "\n")
+        if bad_lines:
+            # Se apartan para revisarlas a mano; no se reintentan en cada arranque
+            with open(f"{self.spill_path}.bad", "a", encoding="utf-8") as f:
+                f.writelines(bad_lines)
+
+        written = 0
+        try:
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start:start + self.batch_size]
+                self._write(batch)
+                written += len(batch)
+            logging.info(f"UsageWriter: {written} registros pendientes recuperados de {self.spill_path}")
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"UsageWriter: no se pudieron recuperar los registros de {replay_path}: {e}")
+            # Lo que falta vuelve al volcado para el siguiente arranque; si ni eso se puede,
+            # el .replay se queda y lo recoge el próximo proceso
+            if not self._spill(items[written:]):
+                return
+        os.remove(replay_path)
+
+    @staticmethod
+    def _parse_spilled(line: str) -> Dict[str, Any]:
+        item = json.loads(line)
+        row = item["row"]
+        created_at = datetime.fromisoformat(row["created_at"])
+        # Las líneas sin zona (escritas antes de usar fechas con zona) están en UTC
+        row["created_at"] = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+        if row.get("event_type"):
+            row["event_type"] = models.EventType(row["event_type"])
+        if item["kind"] not in ("usage", "event"):
+            raise ValueError(f"tipo de registro desconocido: {item['kind']}")
+        return item
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.USAGE_WRITE_BEHIND,
+            "pending": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "sync_writes": self.sync_writes,
+            "failures": self.failures,
+            "spilled": self.spilled,
+        }
+
+
+# Instancia única para todo el proceso
+usage_writer = UsageWriter(
+    max_queue=settings.USAGE_WRITER_MAX_QUEUE,
+    batch_size=settings.USAGE_WRITER_BATCH_SIZE,
+    flush_interval_ms=settings.USAGE_WRITER_FLUSH_MS,
+    spill_path=settings.USAGE_WRITER_SPILL_PATH or None,
+)
@@ -2,6 +2,7 @@
 
 import os
 import shutil
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from celery import Celery
 
@@ -13,8 +14,11 @@ from .config import settings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.document_loaders.text import TextLoader
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from .core.vector_index import BotVectorIndex, bot_index_path, bot_index_lock
+from .embeddings import get_embedding_backend
+from .services.token_ledger import token_ledger
+from .services.usage_rollups import prune_hourly
 
 # --- Configuración de Celery ---
 celery_app = Celery(
@@ -23,12 +27,29 @@ celery_app = Celery(
     backend=settings.CELERY_RESULT_BACKEND
 )
 
-# --- Configuración del Modelo de Embeddings ---
-# Asegúrate de que GOOGLE_API_KEY está en tu archivo .env
-if not settings.GOOGLE_API_KEY:
-    raise ValueError("La GOOGLE_API_KEY no se encontró en las variables de entorno.")
-# Inicializamos el modelo de embeddings una sola vez para reutilizarlo.
-embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+# Compactación periódica de los índices por bot (requiere `celery beat`)
+celery_app.conf.beat_schedule = {
+    "compact-bot-indexes": {
+        "task": "compact_bot_indexes_task",
+        "schedule": settings.RAG_COMPACTION_INTERVAL_SECONDS,
+    },
+    "reconcile-bytoken-ledger": {
+        "task": "reconcile_bytoken_ledger_task",
+        "schedule": settings.BYTOKEN_LEDGER_RECONCILE_SECONDS,
+    },
+    "prune-usage-rollups": {
+        "task": "prune_usage_rollups_task",
+        "schedule": settings.USAGE_ROLLUP_PRUNE_INTERVAL_SECONDS,
+    },
+    "maintain-usage-partitions": {
+        "task": "maintain_usage_partitions_task",
+        "schedule": settings.USAGE_PARTITION_MAINTENANCE_SECONDS,
+    },
+}
+
+# --- Modelos de Embeddings ---
+# Cada bot elige su backend (google o local); los modelos se cargan una sola vez
+# por proceso en app/embeddings/registry.py.
 
 
 def get_db_session():
@@ -48,7 +69,7 @@ def get_db_session():
 def process_document_task(bot_id: int, file_path: str, doc_id: int):
     """
     Tarea de Celery para procesar un documento: lo carga, divide, vectoriza
-    y guarda su índice FAISS, actualizando el estado en la BD.
+    y lo añade al índice FAISS consolidado del bot, actualizando el estado en la BD.
     """
     # Obtenemos una sesión de BD para esta tarea específica
     db: Session = next(get_db_session())
@@ -69,21 +90,41 @@ def process_document_task(bot_id: int, file_path: str, doc_id: int):
         docs = text_splitter.split_documents(documents)
         print(f"📄 Documento dividido en {len(docs)} chunks.")
 
-        # 4. Crear el índice de vectores FAISS usando el modelo de embeddings
-        vector_store = FAISS.from_documents(docs, embeddings_model)
+        if not docs:
+            raise ValueError("El documento no contiene texto procesable.")
 
-        # 5. Guardar el índice en el disco
-        storage_path = f"storage/bot_{bot_id}"
-        os.makedirs(storage_path, exist_ok=True)
-        index_path = os.path.join(storage_path, f"doc_{doc_id}.faiss")
-        vector_store.save_local(index_path)
-        print(f"💾 Índice FAISS guardado en: {index_path}")
+        # 4. Vectorizar los chunks. Si el bot ya tiene índice se usa el backend con el que
+        #    se construyó (cambiar de backend requiere re-vectorizar todo el índice).
+        texts = [doc.page_content for doc in docs]
+        index_path = bot_index_path(bot_id)
+        db_bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+        backend_name = (
+            BotVectorIndex.stored_embedding_backend(index_path)
+            or (db_bot.embedding_backend if db_bot else settings.DEFAULT_EMBEDDING_BACKEND)
+        )
+        vectors = get_embedding_backend(backend_name).embed_documents(texts)
+
+        # 5. Añadir los chunks al índice consolidado del bot (uno solo para todos sus documentos)
+        #    (el tipo de índice se decide al guardar según la estrategia del bot y su tamaño)
+        with bot_index_lock(bot_id):
+            if BotVectorIndex.exists(index_path):
+                bot_index = BotVectorIndex.load(index_path)
+            else:
+                bot_index = BotVectorIndex.create(vectors.shape[1], embedding_backend=backend_name)
+            if bot_index.embedding_backend != backend_name:
+                # El índice se re-vectorizó mientras procesábamos este documento
+                vectors = get_embedding_backend(bot_index.embedding_backend).embed_documents(texts)
+            bot_index.add_document(doc_id, texts, vectors)
+            bot_index.save(index_path, strategy=db_bot.index_strategy if db_bot else None)
+        print(f"💾 Índice del bot {bot_id} actualizado en: {index_path} ({bot_index.ntotal} vectores, {bot_index.strategy})")
 
         # 6. Actualizar el registro en la BD con la ruta del índice y marcar como "completado"
         db_doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
         if db_doc:
             db_doc.vector_index_path = index_path
             db_doc.status = models.DocumentStatus.COMPLETED
+            # El documento ya es buscable: las respuestas cacheadas del bot dejan de valer
+            crud.bump_bot_config_version(db, bot_id)
             db.commit()
         
         print(f"🎉 Procesamiento completado con éxito para doc_id: {doc_id}.")
@@ -97,4 +138,165 @@ def process_document_task(bot_id: int, file_path: str, doc_id: int):
         # Limpiar el archivo temporal, independientemente del resultado
         if os.path.exists(file_path):
             os.remove(file_path)
-            print(f"🗑️ Archivo temporal eliminado: {file_path}")
\ No newline at end of file
+            print(f"🗑️ Archivo temporal eliminado: {file_path}")
+
+
+@celery_app.task(name="remove_document_from_index_task")
+def remove_document_from_index_task(bot_id: int, doc_id: int):
+    """
+    Marca los vectores de un documento eliminado como tombstone en el índice del bot.
+    Si la proporción de vectores muertos supera el umbral, compacta en el momento.
+    """
+    index_path = bot_index_path(bot_id)
+    if not BotVectorIndex.exists(index_path):
+        return
+
+    with bot_index_lock(bot_id):
+        bot_index = BotVectorIndex.load(index_path)
+        bot_index.remove_document(doc_id)
+        if bot_index.tombstone_ratio() >= settings.RAG_COMPACTION_TOMBSTONE_RATIO:
+            removed = bot_index.compact()
+            print(f"🧹 Índice del bot {bot_id} compactado: {removed} vectores eliminados.")
+        bot_index.save(index_path)
+    print(f"🗑️ Documento {doc_id} retirado del índice del bot {bot_id}.")
+
+
+@celery_app.task(name="rebuild_bot_index_task")
+def rebuild_bot_index_task(bot_id: int):
+    """Reconstruye el índice de un bot con su estrategia actual (p. ej. tras cambiarla)."""
+    index_path = bot_index_path(bot_id)
+    if not BotVectorIndex.exists(index_path):
+        return
+
+    db: Session = next(get_db_session())
+    try:
+        db_bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+        if not db_bot:
+            return
+        with bot_index_lock(bot_id):
+            bot_index = BotVectorIndex.load(index_path)
+            bot_index.compact()
+            bot_index.save(index_path, strategy=db_bot.index_strategy, force_rebuild=True)
+        print(f"🔁 Índice del bot {bot_id} reconstruido con estrategia '{bot_index.strategy}'.")
+    finally:
+        db.close()
+
+
+@celery_app.task(name="reembed_bot_index_task")
+def reembed_bot_index_task(bot_id: int):
+    """
+    Re-vectoriza todos los chunks del índice de un bot con su backend de embeddings
+    actual (tras cambiarlo). Usa los textos guardados: no hace falta volver a subir documentos.
+    """
+    index_path = bot_index_path(bot_id)
+    if not BotVectorIndex.exists(index_path):
+        return
+
+    db: Session = next(get_db_session())
+    try:
+        db_bot = db.query(models.Bot).filter(models.Bot.id == bot_id).first()
+        if not db_bot:
+            return
+        backend = get_embedding_backend(db_bot.embedding_backend)
+        with bot_index_lock(bot_id):
+            bot_index = BotVectorIndex.load(index_path)
+            if bot_index.embedding_backend == backend.name:
+                return
+            bot_index.compact()
+            bot_index.reembed(backend.embed_documents, backend.name)
+            bot_index.save(index_path, strategy=db_bot.index_strategy)
+        print(f"🔁 Índice del bot {bot_id} re-vectorizado con '{backend.name}' ({bot_index.ntotal} vectores).")
+    finally:
+        db.close()
+
+
+@celery_app.task(name="compact_bot_indexes_task")
+def compact_bot_indexes_task():
+    """
+    Tarea periódica: elimina físicamente de cada índice los vectores de documentos
+    borrados (tombstones) o que ya no existen en la BD.
+    """
+    if not os.path.isdir("storage"):
+        return
+
+    db: Session = next(get_db_session())
+    try:
+        for entry in os.listdir("storage"):
+            if not entry.startswith("bot_"):
+                continue
+            try:
+                bot_id = int(entry[len("bot_"):])
+            except ValueError:
+                continue
+
+            index_path = bot_index_path(bot_id)
+            if not BotVectorIndex.exists(index_path):
+                continue
+
+            live_doc_ids = {doc.id for doc in crud.get_documents_by_bot(db, bot_id=bot_id)}
+            with bot_index_lock(bot_id):
+                bot_index = BotVectorIndex.load(index_path)
+                for orphan_id in bot_index.document_ids() - live_doc_ids:
+                    bot_index.remove_document(orphan_id)
+                removed = bot_index.compact()
+                if removed:
+                    bot_index.save(index_path)
+                    print(f"🧹 Índice del bot {bot_id} compactado: {removed} vectores eliminados.")
+    finally:
+        db.close()
+
+
+@celery_app.task(name="reconcile_bytoken_ledger_task")
+def reconcile_bytoken_ledger_task():
+    """
+    Tarea periódica: escribe en user_plans, por lotes y con bloqueo de fila, el consumo
+    de BytTokens liquidado en el saldo de Redis.
+    """
+    if not settings.BYTOKEN_LEDGER_ENABLED:
+        return
+    reconciled = token_ledger.reconcile(batch_size=settings.BYTOKEN_LEDGER_RECONCILE_BATCH)
+    if reconciled:
+        print(f"💳 Saldo de BytTokens reconciliado para {reconciled} usuarios.")
+
+
+@celery_app.task(name="prune_usage_rollups_task")
+def prune_usage_rollups_task():
+    """
+    Tarea periódica: borra los agregados por hora de token_usage fuera de la retención
+    (USAGE_ROLLUP_HOURLY_RETENTION_DAYS); los diarios se conservan.
+    """
+    db: Session = next(get_db_session())
+    try:
+        removed = prune_hourly(db)
+        db.commit()
+        if removed:
+            print(f"🧹 {removed} agregados por hora antiguos eliminados.")
+    finally:
+        db.close()
+
+
+@celery_app.task(name="maintain_usage_partitions_task")
+def maintain_usage_partitions_task():
+    """
+    Tarea periódica: crea las particiones mensuales de token_usage y analytics_events
+    de los próximos USAGE_PARTITION_MONTHS_AHEAD meses y borra las anteriores a
+    USAGE_PARTITION_RETENTION_MONTHS (0 = no se borra nada). Las funciones las crea
+    migrate_partition_usage_tables.sql; sin esa migración la tarea no hace nada.
+    """
+    db: Session = next(get_db_session())
+    try:
+        if db.execute(text("SELECT to_regproc('maintain_usage_partitions')")).scalar() is None:
+            return
+        results = db.execute(
+            text("SELECT * FROM maintain_usage_partitions(:months_ahead, :retention_months)"),
+            {
+                "months_ahead": settings.USAGE_PARTITION_MONTHS_AHEAD,
+                "retention_months": settings.USAGE_PARTITION_RETENTION_MONTHS,
+            }
+        ).all()
+        db.commit()
+        for parent, created, dropped in results:
+            if created or dropped:
+                print(f"🗂️ {parent}: {created} particiones creadas, {dropped} eliminadas.")
+    finally:
+        db.close()
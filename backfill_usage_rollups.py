@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Reconstruye desde token_usage los agregados por hora y por día (usage_rollup_hourly /
+usage_rollup_daily) que leen las analíticas.
+
+Los agregados se mantienen solos al escribir token_usage; este comando es para el
+histórico anterior al despliegue o para corregir un rango. Es idempotente: borra y
+recalcula cada día en su propia transacción (el rango empieza al inicio del día de
+--since; los días sin detalle en token_usage conservan su agregado diario). Por defecto llega hasta el inicio de la
+hora actual; ejecutarlo cuando haya terminado la hora del despliegue.
+
+Uso:
+    python backfill_usage_rollups.py --days 365
+    python backfill_usage_rollups.py --since 2025-01-01 --until 2025-02-01
+    python backfill_usage_rollups.py --days 30 --dry-run
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func
+
+from app import models
+from app.database import SessionLocal
+from app.services.usage_rollups import day_start, hour_start, prune_hourly, rebuild
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, help="Reconstruir los últimos N días")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Desde (UTC, p. ej. 2025-01-01)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Hasta, sin incluir (por defecto, la hora actual)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar las filas de token_usage del rango")
+    args = parser.parse_args()
+
+    until = hour_start(args.until or datetime.utcnow())
+    if args.since:
+        since = args.since
+    elif args.days:
+        since = day_start(until - timedelta(days=args.days))
+    else:
+        parser.error("indicar --days o --since")
+    # Días completos: el agregado diario del primer día se recalcula entero
+    since = day_start(since)
+
+    db = SessionLocal()
+    try:
+        rows = db.query(func.count(models.TokenUsage.id)).filter(
+            models.TokenUsage.created_at >= since, models.TokenUsage.created_at < until
+        ).scalar()
+        print(f"📊 {rows} filas de token_usage entre {since} y {until} (UTC)")
+        if args.dry_run:
+            return 0
+
+        start = time.perf_counter()
+        totals = {"hourly_rows": 0, "daily_rows": 0}
+        chunk_start = since
+        while chunk_start < until:
+            chunk_end = min(day_start(chunk_start) + timedelta(days=1), until)
+            result = rebuild(db, chunk_start, chunk_end)
+            db.commit()
+            for key in totals:
+                totals[key] += result[key]
+            print(f"  ✅ {chunk_start:%Y-%m-%d %H:%M} → {chunk_end:%Y-%m-%d %H:%M}: "
+                  f"{result['hourly_rows']} horarios, {result['daily_rows']} diarios")
+            chunk_start = chunk_end
+
+        # El histórico antiguo solo se conserva en los diarios
+        pruned = prune_hourly(db)
+        db.commit()
+        print(f"🏁 {totals['hourly_rows']} agregados por hora y {totals['daily_rows']} diarios en "
+              f"{time.perf_counter() - start:.1f}s ({pruned} horarios fuera de la retención eliminados)")
+        return 0
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error reconstruyendo los agregados: {e}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compara la recuperación vectorial con la híbrida (vectorial + BM25) de un bot.
+
+Para cada pregunta del archivo de evaluación se buscan los k chunks más relevantes
+y se considera acierto si alguno contiene el texto esperado. El reporte muestra,
+para cada modo y cada k, la tasa de aciertos y los tokens de contexto enviados,
+y al final cuántos tokens necesita cada modo para alcanzar la misma calidad.
+
+Archivo de evaluación (JSONL), una pregunta por línea:
+    {"question": "¿Cuánto cuesta el SKU AB-123?", "expected": "AB-123"}
+
+Uso:
+    python benchmark_hybrid_retrieval.py --bot-id 6 --eval eval_bot6.jsonl
+"""
+
+import os
+import sys
+import json
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import settings
+from app.core.text_utils import estimate_tokens, fold_accents
+from app.core.vector_index import BotVectorIndex, bot_index_path
+from app.embeddings import get_embedding_backend
+
+MODES = ("vector", "hybrid")
+
+
+def load_eval(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def contains(text: str, expected: str) -> bool:
+    return fold_accents(expected.lower()) in fold_accents(text.lower())
+
+
+def run_mode(bot_index: BotVectorIndex, backend, questions, mode: str, max_k: int):
+    """Devuelve {k: (aciertos, tokens de contexto totales)}"""
+    stats = {k: [0, 0] for k in range(1, max_k + 1)}
+    for item in questions:
+        query_vector = backend.embed_query(item["question"])
+        if mode == "hybrid":
+            chunks = bot_index.search_hybrid(
+                query_vector, item["question"], k=max_k,
+                candidates=max(settings.RAG_HYBRID_CANDIDATES, max_k), rrf_k=settings.RAG_HYBRID_RRF_K,
+            )
+        else:
+            chunks = bot_index.search(query_vector, k=max_k)
+
+        for k in range(1, max_k + 1):
+            top = chunks[:k]
+            if any(contains(chunk["text"], item["expected"]) for chunk in top):
+                stats[k][0] += 1
+            stats[k][1] += sum(estimate_tokens(chunk["text"]) for chunk in top)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot-id", type=int, required=True)
+    parser.add_argument("--eval", required=True, help="Archivo JSONL con question/expected")
+    parser.add_argument("--max-k", type=int, default=10)
+    args = parser.parse_args()
+
+    index_path = bot_index_path(args.bot_id)
+    if not BotVectorIndex.exists(index_path):
+        print(f"❌ El bot {args.bot_id} no tiene índice en {index_path}")
+        sys.exit(1)
+
+    bot_index = BotVectorIndex.open_readonly(index_path)
+    if bot_index.lexical is None:
+        print("⚠️  El índice no tiene BM25 todavía; ejecuta rebuild_bot_index_task o sube un documento.")
+    backend = get_embedding_backend(bot_index.embedding_backend)
+    questions = load_eval(args.eval)
+    print(f"📊 Bot {args.bot_id}: {bot_index.ntotal} chunks, {len(questions)} preguntas, backend '{backend.name}'\n")
+
+    results = {mode: run_mode(bot_index, backend, questions, mode, args.max_k) for mode in MODES}
+
+    header = f"{'k':>3} " + " ".join(f"{mode + ' acierto':>15} {mode + ' tokens':>14}" for mode in MODES)
+    print(header)
+    print("-" * len(header))
+    for k in range(1, args.max_k + 1):
+        row = f"{k:>3} "
+        for mode in MODES:
+            hits, tokens = results[mode][k]
+            row += f"{hits / len(questions):>15.1%} {tokens / len(questions):>14.0f} "
+        print(row)
+
+    # Tokens por pregunta que necesita cada modo para igualar la mejor tasa de aciertos del modo vectorial
+    target = max(hits for hits, _ in results["vector"].values())
+    print(f"\n🎯 Calidad objetivo: {target / len(questions):.1%} de aciertos (mejor resultado vectorial)")
+    for mode in MODES:
+        reached = [(k, tokens) for k, (hits, tokens) in results[mode].items() if hits >= target]
+        if reached:
+            k, tokens = reached[0]
+            print(f"  {mode:<7} k={k:<3} {tokens / len(questions):.0f} tokens de contexto por pregunta")
+        else:
+            print(f"  {mode:<7} no alcanza la calidad objetivo con k<={args.max_k}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Reporte de recall@k vs latencia para las estrategias de índice vectorial
+(flat, HNSW, IVF-SQ8, IVF-PQ) y sus parámetros de búsqueda (efSearch / nprobe).
+
+Uso:
+    python benchmark_index_strategies.py --bot-id 6            # vectores reales de un bot
+    python benchmark_index_strategies.py --synthetic 200000    # vectores aleatorios
+
+El recall se mide contra la búsqueda exacta (flat). Sirve para elegir los umbrales
+RAG_*_MAX_VECTORS y los parámetros RAG_HNSW_EF_SEARCH / RAG_IVF_NPROBE.
+"""
+
+import os
+import sys
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import faiss
+import numpy as np
+
+from app.core.index_factory import build_faiss_index, make_search_params
+
+# Valores de parámetros de búsqueda a evaluar por estrategia
+SEARCH_SWEEPS = {
+    "flat": [{}],
+    "hnsw": [{"efSearch": ef} for ef in (16, 32, 64, 128, 256)],
+    "ivf_sq8": [{"nprobe": nprobe} for nprobe in (1, 4, 8, 16, 32, 64)],
+    "ivf_pq": [{"nprobe": nprobe} for nprobe in (1, 4, 8, 16, 32, 64)],
+}
+
+
+def load_bot_vectors(bot_id: int) -> np.ndarray:
+    """Lee los vectores originales guardados en el índice del bot"""
+    from app.core.vector_index import BotVectorIndex, bot_index_path
+
+    bot_index = BotVectorIndex.load(bot_index_path(bot_id))
+    return np.stack([bot_index.vectors[vector_id] for vector_id in sorted(bot_index.vectors)]).astype("float32")
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 42) -> np.ndarray:
+    """Consultas = vectores del corpus con ruido, para parecerse a preguntas reales"""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    noise = rng.normal(scale=vectors.std() * 0.1, size=picks.shape).astype("float32")
+    return picks + noise
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def time_queries(index, queries: np.ndarray, k: int, strategy: str, params: dict):
+    """Busca consulta por consulta (como en el chat) y devuelve ids + latencias en ms"""
+    search_params = make_search_params(strategy, params, k)
+    all_ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k, params=search_params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        all_ids.append(ids[0])
+    return np.array(all_ids), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bot-id", type=int, help="Usar los vectores del índice de este bot")
+    parser.add_argument("--synthetic", type=int, default=50000, help="Cantidad de vectores aleatorios")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensión de los vectores aleatorios")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--strategies", default="flat,hnsw,ivf_sq8,ivf_pq")
+    args = parser.parse_args()
+
+    if args.bot_id:
+        vectors = load_bot_vectors(args.bot_id)
+        source = f"bot {args.bot_id}"
+    else:
+        vectors = np.random.default_rng(0).random((args.synthetic, args.dim), dtype="float32")
+        source = "sintético"
+
+    ids = np.arange(len(vectors), dtype=np.int64)
+    queries = make_queries(vectors, args.queries)
+    print(f"📊 Corpus: {len(vectors)} vectores de dimensión {vectors.shape[1]} ({source}), "
+          f"{len(queries)} consultas, k={args.k}\n")
+
+    # Verdad de referencia: búsqueda exacta
+    exact = build_faiss_index(vectors, ids, "flat")
+    _, truth = exact.search(queries, args.k)
+
+    header = f"{'estrategia':<10} {'params':<14} {'build s':>8} {'MB':>8} {'recall@k':>9} {'ms p50':>8} {'ms p95':>8}"
+    print(header)
+    print("-" * len(header))
+
+    for strategy in args.strategies.split(","):
+        start = time.perf_counter()
+        try:
+            index = build_faiss_index(vectors, ids, strategy)
+        except Exception as e:
+            print(f"{strategy:<10} ❌ no se pudo construir: {e}")
+            continue
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+        for params in SEARCH_SWEEPS[strategy]:
+            found, latencies = time_queries(index, queries, args.k, strategy, params)
+            label = ",".join(f"{key}={value}" for key, value in params.items()) or "-"
+            print(f"{strategy:<10} {label:<14} {build_seconds:>8.2f} {size_mb:>8.1f} "
+                  f"{recall_at_k(found, truth):>9.3f} {np.percentile(latencies, 50):>8.3f} "
+                  f"{np.percentile(latencies, 95):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
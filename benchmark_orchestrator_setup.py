@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del costo de preparar una petición de chat.
+
+Compara construir los tres conectores, el ModelRouter y el RAGRetriever en cada
+petición (como hacía Orchestrator.__init__) contra el Orchestrator actual, que
+reutiliza los componentes del proceso y el registro de conectores.
+
+No hace llamadas a los modelos; solo mide la inicialización.
+
+Uso:
+    python benchmark_orchestrator_setup.py --iterations 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+
+from app.connectors.google_connector import GoogleConnector
+from app.connectors.openai_connector import OpenAIConnector
+from app.connectors.deepseek_connector import DeepSeekConnector
+from app.connectors.registry import connector_registry
+from app.core.model_router import ModelRouter
+from app.core.rag_retriever import RAGRetriever
+from app.core.orchestrator import Orchestrator
+
+# Los conectores imprimen y registran en cada inicialización; se silencia para medir
+logging.disable(logging.INFO)
+
+
+def setup_per_request():
+    """Inicialización anterior: todo se construía en cada petición."""
+    ModelRouter()
+    RAGRetriever()
+    return {
+        "google": GoogleConnector(),
+        "openai": OpenAIConnector(),
+        "deepseek": DeepSeekConnector(),
+    }
+
+
+def setup_shared(provider: str):
+    """Inicialización actual: Orchestrator + conector del proveedor elegido desde el registro."""
+    orchestrator = Orchestrator(db=None, bot_config={}, bot_id=0)
+    return orchestrator._get_connector(provider)
+
+
+def measure(fn, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--provider", default="openai", choices=connector_registry.providers())
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    sys.stdout = devnull  # los conectores usan print() al inicializarse
+    try:
+        setup_shared(args.provider)  # primera petición: construye el conector una vez
+        before = measure(setup_per_request, args.iterations)
+        after = measure(lambda: setup_shared(args.provider), args.iterations)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+    print(f"📊 Inicialización por petición ({args.iterations} iteraciones)\n")
+    print(f"{'':<28} {'media ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for label, timings in (("antes (por petición)", before), ("ahora (registro)", after)):
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+        print(f"{label:<28} {statistics.mean(timings):>10.3f} {statistics.median(timings):>10.3f} {p95:>10.3f}")
+    print(f"\n✅ Ahorro por petición: {statistics.mean(before) - statistics.mean(after):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark del registro de uso del chat: escritura síncrona vs diferida (UsageWriter).
+
+Registra N mensajes con MetricsService.record_token_usage desde varios hilos (como
+hacen los workers web) en los dos modos y reporta mensajes/s y la latencia que ve
+la petición (p50/p95). En modo diferido el tiempo total incluye vaciar la cola, así
+que los mensajes/s son los realmente escritos en Postgres.
+
+Escribe filas reales en token_usage, analytics_events y descuenta BytTokens del plan
+del usuario indicado: usar un usuario y un bot de pruebas. Las filas del benchmark
+llevan la pregunta "[benchmark-usage-writer]" y se borran al final salvo --keep.
+
+Uso:
+    python benchmark_usage_writer.py --user-id 3 --bot-id 6 --messages 2000 --threads 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+
+from sqlalchemy import func
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.services.metrics_service import MetricsService
+from app.services.usage_writer import usage_writer
+
+logging.disable(logging.WARNING)
+
+MARKER = "[benchmark-usage-writer]"
+
+
+def record_one(args) -> float:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        MetricsService(db).record_token_usage(
+            user_id=args.user_id, bot_id=args.bot_id, user_anon_id=None, query=MARKER,
+            provider="deepseek", model_id="deepseek-chat", prompt_tokens=400, completion_tokens=150,
+            response_time_ms=1200,
+        )
+        return (time.perf_counter() - start) * 1000
+    finally:
+        db.close()
+
+
+def run_mode(args, write_behind: bool) -> dict:
+    settings.USAGE_WRITE_BEHIND = write_behind
+    if write_behind:
+        usage_writer.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = list(pool.map(lambda _: record_one(args), range(args.messages)))
+    if write_behind:
+        usage_writer.flush()
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": "diferido" if write_behind else "síncrono",
+        "rate": args.messages / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": statistics.quantiles(latencies, n=100)[94] if len(latencies) > 1 else latencies[0],
+        "elapsed": elapsed,
+    }
+
+
+def cleanup(args):
+    db = SessionLocal()
+    try:
+        usage = db.query(models.TokenUsage).filter(
+            models.TokenUsage.user_id == args.user_id, models.TokenUsage.query == MARKER
+        ).delete(synchronize_session=False)
+        events = db.query(models.AnalyticsEvent).filter(
+            models.AnalyticsEvent.user_id == args.user_id,
+            models.AnalyticsEvent.event_type == models.EventType.CHAT_MESSAGE,
+            models.AnalyticsEvent.event_data.like('%"model_id": "deepseek-chat"%'),
+            models.AnalyticsEvent.created_at >= args.started_at,
+        ).delete(synchronize_session=False)
+        db.commit()
+        print(f"🧹 Borradas {usage} filas de token_usage y {events} eventos del benchmark")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--bot-id", type=int, required=True)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--keep", action="store_true", help="No borrar las filas del benchmark")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        # El plan debe existir antes de medir (su creación no es parte del camino caliente)
+        MetricsService(db).get_or_create_user_plan(args.user_id)
+        args.started_at = db.query(func.now()).scalar()
+    finally:
+        db.close()
+
+    print(f"⏱️ {args.messages} mensajes con {args.threads} hilos (lotes de {settings.USAGE_WRITER_BATCH_SIZE}, "
+          f"cada {settings.USAGE_WRITER_FLUSH_MS} ms)\n")
+    print(f"{'modo':>10} {'mensajes/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'total s':>8}")
+    print("-" * 49)
+    try:
+        for write_behind in (False, True):
+            row = run_mode(args, write_behind)
+            print(f"{row['mode']:>10} {row['rate']:>11.0f} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['elapsed']:>8.1f}")
+    finally:
+        usage_writer.stop()
+        if not args.keep:
+            cleanup(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Comprueba con EXPLAIN que las consultas frecuentes de analíticas sobre token_usage y
+analytics_events siguen usando los índices compuestos (y, en las que solo cuentan,
+que se responden solo con el índice: Index Only Scan) y que solo leen las particiones
+mensuales del rango pedido. Sale con código 1 si alguna consulta se degrada, para
+poder usarlo en CI o después de cada migración.
+
+Por defecto desactiva el Seq Scan y el Bitmap Scan en la transacción: en una base de
+datos de desarrollo con pocas filas el planificador preferiría leer la tabla entera, y
+lo que se comprueba es que exista el plan por índice. Con --no-force se ve el plan que
+elegiría el planificador con los datos reales.
+
+Las consultas reproducen las de los endpoints y de crud (si cambian allí, cambiarlas
+aquí). Necesita las migraciones migrate_partition_usage_tables.sql (o las tablas
+creadas con los índices de app/models.py).
+
+Uso:
+    python check_query_plans.py
+    python check_query_plans.py --user-id 3 --bot-id 6 --days 30 --vacuum --analyze
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Query
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+
+TABLES = ("token_usage", "analytics_events")
+
+
+def hot_queries(user_id: int, bot_id: int, since: datetime):
+    """
+    (nombre, tabla, debe ser index-only, filtra por rango de created_at, consulta) de
+    las consultas a vigilar. Las que no filtran por rango leen todas las particiones.
+    """
+    events = models.AnalyticsEvent
+    usage = models.TokenUsage
+    chat_filter = (events.event_type == models.EventType.CHAT_MESSAGE, events.created_at >= since)
+    message_day = func.date(func.timezone("UTC", events.created_at))
+    return [
+        # GET /bots/{bot_id}/analytics
+        ("Mensajes por día de un bot", "analytics_events", True, True,
+         Query([message_day, func.count()]).filter(events.bot_id == bot_id, *chat_filter).group_by(message_day)),
+        ("Últimos mensajes de un bot", "analytics_events", False, True,
+         Query(events).filter(events.bot_id == bot_id, *chat_filter).order_by(events.created_at.desc()).limit(10)),
+        # GET /user/analytics/summary
+        ("Mensajes de un usuario", "analytics_events", True, True,
+         Query(func.count()).select_from(events).filter(events.user_id == user_id, *chat_filter)),
+        # crud.get_analytics_events_by_user (filtrado por tipo)
+        ("Eventos de un usuario por tipo", "analytics_events", False, False,
+         Query(events).filter(events.user_id == user_id, events.event_type == models.EventType.CHAT_MESSAGE)
+         .order_by(events.created_at.desc()).limit(100)),
+        # crud.get_token_usage_by_user
+        ("Historial de uso de un usuario", "token_usage", False, False,
+         Query(usage).filter(usage.user_id == user_id).order_by(usage.created_at.desc()).limit(100)),
+        # crud.get_token_usage_by_period
+        ("Uso de un usuario en un rango", "token_usage", False, True,
+         Query(usage).filter(usage.user_id == user_id, usage.created_at >= since, usage.created_at <= datetime.utcnow())),
+        ("Peticiones de un bot en un rango", "token_usage", True, True,
+         Query(func.count()).select_from(usage).filter(usage.bot_id == bot_id, usage.created_at >= since)),
+    ]
+
+
+def scans(plan):
+    """Nodos del plan que leen una tabla (o una de sus particiones)."""
+    if "Relation Name" in plan:
+        yield plan
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+def belongs_to(relation: str, table: str) -> bool:
+    return relation == table or relation.startswith(f"{table}_p")
+
+
+def months_between(since: datetime, until: datetime) -> int:
+    return (until.year - since.year) * 12 + until.month - since.month + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, default=1, help="Usuario de las consultas (default: 1)")
+    parser.add_argument("--bot-id", type=int, default=1, help="Bot de las consultas (default: 1)")
+    parser.add_argument("--days", type=int, default=30, help="Ventana de las consultas por rango (default: 30)")
+    parser.add_argument("--no-force", action="store_true", help="No desactivar Seq Scan / Bitmap Scan")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="VACUUM ANALYZE de las tablas antes (el mapa de visibilidad permite el Index Only Scan)")
+    parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE: ejecuta las consultas y muestra Heap Fetches")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar el plan completo")
+    args = parser.parse_args()
+
+    since = datetime.utcnow() - timedelta(days=args.days)
+    db = SessionLocal()
+    try:
+        dialect = db.get_bind().dialect
+        if dialect.name != "postgresql":
+            print(f"❌ Se necesita PostgreSQL (la base de datos es {dialect.name})")
+            return 1
+
+        if args.vacuum:
+            with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for table in TABLES:
+                    conn.execute(text(f"VACUUM ANALYZE {table}"))
+            print("🧹 VACUUM ANALYZE completado")
+
+        partitioned = {
+            table for table in TABLES
+            if db.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+                          {"table": table}).scalar() == "p"
+        }
+        print(f"🗂️ Tablas particionadas: {', '.join(sorted(partitioned)) or 'ninguna'}")
+
+        if not args.no_force:
+            db.execute(text("SET LOCAL enable_seqscan = off"))
+            db.execute(text("SET LOCAL enable_bitmapscan = off"))
+
+        # Particiones que puede leer una consulta desde `since`: los meses de la ventana
+        # más las creadas por adelantado (vacías) si la consulta no tiene límite superior
+        max_partitions = months_between(since, datetime.utcnow()) + settings.USAGE_PARTITION_MONTHS_AHEAD
+
+        failures = 0
+        for name, table, index_only, ranged, query in hot_queries(args.user_id, args.bot_id, since):
+            sql = str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            options = "ANALYZE, BUFFERS, FORMAT JSON" if args.analyze else "FORMAT JSON"
+            raw_plan = db.execute(text(f"EXPLAIN ({options}) {sql}")).scalar()
+            plan = (json.loads(raw_plan) if isinstance(raw_plan, str) else raw_plan)[0]["Plan"]
+
+            problems = []
+            table_scans = [node for node in scans(plan) if belongs_to(node["Relation Name"], table)]
+            for node in table_scans:
+                node_type = node["Node Type"]
+                if node_type == "Seq Scan":
+                    problems.append(f"Seq Scan en {node['Relation Name']}")
+                elif index_only and node_type != "Index Only Scan":
+                    problems.append(f"{node_type} en {node['Relation Name']} (se esperaba Index Only Scan)")
+            partitions = {node["Relation Name"] for node in table_scans}
+            if table in partitioned and ranged and len(partitions) > max_partitions:
+                problems.append(f"lee {len(partitions)} particiones (máximo {max_partitions})")
+
+            indexes = sorted({node["Index Name"] for node in table_scans if "Index Name" in node})
+            heap_fetches = sum(node.get("Heap Fetches", 0) for node in table_scans)
+            detail = f"{', '.join(indexes) or 'sin índice'}; {len(partitions)} particiones"
+            if args.analyze and index_only:
+                detail += f"; {heap_fetches} heap fetches"
+            if problems:
+                failures += 1
+                print(f"  ❌ {name}: {'; '.join(problems)} ({detail})")
+            else:
+                print(f"  ✅ {name}: {detail}")
+            if args.verbose or problems:
+                print(json.dumps(plan, indent=2, ensure_ascii=False))
+
+        if failures:
+            print(f"\n❌ {failures} consultas no usan el plan esperado. ¿Falta migrate_partition_usage_tables.sql "
+                  f"o un VACUUM ANALYZE (--vacuum)?")
+            return 1
+        print("\n🏁 Todas las consultas usan los índices compuestos")
+        return 0
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
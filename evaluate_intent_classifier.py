@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Evaluación offline del clasificador de intención del router (palabras clave vs embeddings).
+
+1. `export` vuelca las preguntas recientes de un bot (token_usage) a un JSONL con la
+   etiqueta que les daría hoy el router por palabras clave, para revisarlas a mano:
+       {"query": "¿A qué hora abren?", "task_type": "general"}
+
+2. `run` clasifica las preguntas etiquetadas con los dos métodos y compara exactitud,
+   precisión/recall por tipo y matriz de confusión. Con --folds N, el clasificador por
+   embeddings usa como ejemplos las propias preguntas etiquetadas (validación cruzada
+   en N partes) en lugar de los guardados en bot_intent_examples, útil para decidir
+   cuántos ejemplos cargar antes de activarlo.
+
+Las consultas se vectorizan con el backend de embeddings del bot (vía la caché de
+embeddings de consultas, así que repetir la evaluación no vuelve a llamar al modelo).
+
+Uso:
+    python evaluate_intent_classifier.py export --bot-id 6 --days 30 --out etiquetas_bot6.jsonl
+    python evaluate_intent_classifier.py run --bot-id 6 --labels etiquetas_bot6.jsonl
+    python evaluate_intent_classifier.py run --bot-id 6 --labels etiquetas_bot6.jsonl --folds 5
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.core.embedding_cache import query_embedding_cache
+from app.core.intent_classifier import IntentCentroids, load_intent_examples
+from app.core.keyword_matcher import KeywordMatcher, DEFAULT_KEYWORD_RULES
+from app.embeddings import get_embedding_backend
+
+logging.disable(logging.INFO)
+
+
+def keyword_label(matcher: KeywordMatcher, query: str, default_label: str) -> str:
+    # Sin palabra clave el router usa el modelo general/simple
+    return matcher.classify(query) or default_label
+
+
+def export(db, bot, args):
+    rows = db.query(models.TokenUsage.query).filter(
+        models.TokenUsage.bot_id == bot.id,
+        models.TokenUsage.created_at >= datetime.utcnow() - timedelta(days=args.days),
+    ).order_by(models.TokenUsage.created_at.desc()).limit(args.limit * 5).all()
+
+    matcher = KeywordMatcher(bot.routing_keywords or DEFAULT_KEYWORD_RULES)
+    seen, labeled = set(), []
+    for (query,) in rows:
+        key = query.strip().lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        labeled.append({"query": query, "task_type": keyword_label(matcher, query, args.default_label)})
+        if len(labeled) >= args.limit:
+            break
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        for item in labeled:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    print(f"✅ {len(labeled)} preguntas exportadas a {args.out} (etiquetadas por palabras clave: revisar a mano)")
+
+
+def report(name: str, labels, predictions):
+    total = len(labels)
+    correct = sum(label == prediction for label, prediction in zip(labels, predictions))
+    print(f"\n📊 {name}: exactitud {correct}/{total} ({correct / total * 100:.1f}%)")
+    classes = sorted(set(labels) | set(predictions))
+    print(f"   {'tipo':>12} {'precisión':>10} {'recall':>8} {'soporte':>8}")
+    for cls in classes:
+        tp = sum(l == cls and p == cls for l, p in zip(labels, predictions))
+        predicted = sum(p == cls for p in predictions)
+        actual = sum(l == cls for l in labels)
+        precision = tp / predicted * 100 if predicted else 0.0
+        recall = tp / actual * 100 if actual else 0.0
+        print(f"   {cls:>12} {precision:>9.1f}% {recall:>7.1f}% {actual:>8}")
+    confusion = Counter((l, p) for l, p in zip(labels, predictions) if l != p)
+    if confusion:
+        print("   Errores más frecuentes (real -> predicho):")
+        for (label, prediction), count in confusion.most_common(5):
+            print(f"     {label} -> {prediction}: {count}")
+
+
+def run(db, bot, args):
+    with open(args.labels, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    if not items:
+        print("❌ El archivo de etiquetas está vacío.")
+        return 1
+
+    backend = get_embedding_backend(bot.embedding_backend or settings.DEFAULT_EMBEDDING_BACKEND)
+    print(f"🔢 Vectorizando {len(items)} preguntas con {backend.cache_key}...")
+    vectors = [query_embedding_cache.get_or_embed(item["query"], backend.embed_query, model=backend.cache_key) for item in items]
+    labels = [item["task_type"] for item in items]
+
+    matcher = KeywordMatcher(bot.routing_keywords or DEFAULT_KEYWORD_RULES)
+    report("Palabras clave", labels, [keyword_label(matcher, item["query"], args.default_label) for item in items])
+
+    if args.folds:
+        order = list(range(len(items)))
+        random.Random(args.seed).shuffle(order)
+        predictions = [None] * len(items)
+        for fold in range(args.folds):
+            test = set(order[fold::args.folds])
+            centroids = IntentCentroids((labels[i], vectors[i]) for i in range(len(items)) if i not in test)
+            for i in test:
+                result = centroids.nearest(vectors[i])
+                predictions[i] = result[0] if result else args.default_label
+        report(f"Embeddings (validación cruzada, {args.folds} partes)", labels, predictions)
+        return 0
+
+    examples = load_intent_examples(db, bot.id, backend.cache_key)
+    if not examples:
+        print(f"\n⚠️ El bot no tiene ejemplos de intención para {backend.cache_key}; usar --folds para evaluar con las etiquetas.")
+        return 1
+    centroids = IntentCentroids(examples)
+    print(f"\n📚 Ejemplos del bot por tipo: {centroids.counts}")
+    predictions = []
+    for vector in vectors:
+        result = centroids.nearest(vector)
+        below_minimum = result is None or result[1] < settings.INTENT_MIN_SIMILARITY
+        predictions.append(args.default_label if below_minimum else result[0])
+    report("Embeddings (ejemplos del bot)", labels, predictions)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Exportar preguntas recientes para etiquetarlas")
+    export_parser.add_argument("--bot-id", type=int, required=True)
+    export_parser.add_argument("--days", type=int, default=30)
+    export_parser.add_argument("--limit", type=int, default=300)
+    export_parser.add_argument("--out", required=True)
+
+    run_parser = commands.add_parser("run", help="Evaluar los clasificadores con preguntas etiquetadas")
+    run_parser.add_argument("--bot-id", type=int, required=True)
+    run_parser.add_argument("--labels", required=True)
+    run_parser.add_argument("--folds", type=int, default=0, help="Validación cruzada con las propias etiquetas")
+    run_parser.add_argument("--seed", type=int, default=42)
+
+    for sub in (export_parser, run_parser):
+        sub.add_argument("--default-label", default="general", help="Tipo asignado cuando no hay coincidencia")
+
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        bot = db.query(models.Bot).filter(models.Bot.id == args.bot_id).first()
+        if not bot:
+            print(f"❌ No existe el bot {args.bot_id}")
+            return 1
+        if args.command == "export":
+            export(db, bot, args)
+            return 0
+        return run(db, bot, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
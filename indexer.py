@@ -3,6 +3,7 @@ import faiss
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import json
+from app.core.index_factory import build_faiss_index, choose_index_strategy
 
 # --- Configuración (sin cambios) ---
 DOCS_PATH = "data/raw_docs"
@@ -50,9 +51,10 @@ def create_index():
 
     print(f"Embeddings generados. Dimensión del vector: {embeddings.shape[1]}")
 
-    print("Creando y construyendo el índice FAISS...")
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+    # El tipo de índice (flat, HNSW, IVF) se elige según la cantidad de chunks
+    strategy = choose_index_strategy(len(all_chunks))
+    print(f"Creando y construyendo el índice FAISS (estrategia: {strategy})...")
+    index = build_faiss_index(embeddings, np.arange(len(all_chunks), dtype=np.int64), strategy)
     print(f"Índice creado. Contiene {index.ntotal} vectores.")
 
     os.makedirs("data/vector_db", exist_ok=True)
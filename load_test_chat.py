@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga del chat en streaming: cuántos streams simultáneos aguanta un worker.
+
+Abre N streams concurrentes contra el widget (o contra /chat/{bot_id} con --token)
+para cada nivel de concurrencia y reporta tiempo al primer trozo (TTFT), duración
+total, errores y el máximo de streams abiertos a la vez. Con endpoints síncronos el
+TTFT se dispara en cuanto la concurrencia supera el threadpool del servidor (40 hilos
+por defecto); con el pipeline async debe mantenerse estable.
+
+Para no gastar tokens, el modo `mock-llm` levanta un servidor compatible con la API
+de DeepSeek que emite tokens con una pausa fija:
+
+    python load_test_chat.py mock-llm --port 9000 --tokens 50 --delay-ms 40
+    # en el servidor de la API: DEEPSEEK_BASE_URL=http://<host>:9000/v1 y un bot con modelo deepseek
+
+    python load_test_chat.py run --url http://localhost:8000 --bot-id 6 --concurrency 10,50,200,1000
+
+Las preguntas llevan un sufijo único para que no las resuelvan las cachés ni el
+single-flight. Para comparar antes/después, correr el mismo `run` contra cada versión.
+"""
+
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+
+# --- Servidor LLM simulado ---
+
+def serve_mock_llm(port: int, tokens: int, delay_ms: int):
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse, JSONResponse
+
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if not body.get("stream"):
+            await asyncio.sleep(tokens * delay_ms / 1000)
+            return JSONResponse({
+                "choices": [{"message": {"content": "token " * tokens}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": tokens, "total_tokens": 100 + tokens},
+            })
+
+        async def events():
+            for _ in range(tokens):
+                await asyncio.sleep(delay_ms / 1000)
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': 'token '}}]})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    print(f"🤖 LLM simulado en http://0.0.0.0:{port}/v1 ({tokens} tokens, {delay_ms} ms entre tokens)")
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="warning")
+
+
+# --- Carga ---
+
+class Tracker:
+    def __init__(self):
+        self.open_streams = 0
+        self.max_open_streams = 0
+
+    def opened(self):
+        self.open_streams += 1
+        self.max_open_streams = max(self.max_open_streams, self.open_streams)
+
+    def closed(self):
+        self.open_streams -= 1
+
+
+async def one_stream(client: httpx.AsyncClient, args, tracker: Tracker) -> dict:
+    query = f"{args.query} [{uuid.uuid4().hex[:8]}]"
+    if args.token:
+        url, payload = f"{args.url}/chat/{args.bot_id}", {"query": query}
+        headers = {"Authorization": f"Bearer {args.token}"}
+    else:
+        url, payload = f"{args.url}/chat/widget/{args.bot_id}", {"userAnonId": f"load-{uuid.uuid4().hex[:8]}", "query": query}
+        headers = {}
+
+    start = time.perf_counter()
+    ttft = None
+    try:
+        async with client.stream("POST", url, json=payload, headers=headers) as response:
+            tracker.opened()
+            try:
+                if response.status_code != 200:
+                    return {"ok": False, "error": f"HTTP {response.status_code}"}
+                async for chunk in response.aiter_text():
+                    if chunk and ttft is None:
+                        ttft = time.perf_counter() - start
+            finally:
+                tracker.closed()
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": type(e).__name__}
+    return {"ok": True, "ttft": ttft or 0.0, "total": time.perf_counter() - start}
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else (values[0] if values else 0.0)
+
+
+async def run_level(args, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    tracker = Tracker()
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(args.timeout)) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[one_stream(client, args, tracker) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    ttfts = [r["ttft"] * 1000 for r in ok]
+    totals = [r["total"] * 1000 for r in ok]
+    return {
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": errors,
+        "max_open": tracker.max_open_streams,
+        "ttft_p50": percentile(ttfts, 50) if ttfts else 0.0,
+        "ttft_p95": percentile(ttfts, 95) if ttfts else 0.0,
+        "total_p95": percentile(totals, 95) if totals else 0.0,
+        "elapsed": elapsed,
+    }
+
+
+async def run(args):
+    levels = [int(level) for level in args.concurrency.split(",")]
+    print(f"🚀 Carga contra {args.url} (bot {args.bot_id}), niveles: {levels}\n")
+    header = f"{'concurrencia':>12} {'ok':>6} {'máx abiertos':>13} {'TTFT p50 ms':>12} {'TTFT p95 ms':>12} {'total p95 ms':>13} {'s':>7}  errores"
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        row = await run_level(args, level)
+        errors = ", ".join(f"{name}={count}" for name, count in row["errors"].items()) or "-"
+        print(f"{row['concurrency']:>12} {row['ok']:>6} {row['max_open']:>13} {row['ttft_p50']:>12.0f} "
+              f"{row['ttft_p95']:>12.0f} {row['total_p95']:>13.0f} {row['elapsed']:>7.1f}  {errors}")
+        await asyncio.sleep(args.pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    mock = commands.add_parser("mock-llm", help="Servidor LLM simulado (API compatible con DeepSeek)")
+    mock.add_argument("--port", type=int, default=9000)
+    mock.add_argument("--tokens", type=int, default=50)
+    mock.add_argument("--delay-ms", type=int, default=40)
+
+    load = commands.add_parser("run", help="Lanzar la prueba de carga")
+    load.add_argument("--url", default="http://localhost:8000")
+    load.add_argument("--bot-id", type=int, required=True)
+    load.add_argument("--token", help="JWT para /chat/{bot_id}; sin él se usa el widget público")
+    load.add_argument("--query", default="¿Qué servicios ofrecen?")
+    load.add_argument("--concurrency", default="10,50,100,500,1000")
+    load.add_argument("--timeout", type=float, default=300.0)
+    load.add_argument("--pause", type=float, default=2.0, help="Segundos entre niveles")
+
+    args = parser.parse_args()
+    if args.command == "mock-llm":
+        serve_mock_llm(args.port, args.tokens, args.delay_ms)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
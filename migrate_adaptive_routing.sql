@@ -0,0 +1,19 @@
+-- Migración para el router adaptativo por latencia y costo
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Objetivo de enrutado por bot (keywords, cheapest, fastest)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS routing_objective VARCHAR NOT NULL DEFAULT 'keywords';
+
+-- 2. SLO de latencia (TTFT p95 en ms) para el objetivo cheapest (NULL = ROUTER_DEFAULT_LATENCY_SLO_MS)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS latency_slo_ms INTEGER;
+
+-- Los precios salen de model_pricing: conviene que cada modelo configurado tenga su fila activa.
+-- Ejemplo: el modelo más barato que responda en menos de 2 s (p95)
+-- UPDATE bots SET routing_objective = 'cheapest', latency_slo_ms = 2000 WHERE id = 6;
+
+-- Verificar cambios
+SELECT routing_objective, COUNT(*) AS bots, AVG(latency_slo_ms) AS slo_medio_ms
+FROM bots
+GROUP BY routing_objective;
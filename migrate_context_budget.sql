@@ -0,0 +1,16 @@
+-- Migración para el presupuesto de tokens del contexto RAG
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Presupuesto por bot (NULL = valor global RAG_CONTEXT_TOKEN_BUDGET, 0 = sin límite)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS context_token_budget INTEGER;
+
+-- 2. Tokens de contexto ahorrados en cada petición
+ALTER TABLE token_usage
+ADD COLUMN IF NOT EXISTS context_tokens_saved INTEGER DEFAULT 0;
+
+-- Verificar cambios
+SELECT column_name, data_type, column_default
+FROM information_schema.columns
+WHERE (table_name = 'bots' AND column_name = 'context_token_budget')
+   OR (table_name = 'token_usage' AND column_name = 'context_tokens_saved');
@@ -0,0 +1,11 @@
+-- Migración para el backend de embeddings por bot
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Agregar columna embedding_backend a bots (google, local)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS embedding_backend VARCHAR NOT NULL DEFAULT 'google';
+
+-- Verificar cambios
+SELECT embedding_backend, COUNT(*) AS bots
+FROM bots
+GROUP BY embedding_backend;
@@ -0,0 +1,15 @@
+-- Migración para el hedging de peticiones (segundo modelo ante respuestas lentas)
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Percentil de TTFT tras el cual se lanza el segundo modelo (NULL = desactivado)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS hedge_percentile INTEGER;
+
+-- El segundo modelo es el siguiente de la cadena de fallback (bot_model_configs.fallback_order)
+-- Ejemplo: activar hedging en p95 para un bot con latencia crítica
+-- UPDATE bots SET hedge_percentile = 95 WHERE id = 6;
+
+-- Verificar cambios
+SELECT id, name, hedge_percentile
+FROM bots
+WHERE hedge_percentile IS NOT NULL;
@@ -0,0 +1,11 @@
+-- Migración para la estrategia de índice vectorial por bot
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Agregar columna index_strategy a bots (auto, flat, hnsw, ivf_sq8, ivf_pq)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS index_strategy VARCHAR NOT NULL DEFAULT 'auto';
+
+-- Verificar cambios
+SELECT index_strategy, COUNT(*) AS bots
+FROM bots
+GROUP BY index_strategy;
@@ -0,0 +1,31 @@
+-- Migración para el clasificador de intención por embeddings del router
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Clasificador del tipo de tarea por bot (keywords, embedding)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS task_classifier VARCHAR NOT NULL DEFAULT 'keywords';
+
+-- 2. Crear tabla bot_intent_examples (consultas de ejemplo etiquetadas con su embedding float32)
+CREATE TABLE IF NOT EXISTS bot_intent_examples (
+    id SERIAL PRIMARY KEY,
+    bot_id INTEGER NOT NULL REFERENCES bots(id) ON DELETE CASCADE,
+    task_type VARCHAR NOT NULL,
+    text TEXT NOT NULL,
+    embedding_model VARCHAR NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_bot_intent_examples_bot_id
+ON bot_intent_examples (bot_id);
+
+-- Los ejemplos se cargan con POST /bots/{bot_id}/intent-examples/ (se vectorizan con el backend del bot).
+-- Ejemplo: activar el clasificador cuando el bot ya tiene ejemplos de cada tipo
+-- UPDATE bots SET task_classifier = 'embedding' WHERE id = 6;
+
+-- Verificar cambios
+SELECT b.id, b.name, b.task_classifier, e.task_type, COUNT(e.id) AS ejemplos
+FROM bots b
+LEFT JOIN bot_intent_examples e ON e.bot_id = b.id
+GROUP BY b.id, b.name, b.task_classifier, e.task_type
+ORDER BY b.id, e.task_type;
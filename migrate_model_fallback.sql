@@ -0,0 +1,16 @@
+-- Migración para la cadena de fallback entre modelos de un bot
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Orden como respaldo de cada configuración de modelo (NULL = no se usa como respaldo)
+ALTER TABLE bot_model_configs
+ADD COLUMN IF NOT EXISTS fallback_order INTEGER;
+
+-- Ejemplo: si falla el modelo elegido por el router, probar DeepSeek y luego OpenAI
+-- UPDATE bot_model_configs SET fallback_order = 1 WHERE bot_id = 6 AND provider = 'deepseek';
+-- UPDATE bot_model_configs SET fallback_order = 2 WHERE bot_id = 6 AND provider = 'openai';
+
+-- Verificar cambios
+SELECT bot_id, provider, model_id, task_type, is_active, fallback_order
+FROM bot_model_configs
+WHERE fallback_order IS NOT NULL
+ORDER BY bot_id, fallback_order;
@@ -0,0 +1,170 @@
+-- Migración para índices compuestos y particionado mensual de token_usage y analytics_events
+-- Ejecutar en la base de datos PostgreSQL (11 o superior)
+--
+-- Las analíticas filtran siempre por usuario o bot y un rango de created_at: con esta
+-- migración cada consulta lee solo las particiones de los meses del rango y, dentro de
+-- ellas, el índice compuesto correspondiente. Comprobarlo con:
+--   python check_query_plans.py
+--
+-- IMPORTANTE: la conversión copia las filas y bloquea cada tabla mientras dura. Ejecutar
+-- en una ventana de mantenimiento, con la API y los workers de Celery parados. Es
+-- idempotente: una tabla que ya está particionada no se vuelve a convertir.
+
+-- 1. Funciones de mantenimiento de particiones (las usa también la tarea de Celery beat
+--    maintain_usage_partitions_task, con USAGE_PARTITION_MONTHS_AHEAD y
+--    USAGE_PARTITION_RETENTION_MONTHS)
+
+-- Crea las particiones mensuales (meses UTC) de `parent` desde el mes de `since` hasta
+-- `months_ahead` meses después del actual. Devuelve cuántas ha creado.
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, since TIMESTAMPTZ, months_ahead INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', since AT TIME ZONE 'UTC');
+    last_month TIMESTAMP := date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => months_ahead);
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := parent || '_p' || to_char(month_start, 'YYYY_MM');
+        IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relname = partition_name AND pg_table_is_visible(oid)) THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent,
+                month_start AT TIME ZONE 'UTC', (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Borra las particiones de `parent` de meses anteriores a los últimos `retention_months`
+-- (0 o NULL = no se borra nada). Devuelve cuántas ha borrado.
+CREATE OR REPLACE FUNCTION drop_old_partitions(parent TEXT, retention_months INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    cutoff DATE := (date_trunc('month', now() AT TIME ZONE 'UTC') - make_interval(months => retention_months))::DATE;
+    old_partition RECORD;
+    dropped INTEGER := 0;
+BEGIN
+    IF retention_months IS NULL OR retention_months <= 0 THEN
+        RETURN 0;
+    END IF;
+    FOR old_partition IN
+        SELECT child.relname,
+               to_date(substring(child.relname FROM '_p(\d{4}_\d{2})$'), 'YYYY_MM') AS month_start
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = parent::regclass
+    LOOP
+        IF old_partition.month_start IS NOT NULL AND old_partition.month_start < cutoff THEN
+            EXECUTE format('DROP TABLE %I', old_partition.relname);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mantenimiento periódico de las dos tablas (solo las que ya están particionadas)
+CREATE OR REPLACE FUNCTION maintain_usage_partitions(months_ahead INTEGER, retention_months INTEGER)
+RETURNS TABLE (parent TEXT, created INTEGER, dropped INTEGER) AS $$
+DECLARE
+    usage_table TEXT;
+BEGIN
+    FOREACH usage_table IN ARRAY ARRAY['token_usage', 'analytics_events'] LOOP
+        IF (SELECT relkind FROM pg_class WHERE oid = usage_table::regclass) = 'p' THEN
+            parent := usage_table;
+            created := create_monthly_partitions(usage_table, now(), months_ahead);
+            dropped := drop_old_partitions(usage_table, retention_months);
+            RETURN NEXT;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Convierte `parent` en una tabla particionada por mes de created_at con las mismas
+-- columnas. La tabla original queda como <parent>_legacy (borrarla a mano al verificar).
+CREATE OR REPLACE FUNCTION convert_to_monthly_partitions(parent TEXT, months_ahead INTEGER)
+RETURNS TEXT AS $$
+DECLARE
+    legacy TEXT := parent || '_legacy';
+    legacy_index RECORD;
+    oldest TIMESTAMPTZ;
+    copied BIGINT;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = parent::regclass) = 'p' THEN
+        RETURN parent || ': ya estaba particionada';
+    END IF;
+
+    EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', parent);
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', parent, legacy);
+    -- Los nombres de índice son únicos por esquema: los de la tabla antigua se renombran
+    FOR legacy_index IN
+        SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = legacy
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', legacy_index.indexname, left(legacy_index.indexname, 56) || '_legacy');
+    END LOOP;
+
+    -- created_at es la clave de partición: no puede ser nula
+    EXECUTE format('UPDATE %I SET created_at = now() WHERE created_at IS NULL', legacy);
+    EXECUTE format('SELECT min(created_at) FROM %I', legacy) INTO oldest;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)', parent, legacy);
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN created_at SET NOT NULL', parent);
+    -- La clave primaria de una tabla particionada tiene que incluir la clave de partición
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, created_at)', parent);
+    EXECUTE format('ALTER TABLE %I ADD FOREIGN KEY (user_id) REFERENCES users (id)', parent);
+    EXECUTE format('ALTER TABLE %I ADD FOREIGN KEY (bot_id) REFERENCES bots (id)', parent);
+    -- La secuencia de id pasa a la tabla nueva (si no, se borraría con la antigua)
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', pg_get_serial_sequence(legacy, 'id'), parent);
+
+    PERFORM create_monthly_partitions(parent, coalesce(oldest, now()), months_ahead);
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', parent, legacy);
+    GET DIAGNOSTICS copied = ROW_COUNT;
+    RETURN format('%s: particionada, %s filas copiadas (la tabla original queda como %s)', parent, copied, legacy);
+END;
+$$ LANGUAGE plpgsql;
+
+-- 2. Convertir las tablas (cada SELECT es una transacción: si falla, la tabla queda como estaba)
+SELECT convert_to_monthly_partitions('token_usage', 3);
+SELECT convert_to_monthly_partitions('analytics_events', 3);
+
+-- 3. Índices compuestos para las consultas de analíticas (en la tabla particionada se
+--    crean en todas las particiones, también en las que se creen después)
+CREATE INDEX IF NOT EXISTS idx_token_usage_user_created ON token_usage (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_token_usage_bot_created ON token_usage (bot_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_analytics_events_user_type_created
+ON analytics_events (user_id, event_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_analytics_events_bot_type_created
+ON analytics_events (bot_id, event_type, created_at);
+
+-- 4. Estadísticas y mapa de visibilidad de las filas copiadas (sin él, PostgreSQL no
+--    puede responder solo con el índice)
+VACUUM ANALYZE token_usage;
+VACUUM ANALYZE analytics_events;
+
+-- Ejemplo de mantenimiento manual (lo hace a diario maintain_usage_partitions_task):
+-- crear particiones hasta dentro de 3 meses y borrar las de hace más de 24 meses
+-- (los agregados diarios de usage_rollup_daily conservan los totales de lo borrado)
+-- SELECT * FROM maintain_usage_partitions(3, 24);
+
+-- Una vez verificado, borrar las tablas originales:
+-- DROP TABLE token_usage_legacy;
+-- DROP TABLE analytics_events_legacy;
+
+-- Verificar cambios
+SELECT parent.relname AS tabla, child.relname AS particion,
+       pg_get_expr(child.relpartbound, child.oid) AS rango, child.reltuples::BIGINT AS filas_estimadas
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname IN ('token_usage', 'analytics_events')
+ORDER BY parent.relname, child.relname;
+
+SELECT tablename, indexname, indexdef
+FROM pg_indexes
+WHERE tablename IN ('token_usage', 'analytics_events')
+ORDER BY tablename, indexname;
@@ -0,0 +1,15 @@
+-- Migración para la caché de respuestas del chat
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Versión de configuración del bot (invalida la caché al editar el bot, sus modelos o documentos)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS config_version INTEGER NOT NULL DEFAULT 1;
+
+-- 2. Marcar los usos servidos desde la caché (no consumen BytTokens)
+ALTER TABLE token_usage
+ADD COLUMN IF NOT EXISTS cache_hit BOOLEAN DEFAULT FALSE;
+
+-- Verificar cambios
+SELECT cache_hit, COUNT(*) AS registros, SUM(bytokens_cost) AS bytokens
+FROM token_usage
+GROUP BY cache_hit;
@@ -0,0 +1,15 @@
+-- Migración para el modo de recuperación por bot (búsqueda híbrida)
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Agregar columna retrieval_mode a bots (vector, hybrid)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS retrieval_mode VARCHAR NOT NULL DEFAULT 'vector';
+
+-- Nota: el índice BM25 se escribe la próxima vez que se guarda el índice del bot
+-- (subida o borrado de documento, compactación o rebuild_bot_index_task).
+-- Mientras no exista, el modo hybrid se comporta como vector.
+
+-- Verificar cambios
+SELECT retrieval_mode, COUNT(*) AS bots
+FROM bots
+GROUP BY retrieval_mode;
@@ -0,0 +1,17 @@
+-- Migración para las palabras clave del router por bot
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Reglas {tipo de tarea: [palabras clave]} del bot (NULL = reglas por defecto del ModelRouter)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS routing_keywords JSON;
+
+-- Sin distinguir tildes ni mayúsculas y por palabra completa; "*" al final compara como prefijo.
+-- Cada tipo de tarea se enruta al modelo del bot con ese task_type (bot_model_configs.task_type).
+-- Ejemplo: consultas de cotización a un modelo 'ventas' y análisis al modelo 'complex'
+-- UPDATE bots SET routing_keywords = '{"ventas": ["precio*", "cotiza*"], "complex": ["analiz*", "compar*"]}'
+-- WHERE id = 6;
+
+-- Verificar cambios
+SELECT id, name, routing_keywords
+FROM bots
+WHERE routing_keywords IS NOT NULL;
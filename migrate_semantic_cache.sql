@@ -0,0 +1,14 @@
+-- Migración para la caché semántica de respuestas por bot
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Umbral de similitud por bot (NULL = valor global SEMANTIC_CACHE_THRESHOLD)
+ALTER TABLE bots
+ADD COLUMN IF NOT EXISTS semantic_cache_threshold DOUBLE PRECISION;
+
+-- Ejemplo: activar la caché semántica en un bot público de mucho tráfico
+-- UPDATE bots SET semantic_cache_threshold = 0.93 WHERE id = 6;
+
+-- Verificar cambios
+SELECT id, name, semantic_cache_threshold
+FROM bots
+WHERE semantic_cache_threshold IS NOT NULL;
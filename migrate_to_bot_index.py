@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Script de migración al índice vectorial consolidado por bot.
+
+Antes cada documento tenía su propio índice de LangChain en
+storage/bot_{id}/doc_{id}.faiss; ahora cada bot tiene un único índice en
+storage/bot_{id}/index. Este script copia los vectores y chunks ya calculados
+(sin volver a llamar a la API de embeddings) y actualiza vector_index_path.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import logging
+
+from app.database import SessionLocal
+from app import models
+from app.core.vector_index import BotVectorIndex, bot_index_path, bot_index_lock
+from langchain_community.vectorstores import FAISS
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_legacy_document(index_path: str, embeddings):
+    """Lee los vectores y textos de un índice de LangChain por documento"""
+    store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    texts = [
+        store.docstore.search(store.index_to_docstore_id[i]).page_content
+        for i in range(store.index.ntotal)
+    ]
+    return texts, np.asarray(vectors, dtype="float32")
+
+
+def migrate_bot(db, bot_id: int, documents, embeddings) -> int:
+    """Migra los documentos de un bot a su índice consolidado. Devuelve cuántos se migraron."""
+    index_path = bot_index_path(bot_id)
+    migrated = 0
+
+    with bot_index_lock(bot_id):
+        bot_index = BotVectorIndex.load(index_path) if BotVectorIndex.exists(index_path) else None
+
+        for doc in documents:
+            texts, vectors = load_legacy_document(doc.vector_index_path, embeddings)
+            if not texts:
+                logger.warning(f"⚠️  Documento {doc.id} sin vectores, se omite")
+                continue
+
+            if bot_index is None:
+                bot_index = BotVectorIndex.create(vectors.shape[1])
+            bot_index.add_document(doc.id, texts, vectors)
+            doc.vector_index_path = index_path
+            migrated += 1
+            logger.info(f"  ✅ Documento {doc.id}: {len(texts)} chunks")
+
+        if bot_index is not None and migrated:
+            bot_index.save(index_path)
+            db.commit()
+
+    return migrated
+
+
+def main():
+    logger.info("🚀 Migrando índices por documento al índice consolidado por bot...")
+
+    # Solo se usa para deserializar; no se hacen llamadas a la API
+    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+
+    db = SessionLocal()
+    try:
+        legacy_docs = [
+            doc for doc in db.query(models.Document).filter(
+                models.Document.status == models.DocumentStatus.COMPLETED
+            ).all()
+            if doc.vector_index_path
+            and doc.vector_index_path != bot_index_path(doc.bot_id)
+            and os.path.isdir(doc.vector_index_path)
+        ]
+
+        if not legacy_docs:
+            logger.info("✅ No hay documentos con índices antiguos. Nada que migrar.")
+            return True
+
+        docs_by_bot = {}
+        for doc in legacy_docs:
+            docs_by_bot.setdefault(doc.bot_id, []).append(doc)
+
+        total = 0
+        for bot_id, documents in docs_by_bot.items():
+            logger.info(f"🤖 Bot {bot_id}: {len(documents)} documento(s)")
+            total += migrate_bot(db, bot_id, documents, embeddings)
+
+        logger.info(f"📊 Documentos migrados: {total}/{len(legacy_docs)}")
+        logger.info("ℹ️  Los directorios doc_*.faiss antiguos pueden borrarse tras verificar el chat.")
+        return total == len(legacy_docs)
+
+    except Exception as e:
+        logger.error(f"❌ Error durante la migración: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        if success:
+            logger.info("\n✅ Migración completada exitosamente")
+            sys.exit(0)
+        else:
+            logger.error("\n❌ Migración falló")
+            sys.exit(1)
+    except KeyboardInterrupt:
+        logger.info("\n⚠️  Migración cancelada por el usuario")
+        sys.exit(1)
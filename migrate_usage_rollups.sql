@@ -0,0 +1,62 @@
+-- Migración para los agregados por hora y por día de token_usage (analíticas)
+-- Ejecutar en la base de datos PostgreSQL
+
+-- 1. Crear tablas usage_rollup_hourly y usage_rollup_daily
+--    Una fila por (inicio de la hora/día en UTC, usuario, bot, proveedor, modelo)
+CREATE TABLE IF NOT EXISTS usage_rollup_hourly (
+    id SERIAL PRIMARY KEY,
+    bucket TIMESTAMP NOT NULL,
+    user_id INTEGER NOT NULL,
+    bot_id INTEGER NOT NULL,
+    provider VARCHAR NOT NULL,
+    model_id VARCHAR NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    total_cost INTEGER NOT NULL DEFAULT 0,
+    bytokens_cost INTEGER NOT NULL DEFAULT 0,
+    context_tokens_saved INTEGER NOT NULL DEFAULT 0,
+    response_time_ms_total BIGINT NOT NULL DEFAULT 0,
+    last_used_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS usage_rollup_daily (
+    id SERIAL PRIMARY KEY,
+    bucket TIMESTAMP NOT NULL,
+    user_id INTEGER NOT NULL,
+    bot_id INTEGER NOT NULL,
+    provider VARCHAR NOT NULL,
+    model_id VARCHAR NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    total_cost INTEGER NOT NULL DEFAULT 0,
+    bytokens_cost INTEGER NOT NULL DEFAULT 0,
+    context_tokens_saved INTEGER NOT NULL DEFAULT 0,
+    response_time_ms_total BIGINT NOT NULL DEFAULT 0,
+    last_used_at TIMESTAMP
+);
+
+-- 2. Índices: clave única (para INSERT ... ON CONFLICT) y lecturas por usuario/bot
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usage_rollup_hourly_key
+ON usage_rollup_hourly (bucket, user_id, bot_id, provider, model_id);
+CREATE INDEX IF NOT EXISTS idx_usage_rollup_hourly_user ON usage_rollup_hourly (user_id, bucket);
+CREATE INDEX IF NOT EXISTS idx_usage_rollup_hourly_bot ON usage_rollup_hourly (bot_id, bucket);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usage_rollup_daily_key
+ON usage_rollup_daily (bucket, user_id, bot_id, provider, model_id);
+CREATE INDEX IF NOT EXISTS idx_usage_rollup_daily_user ON usage_rollup_daily (user_id, bucket);
+CREATE INDEX IF NOT EXISTS idx_usage_rollup_daily_bot ON usage_rollup_daily (bot_id, bucket);
+
+-- Los agregados se actualizan al escribir token_usage. Para el histórico, después de
+-- desplegar (y una vez cerrada la hora del despliegue):
+--   python backfill_usage_rollups.py --days 365
+
+-- Verificar cambios
+SELECT 'hourly' AS tabla, COUNT(*) AS filas, MIN(bucket) AS desde, MAX(bucket) AS hasta FROM usage_rollup_hourly
+UNION ALL
+SELECT 'daily', COUNT(*), MIN(bucket), MAX(bucket) FROM usage_rollup_daily;
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Herramienta offline para cambiar el backend de embeddings de bots existentes.
+
+Re-vectoriza los chunks ya guardados en storage/bot_{id}/index con el backend
+indicado (google o local), reconstruye el índice y actualiza bots.embedding_backend.
+No hace falta volver a subir los documentos.
+
+Uso:
+    python reembed_bot_indexes.py --backend local --bot-id 6
+    python reembed_bot_indexes.py --backend local --all
+    python reembed_bot_indexes.py --backend local --all --dry-run
+"""
+
+import os
+import sys
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+
+from app.database import SessionLocal
+from app import models
+from app.core.vector_index import BotVectorIndex, bot_index_path, bot_index_lock
+from app.embeddings import EMBEDDING_BACKENDS, get_embedding_backend
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def reembed_bot(db, bot: models.Bot, backend_name: str, dry_run: bool = False) -> bool:
+    """Re-vectoriza el índice de un bot. Devuelve False si hubo que omitirlo."""
+    index_path = bot_index_path(bot.id)
+    if not BotVectorIndex.exists(index_path):
+        logger.info(f"  ℹ️  Bot {bot.id} sin índice: solo se actualiza el backend")
+        if not dry_run:
+            bot.embedding_backend = backend_name
+            db.commit()
+        return True
+
+    current = BotVectorIndex.stored_embedding_backend(index_path)
+    if current == backend_name:
+        logger.info(f"  ✅ Bot {bot.id} ya usa '{backend_name}'")
+        if not dry_run and bot.embedding_backend != backend_name:
+            bot.embedding_backend = backend_name
+            db.commit()
+        return True
+
+    if dry_run:
+        logger.info(f"  🔎 Bot {bot.id}: '{current}' -> '{backend_name}' (dry-run)")
+        return True
+
+    backend = get_embedding_backend(backend_name)
+    start = time.perf_counter()
+    with bot_index_lock(bot.id):
+        bot_index = BotVectorIndex.load(index_path)
+        bot_index.compact()
+        bot_index.reembed(backend.embed_documents, backend.name)
+        bot_index.save(index_path, strategy=bot.index_strategy)
+        bot.embedding_backend = backend_name
+        db.commit()
+
+    logger.info(f"  ✅ Bot {bot.id}: {bot_index.ntotal} chunks re-vectorizados en "
+                f"{time.perf_counter() - start:.1f}s (dim {bot_index.index.d}, {bot_index.strategy})")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", required=True, choices=EMBEDDING_BACKENDS)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--bot-id", type=int, action="append", help="Bot a migrar (se puede repetir)")
+    target.add_argument("--all", action="store_true", help="Migrar todos los bots")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se haría")
+    args = parser.parse_args()
+
+    logger.info(f"🚀 Re-vectorizando índices con el backend '{args.backend}'...")
+
+    db = SessionLocal()
+    try:
+        query = db.query(models.Bot)
+        if not args.all:
+            query = query.filter(models.Bot.id.in_(args.bot_id))
+        bots = query.order_by(models.Bot.id).all()
+
+        if not bots:
+            logger.info("✅ No hay bots que migrar.")
+            return True
+
+        migrated = 0
+        for bot in bots:
+            logger.info(f"🤖 Bot {bot.id} ({bot.name})")
+            try:
+                if reembed_bot(db, bot, args.backend, dry_run=args.dry_run):
+                    migrated += 1
+            except Exception as e:
+                logger.error(f"  ❌ Bot {bot.id}: {e}")
+                db.rollback()
+
+        logger.info(f"📊 Bots migrados: {migrated}/{len(bots)}")
+        return migrated == len(bots)
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        if success:
+            logger.info("\n✅ Migración completada exitosamente")
+            sys.exit(0)
+        else:
+            logger.error("\n❌ Migración falló")
+            sys.exit(1)
+    except KeyboardInterrupt:
+        logger.info("\n⚠️  Migración cancelada por el usuario")
+        sys.exit(1)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Simulador de políticas de enrutado sobre el historial de token_usage.
+
+Reproduce en orden las preguntas reales (sin aciertos de caché) de los últimos días
+y, para cada política (keywords, cheapest, fastest), deja que el ModelRouter elija
+entre los modelos activos de cada bot con estadísticas que se van alimentando con
+los resultados simulados, igual que en producción.
+
+Resultado de cada elección:
+  - si el router elige el modelo que respondió de verdad, se usa la fila tal cual;
+  - si elige otro, la latencia se toma al azar del historial de ese modelo y el costo
+    se calcula con los tokens de la pregunta original y el precio del modelo elegido
+    (se asume una respuesta de la misma longitud).
+
+token_usage no guarda el tiempo al primer trozo, así que en la simulación la latencia
+(y el SLO) es el tiempo total de respuesta (response_time_ms): un SLO de 5000 ms se
+compara contra respuestas completas, más exigente que en producción.
+
+Uso:
+    python simulate_routing.py --days 30
+    python simulate_routing.py --bot-id 6 --slo-ms 3000 --policies keywords,cheapest
+"""
+
+import os
+import sys
+import random
+import argparse
+import statistics
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.core.model_router import ModelRouter, ROUTING_OBJECTIVES
+from app.services.pricing import load_model_prices
+from app.core.model_stats import ModelStats
+
+# El router registra cada decisión; se silencia para la simulación
+logging.disable(logging.INFO)
+
+
+def load_history(db, days: int, bot_id: int = None, limit: int = None):
+    query = db.query(models.TokenUsage).filter(
+        models.TokenUsage.created_at >= datetime.utcnow() - timedelta(days=days),
+        models.TokenUsage.cache_hit.isnot(True),
+        models.TokenUsage.response_time_ms.isnot(None),
+    )
+    if bot_id:
+        query = query.filter(models.TokenUsage.bot_id == bot_id)
+    query = query.order_by(models.TokenUsage.created_at)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def load_bots(db, bot_ids):
+    """bot_id -> (configuraciones de modelo activas, SLO del bot o None, reglas de palabras clave o None)"""
+    bots = {}
+    for bot in db.query(models.Bot).filter(models.Bot.id.in_(bot_ids)).all():
+        configs = [
+            {"provider": c.provider, "model_id": c.model_id, "task_type": c.task_type or "general", "is_active": bool(c.is_active)}
+            for c in bot.model_configs if c.is_active
+        ]
+        bots[bot.id] = (configs, bot.latency_slo_ms, bot.routing_keywords)
+    return bots
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else (values[0] if values else 0.0)
+
+
+def cost_usd(router: ModelRouter, provider: str, model_id: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_cost_per_1k, output_cost_per_1k = router.price(provider, model_id)
+    return prompt_tokens / 1000 * input_cost_per_1k + completion_tokens / 1000 * output_cost_per_1k
+
+
+def summarize(name, latencies, costs, slo_misses, choices, unknown=0):
+    return {
+        "policy": name,
+        "queries": len(latencies),
+        "cost": sum(costs),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "slo_miss": slo_misses / len(latencies) * 100 if latencies else 0.0,
+        "choices": choices,
+        "unknown": unknown,
+    }
+
+
+def replay_history(rows, bots, router: ModelRouter, default_slo: int):
+    latencies, costs, misses, choices = [], [], 0, Counter()
+    for row in rows:
+        slo = bots.get(row.bot_id, ([], None, None))[1] or default_slo
+        latencies.append(row.response_time_ms)
+        costs.append(cost_usd(router, row.provider, row.model_id, row.prompt_tokens or 0, row.completion_tokens or 0))
+        misses += row.response_time_ms > slo
+        choices[f"{row.provider}/{row.model_id}"] += 1
+    return summarize("historial", latencies, costs, misses, choices)
+
+
+def replay_policy(rows, bots, history_latencies, prices, objective: str, default_slo: int, args):
+    stats = ModelStats(window=settings.ROUTER_STATS_WINDOW, min_samples=settings.ROUTER_MIN_SAMPLES)
+    router = ModelRouter(stats=stats, prices=prices, exploration_rate=args.exploration, seed=args.seed)
+    rng = random.Random(args.seed)
+    latencies, costs, misses, choices, unknown = [], [], 0, Counter(), 0
+
+    for row in rows:
+        configs, bot_slo, keyword_rules = bots.get(row.bot_id, ([], None, None))
+        slo = bot_slo or default_slo
+        chosen = router.select_model(row.query, configs, objective=objective, latency_slo_ms=slo,
+                                     keyword_rules=keyword_rules, rules_key=row.bot_id)
+        provider, model_id = (chosen["provider"], chosen["model_id"]) if chosen else (row.provider, row.model_id)
+
+        if (provider, model_id) == (row.provider, row.model_id):
+            latency = row.response_time_ms
+        elif history_latencies.get((provider, model_id)):
+            latency = rng.choice(history_latencies[(provider, model_id)])
+        else:
+            # Modelo sin historial: no se puede simular, se cuenta con el resultado real
+            unknown += 1
+            provider, model_id, latency = row.provider, row.model_id, row.response_time_ms
+
+        prompt_tokens, completion_tokens = row.prompt_tokens or 0, row.completion_tokens or 0
+        stats.record_success(
+            provider, model_id, latency,
+            completion_tokens / (latency / 1000) if latency else None,
+            prompt_tokens, completion_tokens,
+        )
+        latencies.append(latency)
+        costs.append(cost_usd(router, provider, model_id, prompt_tokens, completion_tokens))
+        misses += latency > slo
+        choices[f"{provider}/{model_id}"] += 1
+
+    return summarize(objective, latencies, costs, misses, choices, unknown)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--bot-id", type=int, help="Solo las preguntas de este bot")
+    parser.add_argument("--limit", type=int, help="Máximo de filas a reproducir")
+    parser.add_argument("--policies", default=",".join(ROUTING_OBJECTIVES))
+    parser.add_argument("--slo-ms", type=int, default=settings.ROUTER_DEFAULT_LATENCY_SLO_MS,
+                        help="SLO para los bots sin latency_slo_ms (sobre el tiempo total de respuesta)")
+    parser.add_argument("--exploration", type=float, default=settings.ROUTER_EXPLORATION_RATE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+    invalid = [p for p in policies if p not in ROUTING_OBJECTIVES]
+    if invalid:
+        print(f"❌ Políticas desconocidas: {', '.join(invalid)} (válidas: {', '.join(ROUTING_OBJECTIVES)})")
+        return 1
+
+    db = SessionLocal()
+    try:
+        rows = load_history(db, args.days, args.bot_id, args.limit)
+        if not rows:
+            print("⚠️ No hay filas de token_usage con response_time_ms en el período.")
+            return 1
+        bots = load_bots(db, {row.bot_id for row in rows})
+        prices = load_model_prices()
+    finally:
+        db.close()
+
+    history_latencies = defaultdict(list)
+    for row in rows:
+        history_latencies[(row.provider, row.model_id)].append(row.response_time_ms)
+
+    print(f"🔁 Reproduciendo {len(rows)} preguntas de {len(bots)} bots (últimos {args.days} días)\n")
+    results = [replay_history(rows, bots, ModelRouter(prices=prices), args.slo_ms)]
+    for objective in policies:
+        results.append(replay_policy(rows, bots, history_latencies, prices, objective, args.slo_ms, args))
+
+    header = f"{'política':>10} {'preguntas':>10} {'costo USD':>11} {'p50 ms':>8} {'p95 ms':>8} {'fuera SLO %':>12} {'sin datos':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['policy']:>10} {r['queries']:>10} {r['cost']:>11.4f} {r['p50']:>8.0f} {r['p95']:>8.0f} "
+              f"{r['slo_miss']:>12.1f} {r['unknown']:>10}")
+
+    print("\n📊 Reparto de modelos por política:")
+    for r in results:
+        top = ", ".join(f"{model}={count}" for model, count in r["choices"].most_common())
+        print(f"   {r['policy']}: {top}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
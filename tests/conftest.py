@@ -0,0 +1,98 @@
+"""
+Configuración común de los tests: SQLite en memoria en lugar de PostgreSQL y fakeredis
+en lugar de Redis, para poder ejecutarlos sin los servicios de docker-compose.
+
+Uso:
+    python -m pytest -q
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Variables obligatorias de Settings (no se usan: ningún test llama a los proveedores)
+for name in ("DB_USER", "DB_PASSWORD", "DB_NAME", "GOOGLE_API_KEY", "OPENAI_API_KEY", "DEEPSEEK_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+import fakeredis
+import pytest
+import redis
+import redis.asyncio as aioredis
+import sqlalchemy
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.pool import StaticPool
+
+_create_engine = sqlalchemy.create_engine
+
+
+def _date_trunc(unit: str, value):
+    moment = datetime.fromisoformat(str(value)).replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        moment = moment.replace(hour=0)
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _register_functions(connection, _):
+    """Funciones de PostgreSQL que usan los agregados (las fechas ya se guardan en UTC)."""
+    connection.create_function("greatest", 2, lambda a, b: b if a is None else a if b is None else max(a, b))
+    connection.create_function("timezone", 2, lambda zone, value: value)
+    connection.create_function("date_trunc", 2, _date_trunc)
+
+
+def _sqlite_engine(*args, **kwargs):
+    # app.database crea el motor al importarse: todas las sesiones comparten una base en memoria
+    engine = _create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    sqlalchemy.event.listen(engine, "connect", _register_functions)
+    return engine
+
+
+sqlalchemy.create_engine = _sqlite_engine
+
+from app import models
+from app.database import Base, SessionLocal, engine
+from app.services import usage_rollups
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Sesión sobre una base de datos vacía con todas las tablas."""
+    # Los agregados usan el INSERT ... ON CONFLICT de PostgreSQL; SQLite tiene el mismo
+    monkeypatch.setattr(usage_rollups, "pg_insert", sqlite.insert)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(email="test@bytchat.local", hashed_password="x", is_active=True, is_approved=True)
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def bot(db, user):
+    bot = models.Bot(name="Bot de prueba", owner_id=user.id)
+    db.add(bot)
+    db.commit()
+    return bot
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """Los clientes creados con Redis.from_url (sync y asyncio) comparten un servidor fakeredis."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(
+        lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)
+    ))
+    monkeypatch.setattr(aioredis.Redis, "from_url", classmethod(
+        lambda cls, url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs)
+    ))
+    return server
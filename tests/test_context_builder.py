@@ -0,0 +1,85 @@
+"""Armado del contexto: deduplicación de chunks y empaquetado dentro del presupuesto."""
+
+from app.core.context_builder import build_context
+from app.core.text_utils import estimate_tokens
+
+REFUNDS = "Los reembolsos se procesan en cinco días hábiles."
+
+
+def filler(count: int, topic: str = "otros temas") -> str:
+    return " ".join(f"Oración de relleno número {i} sobre {topic}." for i in range(count))
+
+
+def test_without_budget_chunks_are_joined_in_relevance_order():
+    chunks = [{"id": 7, "text": "Primero."}, {"id": 3, "text": "Segundo."}]
+
+    result = build_context(chunks, None)
+
+    assert result["context"] == "Primero.\nSegundo."
+    assert result["chunks_used"] == 2
+    assert result["tokens_saved"] == 0
+
+
+def test_repeated_sentences_are_kept_once_ignoring_case_and_accents():
+    chunks = [{"id": 1, "text": f"{REFUNDS} Se piden desde el panel."},
+              {"id": 10, "text": f"{REFUNDS.upper()} Hay que adjuntar la factura."},
+              {"id": 20, "text": "los reembolsos se procesan en cinco dias habiles."}]
+
+    result = build_context(chunks, None)
+
+    assert result["context"].lower().count("reembolsos") == 1
+    assert "Hay que adjuntar la factura." in result["context"]
+    assert result["chunks_used"] == 2
+
+
+def test_overlap_between_neighbour_chunks_is_removed():
+    shared = "Segunda oración compartida entre los dos chunks del splitter."
+    first = f"Primera oración del documento que es bastante larga. {shared}"
+    second = f"{shared} Tercera oración nueva."
+
+    # El chunk siguiente llega antes (más relevante): se recorta el final del anterior
+    result = build_context([{"id": 2, "text": second}, {"id": 1, "text": first}], None)
+
+    assert result["context"].count(shared) == 1
+    assert result["context"].split("\n") == [second, "Primera oración del documento que es bastante larga."]
+
+
+def test_packing_prefers_dense_chunks_and_keeps_relevance_order():
+    chunks = [{"id": 1, "text": "El plan básico cuesta diez euros al mes.", "relevance": 0.9},
+              {"id": 10, "text": filler(30), "relevance": 0.8},
+              {"id": 20, "text": "El plan pro incluye soporte prioritario.", "relevance": 0.4}]
+
+    result = build_context(chunks, 40)
+
+    assert result["context"].split("\n") == [chunks[0]["text"], chunks[2]["text"]]
+    assert result["context_tokens"] <= 40
+    assert result["tokens_saved"] == result["original_tokens"] - result["context_tokens"]
+
+
+def test_sentences_are_not_dropped_because_of_a_chunk_that_did_not_fit():
+    chunks = [{"id": 1, "text": "El plan básico cuesta diez euros al mes.", "relevance": 0.9},
+              {"id": 10, "text": f"{filler(30)} {REFUNDS}", "relevance": 0.5},
+              {"id": 20, "text": f"{REFUNDS} Se piden desde el panel.", "relevance": 0.4}]
+
+    result = build_context(chunks, 60)
+
+    assert result["chunks_used"] == 2
+    assert REFUNDS in result["context"]
+    assert "relleno" not in result["context"]
+
+
+def test_the_first_chunk_is_truncated_when_it_does_not_fit():
+    text = filler(20, "el plan básico")
+
+    result = build_context([{"id": 1, "text": text}, {"id": 5, "text": filler(10)}], 30)
+
+    assert result["chunks_used"] == 1
+    assert 0 < result["context_tokens"] <= 30
+    assert text.startswith(result["context"])
+    assert estimate_tokens(result["context"]) < estimate_tokens(text)
+
+
+def test_empty_input():
+    assert build_context([], 100) == {
+        "context": "", "chunks_used": 0, "context_tokens": 0, "original_tokens": 0, "tokens_saved": 0,
+    }
@@ -0,0 +1,68 @@
+"""Caché de índices residentes: vigencia por mtime, presupuesto en bytes y locks de carga."""
+
+import os
+
+from app.core.index_cache import IndexCache, index_mtime, index_size_bytes
+
+
+def write(path, name, content=b"x", mtime=None):
+    file_path = path / name
+    file_path.write_bytes(content)
+    if mtime is not None:
+        os.utime(file_path, (mtime, mtime))
+
+
+def test_files_being_replaced_are_ignored(tmp_path, monkeypatch):
+    write(tmp_path, "vectors.faiss", b"1234", mtime=1000)
+    write(tmp_path, "manifest.json", b"{}", mtime=2000)
+    write(tmp_path, "chunks.bin.tmp", b"a medio escribir", mtime=3000)
+    # Un archivo que el worker renombra entre el listdir y el stat
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listdir(path) + ["chunk_ids.npy.tmp", "chunk_ids.npy"])
+
+    assert index_mtime(str(tmp_path)) == 2000
+    assert index_size_bytes(str(tmp_path)) == 6
+
+
+def test_indexes_are_reloaded_when_they_change_on_disk(tmp_path):
+    write(tmp_path, "manifest.json", mtime=1000)
+    cache = IndexCache(max_bytes=1024)
+    loads = []
+
+    def loader(path):
+        loads.append(path)
+        return len(loads)
+
+    assert cache.get_or_load(1, str(tmp_path), loader) == 1
+    assert cache.get_or_load(1, str(tmp_path), loader) == 1
+    write(tmp_path, "manifest.json", mtime=2000)
+    assert cache.get_or_load(1, str(tmp_path), loader) == 2
+
+    assert (cache.hits, cache.misses) == (1, 2)
+    # Los locks de carga no se acumulan por bot
+    assert cache._load_locks == {}
+
+
+def test_the_least_recently_used_index_is_evicted(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).mkdir()
+        write(tmp_path / name, "manifest.json", b"x" * 40)
+    cache = IndexCache(max_bytes=100)
+
+    for name in ("a", "b", "a", "c"):
+        cache.get_or_load(name, str(tmp_path / name), lambda path: path)
+
+    assert list(cache._entries) == ["a", "c"]
+    assert cache.stats()["current_bytes"] == 80
+    assert cache.evictions == 1
+
+
+def test_a_new_generation_is_loaded_even_with_the_same_mtime(tmp_path):
+    for name in ("gen_1", "gen_2"):
+        (tmp_path / name).mkdir()
+        write(tmp_path / name, "manifest.json", mtime=1000)
+    cache = IndexCache(max_bytes=1024)
+
+    assert cache.get_or_load(1, str(tmp_path / "gen_1"), lambda path: path).endswith("gen_1")
+    assert cache.get_or_load(1, str(tmp_path / "gen_2"), lambda path: path).endswith("gen_2")
+    assert cache.stats()["entries"] == 1
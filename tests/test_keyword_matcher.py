@@ -0,0 +1,88 @@
+"""Reglas de palabras clave del router compiladas en una sola expresión regular."""
+
+import pytest
+
+from app.core.keyword_matcher import DEFAULT_KEYWORD_RULES, KeywordMatcher, KeywordMatcherCache
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Dame la lista de precios", "complex"),
+    ("¿Hay algún especialista disponible?", None),
+    ("Quiero listas separadas", "complex"),
+    ("Resúmeme este documento", "complex"),
+    ("Necesito un análisis", "complex"),
+    ("Necesito un ANALISIS", "complex"),
+    ("Hay que recrear el pedido", None),
+    ("Hola, ¿qué tal?", None),
+])
+def test_default_rules(query, expected):
+    assert KeywordMatcher(DEFAULT_KEYWORD_RULES).classify(query) == expected
+
+
+def test_matching_ignores_accents_and_case_on_both_sides():
+    matcher = KeywordMatcher({"code": ["codigo"], "legal": ["CLÁUSULA"]})
+
+    assert matcher.classify("Revisa este Código") == "code"
+    assert matcher.classify("la clausula tercera") == "legal"
+
+
+def test_words_match_whole_words_and_prefixes_match_any_ending():
+    matcher = KeywordMatcher({"network": ["red", "redes"], "writing": ["redact*"]})
+
+    assert matcher.classify("la red está caída") == "network"
+    assert matcher.classify("problemas de redes") == "network"
+    assert matcher.classify("una redada") is None
+    assert matcher.classify("redáctame un correo") == "writing"
+    # El prefijo solo cuenta al inicio de una palabra
+    assert matcher.classify("corredactor") is None
+
+
+def test_a_prefix_keyword_absorbs_longer_words_of_the_same_type():
+    matcher = KeywordMatcher({"complex": ["compar*", "comparativa"]})
+
+    assert matcher.classify("comparame precios") == "complex"
+    assert matcher.classify("una comparativa") == "complex"
+
+
+def test_the_first_task_type_in_the_rules_wins():
+    matcher = KeywordMatcher({"code": ["python"], "complex": ["explic*"]})
+
+    assert matcher.classify("explícame este script de python") == "code"
+    assert KeywordMatcher({"complex": ["explic*"], "code": ["python"]}).classify(
+        "explícame este script de python") == "complex"
+
+
+def test_a_lower_priority_keyword_does_not_hide_one_that_starts_inside_it():
+    matcher = KeywordMatcher({"data": ["datos"], "db": ["base de datos"]})
+
+    assert matcher.classify("migrar la base de datos") == "data"
+
+
+def test_regex_metacharacters_and_phrases_are_literal():
+    matcher = KeywordMatcher({"code": ["c++", "node.js"], "db": ["base de datos"]})
+
+    assert matcher.classify("un programa en C++") == "code"
+    assert matcher.classify("servidor en node.js") == "code"
+    assert matcher.classify("servidor en nodexjs") is None
+    assert matcher.classify("diseña la base de datos") == "db"
+    assert matcher.classify("la base de datosfera") is None
+
+
+def test_empty_rules_never_match():
+    assert KeywordMatcher({}).classify("lista") is None
+    assert KeywordMatcher({"complex": ["", "*"], "code": []}).classify("lista") is None
+
+
+def test_cache_reuses_matchers_per_key_and_evicts_the_oldest():
+    cache = KeywordMatcherCache(max_entries=2)
+    rules = {"code": ["python"]}
+
+    first = cache.get((1, 1), rules)
+    assert cache.get((1, 1), rules) is first
+    cache.get((2, 1), rules)
+    cache.get((1, 1), rules)
+    cache.get((3, 1), rules)
+
+    assert list(cache._matchers) == [(1, 1), (3, 1)]
+    # Sin reglas propias: las reglas por defecto
+    assert cache.get((4, 1), None).classify("resume esto") == "complex"
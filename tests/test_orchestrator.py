@@ -0,0 +1,192 @@
+"""Orquestador: cupo de BytTokens con single-flight y cierre de los streams del conector."""
+
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.connectors.base_connector import BaseConnector
+from app.core import orchestrator
+from app.core.single_flight import SingleFlight
+from app.database import SessionLocal
+from app.services.pricing import pricing_resolver
+
+LIMIT_MESSAGE = "Lo siento, has alcanzado el límite de tokens"
+MODEL_CONFIGS = [{"provider": "fake", "model_id": "fake-model", "task_type": "general", "is_active": True}]
+
+
+class FakeConnector(BaseConnector):
+    """Proveedor que responde `chunks` trozos; anota cuántos streams se abrieron y se cerraron."""
+
+    def __init__(self, chunks: int = 3, delay: float = 0.02):
+        self.chunks = chunks
+        self.delay = delay
+        self.opened = 0
+        self.closed = 0
+
+    def get_response_stream(self, prompt_package, model_id, temperature=0.7):
+        raise NotImplementedError
+
+    def get_response_with_metrics(self, prompt_package, model_id, temperature=0.7):
+        raise NotImplementedError
+
+    async def aget_response_stream(self, prompt_package, model_id, temperature=0.7, usage=None):
+        self.opened += 1
+        try:
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                yield f"t{i} "
+            self.fill_usage(usage, 10, self.chunks, model_id)
+        finally:
+            self.closed += 1
+
+
+class FakeRegistry:
+    def __init__(self, connector):
+        self.connector = connector
+
+    def get(self, provider):
+        return self.connector
+
+
+class FakeMetrics:
+    """Sustituye a MetricsService: saldo por usuario y registro de lo facturado."""
+
+    balances = {}
+    released = []
+    cache_hits = []
+    usage = []
+
+    def __init__(self, db):
+        self.db = db
+
+    def reserve_bytokens(self, user_id, provider, model_id, estimated_tokens):
+        allowed = self.balances.get(user_id, True)
+        return {"allowed": allowed, "remaining": 0, "reservation": f"r{user_id}" if allowed else None}
+
+    def release_bytokens(self, user_id, reservation):
+        self.released.append(reservation)
+
+    def record_token_usage(self, **values):
+        self.usage.append(dict(values, session=self.db))
+
+    def record_cache_hit(self, **values):
+        self.cache_hits.append(values)
+
+
+@pytest.fixture
+def connector(db, monkeypatch):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", True)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(orchestrator, "single_flight", SingleFlight())
+    monkeypatch.setattr(orchestrator, "circuit_breaker", None)
+    monkeypatch.setattr(orchestrator, "MetricsService", FakeMetrics)
+    # Precios de respaldo, sin el hilo que escucha los cambios en Redis
+    monkeypatch.setattr(pricing_resolver, "_redis", None)
+    FakeMetrics.balances, FakeMetrics.released, FakeMetrics.cache_hits, FakeMetrics.usage = {}, [], [], []
+    return FakeConnector()
+
+
+def make_orchestrator(db, connector, user_id):
+    bot = orchestrator.Orchestrator(db=db, bot_config={"model_configs": MODEL_CONFIGS}, bot_id=1, user_id=user_id)
+    bot.connectors = FakeRegistry(connector)
+    bot._retrieve_context = lambda query: None
+    bot._semantic_cache_params = lambda query: None
+    return bot
+
+
+async def ask(db, connector, user_id, delay=0.0, query="¿Cuánto cuesta el plan?"):
+    await asyncio.sleep(delay)
+    bot = make_orchestrator(db, connector, user_id)
+    return "".join([chunk async for chunk in bot.handle_query(str(user_id), query)])
+
+
+def test_followers_without_balance_are_denied_before_joining_the_flight(db, connector):
+    FakeMetrics.balances = {8: False}
+
+    async def scenario():
+        return await asyncio.gather(ask(db, connector, 7), ask(db, connector, 8, delay=0.01),
+                                    ask(db, connector, 9, delay=0.01))
+
+    leader, denied, follower = asyncio.run(scenario())
+
+    assert leader == follower == "t0 t1 t2 "
+    assert denied.startswith(LIMIT_MESSAGE)
+    assert connector.opened == 1
+    # La respuesta compartida cuenta como acierto de caché con el modelo del líder, sin facturar tokens
+    assert [(hit["user_id"], hit["provider"], hit["model_id"]) for hit in FakeMetrics.cache_hits] == [
+        (9, "fake", "fake-model")
+    ]
+    assert [usage["user_id"] for usage in FakeMetrics.usage] == [7]
+    assert sorted(FakeMetrics.released) == ["r7", "r9"]
+
+
+@pytest.mark.parametrize("single_flight", [False, True])
+@pytest.mark.parametrize("hedge_percentile", [None, 95])
+def test_closing_the_response_closes_the_connector_stream_at_once(db, connector, monkeypatch,
+                                                                 single_flight, hedge_percentile):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", single_flight)
+    connector.chunks = 100
+
+    async def scenario():
+        bot = make_orchestrator(db, connector, 7)
+        bot.bot_config["hedge_percentile"] = hedge_percentile
+        response = bot.handle_query("7", "pregunta larga")
+        for _ in range(3):
+            await response.__anext__()
+        await response.aclose()
+        # Sin esperar a la recolección de basura: el conector ya se cerró
+        return connector.closed
+
+    assert asyncio.run(scenario()) == 1
+    # Lo generado hasta el corte se factura
+    assert [usage["completion_tokens"] for usage in FakeMetrics.usage] == [2]
+
+
+@pytest.mark.parametrize("single_flight", [False, True])
+def test_cancelling_the_request_closes_the_connector_stream(db, connector, monkeypatch, single_flight):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", single_flight)
+    connector.chunks = 100
+
+    async def scenario():
+        request = asyncio.ensure_future(ask(db, connector, 7))
+        await asyncio.sleep(0.1)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        return connector.closed
+
+    assert asyncio.run(scenario()) == 1
+    assert FakeMetrics.released == ["r7"]
+
+
+def test_the_shared_generation_uses_its_own_session_and_outlives_the_leader(db, connector, monkeypatch):
+    opened, closed = [], []
+
+    def session_factory():
+        session = SessionLocal()
+        close = session.close
+        session.close = lambda: (closed.append(session), close())
+        opened.append(session)
+        return session
+
+    monkeypatch.setattr(orchestrator, "SessionLocal", session_factory)
+    connector.chunks = 10
+
+    async def scenario():
+        leader = make_orchestrator(db, connector, 7).handle_query("7", "pregunta")
+        first = await leader.__anext__()
+        follower = asyncio.ensure_future(ask(db, connector, 9, query="pregunta"))
+        await asyncio.sleep(0.05)
+        # El cliente del líder se desconecta (y su petición cierra su sesión): la suscriptora sigue
+        await leader.aclose()
+        return first, await follower
+
+    first, follower = asyncio.run(scenario())
+
+    assert first == "t0 "
+    assert follower == "".join(f"t{i} " for i in range(10))
+    assert connector.opened == 1
+    # El consumo lo registra la sesión de la generación, no la de la petición del líder
+    assert [usage["session"] for usage in FakeMetrics.usage] == opened
+    assert closed == opened
@@ -0,0 +1,143 @@
+"""Single-flight: peticiones idénticas en curso comparten un solo stream (en un worker y entre workers)."""
+
+import asyncio
+
+from app.core.single_flight import SingleFlight
+
+
+class Producer:
+    """Generación falsa: cuenta las llamadas y anota el modelo como lo hace el orquestador."""
+
+    def __init__(self, flights: SingleFlight, key: str, chunks=("a", "b", "c"), delay: float = 0.02,
+                 meta=None):
+        self.flights = flights
+        self.key = key
+        self.chunks = chunks
+        self.delay = delay
+        self.meta = meta
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.meta:
+            await self.flights.annotate(self.key, self.meta)
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield chunk
+
+
+async def read(flights: SingleFlight, key: str, producer, delay: float = 0.0, follows=None):
+    await asyncio.sleep(delay)
+    on_follow = None
+    if follows is not None:
+        async def on_follow(meta):
+            follows.append(meta)
+    return "".join([chunk async for chunk in flights.stream(key, producer, on_follow=on_follow)])
+
+
+def test_identical_requests_share_one_generation():
+    async def scenario():
+        flights = SingleFlight()
+        producer = Producer(flights, "k", meta={"provider": "openai", "model_id": "gpt-4o-mini"})
+        follows = []
+        results = await asyncio.gather(*(read(flights, "k", producer, delay=0.01 * i, follows=follows)
+                                         for i in range(3)))
+        return flights, producer, follows, results
+
+    flights, producer, follows, results = asyncio.run(scenario())
+
+    assert results == ["abc"] * 3
+    assert producer.calls == 1
+    assert (flights.leaders, flights.followers) == (1, 2)
+    # Solo las suscriptoras, con el modelo que anotó el líder
+    assert follows == [{"provider": "openai", "model_id": "gpt-4o-mini"}] * 2
+
+
+def test_different_keys_and_finished_flights_generate_again():
+    async def scenario():
+        flights = SingleFlight()
+        first, second = Producer(flights, "k1"), Producer(flights, "k2")
+        await asyncio.gather(read(flights, "k1", first), read(flights, "k2", second))
+        await read(flights, "k1", first)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert (first.calls, second.calls) == (2, 1)
+
+
+def test_a_follower_takes_over_when_the_leader_fails_before_any_chunk():
+    async def scenario():
+        flights = SingleFlight()
+        attempts = []
+
+        async def producer():
+            attempts.append(1)
+            await asyncio.sleep(0.02)
+            if len(attempts) == 1:
+                raise RuntimeError("el proveedor no respondió")
+            yield "respuesta"
+
+        leader = asyncio.ensure_future(read(flights, "k", producer))
+        follower = asyncio.ensure_future(read(flights, "k", producer, delay=0.005))
+        leader_result = await asyncio.gather(leader, return_exceptions=True)
+        return leader_result[0], await follower, len(attempts)
+
+    leader_result, follower_result, attempts = asyncio.run(scenario())
+
+    assert isinstance(leader_result, RuntimeError)
+    assert follower_result == "respuesta"
+    assert attempts == 2
+
+
+def test_followers_in_other_workers_read_the_leader_stream_from_redis(redis_server):
+    async def scenario():
+        worker_a = SingleFlight(redis_url="redis://test", wait_seconds=5)
+        worker_b = SingleFlight(redis_url="redis://test", wait_seconds=5)
+        producer_a = Producer(worker_a, "k", meta={"provider": "google", "model_id": "gemini"})
+        producer_b = Producer(worker_b, "k", meta={"provider": "otro", "model_id": "otro"})
+        follows = []
+        results = await asyncio.gather(read(worker_a, "k", producer_a, follows=follows),
+                                       read(worker_b, "k", producer_b, delay=0.01, follows=follows))
+        return producer_a, producer_b, follows, results
+
+    producer_a, producer_b, follows, results = asyncio.run(scenario())
+
+    assert results == ["abc", "abc"]
+    assert (producer_a.calls, producer_b.calls) == (1, 0)
+    assert follows == [{"provider": "google", "model_id": "gemini"}]
+
+
+def test_generation_continues_while_someone_reads_and_stops_when_nobody_does():
+    async def scenario():
+        flights = SingleFlight()
+        closed = []
+
+        async def producer():
+            try:
+                for i in range(50):
+                    await asyncio.sleep(0.01)
+                    yield f"{i} "
+            finally:
+                closed.append(True)
+
+        leader = flights.stream("k", producer)
+        follower = flights.stream("k", producer)
+        await leader.__anext__()
+        await follower.__anext__()
+
+        # El cliente del líder se desconecta: la suscriptora sigue recibiendo
+        await leader.aclose()
+        await follower.__anext__()
+        still_running = not closed
+
+        # Sin lectoras, la generación se cancela y su finally se ejecuta
+        await follower.aclose()
+        await asyncio.sleep(0.01)
+        return still_running, closed, flights.stats()["in_flight"]
+
+    still_running, closed, in_flight = asyncio.run(scenario())
+
+    assert still_running
+    assert closed == [True]
+    assert in_flight == 0
@@ -0,0 +1,131 @@
+"""Saldo de BytTokens en Redis: scripts Lua de reserva y liquidación, y reconciliación."""
+
+import pytest
+
+from app import models
+from app.database import SessionLocal
+from app.services.token_ledger import TokenLedger
+
+
+@pytest.fixture
+def plan(db, user):
+    plan = models.UserPlan(user_id=user.id, plan_type=models.PlanType.FREE,
+                           bytokens_included=1000, bytokens_remaining=1000)
+    db.add(plan)
+    db.commit()
+    return plan
+
+
+@pytest.fixture
+def ledger(redis_server, db):
+    return TokenLedger(redis_url="redis://test", reservation_ttl=300, session_factory=SessionLocal)
+
+
+def balance(ledger, user_id):
+    values = ledger._redis.hgetall(ledger._key(user_id))
+    return {name: int(value) for name, value in values.items() if not name.startswith("r:")}
+
+
+def test_reserve_loads_the_balance_once_and_denies_over_it(ledger, plan):
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return plan
+
+    first = ledger.reserve(plan.user_id, 600, loader)
+    second = ledger.reserve(plan.user_id, 600, loader)
+
+    assert first == {"allowed": True, "remaining": 400, "reservation": first["reservation"]}
+    assert second == {"allowed": False, "remaining": 400, "reservation": None}
+    assert len(loads) == 1
+    assert balance(ledger, plan.user_id)["reserved"] == 600
+
+
+def test_paid_plans_can_reserve_past_zero(ledger, plan, db):
+    plan.plan_type = models.PlanType.PRO
+    db.commit()
+
+    result = ledger.reserve(plan.user_id, 1500, lambda: plan)
+
+    assert result["allowed"] is True
+    assert result["remaining"] == 0
+
+
+def test_commit_releases_the_reservation_only_once(ledger, plan):
+    reservation = ledger.reserve(plan.user_id, 300, lambda: plan)["reservation"]
+
+    ledger.commit(plan.user_id, reservation, 120)
+    # Un reintento de la misma liquidación no vuelve a liberar la reserva
+    ledger.commit(plan.user_id, reservation, 0)
+
+    state = balance(ledger, plan.user_id)
+    assert state["reserved"] == 0
+    assert state["unsynced"] == 120
+    assert ledger._redis.smembers(ledger._dirty_key) == {str(plan.user_id)}
+
+
+def test_refund_is_a_no_op_after_commit_or_a_previous_refund(ledger, plan):
+    committed = ledger.reserve(plan.user_id, 300, lambda: plan)["reservation"]
+    refunded = ledger.reserve(plan.user_id, 200, lambda: plan)["reservation"]
+
+    ledger.commit(plan.user_id, committed, 250)
+    ledger.refund(plan.user_id, committed)
+    ledger.refund(plan.user_id, refunded)
+    ledger.refund(plan.user_id, refunded)
+
+    state = balance(ledger, plan.user_id)
+    assert state["reserved"] == 0
+    assert state["unsynced"] == 250
+    assert ledger.refunds == 1
+    assert ledger._redis.zcard(ledger._key(plan.user_id, "reservations")) == 0
+
+
+def test_expired_reservations_return_to_the_balance(ledger, plan):
+    ledger.reservation_ttl = -1
+    ledger.reserve(plan.user_id, 900, lambda: plan)
+    ledger.reservation_ttl = 300
+
+    # La reserva vencida se libera dentro del mismo script que reserva
+    result = ledger.reserve(plan.user_id, 900, lambda: plan)
+
+    assert result["allowed"] is True
+    assert balance(ledger, plan.user_id)["reserved"] == 900
+
+
+def test_reconcile_writes_settled_usage_to_user_plans(ledger, plan, db):
+    reservation = ledger.reserve(plan.user_id, 300, lambda: plan)["reservation"]
+    ledger.commit(plan.user_id, reservation, 250)
+
+    assert ledger.reconcile() == 1
+
+    db.refresh(plan)
+    assert plan.bytokens_remaining == 750
+    state = balance(ledger, plan.user_id)
+    assert state["base"] == 750
+    assert state["unsynced"] == state["syncing"] == 0
+    # Nada pendiente: una segunda pasada no toca user_plans
+    assert ledger.reconcile() == 0
+
+
+def test_reconcile_restores_pending_usage_when_the_write_fails(ledger, plan, db):
+    ledger.reserve(plan.user_id, 100, lambda: plan)
+    ledger.commit(plan.user_id, None, 80)
+
+    def failing_commit():
+        raise RuntimeError("base de datos caída")
+
+    def failing_session():
+        session = SessionLocal()
+        session.commit = failing_commit
+        return session
+
+    ledger.session_factory = failing_session
+    assert ledger.reconcile() == 0
+
+    db.refresh(plan)
+    assert plan.bytokens_remaining == 1000
+    state = balance(ledger, plan.user_id)
+    assert state["unsynced"] == 80
+    assert state["syncing"] == 0
+    assert ledger._redis.smembers(ledger._dirty_key) == {str(plan.user_id)}
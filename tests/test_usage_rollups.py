@@ -0,0 +1,139 @@
+"""Agregados por hora y por día de token_usage: upsert, ventanas de lectura y reconstrucción."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert
+
+from app import models
+from app.config import settings
+from app.services.usage_rollups import apply_usage_rows, day_start, prune_hourly, rebuild, usage_totals
+
+
+def usage_row(user, bot, created_at, provider="openai", tokens=100, cache_hit=False):
+    return {
+        "user_id": user.id, "bot_id": bot.id, "user_anon_id": None, "query": "q",
+        "provider": provider, "model_id": f"{provider}-model", "prompt_tokens": tokens, "completion_tokens": 0,
+        "total_tokens": tokens, "prompt_cost": 0, "completion_cost": 0, "total_cost": 0,
+        "bytokens_cost": tokens // 10, "response_time_ms": 200, "context_tokens_saved": 0,
+        "cache_hit": cache_hit, "created_at": created_at,
+    }
+
+
+def record(db, rows):
+    """Como UsageWriter: detalle y agregados en la misma transacción."""
+    db.execute(insert(models.TokenUsage), rows)
+    apply_usage_rows(db, rows)
+    db.commit()
+
+
+def snapshot(db, rollup):
+    return sorted(
+        (str(row.bucket), row.provider, row.requests, row.cache_hits, row.total_tokens, row.bytokens_cost)
+        for row in db.query(rollup)
+    )
+
+
+@pytest.fixture
+def today():
+    return day_start(datetime.utcnow())
+
+
+def test_rows_are_upserted_into_hourly_and_daily_buckets(db, user, bot, today):
+    record(db, [usage_row(user, bot, today + timedelta(hours=9, minutes=5))])
+    record(db, [usage_row(user, bot, today + timedelta(hours=9, minutes=50), cache_hit=True),
+                usage_row(user, bot, today + timedelta(hours=11))])
+
+    hourly = {row.bucket: (row.requests, row.cache_hits, row.total_tokens) for row in db.query(models.UsageRollupHourly)}
+    assert hourly == {today + timedelta(hours=9): (2, 1, 200), today + timedelta(hours=11): (1, 0, 100)}
+    daily = db.query(models.UsageRollupDaily).one()
+    assert (daily.bucket, daily.requests, daily.total_tokens) == (today, 3, 300)
+    assert daily.last_used_at == today + timedelta(hours=11)
+
+
+def test_timestamps_with_other_timezones_are_bucketed_in_utc(db, user, bot):
+    madrid = timezone(timedelta(hours=2))
+    record(db, [usage_row(user, bot, datetime(2025, 6, 2, 0, 30, tzinfo=madrid))])
+
+    assert db.query(models.UsageRollupHourly).one().bucket == datetime(2025, 6, 1, 22)
+    assert db.query(models.UsageRollupDaily).one().bucket == datetime(2025, 6, 1)
+
+
+def test_windows_starting_mid_day_read_hours_only_for_the_first_day(db, user, bot, today):
+    yesterday = today - timedelta(days=1)
+    record(db, [
+        usage_row(user, bot, yesterday - timedelta(hours=2)),
+        usage_row(user, bot, yesterday + timedelta(hours=5)),
+        usage_row(user, bot, yesterday + timedelta(hours=20)),
+        usage_row(user, bot, today + timedelta(minutes=1)),
+    ])
+    # Los días completos salen de los diarios: sin horarios de hoy el total no cambia
+    db.query(models.UsageRollupHourly).filter(models.UsageRollupHourly.bucket >= today).delete()
+    db.commit()
+
+    assert usage_totals(db, yesterday + timedelta(hours=12), ["requests"])[0] == (2,)
+    assert usage_totals(db, yesterday, ["requests"])[0] == (3,)
+    assert usage_totals(db, today, ["requests"])[0] == (1,)
+
+
+def test_windows_older_than_the_hourly_retention_count_the_whole_first_day(db, user, bot, today):
+    old_day = today - timedelta(days=settings.USAGE_ROLLUP_HOURLY_RETENTION_DAYS + 5)
+    record(db, [usage_row(user, bot, old_day + timedelta(hours=1)),
+                usage_row(user, bot, old_day + timedelta(hours=20))])
+    prune_hourly(db)
+    db.commit()
+
+    assert db.query(models.UsageRollupHourly).count() == 0
+    assert usage_totals(db, old_day + timedelta(hours=12), ["requests"])[0] == (2,)
+
+
+def test_totals_are_grouped_and_filtered(db, user, bot, today):
+    record(db, [usage_row(user, bot, today + timedelta(hours=1), provider="openai", tokens=100),
+                usage_row(user, bot, today + timedelta(hours=2), provider="openai", tokens=50),
+                usage_row(user, bot, today + timedelta(hours=3), provider="google", tokens=70)])
+
+    totals = usage_totals(db, today - timedelta(days=30), ["total_tokens", "requests"],
+                          group_by=["provider"], user_id=user.id)
+    assert sorted(tuple(row) for row in totals) == [("google", 70, 1), ("openai", 150, 2)]
+    assert usage_totals(db, today, ["requests"], bot_id=bot.id + 1)[0] == (0,)
+
+
+def test_rebuild_reproduces_the_incremental_rollups(db, user, bot, today):
+    record(db, [usage_row(user, bot, today - timedelta(days=1) + timedelta(hours=3)),
+                usage_row(user, bot, today + timedelta(hours=1), cache_hit=True),
+                usage_row(user, bot, today + timedelta(hours=1, minutes=30), provider="google")])
+    expected = snapshot(db, models.UsageRollupHourly), snapshot(db, models.UsageRollupDaily)
+
+    db.query(models.UsageRollupHourly).delete()
+    db.query(models.UsageRollupDaily).delete()
+    rebuild(db, today - timedelta(days=2), today + timedelta(days=1))
+    db.commit()
+
+    assert (snapshot(db, models.UsageRollupHourly), snapshot(db, models.UsageRollupDaily)) == expected
+
+
+def test_rebuild_from_mid_day_recomputes_whole_days(db, user, bot, today):
+    record(db, [usage_row(user, bot, today + timedelta(hours=1)),
+                usage_row(user, bot, today + timedelta(hours=10))])
+    # Los horarios pueden estar podados: el diario sale del detalle
+    db.query(models.UsageRollupHourly).delete()
+    db.commit()
+
+    rebuild(db, today + timedelta(hours=9), today + timedelta(hours=11))
+    db.commit()
+
+    assert db.query(models.UsageRollupDaily).one().requests == 2
+    assert db.query(models.UsageRollupHourly).one().bucket == today + timedelta(hours=10)
+
+
+def test_rebuild_keeps_daily_rollups_of_days_without_detail(db, user, bot, today):
+    old_day = today - timedelta(days=400)
+    record(db, [usage_row(user, bot, old_day + timedelta(hours=4))])
+    # Partición de token_usage ya borrada por la retención
+    db.query(models.TokenUsage).delete()
+    db.commit()
+
+    rebuild(db, old_day, old_day + timedelta(days=1))
+    db.commit()
+
+    assert db.query(models.UsageRollupDaily).one().requests == 1
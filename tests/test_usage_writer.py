@@ -0,0 +1,174 @@
+"""Escritura diferida del uso: lotes en una transacción, reintentos y volcado a disco."""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app import models
+from app.database import SessionLocal
+from app.services.usage_writer import UsageWriter
+
+
+def usage_item(user, bot, bytokens=10, created_at=None, charge=True):
+    row = {
+        "user_id": user.id, "bot_id": bot.id, "user_anon_id": None, "query": "¿Qué planes hay?",
+        "provider": "openai", "model_id": "gpt-4o-mini", "prompt_tokens": 100, "completion_tokens": 20,
+        "total_tokens": 120, "prompt_cost": 0, "completion_cost": 0, "total_cost": 0,
+        "bytokens_cost": bytokens, "response_time_ms": 300, "context_tokens_saved": 0, "cache_hit": False,
+        "created_at": created_at or datetime.now(timezone.utc),
+    }
+    return {"kind": "usage", "row": row, "charge": charge}
+
+
+def event_item(user, bot, event_type=models.EventType.CHAT_MESSAGE):
+    row = {"user_id": user.id, "bot_id": bot.id, "event_type": event_type, "event_data": None,
+           "user_anon_id": None, "ip_address": None, "user_agent": None,
+           "created_at": datetime.now(timezone.utc)}
+    return {"kind": "event", "row": row}
+
+
+@pytest.fixture
+def writer(db, tmp_path):
+    writer = UsageWriter(session_factory=SessionLocal, batch_size=2, flush_interval_ms=20,
+                         spill_path=str(tmp_path / "usage_spill.jsonl"), max_retries=2)
+    yield writer
+    writer.stop()
+
+
+def test_queued_rows_are_written_with_rollups_and_plan_charges(writer, db, user, bot):
+    for _ in range(4):
+        writer.submit_usage(usage_item(user, bot)["row"])
+    writer.submit_usage(usage_item(user, bot, charge=False)["row"], charge_bytokens=False)
+    writer.submit_event(event_item(user, bot)["row"])
+    writer.stop()
+
+    assert writer.written == 6
+    assert writer.batches >= 3
+    assert db.query(models.TokenUsage).count() == 5
+    assert db.query(models.AnalyticsEvent).count() == 1
+    # El plan se crea en el primer lote y solo se descuentan las filas facturables
+    plan = db.query(models.UserPlan).filter_by(user_id=user.id).one()
+    assert plan.bytokens_remaining == plan.bytokens_included - 40
+    daily = db.query(models.UsageRollupDaily).one()
+    assert (daily.requests, daily.total_tokens, daily.bytokens_cost) == (5, 600, 50)
+
+
+def test_a_failed_batch_leaves_no_rows_charges_or_plans(writer, db, user, bot):
+    # event_type es obligatorio: el INSERT de eventos falla después del descuento y de token_usage
+    with pytest.raises(Exception):
+        writer._write([usage_item(user, bot), event_item(user, bot, event_type=None)])
+
+    assert db.query(models.UserPlan).count() == 0
+    assert db.query(models.TokenUsage).count() == 0
+    assert db.query(models.UsageRollupHourly).count() == 0
+
+
+def test_batches_are_retried_after_a_database_error(writer, db, user, bot):
+    sessions = []
+
+    def flaky_session():
+        sessions.append(1)
+        if len(sessions) == 1:
+            raise ConnectionError("sin conexión")
+        return SessionLocal()
+
+    writer.session_factory = flaky_session
+    assert writer._write_with_retries([usage_item(user, bot)]) is True
+
+    assert writer.failures == 1
+    assert db.query(models.TokenUsage).count() == 1
+    assert writer.spilled == 0
+
+
+def test_unwritable_batches_are_spilled_and_replayed_on_start(writer, db, user, bot, tmp_path):
+    def broken_session():
+        raise ConnectionError("sin conexión")
+
+    created_at = datetime(2025, 3, 1, 10, 30, tzinfo=timezone.utc)
+    writer.session_factory = broken_session
+    assert writer._write_with_retries([usage_item(user, bot, created_at=created_at), event_item(user, bot)],
+                                      retries=1) is False
+    spill_path = tmp_path / "usage_spill.jsonl"
+    assert len(spill_path.read_text(encoding="utf-8").splitlines()) == 2
+
+    # El siguiente proceso lo escribe al arrancar
+    restarted = UsageWriter(session_factory=SessionLocal, spill_path=str(spill_path))
+    restarted.start()
+    restarted.stop()
+
+    assert not spill_path.exists()
+    usage = db.query(models.TokenUsage).one()
+    assert usage.created_at.replace(tzinfo=None) == created_at.replace(tzinfo=None)
+    assert db.query(models.AnalyticsEvent).one().event_type == models.EventType.CHAT_MESSAGE
+    assert db.query(models.UsageRollupHourly).one().bucket == datetime(2025, 3, 1, 10)
+
+
+def test_spilled_lines_without_timezone_are_read_as_utc(writer, db, user, bot, tmp_path):
+    item = usage_item(user, bot)
+    item["row"]["created_at"] = "2025-03-01 23:59:00"
+    spill_path = tmp_path / "usage_spill.jsonl"
+    spill_path.write_text(json.dumps(item) + "\n", encoding="utf-8")
+
+    writer._replay_spill()
+
+    assert db.query(models.UsageRollupDaily).one().bucket == datetime(2025, 3, 1)
+
+
+def test_a_truncated_spill_line_is_set_aside_and_the_rest_replayed(db, user, bot, tmp_path):
+    spill_path = tmp_path / "usage_spill.jsonl"
+    complete = json.dumps(usage_item(user, bot), default=str)
+    # El proceso murió escribiendo la última línea del volcado
+    spill_path.write_text(f"{complete}\n{complete[:40]}", encoding="utf-8")
+
+    restarted = UsageWriter(session_factory=SessionLocal, spill_path=str(spill_path))
+    restarted.start()
+    restarted.stop()
+
+    assert db.query(models.TokenUsage).count() == 1
+    assert (tmp_path / "usage_spill.jsonl.bad").read_text(encoding="utf-8") == complete[:40] + "\n"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["usage_spill.jsonl.bad"]
+
+
+def test_spilled_rows_survive_a_database_failure_during_replay(db, user, bot, tmp_path):
+    spill_path = tmp_path / "usage_spill.jsonl"
+    spill_path.write_text("".join(json.dumps(usage_item(user, bot), default=str) + "\n" for _ in range(3)),
+                          encoding="utf-8")
+    sessions = []
+
+    def fails_on_second_batch():
+        sessions.append(1)
+        if len(sessions) == 2:
+            raise ConnectionError("sin conexión")
+        return SessionLocal()
+
+    # Arranca con la base de datos caída a mitad de la recuperación: arranca igual
+    restarted = UsageWriter(session_factory=fails_on_second_batch, batch_size=2, spill_path=str(spill_path))
+    restarted.start()
+    restarted.stop()
+
+    assert db.query(models.TokenUsage).count() == 2
+    assert len(spill_path.read_text(encoding="utf-8").splitlines()) == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["usage_spill.jsonl"]
+
+    # El siguiente arranque escribe lo que faltaba
+    again = UsageWriter(session_factory=SessionLocal, spill_path=str(spill_path))
+    again.start()
+    again.stop()
+
+    assert db.query(models.TokenUsage).count() == 3
+    assert not spill_path.exists()
+
+
+def test_replay_files_left_by_a_dead_process_are_recovered(db, user, bot, tmp_path, monkeypatch):
+    spill_path = tmp_path / "usage_spill.jsonl"
+    orphan = tmp_path / "usage_spill.jsonl.4242.0.replay"
+    orphan.write_text(json.dumps(usage_item(user, bot), default=str) + "\n", encoding="utf-8")
+    monkeypatch.setattr("app.services.usage_writer._process_alive", lambda pid: pid != 4242)
+
+    restarted = UsageWriter(session_factory=SessionLocal, spill_path=str(spill_path))
+    restarted.start()
+    restarted.stop()
+
+    assert db.query(models.TokenUsage).count() == 1
+    assert list(tmp_path.iterdir()) == []
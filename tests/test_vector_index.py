@@ -0,0 +1,193 @@
+"""Índice vectorial por bot: ids de vector, tombstones, compactación y persistencia."""
+
+import numpy as np
+import pytest
+
+from app.core.vector_index import (
+    CHUNK_BITS, BotVectorIndex, MmapChunkStore, document_id_from_vector_id, make_vector_ids
+)
+
+DIM = 8
+
+
+def vectors(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).random((count, DIM), dtype=np.float32)
+
+
+@pytest.fixture
+def index():
+    index = BotVectorIndex.create(DIM)
+    index.add_document(1, ["uno-a", "uno-b", "uno-c"], vectors(3, 1))
+    index.add_document(2, ["dos-a", "dos-b"], vectors(2, 2))
+    return index
+
+
+def test_vector_ids_carry_the_document_id_in_the_high_bits():
+    ids = make_vector_ids(123456, 3)
+
+    assert ids.dtype == np.int64
+    assert ids.tolist() == [(123456 << CHUNK_BITS) + chunk for chunk in range(3)]
+    assert {document_id_from_vector_id(vector_id) for vector_id in ids} == {123456}
+    # Ids de documento grandes siguen cabiendo en int64
+    assert document_id_from_vector_id(make_vector_ids(2 ** 38, 1)[0]) == 2 ** 38
+
+
+def test_search_returns_the_chunk_and_its_document(index):
+    query = vectors(2, 2)[1]
+
+    best = index.search(query, k=1)[0]
+
+    assert (best["document_id"], best["text"]) == (2, "dos-b")
+    assert best["score"] == pytest.approx(0.0, abs=1e-5)
+    assert best["relevance"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_search_can_be_limited_to_some_documents(index):
+    results = index.search(vectors(2, 2)[1], k=5, allowed_document_ids={1})
+
+    assert [result["document_id"] for result in results] == [1, 1, 1]
+
+
+def test_reprocessing_a_document_replaces_its_chunks(index):
+    index.add_document(1, ["nuevo"], vectors(1, 9))
+
+    assert index.ntotal == 3
+    assert sorted(index.chunks.values()) == ["dos-a", "dos-b", "nuevo"]
+
+
+def test_removed_documents_are_filtered_until_compaction(index):
+    index.remove_document(1)
+
+    assert index.tombstone_ratio() == pytest.approx(3 / 5)
+    assert index.ntotal == 5
+    assert {result["document_id"] for result in index.search(vectors(3, 1)[0], k=5)} == {2}
+
+    assert index.compact() == 3
+    assert index.ntotal == 2
+    assert index.tombstones == set()
+    assert index.document_ids() == {2}
+    assert index.compact() == 0
+
+
+def test_adding_a_removed_document_again_clears_its_tombstone(index):
+    index.remove_document(2)
+    index.add_document(2, ["dos-bis"], vectors(1, 7))
+
+    assert index.tombstones == set()
+    assert index.search(vectors(1, 7)[0], k=1)[0]["text"] == "dos-bis"
+
+
+def test_removing_an_unknown_document_is_a_no_op(index):
+    index.remove_document(99)
+
+    assert index.tombstones == set()
+
+
+def test_saved_index_opens_read_only_with_tombstones_and_texts(index, tmp_path):
+    index.remove_document(1)
+    index.save(str(tmp_path))
+
+    readonly = BotVectorIndex.open_readonly(str(tmp_path))
+
+    assert readonly.read_only
+    assert isinstance(readonly.chunks, MmapChunkStore)
+    assert readonly.tombstones == {1}
+    assert [result["text"] for result in readonly.search(vectors(2, 2)[0], k=2)] == ["dos-a", "dos-b"]
+    with pytest.raises(RuntimeError):
+        readonly.add_document(3, ["tres"], vectors(1, 3))
+
+
+def test_loaded_copy_can_be_compacted_and_saved_again(index, tmp_path):
+    index.remove_document(2)
+    index.save(str(tmp_path))
+
+    editable = BotVectorIndex.load(str(tmp_path))
+    assert editable.compact() == 2
+    editable.save(str(tmp_path))
+
+    reopened = BotVectorIndex.open_readonly(str(tmp_path))
+    assert reopened.ntotal == 3
+    assert reopened.tombstones == set()
+    assert MmapChunkStore(BotVectorIndex.generation_path(str(tmp_path))).to_dict() == editable.chunks
+
+
+def test_vector_and_chunk_counts_must_match():
+    index = BotVectorIndex.create(DIM)
+
+    with pytest.raises(ValueError):
+        index.add_document(1, ["a"], vectors(2, 1))
+
+
+def test_the_embedding_backend_is_kept_in_the_manifest(tmp_path):
+    index = BotVectorIndex.create(DIM, embedding_backend="local")
+    index.add_document(1, ["uno"], vectors(1, 1))
+    index.save(str(tmp_path))
+
+    assert BotVectorIndex.stored_embedding_backend(str(tmp_path)) == "local"
+    assert BotVectorIndex.load(str(tmp_path)).embedding_backend == "local"
+    assert BotVectorIndex.stored_embedding_backend(str(tmp_path / "otro")) is None
+
+
+def test_reembedding_changes_the_dimension_and_keeps_ids(index, tmp_path):
+    index.remove_document(2)
+
+    def embed_documents(texts):
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts], dtype=np.float32)
+
+    index.reembed(embed_documents, "local", batch_size=2)
+    index.save(str(tmp_path))
+
+    reopened = BotVectorIndex.open_readonly(str(tmp_path))
+    assert reopened.index.d == 4
+    assert reopened.embedding_backend == "local"
+    assert reopened.tombstones == {2}
+    assert {result["id"] for result in reopened.search(np.array([5, 1, 0, 0]), k=5)} == set(
+        make_vector_ids(1, 3).tolist()
+    )
+
+
+def test_each_save_publishes_a_new_generation_and_keeps_the_previous_one(index, tmp_path):
+    for _ in range(3):
+        index.save(str(tmp_path))
+    reader = BotVectorIndex.open_readonly(str(tmp_path))
+
+    index.add_document(3, ["tres"], vectors(1, 3))
+    index.save(str(tmp_path))
+
+    assert BotVectorIndex.generation_path(str(tmp_path)) == str(tmp_path / "gen_4")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["CURRENT", "gen_3", "gen_4"]
+    # Quien abrió la generación anterior sigue leyendo sus textos, no los de la nueva
+    assert reader.ntotal == 5
+    assert reader.search(vectors(1, 3)[0], k=1)[0]["text"] != "tres"
+    assert BotVectorIndex.open_readonly(str(tmp_path)).search(vectors(1, 3)[0], k=1)[0]["text"] == "tres"
+
+
+def test_an_unpublished_generation_is_ignored_and_overwritten(index, tmp_path):
+    index.save(str(tmp_path))
+    # Un guardado que murió a medias
+    (tmp_path / "gen_2").mkdir()
+    (tmp_path / "gen_2" / "vectors.faiss").write_bytes(b"basura")
+
+    assert BotVectorIndex.open_readonly(str(tmp_path)).ntotal == 5
+    index.save(str(tmp_path))
+    assert BotVectorIndex.open_readonly(str(tmp_path)).ntotal == 5
+
+
+def test_indexes_saved_without_generations_are_read_and_migrated(index, tmp_path):
+    # Formato anterior: los archivos directamente en la raíz del índice
+    index.save(str(tmp_path))
+    for path in (tmp_path / "gen_1").iterdir():
+        path.rename(tmp_path / path.name)
+    (tmp_path / "gen_1").rmdir()
+    (tmp_path / "CURRENT").unlink()
+
+    legacy = BotVectorIndex.load(str(tmp_path))
+    assert BotVectorIndex.exists(str(tmp_path))
+    assert legacy.ntotal == 5
+
+    legacy.save(str(tmp_path))
+    legacy.save(str(tmp_path))
+
+    # La raíz antigua hizo de generación anterior y se borró al publicar la segunda
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["CURRENT", "gen_1", "gen_2"]
+    assert BotVectorIndex.open_readonly(str(tmp_path)).ntotal == 5